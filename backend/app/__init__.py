@@ -4,7 +4,6 @@ Responsable de crear y configurar la aplicación Flask
 """
 from flask import Flask, request, session
 from flask_cors import CORS
-from flask_session import Session
 import logging
 from logging.handlers import RotatingFileHandler
 import os
@@ -63,13 +62,67 @@ def init_extensions(app):
     cors_config = get_cors_config()
     CORS(app, **cors_config)
     
-    # Crear directorio de sesiones si no existe
-    session_dir = app.config.get('SESSION_FILE_DIR')
-    if session_dir and not os.path.exists(session_dir):
-        os.makedirs(session_dir, exist_ok=True)
-    
     # Configurar sesiones
-    Session(app)
+    backend = app.config.get('SESSION_BACKEND', 'memoria')
+    if backend == 'filesystem':
+        # Backend anterior: un archivo por sesión con Flask-Session
+        from flask_session import Session
+        
+        # Crear directorio de sesiones si no existe
+        session_dir = app.config.get('SESSION_FILE_DIR')
+        if session_dir and not os.path.exists(session_dir):
+            os.makedirs(session_dir, exist_ok=True)
+        
+        Session(app)
+    else:
+        from .utils.almacen_sesiones import AlmacenMemoria, BarredorSesiones
+        from .utils.sesion_servidor import InterfazSesionServidor, crear_almacen
+        
+        almacen = crear_almacen(app.config)
+        app.session_interface = InterfazSesionServidor(almacen)
+        
+        # El almacén compartido expira las sesiones por su cuenta
+        if isinstance(almacen, AlmacenMemoria):
+            barredor = BarredorSesiones(almacen, app.config.get('SESSION_BARRIDO_INTERVALO', 60))
+            barredor.iniciar()
+            app.extensions['barredor_sesiones'] = barredor
+    
+    # Eventos para los clientes conectados por Server-Sent Events
+    from .utils.eventos import centro_eventos
+    
+    centro_eventos.max_eventos = app.config.get('EVENTOS_MAX_COLA', 100)
+    app.extensions['centro_eventos'] = centro_eventos
+    
+    # Sesiones de terapia en curso: las transiciones se escriben en BD por lotes
+    from .models.sesion import SesionesActivas
+    from .services.sesion_service import ProgramadorAlertas, SesionService
+    
+    sesiones_activas = SesionesActivas()
+    sesiones_activas.suscribir(SesionService.publicar_estado)
+    sesiones_activas.iniciar_vaciado(app.config.get('SESIONES_VACIADO_INTERVALO', 5))
+    app.extensions['sesiones_activas'] = sesiones_activas
+    
+    # Alertas de seguridad (descanso, límite de tiempo, inactividad) programadas en el servidor
+    from .utils.rueda_temporizadores import RuedaTemporizadores
+    from .services.configuracion_service import ConfiguracionService
+    
+    configuraciones = ConfiguracionService()
+    rueda = RuedaTemporizadores(resolucion=app.config.get('ALERTAS_RESOLUCION', 1.0))
+    app.extensions['alertas_sesiones'] = ProgramadorAlertas(
+        sesiones_activas, rueda,
+        cargar_configuracion=lambda paciente_id: configuraciones.obtener_configuracion(paciente_id).seguridad
+    )
+    rueda.iniciar()
+    
+    # Tokens firmados opcionales: cualquier nodo con el mismo SECRET_KEY los verifica
+    if app.config.get('AUTH_TOKENS'):
+        from .utils.tokens import FirmadorTokens
+        
+        app.extensions['firmador_tokens'] = FirmadorTokens(
+            app.config['SECRET_KEY'],
+            ttl=app.config.get('AUTH_TOKEN_TTL', 3600),
+            cache_entradas=app.config.get('AUTH_TOKEN_CACHE_ENTRADAS', 4096)
+        )
 
 
 def setup_logging(app):
@@ -102,6 +155,7 @@ def register_blueprints(app):
     from .controllers.gamificacion_controller import gamificacion_bp
     from .controllers.sesion_controller import sesion_bp
     from .controllers.reporte_controller import reporte_bp
+    from .controllers.dashboard_controller import dashboard_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -110,6 +164,7 @@ def register_blueprints(app):
     app.register_blueprint(gamificacion_bp, url_prefix='/api')
     app.register_blueprint(sesion_bp, url_prefix='/api')
     app.register_blueprint(reporte_bp, url_prefix='/api')
+    app.register_blueprint(dashboard_bp, url_prefix='/api')
 
 
 def setup_session_middleware(app):
@@ -5,6 +5,7 @@ Responsable de manejar las peticiones HTTP relacionadas con autenticación
 from flask import request, jsonify, session
 from typing import Dict, Any
 from ..services.paciente_service import PacienteService
+from ..utils.autenticacion import obtener_datos_paciente, obtener_firmador
 
 
 class AuthController:
@@ -76,11 +77,19 @@ class AuthController:
             if exito:
                 # Establecer sesión (sin contraseña)
                 session['paciente'] = paciente.to_dict_safe()
-                return jsonify({
+                respuesta = {
                     'success': True,
                     'message': mensaje,
                     'paciente': paciente.to_dict_safe()
-                }), 200
+                }
+                
+                # Con AUTH_TOKENS se entrega además un token para 'Authorization: Bearer'
+                firmador = obtener_firmador()
+                if firmador is not None:
+                    respuesta['token'] = firmador.emitir(paciente.id, {'paciente': paciente.to_dict_safe()})
+                    respuesta['token_expira_en'] = firmador.ttl
+                
+                return jsonify(respuesta), 200
             else:
                 return jsonify({'error': mensaje}), 401
                 
@@ -111,7 +120,7 @@ class AuthController:
             Dict con respuesta JSON
         """
         try:
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if not paciente_data:
                 return jsonify({'error': 'No hay sesión activa'}), 401
             
@@ -138,7 +147,7 @@ class AuthController:
             Dict con respuesta JSON
         """
         try:
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if paciente_data:
                 return jsonify({
                     'success': True,
@@ -1,30 +1,24 @@
 """
 Controlador de Configuración - Endpoints para gestión de configuraciones
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, current_app, g, request, jsonify
 from app.services.configuracion_service import ConfiguracionService
+from app.services.ejercicio_service import EjercicioService
 from app.models.configuracion import ConfiguracionPaciente
+from app.utils.autenticacion import requiere_paciente
 
 configuracion_bp = Blueprint('configuracion', __name__)
 config_service = ConfiguracionService()
-
-
-def _get_paciente_id():
-    """Obtiene el ID del paciente de la sesión activa. Retorna None si no hay sesión."""
-    paciente_data = session.get('paciente')
-    if not paciente_data:
-        return None
-    return paciente_data.get('id')
+ejercicio_service = EjercicioService()
 
 
 @configuracion_bp.route('/configuracion', methods=['GET'])
+@requiere_paciente
 def obtener_configuracion():
     """Obtiene la configuración del paciente actual"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
 
     return jsonify({
         'success': True,
@@ -33,16 +27,15 @@ def obtener_configuracion():
 
 
 @configuracion_bp.route('/configuracion/calibracion', methods=['PUT'])
+@requiere_paciente
 def actualizar_calibracion():
     """Actualiza la calibración física del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     data = request.get_json()
     if not data:
         return jsonify({'success': False, 'error': 'Cuerpo de la solicitud requerido (JSON)'}), 400
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
 
     resultado = config_service.actualizar_calibracion(
         config,
@@ -55,20 +48,20 @@ def actualizar_calibracion():
     if not resultado.get('valido'):
         return jsonify({'success': False, **resultado}), 400
 
+    config_service.guardar_configuracion(config)
     return jsonify({'success': True, **resultado})
 
 
 @configuracion_bp.route('/configuracion/accesibilidad', methods=['PUT'])
+@requiere_paciente
 def actualizar_accesibilidad():
     """Actualiza la configuración de accesibilidad"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     data = request.get_json()
     if not data:
         return jsonify({'success': False, 'error': 'Cuerpo de la solicitud requerido (JSON)'}), 400
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
 
     resultado = config_service.actualizar_accesibilidad(
         config,
@@ -85,20 +78,20 @@ def actualizar_accesibilidad():
     if not resultado.get('valido'):
         return jsonify({'success': False, **resultado}), 400
 
+    config_service.guardar_configuracion(config)
     return jsonify({'success': True, **resultado})
 
 
 @configuracion_bp.route('/configuracion/seguridad', methods=['PUT'])
+@requiere_paciente
 def actualizar_seguridad():
     """Actualiza la configuración de seguridad"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     data = request.get_json()
     if not data:
         return jsonify({'success': False, 'error': 'Cuerpo de la solicitud requerido (JSON)'}), 400
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
 
     resultado = config_service.actualizar_seguridad(
         config,
@@ -115,34 +108,58 @@ def actualizar_seguridad():
     if not resultado.get('valido'):
         return jsonify({'success': False, **resultado}), 400
 
+    config_service.guardar_configuracion(config)
+    # Los temporizadores de una sesión en curso pasan a usar los nuevos plazos
+    current_app.extensions['alertas_sesiones'].configurar(paciente_id, config.seguridad)
     return jsonify({'success': True, **resultado})
 
 
 @configuracion_bp.route('/configuracion/preset/<preset>', methods=['POST'])
+@requiere_paciente
 def aplicar_preset(preset):
     """Aplica un preset de configuración"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
     resultado = config_service.aplicar_preset_accesibilidad(config, preset)
 
     if not resultado.get('valido'):
         return jsonify({'success': False, **resultado}), 400
 
+    config_service.guardar_configuracion(config)
     return jsonify({'success': True, **resultado})
 
 
 @configuracion_bp.route('/configuracion/recomendaciones', methods=['GET'])
+@requiere_paciente
 def obtener_recomendaciones():
     """Obtiene recomendaciones personalizadas"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
-    config = config_service.crear_configuracion_default(paciente_id)
+    config = config_service.obtener_configuracion(paciente_id)
     recomendaciones = config_service.obtener_recomendaciones(config)
 
     return jsonify({'success': True, **recomendaciones})
 
+
+@configuracion_bp.route('/configuracion/ejercicios/<ejercicio_id>', methods=['GET'])
+@requiere_paciente
+def obtener_parametros_ejercicio(ejercicio_id):
+    """
+    Parámetros del ejercicio ya ajustados a la configuración del paciente
+
+    La respuesta se arma una vez por versión de la configuración; el cliente
+    la revalida con su ETag (304 si la configuración no cambió).
+    """
+    ejercicio = ejercicio_service.obtener_ejercicio_por_id(ejercicio_id)
+    if not ejercicio:
+        return jsonify({'success': False, 'error': 'Ejercicio no encontrado'}), 404
+
+    cuerpo, etag = config_service.parametros_ejercicio(g.paciente_id, ejercicio)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(cuerpo, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
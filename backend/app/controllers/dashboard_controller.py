@@ -0,0 +1,34 @@
+"""
+Controlador del Dashboard - Endpoint con todo lo que muestra el dashboard del paciente
+"""
+from flask import Blueprint, jsonify
+from app.services.ejercicio_service import EjercicioService
+from app.utils.autenticacion import obtener_datos_paciente
+
+dashboard_bp = Blueprint('dashboard', __name__)
+ejercicio_service = EjercicioService()
+
+
+@dashboard_bp.route('/dashboard/resumen', methods=['GET'])
+def obtener_resumen():
+    """
+    Resumen del dashboard en una sola respuesta
+
+    Datos del paciente (de la sesión o el token, leídos una vez), totales,
+    tasa de éxito, racha, últimos resultados, recomendación y ejercicios
+    disponibles. El resumen del historial sale de la cache que se actualiza
+    al registrar cada resultado.
+    """
+    paciente_data = obtener_datos_paciente()
+    if not paciente_data or not paciente_data.get('id'):
+        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+
+    paciente = {k: v for k, v in paciente_data.items() if k != 'password'}
+    resumen = ejercicio_service.obtener_resumen_paciente(str(paciente_data['id']))
+
+    return jsonify({
+        'success': True,
+        'paciente': paciente,
+        'resumen': resumen,
+        'ejercicios': ejercicio_service.catalogo.dicts()
+    })
@@ -2,11 +2,158 @@
 Controlador de Ejercicios - Patrón de Diseño MVC Controller
 Responsable de manejar las peticiones HTTP relacionadas con ejercicios
 """
-from flask import request, jsonify, session
-from typing import Dict, Any
+import base64
+import binascii
+import json
+import math
+from dataclasses import fields
+from datetime import datetime
+from flask import Response, current_app, request, jsonify
+from typing import Dict, Any, List, Optional, Tuple
 from ..services.ejercicio_service import EjercicioService
 from ..services.paciente_service import PacienteService
-from ..models.ejercicio import TipoEjercicio
+from ..services.gamificacion_service import GamificacionService
+from ..services.telemetria_service import TelemetriaService, TelemetriaSaturada
+from ..models.catalogo import Listado
+from ..models.ejercicio import ResultadoEjercicio, TipoEjercicio
+from ..utils.autenticacion import obtener_datos_paciente
+from ..utils.telemetria import TelemetriaInvalida
+
+# Campos numéricos opcionales de un resultado
+CAMPOS_NUMERICOS_RESULTADO = (
+    'tiempo_ejecucion', 'puntuacion', 'nivel', 'precision', 'velocidad_promedio', 'rango_movimiento',
+    'tiempo_reaccion_promedio', 'tasa_aciertos', 'consistencia', 'combo_maximo', 'aciertos', 'fallos'
+)
+LARGO_MAXIMO_CLAVE = 128
+
+# Campos que se pueden pedir con ?fields= en el historial; por defecto todos
+# menos observaciones (el JSON del cliente, ya desglosado en las métricas)
+CAMPOS_HISTORIAL = ('id',) + tuple(campo.name for campo in fields(ResultadoEjercicio))
+CAMPOS_HISTORIAL_DEFECTO = tuple(campo for campo in CAMPOS_HISTORIAL if campo != 'observaciones')
+
+
+def _codificar_cursor(clave: Optional[Tuple[str, int]]) -> Optional[str]:
+    """Cursor opaco para la clave (fecha, id) del último registro entregado"""
+    if clave is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(clave)).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decodificar_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    Clave (fecha, id) de un cursor de ``_codificar_cursor``
+    
+    Raises:
+        ValueError: si el cursor no es válido
+    """
+    try:
+        fecha, id_registro = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError('cursor inválido')
+    if not isinstance(fecha, str) or isinstance(id_registro, bool) or not isinstance(id_registro, int):
+        raise ValueError('cursor inválido')
+    return fecha, id_registro
+
+
+def _leer_parametros_historial(args) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Valida limit, cursor, since y fields de la consulta del historial
+    
+    Returns:
+        Tuple: (parámetros, None) o (None, mensaje de error)
+    """
+    limite_defecto = current_app.config.get('HISTORIAL_PAGINA_DEFECTO', 50)
+    limite_maximo = current_app.config.get('HISTORIAL_PAGINA_MAX', 200)
+    try:
+        limite = int(args.get('limit', limite_defecto))
+    except ValueError:
+        return None, "'limit' debe ser un entero"
+    if not 1 <= limite <= limite_maximo:
+        return None, f"'limit' debe estar entre 1 y {limite_maximo}"
+    
+    cursor = None
+    if args.get('cursor'):
+        try:
+            cursor = _decodificar_cursor(args['cursor'])
+        except ValueError as e:
+            return None, str(e)
+    
+    desde = None
+    if args.get('since'):
+        try:
+            fecha = datetime.fromisoformat(args['since'])
+        except ValueError:
+            return None, "'since' debe ser una fecha ISO 8601"
+        # Las fechas del historial son locales sin zona horaria
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone().replace(tzinfo=None)
+        desde = fecha.isoformat()
+    
+    campos: List[str] = list(CAMPOS_HISTORIAL_DEFECTO)
+    if args.get('fields'):
+        campos = [campo.strip() for campo in args['fields'].split(',') if campo.strip()]
+        desconocidos = [campo for campo in campos if campo not in CAMPOS_HISTORIAL]
+        if desconocidos:
+            return None, f"Campos desconocidos: {', '.join(desconocidos)}"
+        if 'id' not in campos:
+            campos.insert(0, 'id')
+    
+    return {'limite': limite, 'cursor': cursor, 'desde': desde, 'campos': campos}, None
+
+
+def _leer_resultado_lote(item: Any) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Valida un resultado de un lote y lo convierte en argumentos de EjercicioService.registrar_resultado
+    
+    Returns:
+        Tuple: (argumentos, None) o (None, mensaje de error)
+    """
+    if not isinstance(item, dict):
+        return None, 'Se esperaba un objeto'
+    
+    ejercicio_id = str(item.get('ejercicio_id') or item.get('nivel') or '')
+    if not ejercicio_id:
+        return None, 'ID de ejercicio requerido'
+    exito = item.get('exito', False)
+    if not isinstance(exito, bool):
+        return None, "'exito' debe ser booleano"
+    
+    datos = {'ejercicio_id': ejercicio_id, 'exito': exito}
+    valores = dict(item, tiempo_ejecucion=item.get('tiempo_ejecucion') or item.get('duracion'))
+    for campo in CAMPOS_NUMERICOS_RESULTADO:
+        valor = valores.get(campo)
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (int, float))
+                                  or not math.isfinite(valor)):
+            return None, f"'{campo}' debe ser numérico"
+        datos[campo] = valor
+    
+    for campo in ('observaciones', 'intento_id', 'clave_idempotencia'):
+        valor = item.get(campo)
+        if valor is not None and not isinstance(valor, str):
+            return None, f"'{campo}' debe ser texto"
+        datos[campo] = valor
+    # Sin clave explícita el intento identifica al resultado
+    datos['clave_idempotencia'] = datos['clave_idempotencia'] or datos['intento_id']
+    if datos['clave_idempotencia'] and len(datos['clave_idempotencia']) > LARGO_MAXIMO_CLAVE:
+        return None, 'clave_idempotencia demasiado larga'
+    return datos, None
+
+
+def _respuesta_catalogo(listado: Listado) -> Response:
+    """
+    Respuesta de un listado del catálogo ya codificado, con su ETag fuerte
+    
+    El catálogo solo cambia al desplegar: el cliente puede reutilizar la
+    respuesta durante CATALOGO_MAX_AGE segundos y después revalidarla (304).
+    """
+    cuerpo, etag = listado
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(cuerpo, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f"public, max-age={current_app.config.get('CATALOGO_MAX_AGE', 3600)}"
+    return response
 
 
 class EjercicioController:
@@ -15,6 +162,8 @@ class EjercicioController:
     def __init__(self):
         self.ejercicio_service = EjercicioService()
         self.paciente_service = PacienteService()
+        self.gamificacion_service = GamificacionService()
+        self.telemetria_service = TelemetriaService()
     
     def obtener_ejercicios(self) -> Dict[str, Any]:
         """
@@ -24,11 +173,7 @@ class EjercicioController:
             Dict con respuesta JSON
         """
         try:
-            ejercicios = self.ejercicio_service.obtener_todos_ejercicios()
-            return jsonify({
-                'success': True,
-                'ejercicios': [e.to_dict() for e in ejercicios]
-            }), 200
+            return _respuesta_catalogo(self.ejercicio_service.listado_ejercicios())
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
@@ -40,11 +185,7 @@ class EjercicioController:
             Dict con respuesta JSON
         """
         try:
-            ejercicios = self.ejercicio_service.obtener_ejercicios_rehabilitacion()
-            return jsonify({
-                'success': True,
-                'ejercicios': [e.to_dict() for e in ejercicios]
-            }), 200
+            return _respuesta_catalogo(self.ejercicio_service.listado_ejercicios(TipoEjercicio.REHABILITACION))
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
@@ -56,11 +197,7 @@ class EjercicioController:
             Dict con respuesta JSON
         """
         try:
-            ejercicios = self.ejercicio_service.obtener_ejercicios_terapia_ocupacional()
-            return jsonify({
-                'success': True,
-                'ejercicios': [e.to_dict() for e in ejercicios]
-            }), 200
+            return _respuesta_catalogo(self.ejercicio_service.listado_ejercicios(TipoEjercicio.TERAPIA_OCUPACIONAL))
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
@@ -70,17 +207,14 @@ class EjercicioController:
         
         Args:
             ejercicio_id: ID del ejercicio
-            
+        
         Returns:
             Dict con respuesta JSON
         """
         try:
-            ejercicio = self.ejercicio_service.obtener_ejercicio_por_id(ejercicio_id)
-            if ejercicio:
-                return jsonify({
-                    'success': True,
-                    'ejercicio': ejercicio.to_dict()
-                }), 200
+            listado = self.ejercicio_service.listado_ejercicio(ejercicio_id)
+            if listado:
+                return _respuesta_catalogo(listado)
             else:
                 return jsonify({'error': 'Ejercicio no encontrado'}), 404
         except Exception as e:
@@ -95,7 +229,7 @@ class EjercicioController:
         """
         try:
             # Verificar sesión
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if not paciente_data:
                 return jsonify({'error': 'No hay sesión activa'}), 401
             
@@ -110,7 +244,7 @@ class EjercicioController:
             puntuacion = data.get('puntuacion')
             observaciones = data.get('observaciones')
             nivel = data.get('nivel')
-
+            
             # Métricas médicas avanzadas
             precision = data.get('precision')
             velocidad_promedio = data.get('velocidad_promedio')
@@ -121,10 +255,15 @@ class EjercicioController:
             combo_maximo = data.get('combo_maximo')
             aciertos = data.get('aciertos')
             fallos = data.get('fallos')
-
+            intento_id = data.get('intento_id')
+            clave_idempotencia = data.get('clave_idempotencia') or intento_id
+            
             if not ejercicio_id:
                 return jsonify({'error': 'ID de ejercicio requerido'}), 400
-
+            if clave_idempotencia is not None and (not isinstance(clave_idempotencia, str)
+                                                   or len(clave_idempotencia) > LARGO_MAXIMO_CLAVE):
+                return jsonify({'error': 'clave_idempotencia inválida'}), 400
+            
             # Bug fix: session guarda to_dict_safe() sin 'password'; se inyecta vacío
             # para que el constructor de Paciente no falle por campo obligatorio.
             from ..models.paciente import Paciente
@@ -132,8 +271,12 @@ class EjercicioController:
             paciente = Paciente.from_dict(safe_data)
             
             # Registrar resultado con métricas avanzadas
-            resultado = self.ejercicio_service.registrar_resultado(
-                paciente, ejercicio_id, exito, tiempo_ejecucion, puntuacion, observaciones,
+            resultado, duplicado = self.ejercicio_service.registrar_resultados_lote(paciente, [dict(
+                ejercicio_id=ejercicio_id,
+                exito=exito,
+                tiempo_ejecucion=tiempo_ejecucion,
+                puntuacion=puntuacion,
+                observaciones=observaciones,
                 precision=precision,
                 velocidad_promedio=velocidad_promedio,
                 rango_movimiento=rango_movimiento,
@@ -143,28 +286,130 @@ class EjercicioController:
                 combo_maximo=combo_maximo,
                 aciertos=aciertos,
                 fallos=fallos,
-                nivel=nivel
-            )
+                nivel=nivel,
+                intento_id=intento_id,
+                clave_idempotencia=clave_idempotencia
+            )])[0]
+            if duplicado:
+                # Reintento de un resultado ya registrado: no se otorgan recompensas de nuevo
+                return jsonify({
+                    'success': True,
+                    'message': 'Resultado ya registrado',
+                    'duplicado': True,
+                    'resultado': resultado.to_dict(),
+                    'recompensas': None
+                }), 200
+            
+            # Las recompensas no deben impedir que el resultado quede registrado
+            try:
+                recompensas = self.gamificacion_service.registrar_ejercicio_paciente(
+                    paciente.id, tiempo_ejecucion, exito, resultado.precision
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudieron otorgar recompensas: {e}")
+                recompensas = None
             
             return jsonify({
                 'success': True,
                 'message': 'Resultado registrado exitosamente',
-                'resultado': resultado.to_dict()
+                'resultado': resultado.to_dict(),
+                'recompensas': recompensas
             }), 201
+        
+        except Exception as e:
+            return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
+    
+    def registrar_resultados_lote(self) -> Dict[str, Any]:
+        """
+        Registra un lote de resultados (clientes que los acumularon sin conexión)
+        
+        Cada resultado se valida por separado; los válidos se guardan con una
+        sola escritura al historial y sus recompensas con una sola
+        actualización. Un resultado con una ``clave_idempotencia`` (o
+        ``intento_id``) ya registrada se informa como duplicado sin guardarse
+        de nuevo.
+        
+        Returns:
+            Dict con respuesta JSON y el estado de cada resultado
+        """
+        try:
+            # Verificar sesión
+            paciente_data = obtener_datos_paciente()
+            if not paciente_data:
+                return jsonify({'error': 'No hay sesión activa'}), 401
+            
+            data = request.get_json(silent=True)
+            items = data.get('resultados') if isinstance(data, dict) else data
+            if not isinstance(items, list) or not items:
+                return jsonify({'error': 'Se esperaba una lista de resultados'}), 400
+            max_lote = current_app.config.get('RESULTADOS_MAX_LOTE', 100)
+            if len(items) > max_lote:
+                return jsonify({'error': f'El lote supera el máximo de {max_lote} resultados'}), 400
+            
+            estados = [None] * len(items)
+            validos = []
+            indices = []
+            for indice, item in enumerate(items):
+                datos, error = _leer_resultado_lote(item)
+                if error:
+                    estados[indice] = {'indice': indice, 'estado': 'invalido', 'error': error}
+                else:
+                    validos.append(datos)
+                    indices.append(indice)
             
+            from ..models.paciente import Paciente
+            safe_data = {**paciente_data, 'password': paciente_data.get('password', '')}
+            paciente = Paciente.from_dict(safe_data)
+            
+            guardados = self.ejercicio_service.registrar_resultados_lote(paciente, validos) if validos else []
+            nuevos = []
+            for indice, (resultado, duplicado) in zip(indices, guardados):
+                estados[indice] = {
+                    'indice': indice,
+                    'estado': 'duplicado' if duplicado else 'registrado',
+                    'clave_idempotencia': resultado.clave_idempotencia,
+                    'resultado': resultado.to_dict()
+                }
+                if not duplicado:
+                    nuevos.append(resultado)
+            
+            # Las recompensas no deben impedir que los resultados queden registrados
+            recompensas = None
+            if nuevos:
+                try:
+                    recompensas = self.gamificacion_service.registrar_ejercicios_paciente(
+                        paciente.id, [(r.tiempo_ejecucion, r.exito, r.precision) for r in nuevos]
+                    )
+                except Exception as e:
+                    print(f"⚠️ No se pudieron otorgar recompensas: {e}")
+            
+            return jsonify({
+                'success': True,
+                'registrados': len(nuevos),
+                'duplicados': len(guardados) - len(nuevos),
+                'invalidos': len(items) - len(guardados),
+                'resultados': estados,
+                'recompensas': recompensas
+            }), 200
+        
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
     def obtener_historial(self) -> Dict[str, Any]:
         """
-        Obtiene el historial de ejercicios del paciente actual
+        Obtiene una página del historial de ejercicios del paciente actual
+        
+        Del resultado más reciente al más antiguo. Parámetros de la consulta:
+        ``limit`` (tamaño de página), ``cursor`` (el ``siguiente`` de la
+        página anterior), ``since`` (fecha ISO mínima) y ``fields`` (campos
+        separados por coma; ``id`` siempre se incluye).
         
         Returns:
             Dict con respuesta JSON
         """
         try:
             # Verificar sesión
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if not paciente_data:
                 return jsonify({'error': 'No hay sesión activa'}), 401
             
@@ -172,13 +417,26 @@ class EjercicioController:
             if not paciente_id:
                 return jsonify({'error': 'ID de paciente no válido'}), 400
             
-            historial = self.paciente_service.obtener_historial_completo(paciente_id)
+            parametros, error = _leer_parametros_historial(request.args)
+            if error:
+                return jsonify({'error': error}), 400
+            
+            pagina = self.ejercicio_service.obtener_pagina_historial(
+                paciente_id, parametros['limite'], parametros['cursor'], parametros['desde']
+            )
+            campos = parametros['campos']
             
             return jsonify({
                 'success': True,
-                'historial': [r.to_dict() for r in historial]
+                'historial': [
+                    {campo: (id_registro if campo == 'id' else registro.get(campo)) for campo in campos}
+                    for id_registro, registro in pagina['registros']
+                ],
+                'siguiente': _codificar_cursor(pagina['siguiente']),
+                'total': pagina['total'],
+                'exitosos': pagina['exitosos']
             }), 200
-            
+        
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
@@ -188,13 +446,13 @@ class EjercicioController:
         
         Args:
             ejercicio_id: ID del ejercicio
-            
+        
         Returns:
             Dict con respuesta JSON
         """
         try:
             # Verificar sesión
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if not paciente_data:
                 return jsonify({'error': 'No hay sesión activa'}), 401
             
@@ -210,7 +468,7 @@ class EjercicioController:
                 'success': True,
                 'estadisticas': estadisticas
             }), 200
-            
+        
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
     
@@ -223,7 +481,7 @@ class EjercicioController:
         """
         try:
             # Verificar sesión
-            paciente_data = session.get('paciente')
+            paciente_data = obtener_datos_paciente()
             if not paciente_data:
                 return jsonify({'error': 'No hay sesión activa'}), 401
             
@@ -234,9 +492,11 @@ class EjercicioController:
             recomendacion = self.ejercicio_service.obtener_recomendacion_ejercicio(paciente_id)
             
             if recomendacion:
+                habilidad = self.ejercicio_service.obtener_habilidad(paciente_id)
                 return jsonify({
                     'success': True,
-                    'recomendacion': recomendacion.to_dict()
+                    'recomendacion': self.ejercicio_service.catalogo.a_dict(recomendacion.id),
+                    'habilidad': {e: h.to_dict() for e, h in habilidad.ejercicios.items()}
                 }), 200
             else:
                 return jsonify({
@@ -244,6 +504,48 @@ class EjercicioController:
                     'recomendacion': None,
                     'message': 'No hay recomendaciones disponibles'
                 }), 200
+        
+        except Exception as e:
+            return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
+    
+    def registrar_telemetria(self, intento_id: str) -> Dict[str, Any]:
+        """
+        Recibe un lote de muestras de movimiento del intento en curso
+        
+        La escritura se hace en segundo plano: la respuesta 202 solo confirma
+        que el lote es válido y quedó encolado.
+        
+        Args:
+            intento_id: ID del intento generado por el cliente
+        
+        Returns:
+            Dict con respuesta JSON
+        """
+        try:
+            # Verificar sesión
+            paciente_data = obtener_datos_paciente()
+            if not paciente_data:
+                return jsonify({'error': 'No hay sesión activa'}), 401
             
+            paciente_id = paciente_data.get('id')
+            if not paciente_id:
+                return jsonify({'error': 'ID de paciente no válido'}), 400
+            
+            try:
+                recibido = self.telemetria_service.registrar_lote(
+                    paciente_id, intento_id, request.get_json(silent=True)
+                )
+            except TelemetriaInvalida as e:
+                return jsonify({'error': str(e)}), 400
+            except TelemetriaSaturada as e:
+                return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+            
+            # El movimiento cuenta como actividad para las alertas de inactividad
+            alertas = current_app.extensions.get('alertas_sesiones')
+            if alertas is not None:
+                alertas.registrar_actividad(paciente_id)
+            
+            return jsonify({'success': True, **recibido}), 202
+        
         except Exception as e:
             return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
@@ -1,29 +1,21 @@
 """
 Controlador de Gamificación - Endpoints para sistema de puntos y logros
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, g, request, jsonify
 from app.services.gamificacion_service import GamificacionService
+from app.utils.autenticacion import obtener_paciente_id, requiere_paciente
 
 gamificacion_bp = Blueprint('gamificacion', __name__)
 gamif_service = GamificacionService()
 
 
-def _get_paciente_id():
-    """Obtiene el ID del paciente de la sesión activa. Retorna None si no hay sesión."""
-    paciente_data = session.get('paciente')
-    if not paciente_data:
-        return None
-    return paciente_data.get('id')
-
-
 @gamificacion_bp.route('/gamificacion', methods=['GET'])
+@requiere_paciente
 def obtener_gamificacion():
     """Obtiene el estado de gamificación del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
-    gamificacion = gamif_service.inicializar_gamificacion(paciente_id)
+    gamificacion = gamif_service.obtener_gamificacion(paciente_id)
     resumen = gamif_service.obtener_resumen_gamificacion(gamificacion)
 
     return jsonify({
@@ -44,26 +36,26 @@ def obtener_logros():
 
 
 @gamificacion_bp.route('/gamificacion/logros/paciente', methods=['GET'])
+@requiere_paciente
 def obtener_logros_paciente():
     """Obtiene los logros del paciente con su progreso"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
+
+    logros = gamif_service.obtener_logros_paciente(paciente_id)
 
     return jsonify({
         'success': True,
-        'logros': [],
-        'completados': 0,
+        'logros': logros,
+        'completados': sum(1 for logro in logros if logro['completado']),
         'total': len(gamif_service.obtener_todos_logros())
     })
 
 
 @gamificacion_bp.route('/gamificacion/objetivo-diario', methods=['GET'])
+@requiere_paciente
 def obtener_objetivo_diario():
     """Obtiene el objetivo diario del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     objetivo = gamif_service.crear_objetivo_diario(paciente_id)
 
@@ -77,9 +69,21 @@ def obtener_objetivo_diario():
 
 @gamificacion_bp.route('/gamificacion/ranking', methods=['GET'])
 def obtener_ranking():
-    """Obtiene el ranking de pacientes"""
-    return jsonify({
+    """Obtiene el ranking de pacientes (y la posición del paciente si hay sesión)"""
+    periodo = request.args.get('periodo', 'total')
+    if periodo not in GamificacionService.PERIODOS_RANKING:
+        return jsonify({'success': False, 'error': 'Período inválido'}), 400
+
+    limite = min(max(request.args.get('limite', 10, type=int), 1), 100)
+
+    respuesta = {
         'success': True,
-        'ranking': []
-    })
+        'periodo': periodo,
+        'ranking': gamif_service.obtener_ranking(limite, periodo)
+    }
+
+    paciente_id = obtener_paciente_id()
+    if paciente_id:
+        respuesta['mi_posicion'] = gamif_service.obtener_posicion_ranking(paciente_id, periodo=periodo)
 
+    return jsonify(respuesta)
@@ -1,91 +1,124 @@
 """
 Controlador de Reportes - Endpoints para generación y descarga de reportes
 """
-from flask import Blueprint, request, jsonify, session, make_response
+from flask import Blueprint, g, Response, request, jsonify
 from app.services.reporte_service import ReporteService
 from app.services.paciente_service import PacienteService
 from app.services.ejercicio_service import EjercicioService
+from app.models.sesion import SesionRepository
+from app.utils.autenticacion import requiere_paciente
 from datetime import datetime
 
 reporte_bp = Blueprint('reporte', __name__)
 reporte_service = ReporteService()
 paciente_service = PacienteService()
 ejercicio_service = EjercicioService()
+sesion_repo = SesionRepository()
 
 
-def _get_paciente_id():
-    """Obtiene el ID del paciente de la sesión activa. Retorna None si no hay sesión."""
-    paciente_data = session.get('paciente')
-    if not paciente_data:
-        return None
-    return paciente_data.get('id')
+def _respuesta_csv(contenido, prefijo: str) -> Response:
+    """Respuesta CSV que se envía al cliente a medida que se genera"""
+    response = Response(contenido, mimetype='text/csv')
+    response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename={prefijo}_{datetime.now().strftime("%Y%m%d")}.csv'
+    )
+    return response
+
+
+def _respuesta_reporte(paciente_id: str, tipo: str, parametros: dict, campo: str, generar):
+    """
+    Respuesta JSON de un reporte con ETag/Last-Modified
+
+    Si el cliente ya tiene la versión actual (If-None-Match) se responde 304
+    sin calcular nada; si no, el reporte sale de la cache o se genera.
+    """
+    version = ejercicio_service.version_historial(paciente_id)
+    etag = reporte_service.etag_reporte(paciente_id, tipo, parametros, version)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        reporte = reporte_service.obtener_reporte(paciente_id, tipo, parametros, etag, generar)
+        response = jsonify({'success': True, campo: reporte})
+
+    response.set_etag(etag)
+    response.last_modified = ejercicio_service.ultima_modificacion_historial(paciente_id)
+    # El navegador puede guardar la respuesta pero debe revalidarla en cada uso
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @reporte_bp.route('/reporte/ejercicios/csv', methods=['GET'])
+@requiere_paciente
 def descargar_reporte_ejercicios_csv():
     """Descarga un reporte CSV de ejercicios del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     paciente = paciente_service.obtener_paciente(str(paciente_id))
     paciente_nombre = paciente.nombre if paciente else "Paciente"
 
     historial = ejercicio_service.obtener_historial_paciente(str(paciente_id))
 
-    csv_content = reporte_service.generar_reporte_csv_ejercicios(historial, paciente_nombre)
+    csv_content = reporte_service.iterar_csv_ejercicios(historial, paciente_nombre)
 
-    response = make_response(csv_content)
-    response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-    response.headers['Content-Disposition'] = (
-        f'attachment; filename=reporte_ejercicios_{datetime.now().strftime("%Y%m%d")}.csv'
-    )
-
-    return response
+    return _respuesta_csv(csv_content, 'reporte_ejercicios')
 
 
 @reporte_bp.route('/reporte/sesiones/csv', methods=['GET'])
+@requiere_paciente
 def descargar_reporte_sesiones_csv():
     """Descarga un reporte CSV de sesiones del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
+
+    paciente = paciente_service.obtener_paciente(str(paciente_id))
+    paciente_nombre = paciente.nombre if paciente else "Paciente"
 
-    return jsonify({
-        'success': False,
-        'error': 'Funcionalidad en desarrollo'
-    }), 501
+    try:
+        # La consulta se ejecuta aquí; las filas se leen mientras se envía el CSV
+        sesiones = sesion_repo.iterar_sesiones(str(paciente_id))
+    except Exception as e:
+        return jsonify({'success': False, 'error': f'No se pudieron obtener las sesiones: {str(e)}'}), 503
+
+    # La conexión se libera al cerrar la respuesta, aunque el cliente se desconecte antes del primer bloque
+    cerrar = getattr(sesiones, 'close', None)
+    try:
+        csv_content = reporte_service.iterar_csv_sesiones(sesiones, paciente_nombre)
+        response = _respuesta_csv(csv_content, 'reporte_sesiones')
+    except Exception:
+        if cerrar:
+            cerrar()
+        raise
+    if cerrar:
+        response.call_on_close(cerrar)
+    return response
 
 
 @reporte_bp.route('/reporte/progreso', methods=['GET'])
+@requiere_paciente
 def obtener_analisis_progreso():
     """Obtiene un análisis de progreso del paciente"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
     periodo = request.args.get('periodo', 30, type=int)
 
-    historial = ejercicio_service.obtener_historial_paciente(str(paciente_id))
-    analisis = reporte_service.generar_analisis_progreso(historial, periodo)
+    def generar():
+        version = ejercicio_service.version_historial(str(paciente_id))
+        historial = ejercicio_service.obtener_historial_paciente(str(paciente_id))
+        return reporte_service.generar_analisis_progreso(historial, periodo, str(paciente_id), version)
 
-    return jsonify({
-        'success': True,
-        'analisis': analisis
-    })
+    return _respuesta_reporte(str(paciente_id), 'progreso', {'periodo': periodo}, 'analisis', generar)
 
 
 @reporte_bp.route('/reporte/comparativa-semanal', methods=['GET'])
+@requiere_paciente
 def obtener_comparativa_semanal():
     """Obtiene una comparativa semanal de resultados"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
+    paciente_id = g.paciente_id
 
-    historial = ejercicio_service.obtener_historial_paciente(str(paciente_id))
-    comparativa = reporte_service.generar_comparativa_semanal(historial)
+    def generar():
+        version = ejercicio_service.version_historial(str(paciente_id))
+        historial = ejercicio_service.obtener_historial_paciente(str(paciente_id))
+        return reporte_service.generar_comparativa_semanal(historial, str(paciente_id), version)
 
-    return jsonify({
-        'success': True,
-        'comparativa': comparativa
-    })
+    return _respuesta_reporte(str(paciente_id), 'comparativa_semanal', {}, 'comparativa', generar)
@@ -1,31 +1,34 @@
 """
 Controlador de Sesiones - Endpoints para gestión de sesiones de terapia
 """
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, current_app, g, request, jsonify
 from app.services.sesion_service import SesionService
 from app.services.configuracion_service import ConfiguracionService
-from app.models.sesion import TipoTerapia
+from app.models.sesion import SesionesActivas, TipoTerapia
+from app.utils.autenticacion import requiere_paciente
+from app.utils.eventos import canal_paciente, centro_eventos, flujo_sse
 
 sesion_bp = Blueprint('sesion', __name__)
 sesion_service = SesionService()
 config_service = ConfiguracionService()
+sesiones_activas = SesionesActivas()
 
 
-def _get_paciente_id():
-    """Obtiene el ID del paciente de la sesión activa. Retorna None si no hay sesión."""
-    paciente_data = session.get('paciente')
-    if not paciente_data:
-        return None
-    return paciente_data.get('id')
+def _sin_sesion_activa():
+    return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
+
+
+def _alertas():
+    """Programador de alertas de seguridad de la aplicación"""
+    return current_app.extensions['alertas_sesiones']
 
 
 @sesion_bp.route('/sesion/iniciar', methods=['POST'])
+@requiere_paciente
 def iniciar_sesion():
     """Inicia una nueva sesión de terapia"""
-    paciente_id = _get_paciente_id()
-    if not paciente_id:
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
-    data = request.get_json()
+    paciente_id = g.paciente_id
+    data = request.get_json() or {}
     
     tipo_terapia_str = data.get('tipo_terapia', 'rehabilitacion')
     try:
@@ -33,12 +36,15 @@ def iniciar_sesion():
     except ValueError:
         return jsonify({'success': False, 'error': 'Tipo de terapia inválido'}), 400
     
-    # Crear y iniciar sesión
-    nueva_sesion = sesion_service.crear_sesion(paciente_id, tipo_terapia)
+    # Crear y iniciar sesión; se guarda en BD con el próximo vaciado
+    config = config_service.obtener_configuracion(paciente_id)
+    nueva_sesion = sesion_service.crear_sesion(paciente_id, tipo_terapia, config.seguridad)
     resultado = sesion_service.iniciar_sesion(nueva_sesion)
+    _alertas().configurar(paciente_id, config.seguridad)
+    anterior = sesiones_activas.registrar(nueva_sesion)
     
-    # TODO: Guardar en BD
-    session['sesion_activa_id'] = nueva_sesion.id
+    if anterior is not None:
+        resultado['sesion_anterior_cancelada'] = True
     
     return jsonify({
         'success': True,
@@ -47,93 +53,66 @@ def iniciar_sesion():
 
 
 @sesion_bp.route('/sesion/calentamiento/completar', methods=['POST'])
+@requiere_paciente
 def completar_calentamiento():
     """Marca el calentamiento como completado"""
-    if not _get_paciente_id() or 'sesion_activa_id' not in session:
-        return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
-    
-    # TODO: Obtener sesión de BD
-    # Por ahora simular
+    resultado = sesiones_activas.aplicar(g.paciente_id, sesion_service.completar_calentamiento)
+    if resultado is None:
+        return _sin_sesion_activa()
     
-    return jsonify({
-        'success': True,
-        'calentamiento_completado': True,
-        'mensaje': '¡Excelente! Ahora puedes comenzar con los ejercicios'
-    })
+    return jsonify({'success': True, **resultado})
 
 
 @sesion_bp.route('/sesion/pausar', methods=['POST'])
+@requiere_paciente
 def pausar_sesion():
     """Pausa la sesión activa"""
-    if 'sesion_activa_id' not in session:
-        return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
-    
-    # TODO: Obtener y pausar sesión en BD
+    resultado = sesiones_activas.aplicar(g.paciente_id, sesion_service.pausar_sesion)
+    if resultado is None:
+        return _sin_sesion_activa()
     
-    return jsonify({
-        'success': True,
-        'sesion_pausada': True,
-        'mensaje': 'Toma un descanso. Presiona continuar cuando estés listo'
-    })
+    return jsonify({'success': True, **resultado})
 
 
 @sesion_bp.route('/sesion/reanudar', methods=['POST'])
+@requiere_paciente
 def reanudar_sesion():
     """Reanuda la sesión activa"""
-    if 'sesion_activa_id' not in session:
-        return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
-    
-    # TODO: Obtener y reanudar sesión en BD
+    resultado = sesiones_activas.aplicar(g.paciente_id, sesion_service.reanudar_sesion)
+    if resultado is None:
+        return _sin_sesion_activa()
     
-    return jsonify({
-        'success': True,
-        'sesion_reanudada': True,
-        'mensaje': '¡Continuemos!'
-    })
+    return jsonify({'success': True, **resultado})
 
 
 @sesion_bp.route('/sesion/enfriamiento/iniciar', methods=['POST'])
+@requiere_paciente
 def iniciar_enfriamiento():
     """Inicia la fase de enfriamiento"""
-    if 'sesion_activa_id' not in session:
-        return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
-    
-    # TODO: Obtener sesión de BD
+    resultado = sesiones_activas.aplicar(g.paciente_id, sesion_service.iniciar_enfriamiento)
+    if resultado is None:
+        return _sin_sesion_activa()
     
-    from app.models.sesion import EJERCICIOS_ENFRIAMIENTO
-    
-    return jsonify({
-        'success': True,
-        'enfriamiento_iniciado': True,
-        'ejercicios_enfriamiento': [e.to_dict() for e in EJERCICIOS_ENFRIAMIENTO],
-        'mensaje': 'Excelente trabajo. Realiza estos ejercicios de enfriamiento'
-    })
+    return jsonify({'success': True, **resultado})
 
 
 @sesion_bp.route('/sesion/enfriamiento/completar', methods=['POST'])
+@requiere_paciente
 def completar_enfriamiento():
     """Completa el enfriamiento y finaliza la sesión"""
-    if 'sesion_activa_id' not in session:
-        return jsonify({'success': False, 'error': 'No hay sesión activa'}), 400
-    
-    # TODO: Obtener sesión, completar enfriamiento y guardar en BD
-    session.pop('sesion_activa_id', None)
+    # Al terminar, la sesión se escribe en BD de inmediato
+    resultado = sesiones_activas.aplicar(g.paciente_id, sesion_service.completar_enfriamiento)
+    if resultado is None:
+        return _sin_sesion_activa()
     
-    return jsonify({
-        'success': True,
-        'enfriamiento_completado': True,
-        'sesion_finalizada': True,
-        'mensaje': '¡Sesión completada! Por favor responde la encuesta'
-    })
+    return jsonify({'success': True, **resultado})
 
 
 @sesion_bp.route('/sesion/encuesta', methods=['POST'])
+@requiere_paciente
 def registrar_encuesta():
     """Registra la encuesta post-sesión"""
-    if not _get_paciente_id():
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
-    
-    data = request.get_json()
+    data = request.get_json() or {}
     
     nivel_fatiga = data.get('nivel_fatiga')
     nivel_dolor = data.get('nivel_dolor')
@@ -142,48 +121,79 @@ def registrar_encuesta():
     if nivel_fatiga is None or nivel_dolor is None:
         return jsonify({'success': False, 'error': 'Datos incompletos'}), 400
     
-    # TODO: Registrar encuesta en BD
+    def registrar(sesion):
+        return sesion_service.registrar_encuesta_post_sesion(
+            sesion, nivel_fatiga, nivel_dolor, observaciones
+        )
     
-    # Generar recomendaciones
-    recomendaciones = []
-    if nivel_fatiga >= 4:
-        recomendaciones.append('Descansa más antes de la próxima sesión')
-        recomendaciones.append('Considera reducir la duración de las sesiones')
+    # La encuesta corresponde a la última sesión terminada del paciente
+    resultado = sesiones_activas.aplicar(g.paciente_id, registrar, finalizada=True)
+    if resultado is None:
+        return jsonify({'success': False, 'error': 'No hay una sesión terminada pendiente de encuesta'}), 400
     
-    if nivel_dolor >= 5:
-        recomendaciones.append('Consulta con tu terapeuta sobre el dolor')
-        recomendaciones.append('Reduce la intensidad de los ejercicios')
-    
-    if nivel_fatiga <= 2 and nivel_dolor <= 2:
-        recomendaciones.append('¡Excelente! Puedes aumentar gradualmente la dificultad')
+    return jsonify({'success': True, **resultado})
+
+
+@sesion_bp.route('/sesion/actividad', methods=['POST'])
+@requiere_paciente
+def registrar_actividad():
+    """Reporta actividad del paciente (reinicia el plazo de inactividad)"""
+    if not _alertas().registrar_actividad(g.paciente_id):
+        return _sin_sesion_activa()
     
-    return jsonify({
-        'success': True,
-        'encuesta_registrada': True,
-        'recomendaciones': recomendaciones
-    })
+    return jsonify({'success': True})
 
 
 @sesion_bp.route('/sesion/alertas', methods=['GET'])
+@requiere_paciente
 def verificar_alertas():
-    """Verifica y devuelve alertas de seguridad"""
-    if 'sesion_activa_id' not in session:
-        return jsonify({'success': True, 'alertas': []})
-    
-    # TODO: Implementar verificación de alertas basada en configuración
+    """Devuelve las alertas de seguridad vencidas desde la última consulta"""
+    alertas = _alertas().tomar_alertas(g.paciente_id)
     
     return jsonify({
         'success': True,
-        'alertas': []
+        'alertas': [alerta.to_dict() for alerta in alertas]
     })
 
 
+@sesion_bp.route('/sesion/eventos', methods=['GET'])
+@requiere_paciente
+def eventos_sesion():
+    """
+    Flujo Server-Sent Events de la sesión activa: cambios de estado ('estado'),
+    alertas de seguridad ('alerta') y recompensas ('recompensa')
+    
+    El flujo empieza con el estado actual y termina con el evento 'fin'
+    cuando la sesión se completa o se cancela.
+    """
+    paciente_id = g.paciente_id
+    
+    # Se suscribe antes de leer el estado para no perder un cambio intermedio
+    suscripcion = centro_eventos.suscribir(canal_paciente(paciente_id))
+    sesion = sesiones_activas.obtener(paciente_id)
+    if sesion is None:
+        centro_eventos.cancelar(suscripcion)
+        return _sin_sesion_activa()
+    
+    inicial = centro_eventos.evento('estado', sesion_service.obtener_resumen_sesion(sesion))
+    flujo = flujo_sse(
+        centro_eventos, suscripcion,
+        latido=current_app.config.get('EVENTOS_LATIDO', 15),
+        iniciales=[inicial],
+        tipos_finales=['fin']
+    )
+    
+    response = Response(flujo, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Evita que un proxy (nginx) acumule el flujo antes de enviarlo
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @sesion_bp.route('/sesion/historial', methods=['GET'])
+@requiere_paciente
 def obtener_historial_sesiones():
     """Obtiene el historial de sesiones del paciente"""
-    if not _get_paciente_id():
-        return jsonify({'success': False, 'error': 'No autenticado'}), 401
-    
     # TODO: Obtener de BD
     
     return jsonify({
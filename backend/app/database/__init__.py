@@ -1,4 +1,6 @@
-"""Paquete de base de datos — gestor MySQL con pool de conexiones."""
-from .mysql_manager import MySQLDatabaseService, PacienteManager, HistorialManager, SesionTerapiaManager
+"""Paquete de base de datos — gestor MySQL con pool de conexiones y journal de historial."""
+from .mysql_manager import MySQLDatabaseService, MySQLPoolRegistry, PacienteManager, HistorialManager, SesionTerapiaManager, GamificacionManager, LogroManager
+from .historial_journal import HistorialJournal
+from .telemetria_journal import TelemetriaJournal, EscritorTelemetria
 
-__all__ = ['MySQLDatabaseService', 'PacienteManager', 'HistorialManager', 'SesionTerapiaManager']
+__all__ = ['MySQLDatabaseService', 'MySQLPoolRegistry', 'PacienteManager', 'HistorialManager', 'SesionTerapiaManager', 'GamificacionManager', 'LogroManager', 'HistorialJournal', 'TelemetriaJournal', 'EscritorTelemetria']
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Journal de Historial de Ejercicios - Almacenamiento append-only (JSON Lines)
+Responsable de persistir los resultados de ejercicios escribiendo solo el registro nuevo
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from app.utils.agregacion import parse_fecha
+from app.utils.cache import CacheLRU
+
+logger = logging.getLogger(__name__)
+
+# Índices de líneas por journal: ruta -> IndiceHistorial
+_indices = CacheLRU(max_costo=32 * 1024 * 1024, nombre='historial-indices')
+
+# Costo estimado de un registro del índice en memoria
+_BYTES_ENTRADA_INDICE = 200
+
+
+def clave_fecha(fecha) -> str:
+    """
+    Fecha de un registro en ISO 8601 uniforme, para ordenar y comparar
+    
+    Los registros antiguos guardan 'YYYY-MM-DD HH:MM:SS' y los nuevos
+    'YYYY-MM-DDTHH:MM:SS': comparados como texto, los primeros quedan antes
+    que los segundos del mismo día. La zona horaria se descarta igual que en
+    los reportes; una fecha que no se puede interpretar queda como está.
+    """
+    if not fecha:
+        return ''
+    fecha = str(fecha)
+    interpretada = parse_fecha(fecha)
+    return interpretada.isoformat() if interpretada is not None else fecha
+
+
+class IndiceHistorial:
+    """
+    Posición en el archivo de cada registro del journal.
+    
+    El id de un registro es su posición (desde 1) en el historial, igual
+    que en ``leer``; ``claves`` son los pares (fecha, id) ordenados, con la
+    fecha normalizada por ``clave_fecha``.
+    ``idempotencia`` lleva cada clave de idempotencia al id del primer
+    registro que la usó.
+    """
+    
+    __slots__ = ('inodo', 'valido', 'posiciones', 'claves', 'exitosos', 'idempotencia')
+    
+    def __init__(self, inodo: Optional[int] = None):
+        self.inodo = inodo
+        # Bytes del archivo ya indexados (hasta la última línea completa)
+        self.valido = 0
+        self.posiciones: List[Tuple[int, int]] = []
+        self.claves: List[Tuple[str, int]] = []
+        self.exitosos = 0
+        self.idempotencia: Dict[str, int] = {}
+    
+    def agregar(self, offset: int, largo: int, registro: Dict):
+        self.posiciones.append((offset, largo))
+        # Los resultados se registran en orden de fecha: casi siempre se inserta al final
+        insort(self.claves, (clave_fecha(registro.get('fecha')), len(self.posiciones)))
+        if registro.get('exito'):
+            self.exitosos += 1
+        if registro.get('clave_idempotencia'):
+            self.idempotencia.setdefault(registro['clave_idempotencia'], len(self.posiciones))
+
+
+class HistorialJournal:
+    """
+    Journal append-only para el historial de ejercicios de cada paciente.
+    
+    Cada paciente tiene un archivo ``<paciente_id>.jsonl`` con un resultado por
+    línea. Registrar un resultado solo agrega una línea al final del archivo,
+    por lo que el costo no depende del tamaño del historial.
+    
+    Los archivos antiguos ``<paciente_id>.json`` (lista JSON completa) se siguen
+    leyendo de forma transparente hasta que se migran con ``migrar``.
+    """
+    
+    EXTENSION = '.jsonl'
+    EXTENSION_LEGACY = '.json'
+    EXTENSION_MIGRADO = '.json.migrado'
+    
+    # always: fsync en cada escritura | interval: como máximo cada N segundos | never: lo decide el SO
+    POLITICAS_FSYNC = ('always', 'interval', 'never')
+    
+    _locks: Dict[str, threading.RLock] = {}
+    _locks_guard = threading.Lock()
+    # Contador de escrituras por archivo dentro del proceso
+    _versiones: Dict[str, int] = {}
+    
+    def __init__(self, historial_path: str, fsync_policy: str = 'never', fsync_interval: float = 1.0):
+        if fsync_policy not in self.POLITICAS_FSYNC:
+            raise ValueError(f"Política de fsync inválida: {fsync_policy}")
+        self.historial_path = historial_path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self._ultimo_fsync: Dict[str, float] = {}
+    
+    def ruta_journal(self, paciente_id: str) -> str:
+        """Ruta del archivo journal (.jsonl) del paciente"""
+        return os.path.join(self.historial_path, f"{paciente_id}{self.EXTENSION}")
+    
+    def ruta_legacy(self, paciente_id: str) -> str:
+        """Ruta del archivo JSON antiguo del paciente"""
+        return os.path.join(self.historial_path, f"{paciente_id}{self.EXTENSION_LEGACY}")
+    
+    @classmethod
+    def _lock_para(cls, ruta: str) -> threading.RLock:
+        """Obtiene el lock del proceso asociado a un archivo"""
+        with cls._locks_guard:
+            lock = cls._locks.get(ruta)
+            if lock is None:
+                lock = cls._locks[ruta] = threading.RLock()
+            return lock
+    
+    @contextmanager
+    def bloqueo(self, paciente_id: str):
+        """Bloquea las escrituras del journal del paciente durante el bloque"""
+        with self._lock_para(self.ruta_journal(paciente_id)):
+            yield
+    
+    def version(self, paciente_id: str) -> int:
+        """Cantidad de escrituras hechas por este proceso sobre el historial del paciente"""
+        return self._versiones.get(self.ruta_journal(paciente_id), 0)
+    
+    def firma(self, paciente_id: str) -> Tuple[int, Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+        """
+        Firma del estado del historial: versión de escritura del proceso más
+        (mtime, tamaño) de los archivos, para detectar escrituras de otros procesos
+        """
+        return (
+            self.version(paciente_id),
+            self._stat(self.ruta_journal(paciente_id)),
+            self._stat(self.ruta_legacy(paciente_id))
+        )
+    
+    def ultima_modificacion(self, paciente_id: str) -> Optional[float]:
+        """Timestamp de la última modificación de los archivos del paciente (None si no existen)"""
+        stats = [
+            stat for stat in (self._stat(self.ruta_journal(paciente_id)), self._stat(self.ruta_legacy(paciente_id)))
+            if stat is not None
+        ]
+        return max(mtime_ns for mtime_ns, _ in stats) / 1e9 if stats else None
+    
+    @staticmethod
+    def _stat(ruta: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(ruta)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def _incrementar_version(self, ruta: str):
+        self._versiones[ruta] = self._versiones.get(ruta, 0) + 1
+    
+    def append(self, paciente_id: str, registro: Dict) -> None:
+        """Agrega un registro al final del journal del paciente"""
+        self.append_many(paciente_id, [registro])
+    
+    def append_many(self, paciente_id: str, registros: Iterable[Dict]) -> None:
+        """Agrega varios registros al journal con una sola escritura"""
+        lineas = ''.join(
+            json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n' for r in registros
+        )
+        if not lineas:
+            return
+        
+        os.makedirs(self.historial_path, exist_ok=True)
+        ruta = self.ruta_journal(paciente_id)
+        
+        with self._lock_para(ruta):
+            with open(ruta, 'a+b') as f:
+                # Si una escritura anterior quedó truncada, no se concatena con ella
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        lineas = '\n' + lineas
+                f.write(lineas.encode('utf-8'))
+                f.flush()
+                if self._debe_sincronizar(ruta):
+                    os.fsync(f.fileno())
+            self._incrementar_version(ruta)
+    
+    def _debe_sincronizar(self, ruta: str) -> bool:
+        """Decide si la escritura actual debe forzarse a disco según la política"""
+        if self.fsync_policy == 'always':
+            return True
+        if self.fsync_policy == 'never':
+            return False
+        
+        ahora = time.monotonic()
+        if ahora - self._ultimo_fsync.get(ruta, 0.0) >= self.fsync_interval:
+            self._ultimo_fsync[ruta] = ahora
+            return True
+        return False
+    
+    def leer(self, paciente_id: str) -> List[Dict]:
+        """Lee el historial completo del paciente (JSON antiguo + journal)"""
+        return self._leer_legacy(self.ruta_legacy(paciente_id)) + self._leer_journal(self.ruta_journal(paciente_id))
+    
+    @staticmethod
+    def _leer_legacy(ruta: str) -> List[Dict]:
+        """Lee un archivo de historial en el formato JSON antiguo"""
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                return data if isinstance(data, list) else []
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+    
+    @staticmethod
+    def _leer_journal(ruta: str) -> List[Dict]:
+        """Lee un journal JSON Lines ignorando líneas vacías o incompletas"""
+        registros = []
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                for numero, linea in enumerate(f, 1):
+                    linea = linea.strip()
+                    if not linea:
+                        continue
+                    try:
+                        registros.append(json.loads(linea))
+                    except json.JSONDecodeError:
+                        # Una escritura interrumpida deja la última línea truncada
+                        logger.warning(f"Línea {numero} inválida en {ruta}, se omite")
+        except FileNotFoundError:
+            pass
+        return registros
+    
+    def _indice(self, ruta: str) -> IndiceHistorial:
+        """
+        Índice del journal; solo se leen las líneas agregadas desde la última vez
+        
+        Se llama con el lock del archivo tomado: el índice cacheado se extiende en el lugar.
+        """
+        try:
+            stat = os.stat(ruta)
+        except FileNotFoundError:
+            return IndiceHistorial()
+        
+        indice = _indices.obtener(ruta)
+        if indice is None or indice.inodo != stat.st_ino or indice.valido > stat.st_size:
+            indice = IndiceHistorial(stat.st_ino)
+        elif indice.valido == stat.st_size:
+            return indice
+        
+        with open(ruta, 'rb') as f:
+            f.seek(indice.valido)
+            offset = indice.valido
+            for linea in f:
+                if not linea.endswith(b'\n'):
+                    # Escritura en curso de otro proceso: se indexa cuando termine la línea
+                    break
+                try:
+                    registro = json.loads(linea) if linea.strip() else None
+                except ValueError:
+                    # Igual que en _leer_journal, las líneas inválidas no son registros
+                    registro = None
+                if isinstance(registro, dict):
+                    indice.agregar(offset, len(linea), registro)
+                offset += len(linea)
+            indice.valido = offset
+        
+        _indices.guardar(ruta, indice, costo=len(indice.posiciones) * _BYTES_ENTRADA_INDICE)
+        return indice
+    
+    def pagina(self, paciente_id: str, limite: int, cursor: Optional[Tuple[str, int]] = None,
+               desde: Optional[str] = None) -> Dict:
+        """
+        Página del historial de la más reciente a la más antigua, por clave (fecha, id)
+        
+        Solo se decodifican las líneas de la página: el índice de posiciones
+        se arma una vez por proceso y luego se extiende con las líneas nuevas.
+        Un historial que todavía tiene el JSON antiguo se lee completo.
+        
+        Args:
+            paciente_id: ID del paciente
+            limite: Cantidad máxima de registros
+            cursor: (fecha, id) del último registro de la página anterior
+            desde: Solo registros con fecha ISO >= desde
+        
+        Returns:
+            Dict con 'registros' (lista de (id, registro)), 'siguiente' (cursor
+            de la página siguiente o None), 'total' y 'exitosos' del historial
+        """
+        ruta = self.ruta_journal(paciente_id)
+        with self._lock_para(ruta):
+            if os.path.exists(self.ruta_legacy(paciente_id)):
+                registros = self.leer(paciente_id)
+                claves = sorted((clave_fecha(r.get('fecha')), i) for i, r in enumerate(registros, 1))
+                ids, siguiente = self._seleccionar(claves, limite, cursor, desde)
+                return {
+                    'registros': [(i, registros[i - 1]) for i in ids],
+                    'siguiente': siguiente,
+                    'total': len(registros),
+                    'exitosos': sum(1 for r in registros if r.get('exito'))
+                }
+            
+            indice = self._indice(ruta)
+            ids, siguiente = self._seleccionar(indice.claves, limite, cursor, desde)
+            pagina = []
+            if ids:
+                with open(ruta, 'rb') as f:
+                    for i in ids:
+                        offset, largo = indice.posiciones[i - 1]
+                        f.seek(offset)
+                        pagina.append((i, json.loads(f.read(largo))))
+            return {
+                'registros': pagina,
+                'siguiente': siguiente,
+                'total': len(indice.posiciones),
+                'exitosos': indice.exitosos
+            }
+    
+    def buscar_claves(self, paciente_id: str, claves: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Registros ya guardados con alguna de las claves de idempotencia
+        
+        Usa el mismo índice que ``pagina``: después de una escritura (de este
+        u otro proceso) solo se indexan las líneas nuevas y se decodifican
+        únicamente los registros encontrados. Un historial que todavía tiene
+        el JSON antiguo se lee completo.
+        
+        Returns:
+            Dict: clave -> primer registro guardado con esa clave
+        """
+        claves = set(claves)
+        if not claves:
+            return {}
+        
+        ruta = self.ruta_journal(paciente_id)
+        with self._lock_para(ruta):
+            if os.path.exists(self.ruta_legacy(paciente_id)):
+                encontrados = {}
+                for registro in self.leer(paciente_id):
+                    clave = registro.get('clave_idempotencia')
+                    if clave in claves:
+                        encontrados.setdefault(clave, registro)
+                return encontrados
+            
+            indice = self._indice(ruta)
+            ids = {clave: indice.idempotencia[clave] for clave in claves if clave in indice.idempotencia}
+            encontrados = {}
+            if ids:
+                with open(ruta, 'rb') as f:
+                    for clave, i in ids.items():
+                        offset, largo = indice.posiciones[i - 1]
+                        f.seek(offset)
+                        encontrados[clave] = json.loads(f.read(largo))
+            return encontrados
+    
+    @staticmethod
+    def _seleccionar(claves: List[Tuple[str, int]], limite: int, cursor: Optional[Tuple[str, int]],
+                     desde: Optional[str]) -> Tuple[List[int], Optional[Tuple[str, int]]]:
+        """Ids de la página (descendente) sobre las claves ordenadas y el cursor de la siguiente"""
+        fin = bisect_left(claves, (clave_fecha(cursor[0]), cursor[1])) if cursor is not None else len(claves)
+        inicio_filtro = bisect_left(claves, (clave_fecha(desde),)) if desde is not None else 0
+        inicio = max(inicio_filtro, fin - limite)
+        seleccion = claves[inicio:fin]
+        siguiente = seleccion[0] if seleccion and inicio > inicio_filtro else None
+        return [i for _, i in reversed(seleccion)], siguiente
+    
+    def migrar(self, paciente_id: str) -> int:
+        """
+        Migra el historial JSON antiguo de un paciente al formato journal
+        
+        Returns:
+            int: Cantidad de registros migrados (0 si no había archivo antiguo)
+        """
+        ruta_legacy = self.ruta_legacy(paciente_id)
+        ruta_journal = self.ruta_journal(paciente_id)
+        
+        with self._lock_para(ruta_journal):
+            if not os.path.exists(ruta_legacy):
+                return 0
+            
+            registros = self._leer_legacy(ruta_legacy) + self._leer_journal(ruta_journal)
+            self._reescribir(paciente_id, registros)
+        
+        logger.info(f"Historial de '{paciente_id}' migrado a journal ({len(registros)} registros)")
+        return len(registros)
+    
+    def reemplazar(self, paciente_id: str, registros: List[Dict]) -> None:
+        """
+        Reescribe el historial completo del paciente con ``registros``
+        
+        Para correcciones en lote (por ejemplo métricas recalculadas); quien
+        llama debe haber leído los registros bajo ``bloqueo``.
+        """
+        with self._lock_para(self.ruta_journal(paciente_id)):
+            self._reescribir(paciente_id, registros)
+    
+    def _reescribir(self, paciente_id: str, registros: List[Dict]) -> None:
+        """Reemplaza el journal de forma atómica; el JSON antiguo, si existe, queda como migrado"""
+        os.makedirs(self.historial_path, exist_ok=True)
+        ruta_journal = self.ruta_journal(paciente_id)
+        ruta_legacy = self.ruta_legacy(paciente_id)
+        # Temporal propio en el mismo directorio: el lock solo ordena los hilos
+        # de este proceso, y otro proceso que reescriba al mismo paciente no
+        # puede escribir sobre este archivo antes del os.replace
+        descriptor, temporal = tempfile.mkstemp(
+            dir=self.historial_path, prefix=f"{paciente_id}.", suffix='.tmp'
+        )
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                for registro in registros:
+                    f.write(json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta_journal)
+        except BaseException:
+            try:
+                os.unlink(temporal)
+            except OSError:
+                pass
+            raise
+        
+        _indices.invalidar(ruta_journal)
+        if os.path.exists(ruta_legacy):
+            # Se conserva una copia del archivo original en lugar de borrarlo
+            try:
+                os.replace(ruta_legacy, ruta_legacy[:-len(self.EXTENSION_LEGACY)] + self.EXTENSION_MIGRADO)
+            except FileNotFoundError:
+                # Otro proceso migró al mismo paciente a la vez
+                pass
+        self._incrementar_version(ruta_journal)
+    
+    def migrar_todos(self) -> Dict[str, int]:
+        """Migra todos los historiales JSON antiguos del directorio"""
+        if not os.path.isdir(self.historial_path):
+            return {}
+        
+        migrados = {}
+        for nombre in sorted(os.listdir(self.historial_path)):
+            if nombre.endswith(self.EXTENSION_LEGACY):
+                paciente_id = nombre[:-len(self.EXTENSION_LEGACY)]
+                migrados[paciente_id] = self.migrar(paciente_id)
+        return migrados
+
+
+if __name__ == '__main__':
+    # Uso: python -m app.database.historial_journal [ruta_historial]
+    logging.basicConfig(level=logging.INFO)
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from config.settings import get_database_config
+    
+    ruta = sys.argv[1] if len(sys.argv) > 1 else get_database_config()['historial_path']
+    resultado = HistorialJournal(ruta, fsync_policy='always').migrar_todos()
+    print(f"Historiales migrados: {len(resultado)} ({sum(resultado.values())} registros)")
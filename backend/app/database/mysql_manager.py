@@ -8,13 +8,14 @@ Fecha: 2024
 import mysql.connector
 import os
 import sys
-from datetime import datetime
-from typing import List, Dict, Optional, Tuple, Any
+from datetime import date, datetime
+from typing import Callable, List, Dict, Iterator, Optional, Tuple, Any
 import hashlib
 import json
+import threading
 import uuid
-from contextlib import contextmanager
-from mysql.connector import pooling
+from contextlib import contextmanager, ExitStack
+from mysql.connector import pooling, errorcode
 import logging
 
 # Agregar el directorio raíz al path para importar configuraciones
@@ -26,27 +27,109 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class MySQLPoolRegistry:
+    """
+    Registro de pools de conexiones compartido por todo el proceso.
+    
+    Cada configuración (host, puerto, usuario, base de datos) tiene un único
+    pool, sin importar cuántos gestores o repositorios se instancien.
+    """
+    
+    _pools: Dict[Tuple, pooling.MySQLConnectionPool] = {}
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def clave(config: Dict[str, Any]) -> Tuple:
+        """Clave del registro para una configuración"""
+        return (config['host'], config['port'], config['user'], config['database'], config.get('charset'))
+    
+    @classmethod
+    def obtener_pool(cls, config: Dict[str, Any]) -> pooling.MySQLConnectionPool:
+        """Obtiene el pool de la configuración, creándolo la primera vez"""
+        clave = cls.clave(config)
+        pool = cls._pools.get(clave)
+        if pool is not None:
+            return pool
+        
+        with cls._lock:
+            pool = cls._pools.get(clave)
+            if pool is None:
+                pool = cls._crear_pool(config, f"rehabilitacion_pool_{len(cls._pools)}")
+                cls._pools[clave] = pool
+        return pool
+    
+    @classmethod
+    def _crear_pool(cls, config: Dict[str, Any], pool_name: str) -> pooling.MySQLConnectionPool:
+        """Crea un pool, creando antes la base de datos si todavía no existe"""
+        parametros = {k: v for k, v in config.items() if k not in ['pool_size', 'pool_recycle']}
+        try:
+            pool = cls._nuevo_pool(parametros, pool_name, config.get('pool_size', 5))
+        except mysql.connector.Error as e:
+            if e.errno != errorcode.ER_BAD_DB_ERROR:
+                logger.error(f"Error al crear pool de conexiones: {e}")
+                raise
+            cls._ensure_database_exists(config)
+            pool = cls._nuevo_pool(parametros, pool_name, config.get('pool_size', 5))
+        
+        logger.info("Pool de conexiones MySQL creado exitosamente")
+        return pool
+    
+    @staticmethod
+    def _nuevo_pool(parametros: Dict[str, Any], pool_name: str, pool_size: int) -> pooling.MySQLConnectionPool:
+        return mysql.connector.pooling.MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=pool_size,
+            pool_reset_session=True,
+            **parametros
+        )
+    
+    @staticmethod
+    def _ensure_database_exists(config: Dict[str, Any]):
+        """Asegura que la base de datos existe"""
+        try:
+            # Conectar sin especificar base de datos
+            connection = mysql.connector.connect(
+                host=config['host'],
+                port=config['port'],
+                user=config['user'],
+                password=config['password']
+            )
+            cursor = connection.cursor()
+            
+            # Crear base de datos si no existe
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{config['database']}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
+            logger.info(f"Base de datos '{config['database']}' verificada/creada")
+            
+            cursor.close()
+            connection.close()
+        except Exception as e:
+            logger.error(f"Error al verificar base de datos: {e}")
+            raise
+    
+    @classmethod
+    def total_pools(cls) -> int:
+        """Cantidad de pools abiertos en el proceso"""
+        return len(cls._pools)
+    
+    @classmethod
+    def limpiar(cls):
+        """Olvida los pools registrados (útil en pruebas o al cambiar de configuración)"""
+        with cls._lock:
+            cls._pools.clear()
+
+
 class MySQLConnectionManager:
-    """Gestor de conexiones MySQL con pool de conexiones"""
+    """Gestor de conexiones MySQL sobre el pool compartido del proceso"""
     
     def __init__(self):
         self.config = get_mysql_config()
+        self.clave = MySQLPoolRegistry.clave(self.config)
         self.connection_pool = None
         self._create_connection_pool()
     
     def _create_connection_pool(self):
-        """Crea el pool de conexiones"""
-        try:
-            self.connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-                pool_name="rehabilitacion_pool",
-                pool_size=self.config.get('pool_size', 5),
-                pool_reset_session=True,
-                **{k: v for k, v in self.config.items() if k not in ['pool_size', 'pool_recycle']}
-            )
-            logger.info("Pool de conexiones MySQL creado exitosamente")
-        except Exception as e:
-            logger.error(f"Error al crear pool de conexiones: {e}")
-            raise
+        """Obtiene el pool de conexiones compartido"""
+        self.connection_pool = MySQLPoolRegistry.obtener_pool(self.config)
     
     @contextmanager
     def get_connection(self):
@@ -63,39 +146,146 @@ class MySQLConnectionManager:
         finally:
             if connection:
                 connection.close()
+    
+    @contextmanager
+    def transaccion(self):
+        """
+        Obtiene una conexión del pool dentro de una transacción explícita:
+        commit al salir del bloque y rollback si hay un error
+        
+        El pool trabaja en autocommit, así que fuera de una transacción cada
+        sentencia se confirma sola y los bloqueos de fila se liberan enseguida.
+        """
+        with self.get_connection() as connection:
+            connection.start_transaction()
+            try:
+                yield connection
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
 
 
 class MySQLDatabaseManager:
     """Gestor principal de la base de datos MySQL"""
     
+    # Incrementar cuando cambie el esquema para que se vuelva a aplicar una vez
+    SCHEMA_VERSION = 4
+    
+    # Cambios sobre tablas ya existentes, por versión del esquema. Las tablas nuevas
+    # ya se crean con estos cambios: las columnas o índices duplicados se ignoran.
+    MIGRACIONES = {
+        2: [
+            "ALTER TABLE sesiones_terapia ADD COLUMN `estado` varchar(20) DEFAULT NULL",
+            "ALTER TABLE sesiones_terapia ADD KEY `idx_sesiones_estado` (`estado`)"
+        ],
+        3: [
+            "ALTER TABLE historial_ejercicios ADD KEY `idx_historial_paciente_fecha` (`paciente_id`, `fecha_ejercicio`, `id`)"
+        ],
+        # El valor de cada métrica parte del mejor progreso ya guardado por logro,
+        # así los logros completados no se vuelven a cruzar
+        4: [
+            """
+            INSERT IGNORE INTO metricas_logros_pacientes (paciente_id, metrica, valor)
+            SELECT lp.paciente_id, l.tipo, MAX(lp.progreso_actual)
+            FROM logros_pacientes lp
+            JOIN logros l ON l.id = lp.logro_id
+            WHERE l.tipo IN ('sesiones', 'precision', 'racha')
+            GROUP BY lp.paciente_id, l.tipo
+            """,
+            """
+            INSERT IGNORE INTO metricas_logros_pacientes (paciente_id, metrica, valor)
+            SELECT lp.paciente_id, 'duracion', MIN(lp.progreso_actual)
+            FROM logros_pacientes lp
+            JOIN logros l ON l.id = lp.logro_id
+            WHERE l.codigo = 'velocista'
+            GROUP BY lp.paciente_id
+            """
+        ]
+    }
+    
+    _schemas_listos = set()
+    _schema_lock = threading.Lock()
+    
     def __init__(self):
         self.connection_manager = MySQLConnectionManager()
-        self._ensure_database_exists()
-        self._create_tables()
+        self._inicializar_schema()
     
-    def _ensure_database_exists(self):
-        """Asegura que la base de datos existe"""
-        config = get_mysql_config()
-        try:
-            # Conectar sin especificar base de datos
-            connection = mysql.connector.connect(
-                host=config['host'],
-                port=config['port'],
-                user=config['user'],
-                password=config['password']
-            )
-            cursor = connection.cursor()
+    def _inicializar_schema(self):
+        """Crea las tablas una sola vez por proceso y solo si la versión guardada es anterior"""
+        clave = self.connection_manager.clave
+        if clave in MySQLDatabaseManager._schemas_listos:
+            return
+        
+        with MySQLDatabaseManager._schema_lock:
+            if clave in MySQLDatabaseManager._schemas_listos:
+                return
             
-            # Crear base de datos si no existe
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{config['database']}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-            logger.info(f"Base de datos '{config['database']}' verificada/creada")
+            version = self._obtener_version_schema()
+            if version < self.SCHEMA_VERSION:
+                self._create_tables()
+                self._aplicar_migraciones(version)
+                self._registrar_version_schema()
+            else:
+                logger.info(f"Esquema MySQL en versión {version}, se omite la creación de tablas")
             
-            cursor.close()
-            connection.close()
-        except Exception as e:
-            logger.error(f"Error al verificar base de datos: {e}")
+            MySQLDatabaseManager._schemas_listos.add(clave)
+    
+    def _obtener_version_schema(self) -> int:
+        """Obtiene la versión del esquema registrada en la base de datos (0 si no existe)"""
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT version FROM schema_version WHERE id = 1")
+                fila = cursor.fetchone()
+                cursor.close()
+                return int(fila[0]) if fila else 0
+        except mysql.connector.Error as e:
+            if e.errno == errorcode.ER_NO_SUCH_TABLE:
+                return 0
             raise
     
+    def _aplicar_migraciones(self, version: int):
+        """Aplica los cambios de las versiones posteriores a la guardada"""
+        pendientes = [
+            sql for numero in sorted(self.MIGRACIONES) if numero > version
+            for sql in self.MIGRACIONES[numero]
+        ]
+        if not pendientes:
+            return
+        
+        with self.connection_manager.get_connection() as connection:
+            cursor = connection.cursor()
+            for sql in pendientes:
+                try:
+                    cursor.execute(sql)
+                except mysql.connector.Error as e:
+                    if e.errno not in (errorcode.ER_DUP_FIELDNAME, errorcode.ER_DUP_KEYNAME):
+                        raise
+            connection.commit()
+            cursor.close()
+    
+    def _registrar_version_schema(self):
+        """Guarda la versión actual del esquema"""
+        with self.connection_manager.get_connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS `schema_version` (
+                    `id` tinyint(1) NOT NULL DEFAULT 1,
+                    `version` int(11) NOT NULL,
+                    `fecha_actualizacion` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (`id`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            cursor.execute(
+                "INSERT INTO schema_version (id, version) VALUES (1, %s) "
+                "ON DUPLICATE KEY UPDATE version = VALUES(version)",
+                (self.SCHEMA_VERSION,)
+            )
+            connection.commit()
+            cursor.close()
+        logger.info(f"Esquema MySQL actualizado a la versión {self.SCHEMA_VERSION}")
+    
     def _create_tables(self):
         """Crea las tablas necesarias"""
         tables_sql = {
@@ -153,6 +343,7 @@ class MySQLDatabaseManager:
                     PRIMARY KEY (`id`),
                     KEY `fk_historial_paciente` (`paciente_id`),
                     KEY `idx_fecha_ejercicio` (`fecha_ejercicio`),
+                    KEY `idx_historial_paciente_fecha` (`paciente_id`, `fecha_ejercicio`, `id`),
                     CONSTRAINT `fk_historial_paciente` FOREIGN KEY (`paciente_id`) REFERENCES `pacientes` (`id`) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """,
@@ -173,9 +364,11 @@ class MySQLDatabaseManager:
                     `nivel_dolor` int(1) DEFAULT NULL,
                     `alertas_descanso` int(3) DEFAULT 0,
                     `pausas_tomadas` int(3) DEFAULT 0,
+                    `estado` varchar(20) DEFAULT NULL,
                     PRIMARY KEY (`id`),
                     KEY `fk_sesiones_paciente` (`paciente_id`),
                     KEY `idx_fecha_sesion` (`fecha_sesion`),
+                    KEY `idx_sesiones_estado` (`estado`),
                     CONSTRAINT `fk_sesiones_paciente` FOREIGN KEY (`paciente_id`) REFERENCES `pacientes` (`id`) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """,
@@ -229,6 +422,17 @@ class MySQLDatabaseManager:
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """,
             
+            'metricas_logros_pacientes': """
+                CREATE TABLE IF NOT EXISTS `metricas_logros_pacientes` (
+                    `paciente_id` int(11) NOT NULL,
+                    `metrica` varchar(30) NOT NULL,
+                    `valor` double NOT NULL,
+                    `valor_anterior` double DEFAULT NULL,
+                    PRIMARY KEY (`paciente_id`, `metrica`),
+                    CONSTRAINT `fk_metricas_logros_paciente` FOREIGN KEY (`paciente_id`) REFERENCES `pacientes` (`id`) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """,
+            
             'objetivos_diarios': """
                 CREATE TABLE IF NOT EXISTS `objetivos_diarios` (
                     `id` int(11) NOT NULL AUTO_INCREMENT,
@@ -356,6 +560,23 @@ class PacienteManager(MySQLDatabaseManager):
             logger.error(f"Error al obtener paciente: {e}")
             raise
     
+    def obtener_paciente_por_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Obtiene un paciente por email (usa el índice único uk_email)"""
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                
+                sql = "SELECT * FROM pacientes WHERE email = %s AND activo = 1"
+                cursor.execute(sql, (email.lower(),))
+                
+                paciente = cursor.fetchone()
+                cursor.close()
+                
+                return paciente
+        except Exception as e:
+            logger.error(f"Error al obtener paciente por email: {e}")
+            raise
+    
     def obtener_todos_pacientes(self) -> List[Dict[str, Any]]:
         """Obtiene todos los pacientes activos"""
         try:
@@ -456,6 +677,26 @@ class HistorialManager(MySQLDatabaseManager):
 class SesionTerapiaManager(MySQLDatabaseManager):
     """Gestor específico para sesiones de terapia"""
     
+    # Columnas que cambian durante la sesión; las fechas y el tipo se fijan al crearla
+    _COLUMNAS_ESTADO = (
+        'duracion_minutos', 'observaciones', 'fecha_inicio', 'fecha_fin',
+        'calentamiento_completado', 'enfriamiento_completado', 'nivel_fatiga',
+        'nivel_dolor', 'alertas_descanso', 'pausas_tomadas', 'estado'
+    )
+    
+    _SQL_INSERTAR = f"""
+        INSERT INTO sesiones_terapia
+            (paciente_id, fecha_sesion, tipo_terapia, {', '.join(_COLUMNAS_ESTADO)})
+        VALUES (%(paciente_id)s, %(fecha_sesion)s, %(tipo_terapia)s,
+                {', '.join(f'%({columna})s' for columna in _COLUMNAS_ESTADO)})
+    """
+    
+    _SQL_ACTUALIZAR = f"""
+        UPDATE sesiones_terapia SET
+            {', '.join(f'{columna} = %({columna})s' for columna in _COLUMNAS_ESTADO)}
+        WHERE id = %(id)s
+    """
+    
     def crear_sesion(self, paciente_id: int, duracion_minutos: int, 
                     tipo_terapia: str, observaciones: str = None) -> Dict[str, Any]:
         """Crea una nueva sesión de terapia"""
@@ -511,6 +752,440 @@ class SesionTerapiaManager(MySQLDatabaseManager):
         except Exception as e:
             logger.error(f"Error al obtener sesiones: {e}")
             raise
+    
+    def guardar_sesiones(self, nuevas: List[Dict[str, Any]],
+                         actualizadas: List[Dict[str, Any]]) -> List[int]:
+        """
+        Inserta y actualiza un lote de sesiones en una sola transacción
+        
+        Las actualizaciones se envían con un solo executemany; las inserciones
+        van una por una para conocer el id de cada sesión. Si algo falla no
+        queda nada escrito, así que el lote completo se puede reintentar sin
+        duplicar sesiones.
+        
+        Returns:
+            List[int]: ids asignados a ``nuevas``, en el mismo orden
+        """
+        if not nuevas and not actualizadas:
+            return []
+        try:
+            with self.connection_manager.transaccion() as connection:
+                cursor = connection.cursor()
+                try:
+                    ids = []
+                    for registro in nuevas:
+                        cursor.execute(self._SQL_INSERTAR, registro)
+                        ids.append(cursor.lastrowid)
+                    if actualizadas:
+                        cursor.executemany(self._SQL_ACTUALIZAR, actualizadas)
+                finally:
+                    cursor.close()
+                return ids
+        except Exception as e:
+            logger.error(f"Error al guardar sesiones: {e}")
+            raise
+    
+    def obtener_sesiones_en_estado(self, estados: List[str]) -> List[Dict[str, Any]]:
+        """Obtiene las sesiones de todos los pacientes que están en alguno de los estados"""
+        if not estados:
+            return []
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                
+                marcadores = ', '.join(['%s'] * len(estados))
+                sql = f"""
+                    SELECT * FROM sesiones_terapia 
+                    WHERE estado IN ({marcadores})
+                    ORDER BY fecha_sesion
+                """
+                cursor.execute(sql, tuple(estados))
+                
+                sesiones = cursor.fetchall()
+                cursor.close()
+                
+                return sesiones
+        except Exception as e:
+            logger.error(f"Error al obtener sesiones por estado: {e}")
+            raise
+    
+    def iterar_sesiones_paciente(self, paciente_id: int, tamano_lote: int = 500,
+                                 convertir: Optional[Callable[[Dict[str, Any]], Any]] = None) -> 'FilasCursor':
+        """
+        Recorre todas las sesiones de un paciente con un cursor sin buffer
+        
+        Las filas se leen del servidor en lotes de ``tamano_lote`` a medida que
+        se consumen, sin cargar el resultado completo en memoria. La consulta
+        se ejecuta al llamar al método (los errores de conexión se lanzan aquí).
+        La conexión vuelve al pool cuando el iterador se agota o se cierra con
+        ``close``, aunque nunca se haya empezado a recorrer.
+        """
+        pila = ExitStack()
+        try:
+            connection = pila.enter_context(self.connection_manager.get_connection())
+            cursor = connection.cursor(dictionary=True, buffered=False)
+            pila.callback(cursor.close)
+            
+            sql = """
+                SELECT * FROM sesiones_terapia 
+                WHERE paciente_id = %s 
+                ORDER BY fecha_sesion DESC
+            """
+            cursor.execute(sql, (paciente_id,))
+        except Exception as e:
+            pila.close()
+            logger.error(f"Error al obtener sesiones: {e}")
+            raise
+        
+        return FilasCursor(cursor, pila, tamano_lote, convertir)
+
+
+class FilasCursor:
+    """
+    Iterador sobre las filas de un cursor sin buffer que es dueño de su conexión.
+    
+    ``close`` descarta las filas que falten leer y devuelve la conexión al
+    pool; se llama solo al agotarse o fallar la lectura, y se puede llamar
+    sin haber empezado a iterar (por ejemplo si la respuesta que lo iba a
+    recorrer nunca se envía). Como respaldo también se cierra al recolectarse.
+    """
+    
+    def __init__(self, cursor, pila: ExitStack, tamano_lote: int,
+                 convertir: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self._cursor = cursor
+        self._pila: Optional[ExitStack] = pila
+        self._tamano_lote = tamano_lote
+        self._convertir = convertir
+        self._lote: Iterator[Dict[str, Any]] = iter(())
+        self._agotado = False
+    
+    def __iter__(self) -> 'FilasCursor':
+        return self
+    
+    def __next__(self):
+        while True:
+            fila = next(self._lote, None)
+            if fila is not None:
+                return self._convertir(fila) if self._convertir else fila
+            if self._pila is None:
+                raise StopIteration
+            try:
+                filas = self._cursor.fetchmany(self._tamano_lote)
+            except Exception:
+                self._agotado = True
+                self.close()
+                raise
+            if not filas:
+                self._agotado = True
+                self.close()
+                raise StopIteration
+            self._lote = iter(filas)
+    
+    def close(self):
+        """Libera la conexión; las filas pendientes se descartan para devolverla limpia"""
+        pila, self._pila = self._pila, None
+        if pila is None:
+            return
+        with pila:
+            if not self._agotado:
+                while self._cursor.fetchmany(self._tamano_lote):
+                    pass
+    
+    def __enter__(self) -> 'FilasCursor':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __del__(self):
+        self.close()
+
+
+class GamificacionManager(MySQLDatabaseManager):
+    """Gestor específico para la gamificación de los pacientes"""
+    
+    # Suma puntos y experiencia y actualiza la racha en una sola sentencia atómica.
+    # Crea la fila si el paciente todavía no tiene gamificación. Las asignaciones
+    # se evalúan de izquierda a derecha: la racha usa la ultima_actividad anterior.
+    _SQL_RECOMPENSA = """
+        INSERT INTO gamificacion_pacientes
+            (paciente_id, puntos_totales, experiencia_actual, racha_dias, ultima_actividad)
+        VALUES (%(paciente_id)s, %(puntos)s, %(experiencia)s,
+                IF(%(actividad)s, 1, 0), IF(%(actividad)s, %(hoy)s, NULL))
+        ON DUPLICATE KEY UPDATE
+            racha_dias = IF(%(actividad)s, CASE
+                WHEN ultima_actividad IS NULL THEN 1
+                WHEN ultima_actividad = %(hoy)s THEN racha_dias
+                WHEN ultima_actividad = %(hoy)s - INTERVAL 1 DAY THEN racha_dias + 1
+                ELSE 1
+            END, racha_dias),
+            ultima_actividad = IF(%(actividad)s, %(hoy)s, ultima_actividad),
+            puntos_totales = puntos_totales + %(puntos)s,
+            experiencia_actual = experiencia_actual + %(experiencia)s
+    """
+    
+    # Sube un nivel solo si la experiencia alcanzó el umbral (se repite mientras aplique)
+    _SQL_SUBIR_NIVEL = """
+        UPDATE gamificacion_pacientes SET
+            experiencia_actual = experiencia_actual - experiencia_siguiente_nivel,
+            nivel_actual = nivel_actual + 1,
+            experiencia_siguiente_nivel = FLOOR(experiencia_siguiente_nivel * 1.5)
+        WHERE paciente_id = %s
+          AND experiencia_siguiente_nivel > 0
+          AND experiencia_actual >= experiencia_siguiente_nivel
+    """
+    
+    _SQL_ESTADO = "SELECT * FROM gamificacion_pacientes WHERE paciente_id = %s"
+    _SQL_ESTADO_BLOQUEADO = _SQL_ESTADO + " FOR UPDATE"
+    
+    def obtener_gamificacion(self, paciente_id: int) -> Optional[Dict[str, Any]]:
+        """Obtiene la gamificación de un paciente"""
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                cursor.execute(self._SQL_ESTADO, (paciente_id,))
+                gamificacion = cursor.fetchone()
+                cursor.close()
+                return gamificacion
+        except Exception as e:
+            logger.error(f"Error al obtener gamificación: {e}")
+            raise
+    
+    def aplicar_recompensa(self, paciente_id: int, puntos: int, experiencia: int,
+                           actividad: bool = True, hoy: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Aplica una recompensa de forma atómica y retorna el estado resultante
+        
+        Las recompensas de un mismo evento se suman antes de llamar, así que se
+        envían en una sola sentencia sin leer la fila antes. La subida de nivel
+        es una sentencia condicional aparte que solo se ejecuta si hace falta.
+        La suma, la lectura y la subida de nivel van en una transacción
+        explícita con la fila bloqueada hasta el commit: varias instancias
+        pueden otorgar puntos al mismo paciente sin perder actualizaciones, y
+        el estado y los niveles subidos que se retornan son solo los de esta
+        recompensa.
+        
+        Returns:
+            Dict: Fila de gamificacion_pacientes más 'niveles_subidos'
+        """
+        parametros = {
+            'paciente_id': paciente_id,
+            'puntos': puntos,
+            'experiencia': experiencia,
+            'actividad': bool(actividad),
+            'hoy': hoy or date.today()
+        }
+        try:
+            with self.connection_manager.transaccion() as connection:
+                cursor = connection.cursor(dictionary=True)
+                cursor.execute(self._SQL_RECOMPENSA, parametros)
+                cursor.execute(self._SQL_ESTADO_BLOQUEADO, (paciente_id,))
+                estado = cursor.fetchone()
+                
+                niveles_subidos = 0
+                if estado['experiencia_actual'] >= estado['experiencia_siguiente_nivel'] > 0:
+                    while True:
+                        cursor.execute(self._SQL_SUBIR_NIVEL, (paciente_id,))
+                        if cursor.rowcount == 0:
+                            break
+                        niveles_subidos += 1
+                    cursor.execute(self._SQL_ESTADO_BLOQUEADO, (paciente_id,))
+                    estado = cursor.fetchone()
+                
+                cursor.close()
+                
+                estado['niveles_subidos'] = niveles_subidos
+                return estado
+        except Exception as e:
+            logger.error(f"Error al aplicar recompensa de gamificación: {e}")
+            raise
+    
+    def obtener_puntajes(self) -> List[Dict[str, Any]]:
+        """Obtiene puntos, nivel y avatar de todos los pacientes (para armar el ranking)"""
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                
+                sql = """
+                    SELECT paciente_id, puntos_totales, nivel_actual, avatar_seleccionado
+                    FROM gamificacion_pacientes
+                """
+                cursor.execute(sql)
+                
+                puntajes = cursor.fetchall()
+                cursor.close()
+                
+                return puntajes
+        except Exception as e:
+            logger.error(f"Error al obtener puntajes de gamificación: {e}")
+            raise
+
+
+class LogroManager(MySQLDatabaseManager):
+    """Gestor del catálogo de logros y del progreso de los pacientes"""
+    
+    _SQL_CATALOGO = """
+        INSERT INTO logros
+            (codigo, nombre, descripcion, icono, puntos_recompensa, tipo, requisito_valor)
+        VALUES (%(codigo)s, %(nombre)s, %(descripcion)s, %(icono)s,
+                %(puntos_recompensa)s, %(tipo)s, %(requisito_valor)s)
+        ON DUPLICATE KEY UPDATE
+            nombre = VALUES(nombre),
+            descripcion = VALUES(descripcion),
+            icono = VALUES(icono),
+            puntos_recompensa = VALUES(puntos_recompensa),
+            tipo = VALUES(tipo),
+            requisito_valor = VALUES(requisito_valor)
+    """
+    
+    # Cómo combina cada modo de métrica (app.utils.logros) el valor guardado con el nuevo
+    _COMBINAR_METRICA = {
+        'acumulado': 'valor + VALUES(valor)',
+        'maximo': 'GREATEST(valor, VALUES(valor))',
+        'minimo': 'LEAST(valor, VALUES(valor))'
+    }
+    
+    # Las asignaciones se evalúan de izquierda a derecha: valor_anterior queda con el valor previo
+    _SQL_METRICA = """
+        INSERT INTO metricas_logros_pacientes (paciente_id, metrica, valor)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            valor_anterior = valor,
+            valor = {combinar}
+    """
+    
+    _SQL_VALOR_METRICA = """
+        SELECT valor_anterior, valor FROM metricas_logros_pacientes
+        WHERE paciente_id = %s AND metrica = %s
+        FOR UPDATE
+    """
+    
+    # Un logro completado no vuelve atrás ni pierde su fecha de obtención.
+    # Las asignaciones se evalúan de izquierda a derecha: la fecha usa el completado anterior.
+    _SQL_PROGRESO = """
+        INSERT INTO logros_pacientes
+            (paciente_id, logro_id, progreso_actual, completado, fecha_obtencion)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            fecha_obtencion = IF(completado, fecha_obtencion, VALUES(fecha_obtencion)),
+            progreso_actual = VALUES(progreso_actual),
+            completado = GREATEST(completado, VALUES(completado))
+    """
+    
+    def sincronizar_catalogo(self, logros: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Inserta o actualiza los logros del catálogo
+        
+        Returns:
+            Dict: codigo -> id de cada logro de la tabla
+        """
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                if logros:
+                    cursor.executemany(self._SQL_CATALOGO, logros)
+                cursor.execute("SELECT id, codigo FROM logros")
+                ids = {fila['codigo']: fila['id'] for fila in cursor.fetchall()}
+                connection.commit()
+                cursor.close()
+                return ids
+        except Exception as e:
+            logger.error(f"Error al sincronizar el catálogo de logros: {e}")
+            raise
+    
+    def obtener_progreso_pacientes(self, paciente_ids: List[int]) -> List[Dict[str, Any]]:
+        """Obtiene el progreso de logros de varios pacientes con una sola consulta"""
+        if not paciente_ids:
+            return []
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor(dictionary=True)
+                
+                marcadores = ', '.join(['%s'] * len(paciente_ids))
+                sql = f"""
+                    SELECT lp.paciente_id, l.codigo, lp.progreso_actual, lp.completado, lp.fecha_obtencion
+                    FROM logros_pacientes lp
+                    JOIN logros l ON l.id = lp.logro_id
+                    WHERE lp.paciente_id IN ({marcadores})
+                """
+                cursor.execute(sql, tuple(paciente_ids))
+                
+                progreso = cursor.fetchall()
+                cursor.close()
+                
+                return progreso
+        except Exception as e:
+            logger.error(f"Error al obtener progreso de logros: {e}")
+            raise
+    
+    def obtener_metricas(self, paciente_id: int) -> Dict[str, float]:
+        """Obtiene el valor de cada métrica de logros del paciente"""
+        try:
+            with self.connection_manager.get_connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT metrica, valor FROM metricas_logros_pacientes WHERE paciente_id = %s",
+                    (paciente_id,)
+                )
+                metricas = dict(cursor.fetchall())
+                cursor.close()
+                return metricas
+        except Exception as e:
+            logger.error(f"Error al obtener métricas de logros: {e}")
+            raise
+    
+    def registrar_metricas(
+        self,
+        valores: List[Tuple[int, str, str, float]],
+        filas_progreso: Callable[[List[Tuple[Optional[float], float]]], List[Tuple]]
+    ) -> List[Tuple[Optional[float], float]]:
+        """
+        Incorpora valores de resultados a las métricas de logros y guarda el
+        progreso que resulta, en una sola transacción
+        
+        Cada valor se combina con una sentencia atómica según su modo (suma,
+        GREATEST o LEAST) dentro de una transacción explícita: la fila queda
+        bloqueada hasta el commit, así que el (valor anterior, valor nuevo)
+        que se lee después es exactamente el cambio que hizo este valor, y el
+        progreso se guarda junto con las métricas o no se guarda nada. Aunque
+        varios procesos evalúen al mismo paciente no se pierden sumas y cada
+        umbral se cruza una sola vez. Las filas se bloquean en orden
+        (paciente, métrica) y (paciente, logro) para que dos lotes no se
+        traben entre sí.
+        
+        Args:
+            valores: (paciente_id, metrica, modo, valor)
+            filas_progreso: recibe el (anterior, actual) de cada valor, en el
+                orden de ``valores``, y retorna las filas (paciente_id,
+                logro_id, progreso_actual, completado, fecha_obtencion) que se
+                guardan en la misma transacción
+        
+        Returns:
+            List: (anterior, actual) de cada valor; anterior es None si la métrica no tenía valor
+        """
+        if not valores:
+            return []
+        cambios: List[Optional[Tuple[Optional[float], float]]] = [None] * len(valores)
+        try:
+            with self.connection_manager.transaccion() as connection:
+                cursor = connection.cursor()
+                for i in sorted(range(len(valores)), key=lambda i: valores[i][:2]):
+                    paciente_id, metrica, modo, valor = valores[i]
+                    cursor.execute(
+                        self._SQL_METRICA.format(combinar=self._COMBINAR_METRICA[modo]),
+                        (paciente_id, metrica, valor)
+                    )
+                    cursor.execute(self._SQL_VALOR_METRICA, (paciente_id, metrica))
+                    cambios[i] = tuple(cursor.fetchone())
+                
+                filas = filas_progreso(cambios)
+                if filas:
+                    cursor.executemany(self._SQL_PROGRESO, sorted(filas, key=lambda fila: fila[:2]))
+                cursor.close()
+                return cambios
+        except Exception as e:
+            logger.error(f"Error al registrar métricas de logros: {e}")
+            raise
 
 
 class MySQLDatabaseService:
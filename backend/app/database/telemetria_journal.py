@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+Journal de Telemetría - Muestras de movimiento por intento en bloques comprimidos append-only
+Responsable de guardar los lotes de telemetría fuera del hilo de la request y de leerlos por rango de tiempo
+"""
+
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+from app.utils.cache import CacheLRU
+from app.utils.telemetria import NUMPY_DISPONIBLE, LoteTelemetria
+
+if NUMPY_DISPONIBLE:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Índices de bloques por archivo: ruta -> (inodo, bytes válidos, entradas)
+_indices = CacheLRU(max_costo=16 * 1024 * 1024, nombre='telemetria-indices')
+
+# Costo estimado de una entrada del índice en memoria
+_BYTES_ENTRADA_INDICE = 120
+
+# Columnas de un bloque ya decodificado
+Columnas = Tuple[Sequence[int], Sequence[int], Sequence[int], Sequence[int]]
+
+
+class TelemetriaJournal:
+    """
+    Archivo por intento: ``<telemetria_path>/<paciente_id>/<intento_id>.tlmz``.
+    
+    El archivo es una secuencia de bloques; cada bloque tiene una cabecera
+    fija (cantidad de muestras, tamaño comprimido, crc32 y el rango
+    ``t_inicio``..``t_fin``) seguida de sus columnas comprimidas con zlib:
+    
+    - t: milisegundos enteros, delta de deltas en int32 (a 60 Hz casi todo 0)
+    - x, y: píxeles enteros, deltas en int16 (módulo 2^16, sin pérdida)
+    - e: código de evento en uint8
+    
+    Cada lote recibido se agrega como un bloque nuevo sin reescribir lo
+    anterior; ``compactar`` reescribe el intento en bloques grandes cuando
+    termina. El índice de bloques se arma leyendo solo las cabeceras y se
+    extiende de forma incremental, así una lectura por rango de tiempo solo
+    descomprime los bloques que lo intersectan. La lectura usa mmap.
+    """
+    
+    EXTENSION = '.tlmz'
+    MAGIA = b'TLMZ'
+    VERSION = 1
+    # magia, versión, reservado, muestras, bytes comprimidos, crc32, t_inicio, t_fin
+    CABECERA = struct.Struct('<4sHHIIIqq')
+    # Muestras por bloque al compactar (~68 s a 60 Hz)
+    BLOQUE_MUESTRAS = 4096
+    NIVEL_COMPRESION = 6
+    
+    _locks: Dict[str, threading.Lock] = {}
+    _locks_guard = threading.Lock()
+    
+    def __init__(self, telemetria_path: str):
+        self.telemetria_path = telemetria_path
+    
+    def ruta(self, paciente_id: str, intento_id: str) -> str:
+        return os.path.join(self.telemetria_path, str(paciente_id), f"{intento_id}{self.EXTENSION}")
+    
+    @classmethod
+    def _lock_para(cls, ruta: str) -> threading.Lock:
+        with cls._locks_guard:
+            lock = cls._locks.get(ruta)
+            if lock is None:
+                lock = cls._locks[ruta] = threading.Lock()
+            return lock
+    
+    def append(self, paciente_id: str, intento_id: str, lote: LoteTelemetria) -> None:
+        """Agrega las muestras del lote al archivo del intento"""
+        columnas = _columnas_enteras(lote.t, lote.x, lote.y, lote.e)
+        datos = b''.join(self._codificar_bloques(columnas))
+        ruta = self.ruta(paciente_id, intento_id)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with self._lock_para(ruta):
+            with open(ruta, 'ab') as f:
+                # Un bloque truncado por una escritura anterior fallida se descarta
+                _, valido, _ = self._indice(ruta)
+                if f.tell() > valido:
+                    f.truncate(valido)
+                    f.seek(0, os.SEEK_END)
+                f.write(datos)
+    
+    def compactar(self, paciente_id: str, intento_id: str) -> bool:
+        """
+        Reescribe el intento en bloques de BLOQUE_MUESTRAS muestras ordenadas por t
+        
+        Returns:
+            bool: False si el intento no tiene telemetría
+        """
+        ruta = self.ruta(paciente_id, intento_id)
+        with self._lock_para(ruta):
+            columnas = self._leer_ruta(ruta, None, None)
+            if columnas is None:
+                return False
+            if NUMPY_DISPONIBLE:
+                orden = np.argsort(columnas['t'], kind='stable')
+                t, x, y, e = (columnas[c][orden] for c in ('t', 'x', 'y', 'e'))
+            else:
+                orden = sorted(range(len(columnas['t'])), key=columnas['t'].__getitem__)
+                t, x, y, e = ([columnas[c][i] for i in orden] for c in ('t', 'x', 'y', 'e'))
+            
+            temporal = f"{ruta}.tmp"
+            with open(temporal, 'wb') as f:
+                for datos in self._codificar_bloques((t, x, y, e)):
+                    f.write(datos)
+                f.flush()
+                os.fsync(f.fileno())
+            # Los lectores que ya tenían el archivo abierto siguen viendo el anterior
+            os.replace(temporal, ruta)
+            _indices.invalidar(ruta)
+            return True
+    
+    def _codificar_bloques(self, columnas: Columnas):
+        t, x, y, e = columnas
+        for inicio in range(0, len(t), self.BLOQUE_MUESTRAS):
+            fin = inicio + self.BLOQUE_MUESTRAS
+            yield self._codificar_bloque(t[inicio:fin], x[inicio:fin], y[inicio:fin], e[inicio:fin])
+    
+    def _codificar_bloque(self, t, x, y, e) -> bytes:
+        if NUMPY_DISPONIBLE:
+            deltas = _deltas_numpy(t - t[0], np.int64)
+            dd = _deltas_numpy(deltas, '<i4')
+            # La resta en int16 da la vuelta módulo 2^16 y al sumar se recupera el valor exacto
+            dx = _deltas_numpy(x, '<i2')
+            dy = _deltas_numpy(y, '<i2')
+            crudo = b''.join((dd.tobytes(), dx.tobytes(), dy.tobytes(), e.astype('u1').tobytes()))
+        else:
+            dd = array('i')
+            anterior_t, anterior_d = t[0], 0
+            for valor in t:
+                delta = valor - anterior_t
+                dd.append(delta - anterior_d)
+                anterior_t, anterior_d = valor, delta
+            dx = array('h', _deltas_int16(x))
+            dy = array('h', _deltas_int16(y))
+            if sys.byteorder == 'big':
+                dd.byteswap()
+                dx.byteswap()
+                dy.byteswap()
+            crudo = b''.join((dd.tobytes(), dx.tobytes(), dy.tobytes(), bytes(e)))
+        
+        comprimido = zlib.compress(crudo, self.NIVEL_COMPRESION)
+        cabecera = self.CABECERA.pack(
+            self.MAGIA, self.VERSION, 0, len(t), len(comprimido), zlib.crc32(comprimido),
+            int(t[0]), int(t[-1])
+        )
+        return cabecera + comprimido
+    
+    def _indice(self, ruta: str) -> Tuple[int, int, tuple]:
+        """
+        (inodo, bytes válidos, entradas) del archivo; cada entrada es
+        (t_inicio, t_fin, offset de los datos, bytes comprimidos, muestras, crc32)
+        
+        Solo se leen las cabeceras de los bloques agregados desde la última vez.
+        """
+        try:
+            stat = os.stat(ruta)
+        except FileNotFoundError:
+            return (None, 0, ())
+        
+        cacheado = _indices.obtener(ruta)
+        if cacheado is not None and cacheado[0] == stat.st_ino and cacheado[1] <= stat.st_size:
+            _, valido, entradas = cacheado
+            if valido == stat.st_size:
+                return cacheado
+        else:
+            valido, entradas = 0, ()
+        
+        nuevas = []
+        with open(ruta, 'rb') as f:
+            f.seek(valido)
+            while True:
+                cabecera = f.read(self.CABECERA.size)
+                if len(cabecera) < self.CABECERA.size:
+                    break
+                magia, version, _, muestras, comprimido, crc, t_inicio, t_fin = self.CABECERA.unpack(cabecera)
+                offset = valido + self.CABECERA.size
+                if magia != self.MAGIA or version != self.VERSION or offset + comprimido > stat.st_size:
+                    break
+                nuevas.append((t_inicio, t_fin, offset, comprimido, muestras, crc))
+                valido = offset + comprimido
+                f.seek(valido)
+        
+        indice = (stat.st_ino, valido, entradas + tuple(nuevas))
+        _indices.guardar(ruta, indice, costo=len(indice[2]) * _BYTES_ENTRADA_INDICE)
+        return indice
+    
+    def bloques(self, paciente_id: str, intento_id: str) -> List[Dict]:
+        """Bloques del intento con su rango de tiempo, muestras y bytes comprimidos"""
+        _, _, entradas = self._indice(self.ruta(paciente_id, intento_id))
+        return [
+            {'t_inicio': t_inicio, 't_fin': t_fin, 'muestras': muestras, 'bytes': comprimido + self.CABECERA.size}
+            for t_inicio, t_fin, _, comprimido, muestras, _ in entradas
+        ]
+    
+    def leer(self, paciente_id: str, intento_id: str, desde: Optional[float] = None,
+             hasta: Optional[float] = None) -> Optional[Dict[str, Sequence]]:
+        """
+        Columnas t, x, y, e del intento, opcionalmente solo con ``desde <= t <= hasta``
+        
+        Con NumPy las columnas son arreglos (t: int64, x/y: int16, e: uint8);
+        sin NumPy son listas. Retorna None si no hay telemetría.
+        """
+        return self._leer_ruta(self.ruta(paciente_id, intento_id), desde, hasta)
+    
+    def _leer_ruta(self, ruta: str, desde: Optional[float], hasta: Optional[float]) -> Optional[Dict[str, Sequence]]:
+        inodo, valido, entradas = self._indice(ruta)
+        if inodo is None:
+            return None
+        seleccionados = [
+            entrada for entrada in entradas
+            if (desde is None or entrada[1] >= desde) and (hasta is None or entrada[0] <= hasta)
+        ]
+        
+        partes = []
+        if seleccionados:
+            with open(ruta, 'rb') as f:
+                with mmap.mmap(f.fileno(), valido, access=mmap.ACCESS_READ) as mapa:
+                    vista = memoryview(mapa)
+                    try:
+                        for t_inicio, _, offset, comprimido, muestras, crc in seleccionados:
+                            bloque = vista[offset:offset + comprimido]
+                            if zlib.crc32(bloque) != crc:
+                                logger.error(f"Bloque de telemetría corrupto en {ruta} (offset {offset})")
+                                bloque.release()
+                                continue
+                            crudo = zlib.decompress(bloque)
+                            bloque.release()
+                            partes.append(_decodificar_bloque(crudo, muestras, t_inicio))
+                    finally:
+                        vista.release()
+        return _unir_columnas(partes, desde, hasta)
+    
+    def estadisticas(self, paciente_id: str, intento_id: str) -> Dict:
+        """Bloques, muestras y bytes en disco del intento"""
+        _, valido, entradas = self._indice(self.ruta(paciente_id, intento_id))
+        muestras = sum(entrada[4] for entrada in entradas)
+        return {
+            'bloques': len(entradas),
+            'muestras': muestras,
+            'bytes': valido,
+            'bytes_por_muestra': round(valido / muestras, 2) if muestras else 0
+        }
+
+
+def _columnas_enteras(t, x, y, e) -> Columnas:
+    """Redondea el lote a milisegundos y píxeles enteros"""
+    if NUMPY_DISPONIBLE:
+        return (
+            np.rint(np.asarray(t, dtype=np.float64)).astype(np.int64),
+            np.rint(np.asarray(x, dtype=np.float64)).astype(np.int16),
+            np.rint(np.asarray(y, dtype=np.float64)).astype(np.int16),
+            np.asarray(e, dtype=np.uint8)
+        )
+    return (
+        [int(round(v)) for v in t], [int(round(v)) for v in x],
+        [int(round(v)) for v in y], [int(v) for v in e]
+    )
+
+
+def _deltas_numpy(valores, tipo):
+    """Deltas consecutivos (el primero desde 0); np.diff con prepend es varias veces más lento para lotes chicos"""
+    valores = valores.astype(tipo, copy=False)
+    deltas = np.empty(len(valores), dtype=tipo)
+    deltas[0] = valores[0]
+    np.subtract(valores[1:], valores[:-1], out=deltas[1:])
+    return deltas
+
+
+def _deltas_int16(valores: Sequence[int]) -> List[int]:
+    """Deltas consecutivos (el primero desde 0) con la vuelta de int16"""
+    deltas = []
+    anterior = 0
+    for valor in valores:
+        deltas.append(((valor - anterior + 32768) & 0xFFFF) - 32768)
+        anterior = valor
+    return deltas
+
+
+def _decodificar_bloque(crudo: bytes, muestras: int, t_inicio: int) -> Columnas:
+    if NUMPY_DISPONIBLE:
+        dd = np.frombuffer(crudo, '<i4', muestras, 0)
+        dx = np.frombuffer(crudo, '<i2', muestras, 4 * muestras)
+        dy = np.frombuffer(crudo, '<i2', muestras, 6 * muestras)
+        e = np.frombuffer(crudo, 'u1', muestras, 8 * muestras)
+        t = t_inicio + np.cumsum(np.cumsum(dd, dtype=np.int64))
+        return t, np.cumsum(dx, dtype=np.int16), np.cumsum(dy, dtype=np.int16), e.copy()
+    
+    columnas = []
+    for codigo, inicio, fin in (('i', 0, 4), ('h', 4, 6), ('h', 6, 8)):
+        valores = array(codigo)
+        valores.frombytes(crudo[inicio * muestras:fin * muestras])
+        if sys.byteorder == 'big':
+            valores.byteswap()
+        columnas.append(valores)
+    dd, dx, dy = columnas
+    
+    t, valor, delta = [], t_inicio, 0
+    for d in dd:
+        delta += d
+        valor += delta
+        t.append(valor)
+    x, y = [], []
+    for deltas, destino in ((dx, x), (dy, y)):
+        valor = 0
+        for d in deltas:
+            valor = ((valor + d + 32768) & 0xFFFF) - 32768
+            destino.append(valor)
+    return t, x, y, list(crudo[8 * muestras:9 * muestras])
+
+
+def _unir_columnas(partes: List[Columnas], desde: Optional[float], hasta: Optional[float]) -> Dict[str, Sequence]:
+    nombres = ('t', 'x', 'y', 'e')
+    if NUMPY_DISPONIBLE:
+        if not partes:
+            vacias = (np.int64, np.int16, np.int16, np.uint8)
+            return {nombre: np.empty(0, dtype=tipo) for nombre, tipo in zip(nombres, vacias)}
+        columnas = {nombre: np.concatenate([parte[i] for parte in partes]) for i, nombre in enumerate(nombres)}
+        if desde is not None or hasta is not None:
+            t = columnas['t']
+            mascara = np.ones(len(t), dtype=bool)
+            if desde is not None:
+                mascara &= t >= desde
+            if hasta is not None:
+                mascara &= t <= hasta
+            columnas = {nombre: columna[mascara] for nombre, columna in columnas.items()}
+        return columnas
+    
+    columnas = {nombre: [] for nombre in nombres}
+    for parte in partes:
+        for nombre, columna in zip(nombres, parte):
+            columnas[nombre].extend(columna)
+    if desde is not None or hasta is not None:
+        indices = [
+            i for i, t in enumerate(columnas['t'])
+            if (desde is None or t >= desde) and (hasta is None or t <= hasta)
+        ]
+        columnas = {nombre: [columna[i] for i in indices] for nombre, columna in columnas.items()}
+    return columnas
+
+
+class EscritorTelemetria:
+    """
+    Hilo que escribe los lotes de telemetría en el journal.
+    
+    La request solo deja el lote en una cola acotada; si la cola está llena
+    ``encolar`` retorna False para que el cliente reintente más tarde en
+    lugar de bloquear el hilo de la request. La compactación de un intento
+    terminado pasa por la misma cola, así se hace después de sus lotes.
+    """
+    
+    def __init__(self, journal: TelemetriaJournal, max_lotes: int = 1000):
+        self.journal = journal
+        self._cola: queue.Queue = queue.Queue(maxsize=max_lotes)
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Lotes encolados y todavía no escritos por intento
+        self._pendientes_intento: Dict[Tuple[str, str], int] = {}
+        self._condicion = threading.Condition()
+        self.escritos = 0
+        self.compactados = 0
+        self.errores = 0
+    
+    def iniciar(self):
+        """Inicia el hilo de escritura (una sola vez)"""
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._ejecutar, name='escritor-telemetria', daemon=True)
+            self._hilo.start()
+    
+    def encolar(self, paciente_id: str, intento_id: str, lote: LoteTelemetria) -> bool:
+        """Deja el lote para escribir; False si la cola está llena"""
+        self.iniciar()
+        clave = (paciente_id, intento_id)
+        with self._condicion:
+            try:
+                self._cola.put_nowait((paciente_id, intento_id, lote))
+            except queue.Full:
+                return False
+            self._pendientes_intento[clave] = self._pendientes_intento.get(clave, 0) + 1
+            return True
+    
+    def encolar_compactacion(self, paciente_id: str, intento_id: str) -> bool:
+        """Deja el intento para compactar después de sus lotes pendientes; False si la cola está llena"""
+        return self.encolar(paciente_id, intento_id, None)
+    
+    def pendientes(self) -> int:
+        return self._cola.qsize()
+    
+    def esperar(self):
+        """Bloquea hasta que se escriban todos los lotes encolados"""
+        self._cola.join()
+    
+    def tiene_pendientes(self, paciente_id: str, intento_id: str) -> bool:
+        """True si el intento tiene lotes (o su compactación) encolados y sin escribir"""
+        with self._condicion:
+            return (paciente_id, intento_id) in self._pendientes_intento
+    
+    def esperar_intento(self, paciente_id: str, intento_id: str, timeout: Optional[float] = None) -> bool:
+        """Espera a que se escriban los lotes ya encolados del intento; False si se agotó el timeout"""
+        clave = (paciente_id, intento_id)
+        with self._condicion:
+            return self._condicion.wait_for(lambda: clave not in self._pendientes_intento, timeout)
+    
+    def detener(self, timeout: Optional[float] = None):
+        """Escribe lo pendiente y detiene el hilo"""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is not None:
+            self._cola.put(None)
+            hilo.join(timeout)
+    
+    def _ejecutar(self):
+        while True:
+            item = self._cola.get()
+            try:
+                if item is None:
+                    return
+                paciente_id, intento_id, lote = item
+                if lote is None:
+                    if self.journal.compactar(paciente_id, intento_id):
+                        self.compactados += 1
+                else:
+                    self.journal.append(paciente_id, intento_id, lote)
+                    self.escritos += 1
+            except Exception as e:
+                self.errores += 1
+                logger.error(f"Error al escribir telemetría: {e}")
+            finally:
+                if item is not None:
+                    self._terminar_intento((item[0], item[1]))
+                self._cola.task_done()
+    
+    def _terminar_intento(self, clave: Tuple[str, str]):
+        with self._condicion:
+            restantes = self._pendientes_intento.get(clave, 0) - 1
+            if restantes > 0:
+                self._pendientes_intento[clave] = restantes
+            else:
+                self._pendientes_intento.pop(clave, None)
+                self._condicion.notify_all()
@@ -0,0 +1,83 @@
+"""
+Catálogo de Ejercicios - Índices inmutables y respuestas JSON ya codificadas
+Responsable de resolver ejercicios por id, tipo y nivel sin recorrer ni serializar en cada request
+"""
+import hashlib
+import json
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from app.models.ejercicio import Ejercicio, NivelDificultad, TipoEjercicio
+
+# Cuerpo JSON codificado y su ETag fuerte
+Listado = Tuple[bytes, str]
+
+
+class CatalogoEjercicios:
+    """
+    Catálogo de ejercicios de solo lectura, compartido por todo el proceso.
+    
+    Se arma una vez: los índices son mapeos de solo lectura y cada listado
+    (todos, por tipo y cada ejercicio) queda codificado en JSON con su ETag.
+    Los ejercicios y los diccionarios que entrega no se deben modificar.
+    """
+    
+    __slots__ = ('_por_id', '_por_tipo', '_por_nivel', '_activos', '_dicts', '_listados')
+    
+    def __init__(self, ejercicios: Iterable[Ejercicio]):
+        activos = tuple(e for e in ejercicios if e.activo)
+        self._activos = activos
+        self._por_id: Mapping[str, Ejercicio] = MappingProxyType({e.id: e for e in activos})
+        self._por_tipo: Mapping[TipoEjercicio, Tuple[Ejercicio, ...]] = MappingProxyType({
+            tipo: tuple(e for e in activos if e.tipo == tipo) for tipo in TipoEjercicio
+        })
+        self._por_nivel: Mapping[NivelDificultad, Tuple[Ejercicio, ...]] = MappingProxyType({
+            nivel: tuple(e for e in activos if e.nivel == nivel) for nivel in NivelDificultad
+        })
+        self._dicts: Mapping[str, Dict] = MappingProxyType({e.id: e.to_dict() for e in activos})
+        
+        listados = {'todos': self._codificar({'success': True, 'ejercicios': self.dicts()})}
+        for tipo, del_tipo in self._por_tipo.items():
+            listados[tipo.value] = self._codificar(
+                {'success': True, 'ejercicios': [self._dicts[e.id] for e in del_tipo]}
+            )
+        for ejercicio_id, datos in self._dicts.items():
+            listados[f'ejercicio:{ejercicio_id}'] = self._codificar({'success': True, 'ejercicio': datos})
+        self._listados: Mapping[str, Listado] = MappingProxyType(listados)
+    
+    @staticmethod
+    def _codificar(cuerpo: Dict) -> Listado:
+        datos = json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return datos, hashlib.sha256(datos).hexdigest()[:32]
+    
+    def por_id(self, ejercicio_id: str) -> Optional[Ejercicio]:
+        """Ejercicio activo con ese id (None si no existe)"""
+        return self._por_id.get(ejercicio_id)
+    
+    def por_tipo(self, tipo: TipoEjercicio) -> Tuple[Ejercicio, ...]:
+        """Ejercicios activos de un tipo"""
+        return self._por_tipo.get(tipo, ())
+    
+    def por_nivel(self, nivel: NivelDificultad) -> Tuple[Ejercicio, ...]:
+        """Ejercicios activos de un nivel de dificultad"""
+        return self._por_nivel.get(nivel, ())
+    
+    def activos(self) -> Tuple[Ejercicio, ...]:
+        """Todos los ejercicios activos"""
+        return self._activos
+    
+    def a_dict(self, ejercicio_id: str) -> Optional[Dict]:
+        """``to_dict`` ya calculado del ejercicio (None si no existe)"""
+        return self._dicts.get(ejercicio_id)
+    
+    def dicts(self) -> List[Dict]:
+        """``to_dict`` ya calculado de todos los ejercicios activos"""
+        return [self._dicts[e.id] for e in self._activos]
+    
+    def listado(self, clave: str) -> Optional[Listado]:
+        """
+        Respuesta JSON ya codificada y su ETag
+        
+        Claves: ``todos``, el valor de un TipoEjercicio o ``ejercicio:<id>``.
+        """
+        return self._listados.get(clave)
@@ -1,10 +1,20 @@
 """
 Modelo de Configuración de Paciente - Accesibilidad y personalización
 """
+import copy
+import json
+import os
+import tempfile
+import threading
 from dataclasses import dataclass, asdict
 from typing import Dict, Optional
 from enum import Enum
 
+from app.utils.cache import CacheLRU
+
+# Configuraciones guardadas (como diccionario), por archivo; la etiqueta es (mtime, tamaño)
+_configuraciones = CacheLRU(max_costo=4096, nombre='configuracion')
+
 
 class ModoAccesibilidad(Enum):
     """Modos de accesibilidad disponibles"""
@@ -130,11 +140,14 @@ class ConfiguracionPaciente:
     calibracion: CalibracionPaciente
     accesibilidad: ConfiguracionAccesibilidad
     seguridad: ConfiguracionSeguridad
+    # Aumenta cada vez que se guarda; identifica lo que se calculó con esta configuración
+    version: int = 0
     
     def to_dict(self) -> Dict:
         """Convierte a diccionario"""
         return {
             'paciente_id': self.paciente_id,
+            'version': self.version,
             'calibracion': self.calibracion.to_dict(),
             'accesibilidad': self.accesibilidad.to_dict(),
             'seguridad': self.seguridad.to_dict()
@@ -147,7 +160,8 @@ class ConfiguracionPaciente:
             paciente_id=data['paciente_id'],
             calibracion=CalibracionPaciente.from_dict(data['calibracion']),
             accesibilidad=ConfiguracionAccesibilidad.from_dict(data['accesibilidad']),
-            seguridad=ConfiguracionSeguridad.from_dict(data['seguridad'])
+            seguridad=ConfiguracionSeguridad.from_dict(data['seguridad']),
+            version=int(data.get('version', 0))
         )
     
     @classmethod
@@ -160,3 +174,87 @@ class ConfiguracionPaciente:
             seguridad=ConfiguracionSeguridad(paciente_id=paciente_id)
         )
 
+
+
+class ConfiguracionRepository:
+    """
+    Configuración por paciente en ``<configuracion_path>/<paciente_id>.json``.
+    
+    Un paciente sin archivo tiene la configuración por defecto (versión 0).
+    Cada ``guardar`` reemplaza el archivo de forma atómica y aumenta la versión.
+    """
+    
+    _bloqueo = threading.Lock()
+    
+    def __init__(self, configuracion_path: str = "data/pacientes/configuracion"):
+        self.configuracion_path = configuracion_path
+    
+    def ruta(self, paciente_id) -> str:
+        """Ruta del archivo de configuración del paciente"""
+        return os.path.join(self.configuracion_path, f"{paciente_id}.json")
+    
+    @staticmethod
+    def _stat(ruta: str):
+        try:
+            stat = os.stat(ruta)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def _leer(self, paciente_id) -> Optional[Dict]:
+        """Configuración guardada como diccionario compartido (no modificar); None si no hay"""
+        ruta = self.ruta(paciente_id)
+        firma = self._stat(ruta)
+        if firma is None:
+            return None
+        
+        data = _configuraciones.obtener(ruta, etiqueta=firma)
+        if data is None:
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Configuración inválida para '{paciente_id}', se usa la configuración por defecto: {e}")
+                return None
+            _configuraciones.guardar(ruta, data, costo=1, etiqueta=firma)
+        return data
+    
+    def obtener(self, paciente_id) -> ConfiguracionPaciente:
+        """Configuración del paciente (una copia que se puede modificar y guardar)"""
+        data = self._leer(paciente_id)
+        if data is None:
+            return ConfiguracionPaciente.crear_default(paciente_id)
+        try:
+            return ConfiguracionPaciente.from_dict(copy.deepcopy(data))
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"⚠️ Configuración inválida para '{paciente_id}', se usa la configuración por defecto: {e}")
+            return ConfiguracionPaciente.crear_default(paciente_id)
+    
+    def version(self, paciente_id) -> int:
+        """Versión de la configuración guardada (0 si no hay), sin armar el objeto"""
+        data = self._leer(paciente_id)
+        return int(data.get('version', 0)) if data else 0
+    
+    def guardar(self, config: ConfiguracionPaciente):
+        """Guarda la configuración con una versión mayor que la guardada"""
+        os.makedirs(self.configuracion_path, exist_ok=True)
+        ruta = self.ruta(config.paciente_id)
+        with self._bloqueo:
+            config.version = max(config.version, self.version(config.paciente_id)) + 1
+            data = config.to_dict()
+            # Temporal propio en el mismo directorio: otro proceso que guarde
+            # a la vez no escribe sobre él y os.replace sigue siendo atómico
+            descriptor, temporal = tempfile.mkstemp(
+                dir=self.configuracion_path, prefix=f"{config.paciente_id}.", suffix='.tmp'
+            )
+            try:
+                with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(temporal, ruta)
+            except BaseException:
+                try:
+                    os.unlink(temporal)
+                except OSError:
+                    pass
+                raise
+            _configuraciones.guardar(ruta, data, costo=1, etiqueta=self._stat(ruta))
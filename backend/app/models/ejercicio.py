@@ -3,11 +3,34 @@ Modelo de Ejercicio - Patrón de Diseño Model
 Responsable de la representación de datos y lógica de negocio de ejercicios
 """
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Dict, Optional, Tuple
+from dataclasses import dataclass, asdict, field, replace
 from enum import Enum
 
+# Agregar el directorio raíz al path para importar configuraciones
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.settings import get_database_config
+from app.database.historial_journal import HistorialJournal
+from app.utils.cache import CacheLRU
+
+# Cache de historiales ya parseados, compartida por todos los repositorios del proceso
+_historial_cache = CacheLRU(
+    max_costo=get_database_config()['historial_cache_mb'] * 1024 * 1024,
+    nombre='historial'
+)
+
+# Resúmenes del historial (dashboard) por paciente, con la misma clave y etiqueta que _historial_cache
+_resumen_cache = CacheLRU(max_costo=16 * 1024 * 1024, nombre='resumen-historial')
+
+# Costo estimado de un resumen en memoria
+_BYTES_RESUMEN = 4096
+
+# Campos de cada resultado reciente en el resumen
+CAMPOS_RESUMEN = ('fecha', 'tipo_ejercicio', 'nivel', 'exito', 'puntuacion', 'precision', 'tiempo_ejecucion')
+
 
 class TipoEjercicio(Enum):
     """Tipos de ejercicios disponibles"""
@@ -43,6 +66,15 @@ class ResultadoEjercicio:
     combo_maximo: Optional[int] = None
     aciertos: Optional[int] = None
     fallos: Optional[int] = None
+    # Id del intento con el que el cliente envió la telemetría de movimiento
+    intento_id: Optional[str] = None
+    # Métricas que solo se calculan con la telemetría
+    longitud_trayectoria: Optional[float] = None
+    suavidad: Optional[float] = None
+    # 'telemetria' si las métricas se calcularon en el servidor; None si las envió el cliente
+    origen_metricas: Optional[str] = None
+    # Clave del cliente para que reenviar el mismo resultado no lo duplique
+    clave_idempotencia: Optional[str] = None
     
     def __post_init__(self):
         if not self.fecha:
@@ -59,7 +91,8 @@ class ResultadoEjercicio:
         campos_opcionales = {
             'precision', 'velocidad_promedio', 'rango_movimiento',
             'tiempo_reaccion_promedio', 'tasa_aciertos', 'consistencia',
-            'combo_maximo', 'aciertos', 'fallos'
+            'combo_maximo', 'aciertos', 'fallos', 'intento_id',
+            'longitud_trayectoria', 'suavidad', 'origen_metricas', 'clave_idempotencia'
         }
         for campo in campos_opcionales:
             if campo not in data:
@@ -68,8 +101,78 @@ class ResultadoEjercicio:
 
 
 @dataclass
+class ResumenHistorial:
+    """
+    Resumen del historial de un paciente para el dashboard.
+    
+    Se arma una vez con el historial completo y después se extiende con
+    cada resultado registrado, sin volver a leer el historial.
+    """
+    total: int = 0
+    exitosos: int = 0
+    # Último día (ISO) con ejercicios y cantidad de días consecutivos hasta él
+    ultimo_dia: Optional[str] = None
+    racha: int = 0
+    # Resultado más reciente por fecha
+    ultimo: Optional[ResultadoEjercicio] = None
+    # Resultados más recientes primero, con CAMPOS_RESUMEN e id
+    ultimos: List[Dict] = field(default_factory=list)
+    
+    @classmethod
+    def desde_historial(cls, historial: List[ResultadoEjercicio], maximo: int) -> 'ResumenHistorial':
+        """Resumen de un historial completo (el id de cada resultado es su posición desde 1)"""
+        ordenados = sorted(enumerate(historial, 1), key=lambda par: (par[1].fecha, par[0]))
+        resumen = cls()
+        resumen._agregar(ordenados, maximo)
+        return resumen
+    
+    def con_resultados(self, resultados: List[ResultadoEjercicio], maximo: int) -> 'ResumenHistorial':
+        """Copia del resumen con los resultados recién agregados al final del historial"""
+        resumen = replace(self, ultimos=list(self.ultimos))
+        resumen._agregar(enumerate(resultados, self.total + 1), maximo)
+        return resumen
+    
+    def _agregar(self, resultados: Iterable[Tuple[int, ResultadoEjercicio]], maximo: int):
+        for id_resultado, resultado in resultados:
+            self.total += 1
+            if resultado.exito:
+                self.exitosos += 1
+            if self.ultimo is None or resultado.fecha >= self.ultimo.fecha:
+                self.ultimo = resultado
+            
+            dia = resultado.fecha[:10]
+            if self.ultimo_dia is None or dia > self.ultimo_dia:
+                consecutivo = self.ultimo_dia is not None and \
+                    date.fromisoformat(dia) - date.fromisoformat(self.ultimo_dia) == timedelta(days=1)
+                self.racha = self.racha + 1 if consecutivo else 1
+                self.ultimo_dia = dia
+            
+            reciente = {'id': id_resultado}
+            reciente.update((campo, getattr(resultado, campo)) for campo in CAMPOS_RESUMEN)
+            self.ultimos.append(reciente)
+        
+        self.ultimos.sort(key=lambda r: (r['fecha'], r['id']), reverse=True)
+        del self.ultimos[maximo:]
+    
+    def to_dict(self, hoy: Optional[date] = None) -> Dict:
+        """Resumen para la respuesta; la racha se corta si el último día con ejercicios fue antes de ayer"""
+        hoy = hoy or date.today()
+        racha = 0
+        if self.ultimo_dia is not None and hoy - date.fromisoformat(self.ultimo_dia) <= timedelta(days=1):
+            racha = self.racha
+        return {
+            'total_ejercicios': self.total,
+            'ejercicios_exitosos': self.exitosos,
+            'porcentaje_exito': round(self.exitosos / self.total * 100, 2) if self.total else 0,
+            'racha_dias': racha,
+            'ultima_actividad': self.ultimo.fecha if self.ultimo else None,
+            'ultimos_resultados': self.ultimos
+        }
+
+
+@dataclass(frozen=True)
 class Ejercicio:
-    """Clase de datos para representar un ejercicio"""
+    """Clase de datos para representar un ejercicio (inmutable: forma parte del catálogo compartido)"""
     id: str
     nombre: str
     descripcion: str
@@ -97,10 +200,28 @@ class Ejercicio:
 class EjercicioRepository:
     """Repositorio para manejo de datos de ejercicios - Patrón Repository"""
     
-    def __init__(self, historial_path: str = "data/pacientes/historial"):
+    def __init__(self, historial_path: str = "data/pacientes/historial",
+                 fsync_policy: Optional[str] = None):
         self.historial_path = historial_path
+        db_config = get_database_config()
+        self.resumen_ultimos = db_config['historial_resumen_ultimos']
+        self.journal = HistorialJournal(
+            historial_path,
+            fsync_policy=fsync_policy or db_config['historial_fsync'],
+            fsync_interval=db_config['historial_fsync_interval']
+        )
     
-    def registrar_resultado(self, paciente_id: str, ejercicio: str, exito: bool, 
+    def bloqueo(self, paciente_id: str):
+        """Bloquea las escrituras del historial del paciente durante el bloque (``with``)"""
+        return self.journal.bloqueo(paciente_id)
+    
+    def registrar_resultado(self, paciente_id: str, *args, **kwargs) -> ResultadoEjercicio:
+        """Registra un resultado de ejercicio (mismos argumentos que ``crear_resultado``)"""
+        resultado = self.crear_resultado(paciente_id, *args, **kwargs)
+        self.registrar_resultados(paciente_id, [resultado])
+        return resultado
+    
+    def crear_resultado(self, paciente_id: str, ejercicio: str, exito: bool,
                           tiempo_ejecucion: Optional[float] = None,
                           puntuacion: Optional[int] = None,
                           observaciones: Optional[str] = None,
@@ -113,8 +234,13 @@ class EjercicioRepository:
                           combo_maximo: Optional[int] = None,
                           aciertos: Optional[int] = None,
                           fallos: Optional[int] = None,
-                          nivel: Optional[int] = None) -> ResultadoEjercicio:
-        """Registra un resultado de ejercicio con métricas médicas avanzadas"""
+                          nivel: Optional[int] = None,
+                          intento_id: Optional[str] = None,
+                          longitud_trayectoria: Optional[float] = None,
+                          suavidad: Optional[float] = None,
+                          origen_metricas: Optional[str] = None,
+                          clave_idempotencia: Optional[str] = None) -> ResultadoEjercicio:
+        """Crea (sin guardarlo) un resultado de ejercicio con métricas médicas avanzadas"""
         # Parsear observaciones si es JSON string
         if observaciones and isinstance(observaciones, str):
             try:
@@ -134,6 +260,7 @@ class EjercicioRepository:
             tipo_ejercicio=ejercicio,
             nivel=nivel or 1,
             exito=exito,
+            fecha=datetime.now().isoformat(),
             tiempo_ejecucion=tiempo_ejecucion,
             puntuacion=puntuacion,
             observaciones=observaciones,
@@ -145,37 +272,171 @@ class EjercicioRepository:
             consistencia=consistencia,
             combo_maximo=combo_maximo,
             aciertos=aciertos,
-            fallos=fallos
+            fallos=fallos,
+            intento_id=intento_id,
+            longitud_trayectoria=longitud_trayectoria,
+            suavidad=suavidad,
+            origen_metricas=origen_metricas,
+            clave_idempotencia=clave_idempotencia
         )
+        return resultado
+    
+    def registrar_resultados(self, paciente_id: str,
+                             resultados: List[ResultadoEjercicio]) -> List[Tuple[ResultadoEjercicio, bool]]:
+        """
+        Guarda varios resultados del paciente con una sola escritura al journal
         
-        # Guardar en el historial del paciente
-        historial_file = f"{paciente_id}.json"
-        historial_path = f"{self.historial_path}/{historial_file}"
-        
-        try:
-            with open(historial_path, "r", encoding="utf-8") as f:
-                historial = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            historial = []
-        
-        historial.append(resultado.to_dict())
+        Un resultado cuya ``clave_idempotencia`` ya está en el historial (o
+        antes en el mismo lote) no se vuelve a guardar.
         
-        with open(historial_path, "w", encoding="utf-8") as f:
-            json.dump(historial, f, ensure_ascii=False, indent=2)
+        Returns:
+            Por cada resultado recibido: (resultado guardado o el ya existente, duplicado)
+        """
+        with self.journal.bloqueo(paciente_id):
+            # Solo se leen los registros con las claves recibidas, no el historial
+            existentes = {
+                clave: ResultadoEjercicio.from_dict(registro)
+                for clave, registro in self.journal.buscar_claves(
+                    paciente_id, (r.clave_idempotencia for r in resultados if r.clave_idempotencia)
+                ).items()
+            }
+            
+            salida = []
+            nuevos = []
+            for resultado in resultados:
+                existente = existentes.get(resultado.clave_idempotencia) if resultado.clave_idempotencia else None
+                if existente is not None:
+                    salida.append((existente, True))
+                    continue
+                if resultado.clave_idempotencia:
+                    existentes[resultado.clave_idempotencia] = resultado
+                nuevos.append(resultado)
+                salida.append((resultado, False))
+            
+            if nuevos:
+                # Solo se agregan los registros nuevos al historial del paciente
+                firma_anterior = self.journal.firma(paciente_id)
+                self.journal.append_many(paciente_id, [r.to_dict() for r in nuevos])
+                # Si el historial o su resumen estaban en cache se extienden en lugar de invalidarlos
+                firma = self.journal.firma(paciente_id)
+                _historial_cache.actualizar(
+                    self._clave_cache(paciente_id), firma_anterior, firma,
+                    lambda historial: self._con_costo(historial + nuevos)
+                )
+                _resumen_cache.actualizar(
+                    self._clave_cache(paciente_id), firma_anterior, firma,
+                    lambda resumen: (resumen.con_resultados(nuevos, self.resumen_ultimos), _BYTES_RESUMEN)
+                )
         
-        return resultado
+        return salida
     
     def obtener_historial(self, paciente_id: str) -> List[ResultadoEjercicio]:
         """Obtiene el historial de ejercicios de un paciente"""
-        historial_file = f"{paciente_id}.json"
-        historial_path = f"{self.historial_path}/{historial_file}"
-        
-        try:
-            with open(historial_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return [ResultadoEjercicio.from_dict(r) for r in data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        clave = self._clave_cache(paciente_id)
+        
+        historial = _historial_cache.obtener(clave, etiqueta=self.journal.firma(paciente_id))
+        if historial is None:
+            # Bajo el lock la firma y el contenido leído corresponden a la misma escritura
+            with self.journal.bloqueo(paciente_id):
+                firma = self.journal.firma(paciente_id)
+                historial = [ResultadoEjercicio.from_dict(r) for r in self.journal.leer(paciente_id)]
+                _historial_cache.guardar(clave, historial, costo=self._con_costo(historial)[1], etiqueta=firma)
+        
+        # Copia de la lista para que quien llama no modifique la cache
+        return list(historial)
+    
+    def obtener_resumen(self, paciente_id: str) -> ResumenHistorial:
+        """
+        Resumen del historial del paciente (totales, racha y últimos resultados)
+        
+        Se lee de la cache; solo se arma con el historial completo la primera
+        vez o si el historial cambió sin pasar por ``registrar_resultados``.
+        No se debe modificar el resumen retornado.
+        """
+        clave = self._clave_cache(paciente_id)
+        resumen = _resumen_cache.obtener(clave, etiqueta=self.journal.firma(paciente_id))
+        if resumen is None:
+            with self.journal.bloqueo(paciente_id):
+                firma = self.journal.firma(paciente_id)
+                resumen = ResumenHistorial.desde_historial(self.obtener_historial(paciente_id), self.resumen_ultimos)
+                _resumen_cache.guardar(clave, resumen, costo=_BYTES_RESUMEN, etiqueta=firma)
+        return resumen
+    
+    def obtener_pagina_historial(self, paciente_id: str, limite: int,
+                                 cursor: Optional[Tuple[str, int]] = None,
+                                 desde: Optional[str] = None) -> Dict:
+        """
+        Página del historial del paciente, de la más reciente a la más antigua
+        
+        Usa el índice de posiciones del journal: solo se decodifican los
+        registros de la página, que son diccionarios como los de
+        ``ResultadoEjercicio.to_dict`` (ver HistorialJournal.pagina).
+        """
+        return self.journal.pagina(str(paciente_id), limite, cursor, desde)
+    
+    def aplicar_metricas(self, paciente_id: str, metricas_por_intento: Dict[str, Dict]) -> int:
+        """
+        Reemplaza campos de los resultados del historial según su intento_id
+        
+        Args:
+            paciente_id: ID del paciente
+            metricas_por_intento: intento_id -> {campo: valor} de ResultadoEjercicio
+        
+        Returns:
+            int: Cantidad de resultados actualizados
+        """
+        if not metricas_por_intento:
+            return 0
+        with self.journal.bloqueo(paciente_id):
+            registros = self.journal.leer(paciente_id)
+            actualizados = 0
+            for registro in registros:
+                campos = metricas_por_intento.get(registro.get('intento_id'))
+                if campos:
+                    registro.update(campos)
+                    actualizados += 1
+            if actualizados:
+                # La firma del journal cambia y la cache del historial se descarta sola
+                self.journal.reemplazar(paciente_id, registros)
+        return actualizados
+    
+    def version_historial(self, paciente_id: str) -> Tuple:
+        """
+        Versión del historial del paciente basada en (mtime, tamaño) de sus archivos
+        
+        Cambia con cada resultado registrado y es la misma en todos los procesos.
+        """
+        _, journal, legacy = self.journal.firma(paciente_id)
+        return (journal, legacy)
+    
+    def ultima_modificacion(self, paciente_id: str) -> Optional[datetime]:
+        """Fecha (UTC) de la última escritura en el historial del paciente"""
+        timestamp = self.journal.ultima_modificacion(paciente_id)
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc) if timestamp is not None else None
+    
+    def _clave_cache(self, paciente_id: str) -> tuple:
+        return (self.historial_path, str(paciente_id))
+    
+    @staticmethod
+    def _con_costo(historial: List[ResultadoEjercicio]) -> tuple:
+        """Retorna el historial junto con su tamaño estimado en bytes"""
+        if not historial:
+            return historial, sys.getsizeof(historial)
+        muestra = historial[-1]
+        bytes_resultado = (
+            sys.getsizeof(muestra) + sys.getsizeof(muestra.__dict__) +
+            sum(sys.getsizeof(v) for v in muestra.__dict__.values())
+        )
+        return historial, sys.getsizeof(historial) + bytes_resultado * len(historial)
+    
+    @staticmethod
+    def estadisticas_cache() -> Dict:
+        """Contadores de aciertos/fallos de la cache de historiales"""
+        return _historial_cache.estadisticas()
+    
+    def migrar_historiales(self) -> Dict[str, int]:
+        """Migra los historiales en formato JSON antiguo al journal append-only"""
+        return self.journal.migrar_todos()
     
     def obtener_estadisticas(self, paciente_id: str) -> Dict:
         """Obtiene estadísticas del paciente"""
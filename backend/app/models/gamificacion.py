@@ -1,11 +1,20 @@
 """
 Modelo de Gamificación - Sistema de puntos, logros y recompensas
 """
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Optional
+import math
+import os
+import sys
+import threading
+from dataclasses import dataclass, asdict, fields, replace
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, date
 from enum import Enum
 
+# Agregar el directorio raíz al path para importar configuraciones
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.database.mysql_manager import GamificacionManager, LogroManager
+from app.utils.logros import ACUMULADO, MAXIMO, MINIMO, IndiceLogros, ProgresoLogros
+
 
 class TipoLogro(Enum):
     """Tipos de logros disponibles"""
@@ -15,6 +24,20 @@ class TipoLogro(Enum):
     ESPECIAL = "especial"
 
 
+# Métricas con las que se evalúan los logros y cómo se acumulan entre resultados
+MODOS_METRICA = {
+    'sesiones': ACUMULADO,
+    'precision': MAXIMO,
+    'racha': MAXIMO,
+    'duracion': MINIMO
+}
+
+# Los logros especiales indican su métrica por código
+METRICAS_ESPECIALES = {
+    'velocista': 'duracion'
+}
+
+
 @dataclass
 class Logro:
     """Clase de datos para representar un logro"""
@@ -27,6 +50,13 @@ class Logro:
     requisito_valor: int
     id: Optional[int] = None
     
+    @property
+    def metrica(self) -> Optional[str]:
+        """Métrica con la que se evalúa el logro (None si no se evalúa automáticamente)"""
+        if self.tipo == TipoLogro.ESPECIAL:
+            return METRICAS_ESPECIALES.get(self.codigo)
+        return self.tipo.value
+    
     def to_dict(self) -> Dict:
         """Convierte el logro a diccionario"""
         data = asdict(self)
@@ -61,6 +91,24 @@ class LogroPaciente:
         return cls(**data)
 
 
+@dataclass
+class Recompensa:
+    """Puntos y experiencia de un evento, acumulados para aplicarlos de una sola vez"""
+    puntos: int = 0
+    experiencia: int = 0
+    actividad: bool = False  # Si cuenta como actividad del día (actualiza la racha)
+    
+    def agregar(self, puntos: int = 0, experiencia: int = 0):
+        """Suma puntos y experiencia a la recompensa"""
+        self.puntos += puntos
+        self.experiencia += experiencia
+    
+    def combinar(self, otra: 'Recompensa'):
+        """Suma otra recompensa a esta"""
+        self.agregar(otra.puntos, otra.experiencia)
+        self.actividad = self.actividad or otra.actividad
+
+
 @dataclass
 class GamificacionPaciente:
     """Clase de datos para representar la gamificación de un paciente"""
@@ -114,6 +162,20 @@ class GamificacionPaciente:
         
         self.ultima_actividad = hoy
     
+    def aplicar_recompensa(self, recompensa: Recompensa) -> int:
+        """
+        Aplica una recompensa completa al objeto
+        
+        Returns:
+            int: Cantidad de niveles subidos
+        """
+        nivel_anterior = self.nivel_actual
+        if recompensa.actividad:
+            self.actualizar_racha()
+        self.agregar_puntos(recompensa.puntos)
+        self.agregar_experiencia(recompensa.experiencia)
+        return self.nivel_actual - nivel_anterior
+    
     def to_dict(self) -> Dict:
         """Convierte a diccionario"""
         data = asdict(self)
@@ -127,6 +189,192 @@ class GamificacionPaciente:
         if 'ultima_actividad' in data and isinstance(data['ultima_actividad'], str):
             data['ultima_actividad'] = date.fromisoformat(data['ultima_actividad'])
         return cls(**data)
+    
+    @classmethod
+    def from_registro(cls, registro: Dict) -> 'GamificacionPaciente':
+        """Crea desde una fila de la tabla gamificacion_pacientes"""
+        campos = {f.name for f in fields(cls)}
+        return cls.from_dict({k: v for k, v in registro.items() if k in campos})
+
+
+class GamificacionRepository:
+    """
+    Repositorio de gamificación sobre la tabla gamificacion_pacientes.
+    
+    Las recompensas se aplican con una actualización atómica en MySQL. Los
+    pacientes que solo existen en JSON (id no numérico) o un entorno sin MySQL
+    usan un estado en memoria compartido por el proceso.
+    """
+    
+    _memoria: Dict[str, GamificacionPaciente] = {}
+    _memoria_lock = threading.Lock()
+    
+    def __init__(self):
+        try:
+            self.db_gamificacion = GamificacionManager()
+            self.use_mysql = True
+        except Exception as e:
+            print(f"⚠️ No se pudo conectar a MySQL, gamificación solo en memoria: {e}")
+            self.db_gamificacion = None
+            self.use_mysql = False
+    
+    def _usa_mysql(self, paciente_id) -> bool:
+        return self.use_mysql and str(paciente_id).isdigit()
+    
+    def obtener(self, paciente_id) -> GamificacionPaciente:
+        """Obtiene la gamificación del paciente (valores iniciales si no tiene)"""
+        if self._usa_mysql(paciente_id):
+            registro = self.db_gamificacion.obtener_gamificacion(int(paciente_id))
+            if registro:
+                return GamificacionPaciente.from_registro(registro)
+            return GamificacionPaciente(paciente_id=int(paciente_id))
+        
+        with self._memoria_lock:
+            gamificacion = self._memoria.get(str(paciente_id))
+            return replace(gamificacion) if gamificacion else GamificacionPaciente(paciente_id=paciente_id)
+    
+    def aplicar_recompensa(self, paciente_id, recompensa: Recompensa) -> Tuple[GamificacionPaciente, int]:
+        """
+        Aplica una recompensa y retorna el estado resultante
+        
+        Returns:
+            Tuple: (gamificación actualizada, niveles subidos)
+        """
+        if self._usa_mysql(paciente_id):
+            registro = self.db_gamificacion.aplicar_recompensa(
+                int(paciente_id), recompensa.puntos, recompensa.experiencia, recompensa.actividad
+            )
+            return GamificacionPaciente.from_registro(registro), registro['niveles_subidos']
+        
+        with self._memoria_lock:
+            gamificacion = self._memoria.get(str(paciente_id))
+            if gamificacion is None:
+                gamificacion = self._memoria[str(paciente_id)] = GamificacionPaciente(paciente_id=paciente_id)
+            niveles_subidos = gamificacion.aplicar_recompensa(recompensa)
+            return replace(gamificacion), niveles_subidos
+
+
+class LogroRepository:
+    """
+    Repositorio del progreso de logros sobre las tablas metricas_logros_pacientes
+    y logros_pacientes.
+    
+    En MySQL el valor de cada métrica se actualiza con una sentencia atómica
+    y los logros nuevos son los umbrales que cruzó ese cambio, así que varios
+    procesos pueden evaluar al mismo paciente sin perder progreso ni otorgar
+    un logro dos veces; el progreso se lee siempre de la base. Los pacientes
+    que solo existen en JSON o un entorno sin MySQL conservan el progreso
+    únicamente en memoria.
+    """
+    
+    _memoria: Dict[str, ProgresoLogros] = {}
+    _ids_logros: Dict[str, int] = {}
+    _lock = threading.Lock()
+    
+    def __init__(self, indice: IndiceLogros, logros: List[Logro]):
+        self.indice = indice
+        try:
+            self.db_logros = LogroManager()
+            self.use_mysql = True
+            self._sincronizar_catalogo(logros)
+        except Exception as e:
+            print(f"⚠️ No se pudo conectar a MySQL, progreso de logros solo en memoria: {e}")
+            self.db_logros = None
+            self.use_mysql = False
+    
+    def _sincronizar_catalogo(self, logros: List[Logro]):
+        """Registra el catálogo en la tabla logros (una vez por proceso) y asigna los ids"""
+        with self._lock:
+            if not self._ids_logros:
+                filas = [logro.to_dict() for logro in logros]
+                for fila in filas:
+                    fila.pop('id', None)
+                LogroRepository._ids_logros = self.db_logros.sincronizar_catalogo(filas)
+            for logro in logros:
+                logro.id = self._ids_logros.get(logro.codigo, logro.id)
+    
+    def _usa_mysql(self, paciente_id) -> bool:
+        return self.use_mysql and str(paciente_id).isdigit()
+    
+    def obtener_progreso(self, paciente_id) -> ProgresoLogros:
+        """Progreso de logros del paciente"""
+        if self._usa_mysql(paciente_id):
+            filas = self.db_logros.obtener_progreso_pacientes([int(paciente_id)])
+            progreso = self.indice.restaurar(
+                (fila['codigo'], fila['progreso_actual'], bool(fila['completado'])) for fila in filas
+            )
+            progreso.valores.update(self.db_logros.obtener_metricas(int(paciente_id)))
+            return progreso
+        
+        with self._lock:
+            return self._memoria.get(str(paciente_id)) or ProgresoLogros()
+    
+    def evaluar(self, eventos: List[Tuple]) -> Dict[str, List[Logro]]:
+        """
+        Incorpora los valores de muchos resultados al progreso de sus pacientes
+        
+        Args:
+            eventos: (paciente_id, {metrica: valor}) por resultado
+        
+        Returns:
+            Dict: paciente_id (str) -> logros nuevos desbloqueados
+        """
+        nuevos_por_paciente: Dict[str, List[Logro]] = {}
+        en_mysql = [(paciente_id, valores) for paciente_id, valores in eventos if self._usa_mysql(paciente_id)]
+        if en_mysql:
+            nuevos_por_paciente.update(self._evaluar_mysql(en_mysql))
+        
+        with self._lock:
+            for paciente_id, valores in eventos:
+                if self._usa_mysql(paciente_id):
+                    continue
+                progreso = self._memoria.setdefault(str(paciente_id), ProgresoLogros())
+                nuevos = self.indice.evaluar(progreso, valores)
+                if nuevos:
+                    nuevos_por_paciente.setdefault(str(paciente_id), []).extend(nuevos)
+        return nuevos_por_paciente
+    
+    def _evaluar_mysql(self, eventos: List[Tuple]) -> Dict[str, List[Logro]]:
+        """
+        Suma los valores a las métricas en MySQL y guarda, en la misma
+        transacción, los logros que cruzó cada cambio y el progreso del
+        siguiente logro pendiente de cada métrica
+        """
+        valores = [
+            (int(paciente_id), metrica, self.indice.modos[metrica], valor)
+            for paciente_id, valores_evento in eventos
+            for metrica, valor in valores_evento.items()
+            if valor is not None and self.indice.logros(metrica)
+        ]
+        nuevos_por_paciente: Dict[str, List[Logro]] = {}
+        ahora = datetime.now()
+        
+        def filas_progreso(cambios: List[Tuple]) -> List[Tuple]:
+            filas = []
+            for (paciente_id, metrica, _, _), (anterior, actual) in zip(valores, cambios):
+                for logro in self.indice.cruzados(metrica, anterior, actual):
+                    nuevos_por_paciente.setdefault(str(paciente_id), []).append(logro)
+                    filas.append((paciente_id, logro, actual, True, ahora))
+                siguiente = self.indice.siguiente(metrica, actual)
+                if siguiente is not None and actual != anterior:
+                    filas.append((paciente_id, siguiente, actual, False, None))
+            return [
+                (paciente_id, self._ids_logros[logro.codigo], self._entero(logro, valor), completado, fecha)
+                for paciente_id, logro, valor, completado, fecha in filas
+                if logro.codigo in self._ids_logros
+            ]
+        
+        self.db_logros.registrar_metricas(valores, filas_progreso)
+        return nuevos_por_paciente
+    
+    def _entero(self, logro: Logro, valor: float) -> int:
+        """
+        Redondea el progreso para la columna entera sin cambiar qué logros
+        cumple (los requisitos son enteros)
+        """
+        if MODOS_METRICA[logro.metrica] == MINIMO:
+            return math.ceil(valor)
+        return math.floor(valor)
 
 
 @dataclass
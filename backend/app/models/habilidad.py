@@ -0,0 +1,209 @@
+"""
+Modelo de Habilidad - Estado de habilidad del paciente por ejercicio
+Responsable del rating tipo Elo/Glicko y las tasas con promedio exponencial que se actualizan en O(1) con cada resultado
+"""
+import json
+import math
+import os
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.utils.cache import CacheLRU
+
+# Estados cargados, por archivo; la etiqueta es (mtime, tamaño) para ver escrituras de otros procesos
+_habilidades = CacheLRU(max_costo=4096, nombre='habilidad')
+
+RATING_INICIAL = 1000.0
+# Dificultad de un ejercicio en la misma escala: nivel 1 = 1000, cada nivel suma 100
+DIFICULTAD_BASE = 1000.0
+DIFICULTAD_POR_NIVEL = 100.0
+
+# Incertidumbre del rating (como el RD de Glicko): baja con cada resultado y sube con la inactividad
+INCERTIDUMBRE_INICIAL = 350.0
+INCERTIDUMBRE_MINIMA = 50.0
+# Incertidumbre de un solo resultado como medición de la habilidad
+INCERTIDUMBRE_RESULTADO = 250.0
+# Cuánto crece la incertidumbre por cada día sin practicar el ejercicio
+INCERTIDUMBRE_POR_DIA = 15.0
+
+# Paso del rating: proporcional a la incertidumbre, entre K_MINIMO y K_MAXIMO
+K_MAXIMO = 160.0
+K_MINIMO = 32.0
+
+# Peso del resultado nuevo en las tasas con promedio exponencial
+ALFA_PROMEDIO = 0.2
+
+
+def dificultad_nivel(nivel: int) -> float:
+    """Rating de dificultad de un nivel (1, 2, 3...)"""
+    return DIFICULTAD_BASE + DIFICULTAD_POR_NIVEL * (max(int(nivel or 1), 1) - 1)
+
+
+def probabilidad_exito(rating: float, dificultad: float) -> float:
+    """Probabilidad esperada de éxito (curva logística de Elo)"""
+    return 1.0 / (1.0 + 10 ** ((dificultad - rating) / 400.0))
+
+
+@dataclass
+class HabilidadEjercicio:
+    """Estado de habilidad del paciente en un ejercicio"""
+    rating: float = RATING_INICIAL
+    incertidumbre: float = INCERTIDUMBRE_INICIAL
+    intentos: int = 0
+    # Promedios exponenciales: éxito en [0, 1], precisión en %
+    tasa_exito: Optional[float] = None
+    precision: Optional[float] = None
+    ultima_fecha: Optional[str] = None
+    
+    def registrar(self, dificultad: float, exito: bool, precision: Optional[float], fecha: str):
+        """
+        Aplica un resultado al estado
+        
+        El puntaje observado es el éxito, promediado con la precisión cuando
+        existe (0.5 * éxito + 0.5 * precisión); el rating se mueve hacia él en
+        proporción a la diferencia con la probabilidad esperada.
+        """
+        if self.ultima_fecha and fecha > self.ultima_fecha:
+            try:
+                dias = (datetime.fromisoformat(fecha) - datetime.fromisoformat(self.ultima_fecha)).total_seconds() / 86400
+                self.incertidumbre = min(
+                    INCERTIDUMBRE_INICIAL, math.sqrt(self.incertidumbre ** 2 + INCERTIDUMBRE_POR_DIA ** 2 * dias)
+                )
+            except ValueError:
+                pass
+        
+        if precision is not None:
+            precision = min(max(float(precision), 0.0), 100.0)
+            puntaje = 0.5 * float(exito) + 0.5 * precision / 100.0
+        else:
+            puntaje = float(exito)
+        
+        k = max(K_MINIMO, K_MAXIMO * self.incertidumbre / INCERTIDUMBRE_INICIAL)
+        self.rating += k * (puntaje - probabilidad_exito(self.rating, dificultad))
+        self.incertidumbre = max(
+            INCERTIDUMBRE_MINIMA,
+            1.0 / math.sqrt(1.0 / self.incertidumbre ** 2 + 1.0 / INCERTIDUMBRE_RESULTADO ** 2)
+        )
+        
+        self.intentos += 1
+        self.tasa_exito = self._promediar(self.tasa_exito, float(exito))
+        if precision is not None:
+            self.precision = self._promediar(self.precision, precision)
+        if not self.ultima_fecha or fecha > self.ultima_fecha:
+            self.ultima_fecha = fecha
+    
+    @staticmethod
+    def _promediar(actual: Optional[float], valor: float) -> float:
+        return valor if actual is None else actual + ALFA_PROMEDIO * (valor - actual)
+    
+    def to_dict(self) -> Dict:
+        """Convierte el estado a diccionario"""
+        return asdict(self)
+
+
+@dataclass
+class HabilidadPaciente:
+    """Estado de habilidad de un paciente en cada ejercicio que practicó"""
+    paciente_id: str
+    ejercicios: Dict[str, HabilidadEjercicio] = field(default_factory=dict)
+    # Resultados del historial ya aplicados: si no coincide con el historial el estado se reconstruye
+    aplicados: int = 0
+    
+    def registrar(self, ejercicio_id: str, dificultad: float, exito: bool,
+                  precision: Optional[float], fecha: str, rating_inicial: float = RATING_INICIAL):
+        """
+        Aplica un resultado del historial al ejercicio correspondiente
+        
+        ``rating_inicial`` es la estimación con la que arranca un ejercicio
+        que todavía no se practicó.
+        """
+        habilidad = self.ejercicios.get(ejercicio_id)
+        if habilidad is None:
+            habilidad = self.ejercicios[ejercicio_id] = HabilidadEjercicio(rating=rating_inicial)
+        habilidad.registrar(dificultad, exito, precision, fecha)
+        self.aplicados += 1
+    
+    def to_dict(self) -> Dict:
+        """Convierte el estado a diccionario"""
+        return {
+            'paciente_id': self.paciente_id,
+            'aplicados': self.aplicados,
+            'ejercicios': {ejercicio_id: h.to_dict() for ejercicio_id, h in self.ejercicios.items()}
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HabilidadPaciente':
+        """Crea el estado desde un diccionario"""
+        return cls(
+            paciente_id=str(data['paciente_id']),
+            ejercicios={
+                ejercicio_id: HabilidadEjercicio(**h) for ejercicio_id, h in data.get('ejercicios', {}).items()
+            },
+            aplicados=int(data.get('aplicados', 0))
+        )
+
+
+class HabilidadRepository:
+    """
+    Estado de habilidad por paciente en ``<habilidad_path>/<paciente_id>.json``.
+    
+    El archivo es chico (un registro por ejercicio practicado) y se reemplaza
+    de forma atómica en cada actualización. Como se puede reconstruir desde
+    el historial no se fuerza a disco: si se pierde una escritura, ``aplicados``
+    deja de coincidir con el historial y el estado se vuelve a calcular.
+    Quien llama debe serializar las actualizaciones de un paciente (el
+    servicio usa el bloqueo del historial).
+    """
+    
+    def __init__(self, habilidad_path: str = "data/pacientes/habilidad"):
+        self.habilidad_path = habilidad_path
+    
+    def ruta(self, paciente_id: str) -> str:
+        """Ruta del archivo de estado del paciente"""
+        return os.path.join(self.habilidad_path, f"{paciente_id}.json")
+    
+    @staticmethod
+    def _stat(ruta: str):
+        try:
+            stat = os.stat(ruta)
+            return (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            return None
+    
+    def obtener(self, paciente_id: str) -> Optional[HabilidadPaciente]:
+        """Estado guardado del paciente (None si no existe o no se puede leer)"""
+        ruta = self.ruta(paciente_id)
+        firma = self._stat(ruta)
+        if firma is None:
+            return None
+        
+        habilidad = _habilidades.obtener(ruta, etiqueta=firma)
+        if habilidad is None:
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    habilidad = HabilidadPaciente.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"⚠️ Estado de habilidad inválido para '{paciente_id}', se reconstruye: {e}")
+                return None
+            _habilidades.guardar(ruta, habilidad, costo=1, etiqueta=firma)
+        return habilidad
+    
+    def guardar(self, habilidad: HabilidadPaciente):
+        """Reemplaza el estado guardado del paciente"""
+        os.makedirs(self.habilidad_path, exist_ok=True)
+        ruta = self.ruta(habilidad.paciente_id)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(habilidad.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporal, ruta)
+        _habilidades.guardar(ruta, habilidad, costo=1, etiqueta=self._stat(ruta))
+    
+    def invalidar(self, paciente_id: str):
+        """Descarta el estado del paciente para que se reconstruya desde el historial"""
+        ruta = self.ruta(paciente_id)
+        _habilidades.invalidar(ruta)
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
@@ -5,8 +5,9 @@ Responsable de la representación de datos y lógica de negocio de pacientes
 import json
 import os
 import sys
+import threading
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, asdict
 
 # Agregar el directorio raíz al path para importar configuraciones
@@ -46,9 +47,35 @@ class Paciente:
         return data
 
 
+class _IndicePacientesJson:
+    """
+    Índice en memoria del archivo pacientes.json.
+
+    Guarda los pacientes por id y por email para búsquedas O(1) y se
+    reconstruye solo cuando cambia el archivo (mtime o tamaño).
+    """
+    
+    def __init__(self):
+        self.firma: Optional[Tuple[int, int]] = None
+        self.pacientes: List[Paciente] = []
+        self.por_id: Dict[str, Paciente] = {}
+        self.por_email: Dict[str, Paciente] = {}
+    
+    def reconstruir(self, pacientes: List[Paciente], firma: Optional[Tuple[int, int]]):
+        """Reemplaza el contenido del índice"""
+        self.pacientes = pacientes
+        self.por_id = {p.id: p for p in pacientes}
+        self.por_email = {p.email.lower(): p for p in pacientes}
+        self.firma = firma
+
+
 class PacienteRepository:
     """Repositorio para manejo de datos de pacientes - Patrón Repository con MySQL"""
     
+    # Índices compartidos por todas las instancias, uno por archivo
+    _indices_json: Dict[str, _IndicePacientesJson] = {}
+    _indices_lock = threading.Lock()
+    
     def __init__(self, data_path: str = "data/pacientes"):
         self.data_path = data_path
         self.pacientes_file = os.path.join(data_path, "pacientes.json")
@@ -69,24 +96,25 @@ class PacienteRepository:
         os.makedirs(self.data_path, exist_ok=True)
         os.makedirs(self.historial_path, exist_ok=True)
     
+    @staticmethod
+    def _from_mysql(p_data: Dict, password: str = '') -> Paciente:
+        """Convierte un registro de MySQL a objeto Paciente"""
+        return Paciente(
+            nombre=p_data['nombre'],
+            email=p_data['email'],
+            password=password,
+            edad=str(p_data['edad']),
+            id=str(p_data['id']),
+            fecha_registro=p_data['fecha_registro'].isoformat() if hasattr(p_data['fecha_registro'], 'isoformat') else str(p_data['fecha_registro'])
+        )
+    
     def get_all(self) -> List[Paciente]:
         """Obtiene todos los pacientes"""
         if self.use_mysql and self.db_service:
             try:
                 pacientes_data = self.db_service.pacientes.obtener_todos_pacientes()
-                pacientes = []
-                for p_data in pacientes_data:
-                    # Convertir datos de MySQL a objeto Paciente
-                    paciente = Paciente(
-                        nombre=p_data['nombre'],
-                        email=p_data['email'],
-                        password='',  # No devolver contraseña
-                        edad=str(p_data['edad']),
-                        id=str(p_data['id']),
-                        fecha_registro=p_data['fecha_registro'].isoformat() if hasattr(p_data['fecha_registro'], 'isoformat') else str(p_data['fecha_registro'])
-                    )
-                    pacientes.append(paciente)
-                return pacientes
+                # No devolver contraseña
+                return [self._from_mysql(p_data) for p_data in pacientes_data]
             except Exception as e:
                 print(f"⚠️ Error al obtener pacientes de MySQL: {e}")
                 # Fallback a JSON
@@ -96,21 +124,42 @@ class PacienteRepository:
     
     def _get_all_json(self) -> List[Paciente]:
         """Obtiene todos los pacientes desde JSON (fallback)"""
-        if not os.path.exists(self.pacientes_file):
-            return []
-        
+        return list(self._indice_json().pacientes)
+    
+    def _indice_json(self) -> _IndicePacientesJson:
+        """Obtiene el índice del archivo JSON, reconstruyéndolo si el archivo cambió"""
         try:
-            with open(self.pacientes_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                return [Paciente.from_dict(p) for p in data]
-        except (json.JSONDecodeError, FileNotFoundError):
-            return []
+            stat = os.stat(self.pacientes_file)
+            firma = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            firma = None
+        
+        with self._indices_lock:
+            indice = self._indices_json.setdefault(self.pacientes_file, _IndicePacientesJson())
+            if indice.firma == firma and firma is not None:
+                return indice
+            
+            pacientes = []
+            if firma is not None:
+                try:
+                    with open(self.pacientes_file, "r", encoding="utf-8") as f:
+                        pacientes = [Paciente.from_dict(p) for p in json.load(f)]
+                except (json.JSONDecodeError, FileNotFoundError):
+                    pacientes = []
+            indice.reconstruir(pacientes, firma)
+            return indice
     
     def save_all(self, pacientes: List[Paciente]):
         """Guarda todos los pacientes (solo para JSON)"""
         data = [p.to_dict() for p in pacientes]
         with open(self.pacientes_file, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        
+        # Actualizar el índice sin esperar a detectar el cambio por mtime
+        stat = os.stat(self.pacientes_file)
+        with self._indices_lock:
+            indice = self._indices_json.setdefault(self.pacientes_file, _IndicePacientesJson())
+            indice.reconstruir(list(pacientes), (stat.st_mtime_ns, stat.st_size))
     
     def add(self, paciente: Paciente) -> bool:
         """Agrega un nuevo paciente"""
@@ -145,27 +194,40 @@ class PacienteRepository:
     
     def _add_json(self, paciente: Paciente) -> bool:
         """Agrega un paciente usando JSON (fallback)"""
-        pacientes = self._get_all_json()
-        
         # Verificar si ya existe el email
-        for p in pacientes:
-            if p.email.lower() == paciente.email.lower():
-                return False
+        if self._find_by_email_json(paciente.email):
+            return False
         
+        pacientes = self._get_all_json()
         pacientes.append(paciente)
         self.save_all(pacientes)
         return True
     
+    def find_by_id(self, paciente_id: str) -> Optional[Paciente]:
+        """Busca un paciente por ID"""
+        if self.use_mysql and self.db_service:
+            try:
+                if not str(paciente_id).isdigit():
+                    # Los IDs de pacientes en JSON no son numéricos
+                    return self._find_by_id_json(paciente_id)
+                paciente_data = self.db_service.pacientes.obtener_paciente_por_id(int(paciente_id))
+                return self._from_mysql(paciente_data) if paciente_data else None
+            except Exception as e:
+                print(f"⚠️ Error al buscar paciente en MySQL: {e}")
+                return self._find_by_id_json(paciente_id)
+        else:
+            return self._find_by_id_json(paciente_id)
+    
+    def _find_by_id_json(self, paciente_id: str) -> Optional[Paciente]:
+        """Busca un paciente por ID en JSON (fallback)"""
+        return self._indice_json().por_id.get(str(paciente_id))
+    
     def find_by_email(self, email: str) -> Optional[Paciente]:
         """Busca un paciente por email"""
         if self.use_mysql and self.db_service:
             try:
-                # No hay método directo, buscar en todos
-                pacientes = self.get_all()
-                for p in pacientes:
-                    if p.email.lower() == email.lower():
-                        return p
-                return None
+                paciente_data = self.db_service.pacientes.obtener_paciente_por_email(email)
+                return self._from_mysql(paciente_data) if paciente_data else None
             except Exception as e:
                 print(f"⚠️ Error al buscar paciente en MySQL: {e}")
                 return self._find_by_email_json(email)
@@ -174,11 +236,7 @@ class PacienteRepository:
     
     def _find_by_email_json(self, email: str) -> Optional[Paciente]:
         """Busca un paciente por email en JSON (fallback)"""
-        pacientes = self._get_all_json()
-        for p in pacientes:
-            if p.email.lower() == email.lower():
-                return p
-        return None
+        return self._indice_json().por_email.get(email.lower())
     
     def find_by_credentials(self, email: str, password: str) -> Optional[Paciente]:
         """Busca un paciente por email y contraseña"""
@@ -186,16 +244,8 @@ class PacienteRepository:
             try:
                 paciente_data = self.db_service.pacientes.autenticar_paciente(email, password)
                 if paciente_data:
-                    # Convertir datos de MySQL a objeto Paciente
-                    paciente = Paciente(
-                        nombre=paciente_data['nombre'],
-                        email=paciente_data['email'],
-                        password=password,  # Guardar temporalmente para validación
-                        edad=str(paciente_data['edad']),
-                        id=str(paciente_data['id']),
-                        fecha_registro=paciente_data['fecha_registro'].isoformat() if hasattr(paciente_data['fecha_registro'], 'isoformat') else str(paciente_data['fecha_registro'])
-                    )
-                    return paciente
+                    # Guardar contraseña temporalmente para validación
+                    return self._from_mysql(paciente_data, password=password)
                 return None
             except Exception as e:
                 print(f"⚠️ Error al autenticar en MySQL: {e}")
@@ -1,11 +1,19 @@
 """
 Modelo de Sesión - Gestión de sesiones de terapia con seguridad y tracking
 """
+import atexit
+import os
+import sys
+import threading
 from dataclasses import dataclass, asdict
-from typing import Dict, Optional, List
+from typing import Any, Callable, Dict, Iterator, Optional, List
 from datetime import datetime, timedelta
 from enum import Enum
 
+# Agregar el directorio raíz al path para importar configuraciones
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from app.database.mysql_manager import SesionTerapiaManager
+
 
 class EstadoSesion(Enum):
     """Estados posibles de una sesión"""
@@ -18,6 +26,13 @@ class EstadoSesion(Enum):
     CANCELADA = "cancelada"
 
 
+# Estados de una sesión que todavía no terminó
+ESTADOS_ACTIVOS = (
+    EstadoSesion.PENDIENTE, EstadoSesion.CALENTAMIENTO, EstadoSesion.EN_CURSO,
+    EstadoSesion.PAUSA, EstadoSesion.ENFRIAMIENTO
+)
+
+
 class TipoTerapia(Enum):
     """Tipos de terapia disponibles"""
     REHABILITACION = "rehabilitacion"
@@ -124,6 +139,10 @@ class Sesion:
         """Verifica si la sesión excede el límite de tiempo"""
         return self.tiempo_transcurrido() >= limite_minutos
     
+    def esta_activa(self) -> bool:
+        """Indica si la sesión todavía no se completó ni se canceló"""
+        return self.estado in ESTADOS_ACTIVOS
+    
     def to_dict(self) -> Dict:
         """Convierte a diccionario"""
         data = asdict(self)
@@ -152,6 +171,59 @@ class Sesion:
                 data[campo] = datetime.fromisoformat(data[campo])
         
         return cls(**data)
+    
+    def to_registro(self) -> Dict[str, Any]:
+        """Convierte a una fila de la tabla sesiones_terapia"""
+        return {
+            'id': self.id,
+            'paciente_id': int(self.paciente_id),
+            'fecha_sesion': self.fecha_sesion,
+            'tipo_terapia': self.tipo_terapia.value,
+            'duracion_minutos': self.duracion_minutos,
+            'observaciones': self.observaciones,
+            'fecha_inicio': self.fecha_inicio,
+            'fecha_fin': self.fecha_fin,
+            'calentamiento_completado': self.calentamiento_completado,
+            'enfriamiento_completado': self.enfriamiento_completado,
+            'nivel_fatiga': self.nivel_fatiga,
+            'nivel_dolor': self.nivel_dolor,
+            'alertas_descanso': self.alertas_descanso,
+            'pausas_tomadas': self.pausas_tomadas,
+            'estado': self.estado.value
+        }
+    
+    @classmethod
+    def from_registro(cls, registro: Dict) -> 'Sesion':
+        """Crea desde una fila de la tabla sesiones_terapia"""
+        try:
+            tipo_terapia = TipoTerapia(registro.get('tipo_terapia'))
+        except ValueError:
+            tipo_terapia = TipoTerapia.MIXTA
+        
+        # Las filas anteriores a la columna estado no lo guardan: una sesión con
+        # fecha de fin se considera completada
+        fecha_fin = registro.get('fecha_fin')
+        try:
+            estado = EstadoSesion(registro.get('estado'))
+        except ValueError:
+            estado = EstadoSesion.COMPLETADA if fecha_fin else EstadoSesion.PENDIENTE
+        return cls(
+            id=registro.get('id'),
+            paciente_id=registro.get('paciente_id'),
+            tipo_terapia=tipo_terapia,
+            duracion_minutos=registro.get('duracion_minutos') or 0,
+            fecha_sesion=registro.get('fecha_sesion'),
+            fecha_inicio=registro.get('fecha_inicio'),
+            fecha_fin=fecha_fin,
+            estado=estado,
+            calentamiento_completado=bool(registro.get('calentamiento_completado')),
+            enfriamiento_completado=bool(registro.get('enfriamiento_completado')),
+            nivel_fatiga=registro.get('nivel_fatiga'),
+            nivel_dolor=registro.get('nivel_dolor'),
+            alertas_descanso=registro.get('alertas_descanso') or 0,
+            pausas_tomadas=registro.get('pausas_tomadas') or 0,
+            observaciones=registro.get('observaciones')
+        )
 
 
 @dataclass
@@ -272,3 +344,259 @@ class AlertaSeguridad:
             severidad='warning'
         )
 
+
+class SesionRepository:
+    """Repositorio de sesiones de terapia guardadas en MySQL"""
+    
+    def __init__(self):
+        try:
+            self.db_sesiones = SesionTerapiaManager()
+            self.use_mysql = True
+        except Exception as e:
+            print(f"⚠️ No se pudo conectar a MySQL, no hay sesiones guardadas: {e}")
+            self.db_sesiones = None
+            self.use_mysql = False
+    
+    def iterar_sesiones(self, paciente_id: str) -> Iterator[Sesion]:
+        """
+        Recorre las sesiones del paciente (más recientes primero) sin cargarlas todas
+        
+        Los pacientes guardados solo en JSON (id no numérico) no tienen sesiones.
+        Si el iterador tiene ``close`` (conexión abierta), quien lo recibe debe
+        llamarlo aunque no lo recorra.
+        """
+        if not self.use_mysql or not str(paciente_id).isdigit():
+            return iter(())
+        
+        return self.db_sesiones.iterar_sesiones_paciente(int(paciente_id), convertir=Sesion.from_registro)
+
+
+class SesionesActivas:
+    """
+    Sesiones en curso de todos los pacientes, en memoria y con escritura diferida.
+    
+    Las transiciones (pausar, reanudar, calentamiento, ...) se aplican sobre
+    el objeto Sesion en memoria y solo lo marcan como pendiente; las sesiones
+    pendientes se escriben en sesiones_terapia en un solo lote cada
+    ``intervalo`` segundos y al completarse o cancelarse una sesión. Así una
+    transición no cuesta una escritura en MySQL.
+    
+    Tras un reinicio las sesiones que estaban en curso se recargan desde la
+    tabla (columna ``estado``); se pierden a lo sumo las transiciones del
+    último intervalo. Los pacientes que solo existen en JSON o un entorno sin
+    MySQL mantienen la sesión únicamente en memoria.
+    """
+    
+    # paciente -> sesión en curso
+    _activas: Dict[str, Sesion] = {}
+    # paciente -> última sesión terminada que todavía espera la encuesta
+    _finalizadas: Dict[str, Sesion] = {}
+    # id(sesion) -> sesión con cambios sin escribir
+    _pendientes: Dict[int, Sesion] = {}
+    # Funciones que se llaman (con el lock tomado) cada vez que cambia una sesión
+    _observadores: List[Callable[[Sesion], None]] = []
+    _recuperadas = False
+    _lock = threading.RLock()
+    # Un solo vaciado a la vez: las sesiones nuevas reciben su id antes del siguiente
+    _vaciado_lock = threading.Lock()
+    _hilo: Optional[threading.Thread] = None
+    _detener = threading.Event()
+    
+    def __init__(self):
+        try:
+            self.db_sesiones = SesionTerapiaManager()
+            self.use_mysql = True
+        except Exception as e:
+            print(f"⚠️ No se pudo conectar a MySQL, sesiones activas solo en memoria: {e}")
+            self.db_sesiones = None
+            self.use_mysql = False
+        self._recuperar()
+    
+    def _usa_mysql(self, paciente_id) -> bool:
+        return self.use_mysql and str(paciente_id).isdigit()
+    
+    def _recuperar(self):
+        """Recarga una vez por proceso las sesiones que quedaron en curso en MySQL"""
+        with self._lock:
+            if SesionesActivas._recuperadas or not self.use_mysql:
+                return
+            try:
+                registros = self.db_sesiones.obtener_sesiones_en_estado(
+                    [estado.value for estado in ESTADOS_ACTIVOS]
+                )
+            except Exception as e:
+                print(f"⚠️ No se pudieron recuperar las sesiones en curso: {e}")
+                return
+            
+            for registro in registros:
+                sesion = Sesion.from_registro(registro)
+                # Ordenadas por fecha: si hubiera dos, queda la más reciente
+                self._activas[str(sesion.paciente_id)] = sesion
+            SesionesActivas._recuperadas = True
+            if registros:
+                print(f"✅ {len(registros)} sesiones en curso recuperadas")
+    
+    def obtener(self, paciente_id) -> Optional[Sesion]:
+        """Sesión en curso del paciente"""
+        with self._lock:
+            return self._activas.get(str(paciente_id))
+    
+    def activas(self) -> List[Sesion]:
+        """Sesiones en curso de todos los pacientes"""
+        with self._lock:
+            return list(self._activas.values())
+    
+    def suscribir(self, observador: Callable[[Sesion], None]):
+        """
+        Registra una función que recibe cada sesión registrada o modificada
+        
+        Se llama con el lock del almacén tomado: no debe aplicar transiciones.
+        """
+        with self._lock:
+            if observador not in self._observadores:
+                self._observadores.append(observador)
+    
+    def _notificar(self, sesion: Sesion):
+        for observador in self._observadores:
+            try:
+                observador(sesion)
+            except Exception as e:
+                print(f"⚠️ Error al notificar el cambio de sesión: {e}")
+    
+    def registrar(self, sesion: Sesion) -> Optional[Sesion]:
+        """
+        Registra la nueva sesión en curso del paciente
+        
+        Si el paciente tenía otra sesión sin terminar se cancela.
+        
+        Returns:
+            Optional[Sesion]: la sesión anterior cancelada, si había una
+        """
+        clave = str(sesion.paciente_id)
+        with self._lock:
+            anterior = self._activas.pop(clave, None)
+            if anterior is not None:
+                anterior.observaciones = 'Cancelada: se inició una nueva sesión'
+                anterior.cancelar()
+                self._marcar(anterior)
+                self._notificar(anterior)
+            self._finalizadas.pop(clave, None)
+            
+            self._activas[clave] = sesion
+            self._marcar(sesion)
+            self._notificar(sesion)
+        if anterior is not None:
+            self.vaciar()
+        return anterior
+    
+    def aplicar(self, paciente_id, transicion: Callable[[Sesion], Any],
+                finalizada: bool = False) -> Optional[Any]:
+        """
+        Aplica una transición a la sesión del paciente y la marca como pendiente
+        
+        Si la sesión termina con la transición deja de estar en curso y se
+        escribe de inmediato junto con el resto de pendientes.
+        
+        Args:
+            paciente_id: ID del paciente
+            transicion: función que recibe la Sesion y retorna el resultado
+            finalizada: aplicarla a la última sesión terminada (encuesta) en
+                lugar de a la sesión en curso
+        
+        Returns:
+            El resultado de la transición o None si no hay sesión
+        """
+        clave = str(paciente_id)
+        with self._lock:
+            if finalizada:
+                sesion = self._finalizadas.pop(clave, None)
+            else:
+                sesion = self._activas.get(clave)
+            if sesion is None:
+                return None
+            
+            resultado = transicion(sesion)
+            self._marcar(sesion)
+            self._notificar(sesion)
+            
+            terminada = finalizada or not sesion.esta_activa()
+            if not finalizada and terminada:
+                del self._activas[clave]
+                self._finalizadas[clave] = sesion
+        if terminada:
+            self.vaciar()
+        return resultado
+    
+    def _marcar(self, sesion: Sesion):
+        if self._usa_mysql(sesion.paciente_id):
+            self._pendientes[id(sesion)] = sesion
+    
+    def pendientes(self) -> int:
+        """Cantidad de sesiones con cambios sin escribir"""
+        with self._lock:
+            return len(self._pendientes)
+    
+    def vaciar(self) -> int:
+        """
+        Escribe en un solo lote las sesiones con cambios pendientes
+        
+        El lote se escribe en una sola transacción: si falla no queda nada
+        escrito y las sesiones quedan pendientes para el próximo vaciado.
+        
+        Returns:
+            int: cantidad de sesiones escritas
+        """
+        with self._vaciado_lock:
+            with self._lock:
+                if not self._pendientes:
+                    return 0
+                lote = list(self._pendientes.values())
+                self._pendientes.clear()
+                # Copia de los valores: las transiciones pueden seguir mientras se escribe
+                registros = [sesion.to_registro() for sesion in lote]
+            
+            nuevas = [(sesion, registro) for sesion, registro in zip(lote, registros) if registro['id'] is None]
+            actualizadas = [registro for registro in registros if registro['id'] is not None]
+            try:
+                ids = self.db_sesiones.guardar_sesiones([registro for _, registro in nuevas], actualizadas)
+            except Exception as e:
+                print(f"⚠️ No se pudieron guardar {len(lote)} sesiones, se reintentará: {e}")
+                with self._lock:
+                    for sesion in lote:
+                        self._pendientes.setdefault(id(sesion), sesion)
+                return 0
+            
+            with self._lock:
+                for (sesion, _), sesion_id in zip(nuevas, ids):
+                    sesion.id = sesion_id
+            return len(lote)
+    
+    def iniciar_vaciado(self, intervalo: float = 5):
+        """Inicia el hilo que vacía las sesiones pendientes periódicamente (una sola vez)"""
+        with self._lock:
+            if SesionesActivas._hilo is not None:
+                return
+            SesionesActivas._detener.clear()
+            SesionesActivas._hilo = threading.Thread(
+                target=self._ejecutar_vaciado, args=(intervalo,),
+                name='vaciado-sesiones-terapia', daemon=True
+            )
+            SesionesActivas._hilo.start()
+            # Al cerrar el proceso se escriben las transiciones del último intervalo
+            atexit.register(self.detener_vaciado)
+    
+    def detener_vaciado(self, timeout: Optional[float] = None):
+        """Detiene el hilo de vaciado y escribe lo que quede pendiente"""
+        SesionesActivas._detener.set()
+        hilo = SesionesActivas._hilo
+        if hilo is not None:
+            hilo.join(timeout)
+            SesionesActivas._hilo = None
+        self.vaciar()
+    
+    def _ejecutar_vaciado(self, intervalo: float):
+        while not SesionesActivas._detener.wait(intervalo):
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"⚠️ Error al vaciar sesiones pendientes: {e}")
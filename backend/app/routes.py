@@ -160,6 +160,18 @@ def registrar_resultado():
     return ejercicio_controller.registrar_resultado()
 
 
+@ejercicio_bp.route('/resultados/lote', methods=['POST'])
+def registrar_resultados_lote():
+    """API para registrar varios resultados de ejercicio en una sola petición"""
+    return ejercicio_controller.registrar_resultados_lote()
+
+
+@ejercicio_bp.route('/telemetria/<intento_id>', methods=['POST'])
+def registrar_telemetria(intento_id):
+    """API para enviar la telemetría de movimiento de un intento"""
+    return ejercicio_controller.registrar_telemetria(intento_id)
+
+
 @ejercicio_bp.route('/historial', methods=['GET'])
 def obtener_historial():
     """API para obtener historial de ejercicios"""
@@ -1,17 +1,112 @@
 """
 Servicio de Configuración - Lógica de negocio para configuración de pacientes
 """
+import hashlib
+import json
 from typing import Dict, Optional
+from app.models.catalogo import Listado
 from app.models.configuracion import (
     ConfiguracionPaciente, CalibracionPaciente,
     ConfiguracionAccesibilidad, ConfiguracionSeguridad,
+    ConfiguracionRepository,
     ModoAccesibilidad, ManosHabilitadas, TamanoObjetivos
 )
+from app.models.ejercicio import Ejercicio
+from app.utils.cache import CacheLRU
+from config.settings import get_database_config
+
+# Parámetros de ejercicio ya resueltos y codificados, compartidos por todas las instancias.
+# Clave: (paciente, ejercicio); etiqueta: versión de la configuración con la que se resolvieron
+_parametros_cache = CacheLRU(max_costo=4096, nombre='parametros_ejercicio')
 
 
 class ConfiguracionService:
     """Servicio para gestionar configuraciones de pacientes"""
     
+    def __init__(self):
+        self.configuracion_repo = ConfiguracionRepository(get_database_config()['configuracion_path'])
+    
+    def obtener_configuracion(self, paciente_id) -> ConfiguracionPaciente:
+        """Configuración guardada del paciente (la de defecto si nunca la cambió)"""
+        return self.configuracion_repo.obtener(paciente_id)
+    
+    def guardar_configuracion(self, config: ConfiguracionPaciente):
+        """Guarda la configuración; los parámetros resueltos con la versión anterior dejan de servir"""
+        self.configuracion_repo.guardar(config)
+        paciente_id = str(config.paciente_id)
+        _parametros_cache.invalidar_si(lambda clave: clave[0] == paciente_id)
+    
+    def parametros_ejercicio(self, paciente_id, ejercicio: Ejercicio) -> Listado:
+        """
+        Parámetros del ejercicio resueltos para el paciente, en JSON ya
+        codificado y con su ETag
+        
+        Se calculan una vez por (paciente, ejercicio, versión de la
+        configuración): mientras la configuración no cambie solo se consulta
+        la versión guardada.
+        """
+        clave = (str(paciente_id), ejercicio.id)
+        version = self.configuracion_repo.version(paciente_id)
+        listado = _parametros_cache.obtener(clave, etiqueta=version)
+        if listado is None:
+            config = self.configuracion_repo.obtener(paciente_id)
+            cuerpo = {'success': True, **self.resolver_parametros(config, ejercicio)}
+            datos = json.dumps(cuerpo, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            listado = (datos, hashlib.sha256(datos).hexdigest()[:32])
+            # La versión leída es la de la configuración usada: si cambió entre ambas lecturas no se guarda
+            if config.version == version:
+                _parametros_cache.guardar(clave, listado, costo=1, etiqueta=version)
+        return listado
+    
+    def resolver_parametros(self, config: ConfiguracionPaciente, ejercicio: Ejercicio) -> Dict:
+        """
+        Combina los parámetros del ejercicio con la configuración del paciente
+        
+        - velocidad_objetivo se multiplica por la velocidad de juego y
+          tamaño_objetivo (px) por la escala del tamaño de objetivos
+        - alcance: rango de movimiento calibrado respecto del máximo
+          fisiológico (0 a 1) por articulación, para limitar la zona donde
+          aparecen los objetivos
+        """
+        acc = config.accesibilidad
+        cal = config.calibracion
+        seg = config.seguridad
+        multiplicador = acc.obtener_multiplicador_velocidad()
+        escala = acc.obtener_escala_objetivos()
+        
+        parametros = dict(ejercicio.parametros)
+        if parametros.get('velocidad_objetivo') is not None:
+            parametros['velocidad_objetivo'] = round(parametros['velocidad_objetivo'] * multiplicador, 2)
+        if parametros.get('tamaño_objetivo') is not None:
+            parametros['tamaño_objetivo'] = round(parametros['tamaño_objetivo'] * escala)
+        
+        return {
+            'ejercicio_id': ejercicio.id,
+            'version_configuracion': config.version,
+            'parametros': parametros,
+            'multiplicador_velocidad': multiplicador,
+            'escala_objetivos': escala,
+            'alcance': {
+                'hombro': round(cal.rango_movimiento_hombro / 180, 3),
+                'codo': round(cal.rango_movimiento_codo / 150, 3),
+                'muneca': round(cal.rango_movimiento_muneca / 90, 3)
+            },
+            'altura_cm': cal.altura_cm,
+            'modo_accesibilidad': acc.modo_accesibilidad.value,
+            'manos_habilitadas': acc.manos_habilitadas.value,
+            'dificultad_adaptativa': acc.dificultad_adaptativa,
+            'controles_simplificados': acc.controles_simplificados,
+            'texto_grande': acc.texto_grande,
+            'alto_contraste': acc.alto_contraste,
+            'seguridad': {
+                'alerta_movimientos_bruscos': seg.alerta_movimientos_bruscos,
+                'pausa_automatica_inactividad': seg.pausa_automatica_inactividad,
+                'tiempo_inactividad': seg.tiempo_inactividad,
+                'zona_juego_delimitada': seg.zona_juego_delimitada,
+                'sistema_antimareo': seg.sistema_antimareo
+            }
+        }
+    
     def crear_configuracion_default(self, paciente_id: int) -> ConfiguracionPaciente:
         """Crea una configuración por defecto para un paciente nuevo"""
         return ConfiguracionPaciente.crear_default(paciente_id)
@@ -2,189 +2,205 @@
 Servicio de Ejercicios - Patrón de Diseño Service Layer
 Responsable de la lógica de negocio relacionada con ejercicios
 """
-from typing import List, Dict, Optional
-from ..models.ejercicio import Ejercicio, TipoEjercicio, NivelDificultad, EjercicioRepository
+from typing import List, Dict, Optional, Tuple
+from ..models.ejercicio import Ejercicio, TipoEjercicio, NivelDificultad, EjercicioRepository, ResultadoEjercicio
+from ..models.catalogo import CatalogoEjercicios, Listado
+from ..models.habilidad import (
+    HabilidadPaciente, HabilidadRepository, RATING_INICIAL, dificultad_nivel, probabilidad_exito
+)
 from ..models.paciente import Paciente
+from .reporte_service import ReporteService
+from .telemetria_service import TelemetriaService
+from ..utils.cinematica import CAMPOS_RESULTADO
+from ..utils.telemetria import TelemetriaInvalida
+from config.settings import get_database_config
+
+
+def _definir_ejercicios() -> List[Ejercicio]:
+    """Ejercicios disponibles en el sistema"""
+    ejercicios = [
+        Ejercicio(
+            id="rehabilitacion_nivel_1",
+            nombre="Objetivo Estático",
+            descripcion="Ejercicio de precisión con objetivo fijo",
+            tipo=TipoEjercicio.REHABILITACION,
+            nivel=NivelDificultad.PRINCIPIANTE,
+            instrucciones=[
+                "Usa las flechas del teclado para mover la mano azul",
+                "Toca el objetivo rojo para completar el ejercicio",
+                "Mantén la precisión y control"
+            ],
+            parametros={
+                "velocidad_mano": 10,
+                "tamaño_objetivo": 60,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="rehabilitacion_nivel_2",
+            nombre="Objetivo en Movimiento Lento",
+            descripcion="Ejercicio de precisión con objetivo en movimiento lento",
+            tipo=TipoEjercicio.REHABILITACION,
+            nivel=NivelDificultad.INTERMEDIO,
+            instrucciones=[
+                "Usa las flechas del teclado para mover la mano azul",
+                "El objetivo rojo se mueve lentamente",
+                "Anticipa el movimiento y mantén la precisión"
+            ],
+            parametros={
+                "velocidad_mano": 10,
+                "velocidad_objetivo": 3,
+                "tamaño_objetivo": 60,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="rehabilitacion_nivel_3",
+            nombre="Objetivo en Movimiento Rápido",
+            descripcion="Ejercicio de precisión con objetivo en movimiento rápido",
+            tipo=TipoEjercicio.REHABILITACION,
+            nivel=NivelDificultad.AVANZADO,
+            instrucciones=[
+                "Usa las flechas del teclado para mover la mano azul",
+                "El objetivo rojo se mueve rápidamente",
+                "Requiere máxima concentración y velocidad de reacción"
+            ],
+            parametros={
+                "velocidad_mano": 10,
+                "velocidad_objetivo": 7,
+                "tamaño_objetivo": 60,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_abotonar_camisa",
+            nombre="Abotonar Camisa",
+            descripcion="Ejercicio de coordinación fina para mejorar la destreza manual y la precisión en movimientos pequeños.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.PRINCIPIANTE,
+            instrucciones=[
+                "Haz clic en los botones en orden de arriba a abajo",
+                "Sigue la secuencia correcta",
+                "Practica la coordinación mano-ojo"
+            ],
+            parametros={
+                "numero_botones": 5,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_arrastrar_objeto",
+            nombre="Arrastrar y Soltar",
+            descripcion="Ejercicio de coordinación mano-ojo para mejorar la capacidad de manipulación de objetos.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.INTERMEDIO,
+            instrucciones=[
+                "Arrastra cada objeto a su área de destino correspondiente",
+                "Mantén el control durante el arrastre",
+                "Practica la precisión en el posicionamiento"
+            ],
+            parametros={
+                "tamaño_objetivo": 60,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_abrir_cerradura",
+            nombre="Abrir Cerradura",
+            descripcion="Ejercicio de motricidad fina para mejorar la destreza en tareas de precisión como usar llaves.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.INTERMEDIO,
+            instrucciones=[
+                "Inserta la llave en la cerradura",
+                "Gira la llave en la dirección correcta",
+                "Practica la coordinación y precisión"
+            ],
+            parametros={
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_usar_cubiertos",
+            nombre="Usar Cubiertos",
+            descripcion="Simulación de uso de cubiertos para mejorar la coordinación y habilidades de alimentación independiente.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.INTERMEDIO,
+            instrucciones=[
+                "Simula el uso de cubiertos para comer",
+                "Practica la coordinación mano-ojo",
+                "Mejora las habilidades de alimentación"
+            ],
+            parametros={
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_rompecabezas",
+            nombre="Rompecabezas",
+            descripcion="Ejercicio de organización espacial y resolución de problemas para mejorar la función cognitiva y motora.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.AVANZADO,
+            instrucciones=[
+                "Arma el rompecabezas arrastrando las piezas",
+                "Observa la imagen completa",
+                "Practica la organización espacial"
+            ],
+            parametros={
+                "numero_piezas": 9,
+                "tiempo_limite": None
+            }
+        ),
+        Ejercicio(
+            id="terapia_clasificar_objetos",
+            nombre="Clasificar Objetos",
+            descripcion="Ejercicio de organización y categorización para mejorar habilidades de planificación y ejecución.",
+            tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
+            nivel=NivelDificultad.INTERMEDIO,
+            instrucciones=[
+                "Clasifica los objetos en sus categorías correspondientes",
+                "Observa las características de cada objeto",
+                "Practica la organización y planificación"
+            ],
+            parametros={
+                "numero_categorias": 3,
+                "tiempo_limite": None
+            }
+        )
+    ]
+    return ejercicios
+
+
+# Catálogo único por proceso, compartido por todas las instancias del servicio
+_catalogo = CatalogoEjercicios(_definir_ejercicios())
 
 
 class EjercicioService:
     """Servicio para gestión de ejercicios - Patrón Service Layer"""
     
+    # Probabilidad de éxito que se busca al recomendar: ni trivial ni frustrante
+    OBJETIVO_EXITO = 0.7
+    
     def __init__(self):
         self.ejercicio_repo = EjercicioRepository()
-        self._ejercicios_disponibles = self._inicializar_ejercicios()
-    
-    def _inicializar_ejercicios(self) -> List[Ejercicio]:
-        """Inicializa los ejercicios disponibles en el sistema"""
-        ejercicios = [
-            Ejercicio(
-                id="rehabilitacion_nivel_1",
-                nombre="Objetivo Estático",
-                descripcion="Ejercicio de precisión con objetivo fijo",
-                tipo=TipoEjercicio.REHABILITACION,
-                nivel=NivelDificultad.PRINCIPIANTE,
-                instrucciones=[
-                    "Usa las flechas del teclado para mover la mano azul",
-                    "Toca el objetivo rojo para completar el ejercicio",
-                    "Mantén la precisión y control"
-                ],
-                parametros={
-                    "velocidad_mano": 10,
-                    "tamaño_objetivo": 60,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="rehabilitacion_nivel_2",
-                nombre="Objetivo en Movimiento Lento",
-                descripcion="Ejercicio de precisión con objetivo en movimiento lento",
-                tipo=TipoEjercicio.REHABILITACION,
-                nivel=NivelDificultad.INTERMEDIO,
-                instrucciones=[
-                    "Usa las flechas del teclado para mover la mano azul",
-                    "El objetivo rojo se mueve lentamente",
-                    "Anticipa el movimiento y mantén la precisión"
-                ],
-                parametros={
-                    "velocidad_mano": 10,
-                    "velocidad_objetivo": 3,
-                    "tamaño_objetivo": 60,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="rehabilitacion_nivel_3",
-                nombre="Objetivo en Movimiento Rápido",
-                descripcion="Ejercicio de precisión con objetivo en movimiento rápido",
-                tipo=TipoEjercicio.REHABILITACION,
-                nivel=NivelDificultad.AVANZADO,
-                instrucciones=[
-                    "Usa las flechas del teclado para mover la mano azul",
-                    "El objetivo rojo se mueve rápidamente",
-                    "Requiere máxima concentración y velocidad de reacción"
-                ],
-                parametros={
-                    "velocidad_mano": 10,
-                    "velocidad_objetivo": 7,
-                    "tamaño_objetivo": 60,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_abotonar_camisa",
-                nombre="Abotonar Camisa",
-                descripcion="Ejercicio de coordinación fina para mejorar la destreza manual y la precisión en movimientos pequeños.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.PRINCIPIANTE,
-                instrucciones=[
-                    "Haz clic en los botones en orden de arriba a abajo",
-                    "Sigue la secuencia correcta",
-                    "Practica la coordinación mano-ojo"
-                ],
-                parametros={
-                    "numero_botones": 5,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_arrastrar_objeto",
-                nombre="Arrastrar y Soltar",
-                descripcion="Ejercicio de coordinación mano-ojo para mejorar la capacidad de manipulación de objetos.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.INTERMEDIO,
-                instrucciones=[
-                    "Arrastra cada objeto a su área de destino correspondiente",
-                    "Mantén el control durante el arrastre",
-                    "Practica la precisión en el posicionamiento"
-                ],
-                parametros={
-                    "tamaño_objetivo": 60,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_abrir_cerradura",
-                nombre="Abrir Cerradura",
-                descripcion="Ejercicio de motricidad fina para mejorar la destreza en tareas de precisión como usar llaves.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.INTERMEDIO,
-                instrucciones=[
-                    "Inserta la llave en la cerradura",
-                    "Gira la llave en la dirección correcta",
-                    "Practica la coordinación y precisión"
-                ],
-                parametros={
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_usar_cubiertos",
-                nombre="Usar Cubiertos",
-                descripcion="Simulación de uso de cubiertos para mejorar la coordinación y habilidades de alimentación independiente.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.INTERMEDIO,
-                instrucciones=[
-                    "Simula el uso de cubiertos para comer",
-                    "Practica la coordinación mano-ojo",
-                    "Mejora las habilidades de alimentación"
-                ],
-                parametros={
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_rompecabezas",
-                nombre="Rompecabezas",
-                descripcion="Ejercicio de organización espacial y resolución de problemas para mejorar la función cognitiva y motora.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.AVANZADO,
-                instrucciones=[
-                    "Arma el rompecabezas arrastrando las piezas",
-                    "Observa la imagen completa",
-                    "Practica la organización espacial"
-                ],
-                parametros={
-                    "numero_piezas": 9,
-                    "tiempo_limite": None
-                }
-            ),
-            Ejercicio(
-                id="terapia_clasificar_objetos",
-                nombre="Clasificar Objetos",
-                descripcion="Ejercicio de organización y categorización para mejorar habilidades de planificación y ejecución.",
-                tipo=TipoEjercicio.TERAPIA_OCUPACIONAL,
-                nivel=NivelDificultad.INTERMEDIO,
-                instrucciones=[
-                    "Clasifica los objetos en sus categorías correspondientes",
-                    "Observa las características de cada objeto",
-                    "Practica la organización y planificación"
-                ],
-                parametros={
-                    "numero_categorias": 3,
-                    "tiempo_limite": None
-                }
-            )
-        ]
-        return ejercicios
+        self.habilidad_repo = HabilidadRepository(get_database_config()['habilidad_path'])
+        self.telemetria_service = TelemetriaService()
+        self.catalogo = _catalogo
     
     def obtener_ejercicios_por_tipo(self, tipo: TipoEjercicio) -> List[Ejercicio]:
         """Obtiene ejercicios filtrados por tipo"""
-        return [e for e in self._ejercicios_disponibles if e.tipo == tipo and e.activo]
+        return list(self.catalogo.por_tipo(tipo))
     
     def obtener_ejercicios_por_nivel(self, nivel: NivelDificultad) -> List[Ejercicio]:
         """Obtiene ejercicios filtrados por nivel de dificultad"""
-        return [e for e in self._ejercicios_disponibles if e.nivel == nivel and e.activo]
+        return list(self.catalogo.por_nivel(nivel))
     
     def obtener_ejercicio_por_id(self, ejercicio_id: str) -> Optional[Ejercicio]:
         """Obtiene un ejercicio específico por ID"""
-        for ejercicio in self._ejercicios_disponibles:
-            if ejercicio.id == ejercicio_id and ejercicio.activo:
-                return ejercicio
-        return None
+        return self.catalogo.por_id(ejercicio_id)
     
     def obtener_todos_ejercicios(self) -> List[Ejercicio]:
         """Obtiene todos los ejercicios activos"""
-        return [e for e in self._ejercicios_disponibles if e.activo]
+        return list(self.catalogo.activos())
     
     def obtener_ejercicios_rehabilitacion(self) -> List[Ejercicio]:
         """Obtiene ejercicios de rehabilitación"""
@@ -194,6 +210,14 @@ class EjercicioService:
         """Obtiene ejercicios de terapia ocupacional"""
         return self.obtener_ejercicios_por_tipo(TipoEjercicio.TERAPIA_OCUPACIONAL)
     
+    def listado_ejercicios(self, tipo: Optional[TipoEjercicio] = None) -> Listado:
+        """Respuesta JSON ya codificada (y su ETag) con los ejercicios activos, opcionalmente de un tipo"""
+        return self.catalogo.listado(tipo.value if tipo else 'todos')
+    
+    def listado_ejercicio(self, ejercicio_id: str) -> Optional[Listado]:
+        """Respuesta JSON ya codificada (y su ETag) de un ejercicio; None si no existe"""
+        return self.catalogo.listado(f'ejercicio:{ejercicio_id}')
+    
     def registrar_resultado(self, paciente: Paciente, ejercicio_id: str, exito: bool,
                           tiempo_ejecucion: Optional[float] = None,
                           puntuacion: Optional[int] = None,
@@ -207,9 +231,17 @@ class EjercicioService:
                           combo_maximo: Optional[int] = None,
                           aciertos: Optional[int] = None,
                           fallos: Optional[int] = None,
-                          nivel: Optional[int] = None):
-        """Registra el resultado de un ejercicio con métricas médicas avanzadas"""
-        return self.ejercicio_repo.registrar_resultado(
+                          nivel: Optional[int] = None,
+                          intento_id: Optional[str] = None):
+        """
+        Registra el resultado de un ejercicio con métricas médicas avanzadas
+        
+        Si el intento tiene telemetría, las métricas se calculan en el servidor
+        con ella y reemplazan a las que envió el cliente. Si sus últimos lotes
+        siguen en la cola, el resultado se guarda con las del cliente y las
+        calculadas se aplican después, en segundo plano.
+        """
+        resultado = self._crear_resultado(
             paciente.id, ejercicio_id, exito, tiempo_ejecucion, puntuacion, observaciones,
             precision=precision,
             velocidad_promedio=velocidad_promedio,
@@ -220,8 +252,103 @@ class EjercicioService:
             combo_maximo=combo_maximo,
             aciertos=aciertos,
             fallos=fallos,
-            nivel=nivel
+            nivel=nivel,
+            intento_id=intento_id
         )
+        self._guardar_resultados(paciente.id, [resultado])
+        return resultado
+    
+    def registrar_resultados_lote(self, paciente: Paciente, datos: List[Dict]) -> List[Tuple[ResultadoEjercicio, bool]]:
+        """
+        Registra varios resultados del paciente con una sola escritura al historial
+        
+        Args:
+            paciente: Paciente
+            datos: argumentos de ``registrar_resultado`` por resultado (ya
+                validados), opcionalmente con ``clave_idempotencia``
+        
+        Returns:
+            Por cada resultado: (resultado, duplicado); un duplicado es el
+            resultado que ya estaba registrado con la misma clave
+        """
+        resultados = [self._crear_resultado(paciente.id, **d) for d in datos]
+        return self._guardar_resultados(paciente.id, resultados)
+    
+    def _crear_resultado(self, paciente_id, ejercicio_id: str, exito: bool, *args,
+                         intento_id: Optional[str] = None, **kwargs) -> ResultadoEjercicio:
+        """Crea el resultado; si la telemetría del intento ya está escrita sus métricas reemplazan a las del cliente"""
+        if intento_id:
+            try:
+                if not self.telemetria_service.lotes_pendientes(paciente_id, intento_id):
+                    kwargs.update(self._campos_telemetria(
+                        self.telemetria_service.metricas_intento(paciente_id, intento_id)
+                    ))
+            except TelemetriaInvalida:
+                intento_id = None
+        return self.ejercicio_repo.crear_resultado(
+            paciente_id, ejercicio_id, exito, *args, intento_id=intento_id, **kwargs
+        )
+    
+    def _guardar_resultados(self, paciente_id,
+                            resultados: List[ResultadoEjercicio]) -> List[Tuple[ResultadoEjercicio, bool]]:
+        with self.ejercicio_repo.bloqueo(paciente_id):
+            guardados = self.ejercicio_repo.registrar_resultados(paciente_id, resultados)
+            nuevos = [resultado for resultado, duplicado in guardados if not duplicado]
+            if nuevos:
+                self._actualizar_habilidad(paciente_id, nuevos)
+        # Los reportes calculados con el historial anterior ya no sirven
+        ReporteService.invalidar_reportes(paciente_id)
+        for resultado in nuevos:
+            if resultado.intento_id:
+                # El intento terminó: su telemetría se reescribe en bloques grandes
+                self.telemetria_service.cerrar_intento(paciente_id, resultado.intento_id)
+        # Los intentos que se guardaron sin esperar a sus últimos lotes se miden cuando se escriban
+        sin_medir = [
+            resultado.intento_id for resultado in nuevos
+            if resultado.intento_id and resultado.origen_metricas != 'telemetria'
+        ]
+        self.telemetria_service.metricas_diferidas(
+            paciente_id, sin_medir, lambda calculadas: self._aplicar_metricas(paciente_id, calculadas)
+        )
+        return guardados
+    
+    def recalcular_metricas(self, paciente_id: str, procesos: Optional[int] = None) -> int:
+        """
+        Recalcula con la telemetría las métricas de los resultados del historial del paciente
+        
+        El cálculo se reparte en un pool de procesos (ver TelemetriaService.recalcular_metricas).
+        
+        Returns:
+            int: Cantidad de resultados actualizados
+        """
+        intentos = {r.intento_id for r in self.ejercicio_repo.obtener_historial(paciente_id) if r.intento_id}
+        intentos &= set(self.telemetria_service.intentos(paciente_id))
+        calculadas = self.telemetria_service.recalcular_metricas(paciente_id, sorted(intentos), procesos)
+        return self._aplicar_metricas(paciente_id, calculadas)
+    
+    def _aplicar_metricas(self, paciente_id, calculadas: Dict[str, Dict]) -> int:
+        """Reemplaza en el historial las métricas de los intentos calculadas con la telemetría"""
+        actualizados = self.ejercicio_repo.aplicar_metricas(
+            paciente_id, {i: self._campos_telemetria(m) for i, m in calculadas.items()}
+        )
+        if actualizados:
+            ReporteService.invalidar_reportes(paciente_id)
+            # Las precisiones cambiaron: la habilidad se recalcula con el historial corregido
+            with self.ejercicio_repo.bloqueo(paciente_id):
+                self.habilidad_repo.invalidar(str(paciente_id))
+        return actualizados
+    
+    @staticmethod
+    def _campos_telemetria(metricas: Optional[Dict]) -> Dict:
+        """Campos de ResultadoEjercicio que salen de las métricas calculadas con la telemetría"""
+        if not metricas:
+            return {}
+        campos = {
+            campo: metricas[nombre] for nombre, campo in CAMPOS_RESULTADO.items()
+            if metricas.get(nombre) is not None
+        }
+        campos['origen_metricas'] = 'telemetria'
+        return campos
     
     def obtener_estadisticas_ejercicio(self, paciente_id: str, ejercicio_id: str) -> Dict:
         """Obtiene estadísticas específicas de un ejercicio para un paciente"""
@@ -260,24 +387,110 @@ class EjercicioService:
     def obtener_historial_paciente(self, paciente_id: str):
         """Obtiene el historial completo de ejercicios de un paciente"""
         return self.ejercicio_repo.obtener_historial(paciente_id)
-
-    def obtener_recomendacion_ejercicio(self, paciente_id: str) -> Optional[Ejercicio]:
-        """Obtiene una recomendación de ejercicio basada en el historial del paciente"""
-        historial = self.ejercicio_repo.obtener_historial(paciente_id)
+    
+    def obtener_pagina_historial(self, paciente_id: str, limite: int,
+                                 cursor: Optional[Tuple[str, int]] = None,
+                                 desde: Optional[str] = None) -> Dict:
+        """Página del historial del paciente por clave (fecha, id), de la más reciente a la más antigua"""
+        return self.ejercicio_repo.obtener_pagina_historial(paciente_id, limite, cursor, desde)
+    
+    def version_historial(self, paciente_id: str):
+        """Versión actual del historial del paciente (cambia con cada resultado registrado)"""
+        return self.ejercicio_repo.version_historial(paciente_id)
+    
+    def ultima_modificacion_historial(self, paciente_id: str):
+        """Fecha de la última escritura en el historial del paciente"""
+        return self.ejercicio_repo.ultima_modificacion(paciente_id)
+    
+    def obtener_resumen_paciente(self, paciente_id: str) -> Dict:
+        """
+        Resumen del dashboard: totales, tasa de éxito, racha, últimos resultados y recomendación
         
-        if not historial:
+        Sale del resumen que el repositorio mantiene al registrar cada
+        resultado, sin leer el historial.
+        """
+        resumen = self.ejercicio_repo.obtener_resumen(paciente_id)
+        recomendacion = self._recomendar(paciente_id, resumen.ultimo)
+        return {
+            **resumen.to_dict(),
+            'recomendacion': self.catalogo.a_dict(recomendacion.id) if recomendacion else None
+        }
+    
+    def obtener_recomendacion_ejercicio(self, paciente_id: str) -> Optional[Ejercicio]:
+        """Obtiene una recomendación de ejercicio basada en la habilidad del paciente en cada ejercicio"""
+        return self._recomendar(paciente_id, self.ejercicio_repo.obtener_resumen(paciente_id).ultimo)
+    
+    def _recomendar(self, paciente_id: str, ultimo_ejercicio: Optional[ResultadoEjercicio]) -> Optional[Ejercicio]:
+        """
+        Ejercicio del mismo tipo que el último realizado cuya probabilidad de
+        éxito estimada (rating del paciente contra la dificultad del nivel)
+        esté más cerca de OBJETIVO_EXITO
+        """
+        if ultimo_ejercicio is None:
             # Si no hay historial, recomendar nivel principiante
             return self.obtener_ejercicio_por_id("rehabilitacion_nivel_1")
         
-        # Analizar el último ejercicio realizado
-        ultimo_ejercicio = max(historial, key=lambda x: x.fecha)
+        ejercicio = self.catalogo.por_id(ultimo_ejercicio.tipo_ejercicio)
+        candidatos = self.catalogo.por_tipo(ejercicio.tipo if ejercicio else TipoEjercicio.REHABILITACION)
+        habilidad = self.obtener_habilidad(paciente_id)
         
-        # Si el último ejercicio fue exitoso, sugerir el siguiente nivel
-        if ultimo_ejercicio.exito:
-            if "nivel_1" in ultimo_ejercicio.tipo_ejercicio:
-                return self.obtener_ejercicio_por_id("rehabilitacion_nivel_2")
-            elif "nivel_2" in ultimo_ejercicio.tipo_ejercicio:
-                return self.obtener_ejercicio_por_id("rehabilitacion_nivel_3")
+        def distancia_objetivo(candidato: Ejercicio) -> float:
+            rating = self._rating_estimado(habilidad, candidato)
+            return abs(probabilidad_exito(rating, dificultad_nivel(candidato.nivel.value)) - self.OBJETIVO_EXITO)
         
-        # Si no fue exitoso, sugerir el mismo nivel o uno anterior
-        return self.obtener_ejercicio_por_id(ultimo_ejercicio.tipo_ejercicio)
+        return min(candidatos, key=distancia_objetivo, default=None)
+    
+    def _rating_estimado(self, habilidad: HabilidadPaciente, ejercicio: Ejercicio) -> float:
+        """
+        Rating del paciente en el ejercicio; si todavía no lo practicó, su peor
+        rating entre los ejercicios del mismo tipo de nivel igual o menor
+        (fallar en un nivel impide saltar al siguiente)
+        """
+        practicado = habilidad.ejercicios.get(ejercicio.id)
+        if practicado:
+            return practicado.rating
+        return min((
+            habilidad.ejercicios[e.id].rating for e in self.catalogo.por_tipo(ejercicio.tipo)
+            if e.id in habilidad.ejercicios and e.nivel.value <= ejercicio.nivel.value
+        ), default=RATING_INICIAL)
+    
+    def obtener_habilidad(self, paciente_id: str) -> HabilidadPaciente:
+        """
+        Estado de habilidad del paciente en cada ejercicio practicado
+        
+        Se reconstruye con el historial completo solo si no existe o no
+        coincide con él (por ejemplo, si se perdió una escritura).
+        """
+        with self.ejercicio_repo.bloqueo(paciente_id):
+            habilidad = self.habilidad_repo.obtener(str(paciente_id))
+            if habilidad is None or habilidad.aplicados != self.ejercicio_repo.obtener_resumen(paciente_id).total:
+                habilidad = self._reconstruir_habilidad(paciente_id)
+            return habilidad
+    
+    def _actualizar_habilidad(self, paciente_id: str, nuevos: List[ResultadoEjercicio]):
+        """Aplica los resultados recién guardados al estado de habilidad (con el historial bloqueado)"""
+        habilidad = self.habilidad_repo.obtener(str(paciente_id))
+        total = self.ejercicio_repo.obtener_resumen(paciente_id).total
+        if habilidad is None or habilidad.aplicados != total - len(nuevos):
+            # El historial ya incluye los resultados nuevos
+            self._reconstruir_habilidad(paciente_id)
+            return
+        for resultado in nuevos:
+            self._aplicar_habilidad(habilidad, resultado)
+        self.habilidad_repo.guardar(habilidad)
+    
+    def _reconstruir_habilidad(self, paciente_id: str) -> HabilidadPaciente:
+        habilidad = HabilidadPaciente(str(paciente_id))
+        for resultado in sorted(self.ejercicio_repo.obtener_historial(paciente_id), key=lambda r: r.fecha):
+            self._aplicar_habilidad(habilidad, resultado)
+        self.habilidad_repo.guardar(habilidad)
+        return habilidad
+    
+    def _aplicar_habilidad(self, habilidad: HabilidadPaciente, resultado: ResultadoEjercicio):
+        ejercicio = self.catalogo.por_id(resultado.tipo_ejercicio)
+        if ejercicio is None:
+            habilidad.registrar(resultado.tipo_ejercicio, dificultad_nivel(resultado.nivel),
+                                resultado.exito, resultado.precision, resultado.fecha)
+            return
+        habilidad.registrar(ejercicio.id, dificultad_nivel(ejercicio.nivel.value), resultado.exito,
+                            resultado.precision, resultado.fecha, self._rating_estimado(habilidad, ejercicio))
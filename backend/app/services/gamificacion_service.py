@@ -1,19 +1,77 @@
 """
 Servicio de Gamificación - Lógica de negocio para puntos, logros y recompensas
 """
-from typing import List, Dict, Optional
+import heapq
+import threading
+from typing import Iterable, List, Dict, Hashable, Optional, Tuple
 from datetime import date, datetime
+from app.database.mysql_manager import GamificacionManager
 from app.models.gamificacion import (
-    GamificacionPaciente, Logro, LogroPaciente, ObjetivoDiario,
-    TipoLogro, LOGROS_PREDEFINIDOS
+    GamificacionPaciente, GamificacionRepository, Logro, LogroPaciente, LogroRepository, ObjetivoDiario,
+    Recompensa, LOGROS_PREDEFINIDOS, MODOS_METRICA
 )
+from app.utils.eventos import canal_paciente, centro_eventos
+from app.utils.logros import IndiceLogros
+from app.utils.ranking import IndiceRanking, RankingVentana
 
 
 class GamificacionService:
     """Servicio para gestionar la gamificación"""
     
+    PERIODOS_RANKING = ('total', 'semanal')
+    
+    # Rankings compartidos por todas las instancias del proceso
+    _ranking_total = IndiceRanking()
+    _ranking_semanal = RankingVentana(dias=7)
+    # paciente_id -> (nivel, avatar) para mostrar en el ranking
+    _perfiles_ranking: Dict[str, Tuple[int, str]] = {}
+    _ranking_lock = threading.Lock()
+    _ranking_cargado = False
+    
+    # Catálogo de logros indexado por métrica con umbrales ordenados
+    _indice_logros = IndiceLogros(LOGROS_PREDEFINIDOS, MODOS_METRICA)
+    
+    # Recompensa base por completar una actividad
+    PUNTOS_ACTIVIDAD = 10
+    EXPERIENCIA_ACTIVIDAD = 20
+    
     def __init__(self):
         self.logros_disponibles = {logro.codigo: logro for logro in LOGROS_PREDEFINIDOS}
+        self.gamificacion_repo = GamificacionRepository()
+        self.logro_repo = LogroRepository(self._indice_logros, LOGROS_PREDEFINIDOS)
+        self._cargar_ranking()
+    
+    @classmethod
+    def _cargar_ranking(cls):
+        """Arma el ranking total desde gamificacion_pacientes (una vez por proceso)"""
+        with cls._ranking_lock:
+            if cls._ranking_cargado:
+                return
+            
+            try:
+                puntajes = GamificacionManager().obtener_puntajes()
+            except Exception as e:
+                print(f"⚠️ No se pudo cargar el ranking desde MySQL: {e}")
+                puntajes = []
+            
+            for fila in puntajes:
+                paciente_id = fila['paciente_id']
+                cls._perfiles_ranking[str(paciente_id)] = (
+                    fila.get('nivel_actual') or 1, fila.get('avatar_seleccionado') or 'default'
+                )
+                cls._ranking_total.actualizar(paciente_id, fila.get('puntos_totales') or 0)
+            cls._ranking_cargado = True
+    
+    def _actualizar_ranking(self, gamificacion: GamificacionPaciente, puntos_ganados: int):
+        """Refleja en los rankings los puntos otorgados a un paciente (O(log n))"""
+        paciente_id = gamificacion.paciente_id
+        self._perfiles_ranking[str(paciente_id)] = (gamificacion.nivel_actual, gamificacion.avatar_seleccionado)
+        self._ranking_total.actualizar(paciente_id, gamificacion.puntos_totales)
+        self._ranking_semanal.sumar(paciente_id, puntos_ganados)
+    
+    def obtener_gamificacion(self, paciente_id) -> GamificacionPaciente:
+        """Obtiene la gamificación guardada del paciente"""
+        return self.gamificacion_repo.obtener(paciente_id)
     
     def inicializar_gamificacion(self, paciente_id: int) -> GamificacionPaciente:
         """Inicializa la gamificación para un paciente nuevo"""
@@ -35,22 +93,44 @@ class GamificacionService:
         Returns:
             Dict con información sobre cambios (subió nivel, logros, etc.)
         """
-        gamificacion.actualizar_racha()
-        
         # Otorgar puntos base por completar actividad
-        puntos_base = 10
-        exp_base = 20
+        recompensa = Recompensa(self.PUNTOS_ACTIVIDAD, self.EXPERIENCIA_ACTIVIDAD, actividad=True)
+        niveles_subidos = gamificacion.aplicar_recompensa(recompensa)
+        self._actualizar_ranking(gamificacion, recompensa.puntos)
+        return self._resultado_recompensa(gamificacion, recompensa, niveles_subidos)
+    
+    def calcular_recompensa_ejercicio(
+        self,
+        duracion_segundos: Optional[int],
+        exito: bool,
+        precision: Optional[float] = None
+    ) -> Tuple[Recompensa, Dict]:
+        """
+        Calcula todas las recompensas de un ejercicio completado sin aplicarlas
         
-        gamificacion.agregar_puntos(puntos_base)
-        subio_nivel = gamificacion.agregar_experiencia(exp_base)
+        Returns:
+            Tuple: (recompensa total, detalle de bonus obtenidos)
+        """
+        recompensa = Recompensa(self.PUNTOS_ACTIVIDAD, self.EXPERIENCIA_ACTIVIDAD, actividad=True)
+        detalle = {}
         
-        return {
-            'puntos_ganados': puntos_base,
-            'experiencia_ganada': exp_base,
-            'subio_nivel': subio_nivel,
-            'nuevo_nivel': gamificacion.nivel_actual if subio_nivel else None,
-            'racha_actual': gamificacion.racha_dias
-        }
+        # Bonus por éxito
+        if exito:
+            recompensa.agregar(puntos=25)
+            detalle['bonus_exito'] = True
+        
+        # Bonus por precisión (base 80 = umbral mínimo para el bonus)
+        if precision and precision >= 80:
+            bonus_precision = int((precision - 80) * 2)
+            recompensa.agregar(puntos=bonus_precision)
+            detalle['bonus_precision'] = bonus_precision
+        
+        # Bonus por velocidad
+        if duracion_segundos is not None and duracion_segundos < 60:
+            recompensa.agregar(puntos=15, experiencia=10)
+            detalle['bonus_velocidad'] = True
+        
+        return recompensa, detalle
     
     def registrar_ejercicio_completado(
         self,
@@ -65,31 +145,98 @@ class GamificacionService:
         Returns:
             Dict con información sobre recompensas
         """
-        resultado = self.registrar_actividad(gamificacion)
+        recompensa, detalle = self.calcular_recompensa_ejercicio(duracion_segundos, exito, precision)
+        niveles_subidos = gamificacion.aplicar_recompensa(recompensa)
+        self._actualizar_ranking(gamificacion, recompensa.puntos)
+        return self._resultado_recompensa(gamificacion, recompensa, niveles_subidos, detalle)
+    
+    def registrar_ejercicio_paciente(
+        self,
+        paciente_id,
+        duracion_segundos: Optional[int],
+        exito: bool,
+        precision: Optional[float] = None,
+        adicional: Optional[Recompensa] = None
+    ) -> Dict:
+        """
+        Registra un ejercicio completado y persiste sus recompensas
         
-        # Bonus por éxito
-        if exito:
-            bonus_exito = 25
-            gamificacion.agregar_puntos(bonus_exito)
-            resultado['puntos_ganados'] += bonus_exito
-            resultado['bonus_exito'] = True
+        Todos los bonus (y la recompensa ``adicional``) se suman y se guardan
+        con una sola actualización atómica. Después se evalúan los logros con
+        la racha ya actualizada; si se desbloquea alguno, su recompensa se
+        aplica con una segunda actualización.
         
-        # Bonus por precisión (base 80 = umbral mínimo para el bonus)
-        if precision and precision >= 80:
-            bonus_precision = int((precision - 80) * 2)
-            gamificacion.agregar_puntos(bonus_precision)
-            resultado['puntos_ganados'] += bonus_precision
-            resultado['bonus_precision'] = bonus_precision
+        Returns:
+            Dict con información sobre recompensas y logros nuevos
+        """
+        return self.registrar_ejercicios_paciente(
+            paciente_id, [(duracion_segundos, exito, precision)], adicional
+        )
+    
+    def registrar_ejercicios_paciente(
+        self,
+        paciente_id,
+        ejercicios: List[Tuple[Optional[int], bool, Optional[float]]],
+        adicional: Optional[Recompensa] = None
+    ) -> Dict:
+        """
+        Registra varios ejercicios completados del paciente (por ejemplo un
+        lote de resultados reenviado por un cliente sin conexión)
         
-        # Bonus por velocidad
-        if duracion_segundos < 60:
-            bonus_velocidad = 15
-            gamificacion.agregar_puntos(bonus_velocidad)
-            gamificacion.agregar_experiencia(10)
-            resultado['puntos_ganados'] += bonus_velocidad
-            resultado['experiencia_ganada'] += 10
-            resultado['bonus_velocidad'] = True
+        Las recompensas de todos se suman y se guardan con una sola
+        actualización; los logros se evalúan con ``evaluar_logros_lote``.
+        
+        Args:
+            ejercicios: (duracion_segundos, exito, precision) por ejercicio
+        
+        Returns:
+            Dict con información sobre recompensas y logros nuevos
+        """
+        recompensa = Recompensa()
+        detalle = {}
+        for duracion_segundos, exito, precision in ejercicios:
+            recompensa_ejercicio, detalle = self.calcular_recompensa_ejercicio(duracion_segundos, exito, precision)
+            recompensa.combinar(recompensa_ejercicio)
+        if len(ejercicios) != 1:
+            # El detalle de bonus solo tiene sentido para un ejercicio
+            detalle = {'ejercicios': len(ejercicios)}
+        if adicional:
+            recompensa.combinar(adicional)
+        
+        gamificacion, niveles_subidos = self.gamificacion_repo.aplicar_recompensa(paciente_id, recompensa)
         
+        logros = self.evaluar_logros_lote([
+            (paciente_id, {
+                'sesiones': 1,
+                'precision': precision,
+                'racha': gamificacion.racha_dias,
+                'duracion': duracion_segundos or None
+            })
+            for duracion_segundos, _, precision in ejercicios
+        ]).get(str(paciente_id), [])
+        if logros:
+            recompensa_logros = self.recompensa_logros(logros)
+            gamificacion, niveles_logros = self.gamificacion_repo.aplicar_recompensa(paciente_id, recompensa_logros)
+            niveles_subidos += niveles_logros
+            recompensa.combinar(recompensa_logros)
+        
+        self._actualizar_ranking(gamificacion, recompensa.puntos)
+        resultado = self._resultado_recompensa(gamificacion, recompensa, niveles_subidos, detalle)
+        resultado['logros_nuevos'] = [logro.to_dict() for logro in logros]
+        centro_eventos.publicar(canal_paciente(paciente_id), 'recompensa', resultado)
+        return resultado
+    
+    @staticmethod
+    def _resultado_recompensa(gamificacion: GamificacionPaciente, recompensa: Recompensa,
+                              niveles_subidos: int, detalle: Optional[Dict] = None) -> Dict:
+        resultado = {
+            'puntos_ganados': recompensa.puntos,
+            'experiencia_ganada': recompensa.experiencia,
+            'subio_nivel': niveles_subidos > 0,
+            'nuevo_nivel': gamificacion.nivel_actual if niveles_subidos > 0 else None,
+            'racha_actual': gamificacion.racha_dias
+        }
+        resultado.update(detalle or {})
         return resultado
     
     def verificar_logros(
@@ -107,37 +254,73 @@ class GamificacionService:
         Returns:
             Lista de logros nuevos desbloqueados
         """
-        logros_nuevos = []
         logros_completados = set()
         
         if logros_paciente:
             logros_completados = {lp.logro_id for lp in logros_paciente if lp.completado}
         
-        for codigo, logro in self.logros_disponibles.items():
-            # Si ya está completado, saltar
-            if logro.id in logros_completados:
-                continue
-            
-            cumple_requisito = False
-            
-            if logro.tipo == TipoLogro.SESIONES:
-                cumple_requisito = sesiones_completadas >= logro.requisito_valor
-            
-            elif logro.tipo == TipoLogro.PRECISION:
-                cumple_requisito = precision_maxima >= logro.requisito_valor
-            
-            elif logro.tipo == TipoLogro.RACHA:
-                cumple_requisito = racha_dias >= logro.requisito_valor
-            
-            elif logro.tipo == TipoLogro.ESPECIAL:
-                if codigo == "velocista" and duracion_ejercicio:
-                    cumple_requisito = duracion_ejercicio <= logro.requisito_valor
-            
-            if cumple_requisito:
-                logros_nuevos.append(logro)
+        valores = {
+            'sesiones': sesiones_completadas,
+            'precision': precision_maxima,
+            'racha': racha_dias,
+            'duracion': duracion_ejercicio or None
+        }
+        
+        # Por métrica, los logros cumplidos son un prefijo de la lista ordenada
+        logros_nuevos = []
+        for metrica, valor in valores.items():
+            logros_nuevos.extend(
+                logro for logro in self._indice_logros.desbloqueados(metrica, valor)
+                if logro.id not in logros_completados
+            )
         
         return logros_nuevos
     
+    def evaluar_logros(self, paciente_id, valores: Dict[str, Optional[float]]) -> List[Logro]:
+        """
+        Incorpora los valores de un resultado al progreso de logros del paciente
+        
+        Args:
+            valores: metrica -> valor del resultado (por ejemplo {'sesiones': 1, 'precision': 92})
+        
+        Returns:
+            Lista de logros nuevos desbloqueados
+        """
+        return self.evaluar_logros_lote([(paciente_id, valores)]).get(str(paciente_id), [])
+    
+    def evaluar_logros_lote(self, eventos: Iterable[Tuple[Hashable, Dict[str, Optional[float]]]]) -> Dict[str, List[Logro]]:
+        """
+        Evalúa los logros de muchos resultados (de uno o varios pacientes)
+        
+        En MySQL todas las métricas y filas de progreso se guardan en una
+        sola transacción, con actualizaciones atómicas: un logro se otorga
+        una sola vez aunque otro proceso evalúe al mismo paciente.
+        
+        Returns:
+            Dict: paciente_id (str) -> logros nuevos desbloqueados
+        """
+        return self.logro_repo.evaluar(list(eventos))
+    
+    @staticmethod
+    def recompensa_logros(logros: List[Logro]) -> Recompensa:
+        """Recompensa total de varios logros (cada logro otorga sus puntos como puntos y experiencia)"""
+        recompensa = Recompensa()
+        for logro in logros:
+            recompensa.agregar(logro.puntos_recompensa, logro.puntos_recompensa)
+        return recompensa
+    
+    def obtener_logros_paciente(self, paciente_id) -> List[Dict]:
+        """Obtiene todos los logros con el progreso y el estado del paciente"""
+        progreso = self.logro_repo.obtener_progreso(paciente_id)
+        return [
+            {
+                **logro.to_dict(),
+                'progreso_actual': valor if valor is not None else 0,
+                'completado': completado
+            }
+            for logro, valor, completado in self._indice_logros.estado(progreso)
+        ]
+    
     def otorgar_logro(
         self,
         gamificacion: GamificacionPaciente,
@@ -151,6 +334,7 @@ class GamificacionService:
         """
         gamificacion.agregar_puntos(logro.puntos_recompensa)
         gamificacion.agregar_experiencia(logro.puntos_recompensa)
+        self._actualizar_ranking(gamificacion, logro.puntos_recompensa)
         
         return {
             'logro': logro.to_dict(),
@@ -189,6 +373,7 @@ class GamificacionService:
             bonus_objetivo = 50
             gamificacion.agregar_puntos(bonus_objetivo)
             gamificacion.agregar_experiencia(30)
+            self._actualizar_ranking(gamificacion, bonus_objetivo)
             
             return {
                 'objetivo_completado': True,
@@ -225,11 +410,8 @@ class GamificacionService:
         Returns:
             Lista ordenada de pacientes con sus puntos
         """
-        ranking = sorted(
-            gamificaciones,
-            key=lambda g: g.puntos_totales,
-            reverse=True
-        )
+        # Top 10 sin ordenar la lista completa
+        ranking = heapq.nlargest(10, gamificaciones, key=lambda g: g.puntos_totales)
         
         return [
             {
@@ -239,6 +421,51 @@ class GamificacionService:
                 'nivel': g.nivel_actual,
                 'avatar': g.avatar_seleccionado
             }
-            for i, g in enumerate(ranking[:10])  # Top 10
+            for i, g in enumerate(ranking)
         ]
+    
+    def _indice_ranking(self, periodo: str):
+        if periodo not in self.PERIODOS_RANKING:
+            raise ValueError(f"Período de ranking inválido: {periodo}")
+        return self._ranking_semanal if periodo == 'semanal' else self._ranking_total
+    
+    def _entrada_ranking(self, posicion: int, paciente_id: Hashable, puntos: int) -> Dict:
+        nivel, avatar = self._perfiles_ranking.get(str(paciente_id), (1, 'default'))
+        return {
+            'posicion': posicion,
+            'paciente_id': paciente_id,
+            'puntos': puntos,
+            'nivel': nivel,
+            'avatar': avatar
+        }
+    
+    def obtener_ranking(self, limite: int = 10, periodo: str = 'total') -> List[Dict]:
+        """
+        Obtiene los primeros pacientes del ranking
+        
+        Args:
+            periodo: 'total' (puntos acumulados) o 'semanal' (puntos de los últimos 7 días)
+        """
+        indice = self._indice_ranking(periodo)
+        return [self._entrada_ranking(*entrada) for entrada in indice.top(limite)]
+    
+    def obtener_posicion_ranking(self, paciente_id: Hashable, vecinos: int = 2,
+                                 periodo: str = 'total') -> Optional[Dict]:
+        """
+        Obtiene la posición de un paciente junto con los pacientes que lo rodean
+        
+        Returns:
+            Dict con posición, puntos y vecinos, o None si el paciente no está en el ranking
+        """
+        indice = self._indice_ranking(periodo)
+        entradas = indice.vecinos(paciente_id, vecinos)
+        propia = next((e for e in entradas if str(e[1]) == str(paciente_id)), None)
+        if propia is None:
+            return None
+        
+        return {
+            'posicion': propia[0],
+            'puntos': propia[2],
+            'vecinos': [self._entrada_ranking(*entrada) for entrada in entradas]
+        }
 
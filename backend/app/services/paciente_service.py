@@ -5,6 +5,7 @@ Responsable de la lógica de negocio relacionada con pacientes
 from typing import List, Optional, Dict, Tuple
 from ..models.paciente import Paciente, PacienteRepository
 from ..models.ejercicio import EjercicioRepository, ResultadoEjercicio
+from .reporte_service import ReporteService
 
 
 class PacienteService:
@@ -78,11 +79,7 @@ class PacienteService:
     
     def obtener_paciente(self, paciente_id: str) -> Optional[Paciente]:
         """Obtiene un paciente por ID"""
-        pacientes = self.paciente_repo.get_all()
-        for paciente in pacientes:
-            if paciente.id == paciente_id:
-                return paciente
-        return None
+        return self.paciente_repo.find_by_id(paciente_id)
     
     def obtener_todos_pacientes(self) -> List[Paciente]:
         """Obtiene todos los pacientes"""
@@ -114,9 +111,11 @@ class PacienteService:
                                     puntuacion: Optional[int] = None,
                                     observaciones: Optional[str] = None) -> ResultadoEjercicio:
         """Registra un resultado de ejercicio para un paciente"""
-        return self.ejercicio_repo.registrar_resultado(
+        resultado = self.ejercicio_repo.registrar_resultado(
             paciente_id, ejercicio, exito, tiempo_ejecucion, puntuacion, observaciones
         )
+        ReporteService.invalidar_reportes(paciente_id)
+        return resultado
     
     def obtener_historial_completo(self, paciente_id: str) -> List[ResultadoEjercicio]:
         """Obtiene el historial completo de ejercicios del paciente"""
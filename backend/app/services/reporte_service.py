@@ -2,24 +2,151 @@
 Servicio de Reportes - Generación de reportes en CSV y análisis de datos
 """
 import csv
-import io
-from typing import List, Dict, Optional
-from datetime import datetime, timedelta, date
+import hashlib
+import time
+from itertools import islice
+from typing import Any, Callable, List, Dict, Iterable, Iterator, Optional
+from datetime import datetime
 from app.models.ejercicio import ResultadoEjercicio
 from app.models.sesion import Sesion, EstadoSesion
+from app.utils import agregacion, agregacion_vectorizada
+from app.utils.agregacion_vectorizada import HistorialColumnar, NUMPY_DISPONIBLE
+from app.utils.cache import CacheLRU
+from config.settings import get_reportes_config
+
+_reportes_config = get_reportes_config()
+
+# Reportes ya calculados, compartidos por todas las instancias del servicio.
+# Clave: (paciente, tipo de reporte, parámetros); etiqueta: ETag del reporte
+_reportes_cache = CacheLRU(
+    max_costo=_reportes_config['cache_entradas'],
+    ttl=_reportes_config['cache_ttl'],
+    nombre='reportes'
+)
+
+# Historiales convertidos a columnas NumPy, por paciente y con la versión del
+# historial como etiqueta: todos los reportes de una misma versión (progreso con
+# distintos períodos, comparativa semanal, renovaciones por TTL) los convierten
+# una sola vez. Costo: cantidad de resultados.
+_columnas_cache = CacheLRU(
+    max_costo=_reportes_config['columnas_max_resultados'],
+    nombre='reportes-columnas'
+)
+
+
+class _Linea:
+    """Destino para csv.writer que retorna cada fila escrita en lugar de acumularla"""
+    
+    def write(self, linea: str) -> str:
+        return linea
+
+
+def _en_bloques(lineas: Iterator[str], filas_por_bloque: int) -> Iterator[str]:
+    """Agrupa líneas en bloques para no enviar una escritura por fila"""
+    while True:
+        bloque = ''.join(islice(lineas, filas_por_bloque))
+        if not bloque:
+            return
+        yield bloque
 
 
 class ReporteService:
     """Servicio para generar reportes y análisis"""
     
+    # Desde este tamaño de historial se usa el backend NumPy (si está instalado); 0 lo desactiva
+    UMBRAL_VECTORIZADO: int = _reportes_config['umbral_vectorizado']
+    
+    def _columnas(self, resultados: List[ResultadoEjercicio], paciente_id: Optional[str],
+                  version_historial: Any) -> Optional[HistorialColumnar]:
+        """
+        Historial en columnas si conviene el backend vectorizado; None para el motor de Python
+        
+        Sin versión del historial las columnas se convierten y no se guardan.
+        """
+        if not (NUMPY_DISPONIBLE and self.UMBRAL_VECTORIZADO
+                and len(resultados) >= self.UMBRAL_VECTORIZADO):
+            return None
+        if paciente_id is None or version_historial is None:
+            return HistorialColumnar(resultados)
+        
+        clave = str(paciente_id)
+        columnas = _columnas_cache.obtener(clave, etiqueta=version_historial)
+        # La versión se lee antes que el historial: si cambió en el medio, el tamaño no coincide
+        if columnas is None or columnas.total != len(resultados):
+            columnas = HistorialColumnar(resultados)
+            _columnas_cache.guardar(clave, columnas, costo=max(columnas.total, 1), etiqueta=version_historial)
+        return columnas
+    
+    # Reportes cuyo resultado depende de la fecha actual además del historial
+    REPORTES_DEPENDIENTES_DEL_TIEMPO = ('progreso',)
+    
+    def etag_reporte(self, paciente_id: str, tipo: str, parametros: Dict[str, Any],
+                     version_historial: Any) -> str:
+        """
+        ETag de un reporte: cambia si cambia el historial o los parámetros
+        
+        Los reportes que dependen de la fecha actual (ventanas de período o de
+        última semana) cambian además cada ``cache_ttl`` segundos.
+        """
+        ventana = None
+        if tipo in self.REPORTES_DEPENDIENTES_DEL_TIEMPO:
+            ventana = int(time.time() // _reportes_config['cache_ttl'])
+        
+        firma = repr((str(paciente_id), tipo, sorted(parametros.items()), version_historial, ventana))
+        return hashlib.sha1(firma.encode('utf-8')).hexdigest()
+    
+    def obtener_reporte(self, paciente_id: str, tipo: str, parametros: Dict[str, Any],
+                        etag: str, generar: Callable[[], Dict]) -> Dict:
+        """
+        Retorna el reporte desde la cache o lo genera si cambió su ETag
+        
+        Args:
+            generar: Función que calcula el reporte cuando no está en cache
+        """
+        clave = (str(paciente_id), tipo, tuple(sorted(parametros.items())))
+        reporte = _reportes_cache.obtener(clave, etiqueta=etag)
+        if reporte is None:
+            reporte = generar()
+            _reportes_cache.guardar(clave, reporte, etiqueta=etag)
+        return reporte
+    
+    @staticmethod
+    def invalidar_reportes(paciente_id: str) -> int:
+        """Descarta los reportes en cache de un paciente"""
+        paciente_id = str(paciente_id)
+        _columnas_cache.invalidar(paciente_id)
+        return _reportes_cache.invalidar_si(lambda clave: clave[0] == paciente_id)
+    
+    @staticmethod
+    def estadisticas_cache() -> Dict:
+        """Contadores de aciertos/fallos de la cache de reportes"""
+        return _reportes_cache.estadisticas()
+    
+    # Filas CSV que se agrupan en cada bloque enviado al cliente
+    FILAS_POR_BLOQUE = 200
+    
     def generar_reporte_csv_ejercicios(
         self,
         resultados: List[ResultadoEjercicio],
         paciente_nombre: str
     ) -> str:
         """Genera un reporte CSV de ejercicios"""
-        output = io.StringIO()
-        writer = csv.writer(output)
+        return ''.join(self.iterar_csv_ejercicios(resultados, paciente_nombre))
+    
+    def iterar_csv_ejercicios(
+        self,
+        resultados: Iterable[ResultadoEjercicio],
+        paciente_nombre: str
+    ) -> Iterator[str]:
+        """Genera el reporte CSV de ejercicios por bloques, a medida que se recorren los resultados"""
+        return _en_bloques(self._filas_csv_ejercicios(resultados, paciente_nombre), self.FILAS_POR_BLOQUE)
+    
+    def _filas_csv_ejercicios(
+        self,
+        resultados: Iterable[ResultadoEjercicio],
+        paciente_nombre: str
+    ) -> Iterator[str]:
+        writer = csv.writer(_Linea())
         
         # Encabezados
         headers = [
@@ -39,10 +166,15 @@ class ReporteService:
             'Aciertos',
             'Fallos'
         ]
-        writer.writerow(headers)
+        yield writer.writerow(headers)
         
-        # Datos
+        # Datos (el resumen se acumula en la misma pasada)
+        total = 0
+        exitosos = 0
         for resultado in resultados:
+            total += 1
+            if resultado.exito:
+                exitosos += 1
             row = [
                 resultado.fecha,
                 resultado.tipo_ejercicio,
@@ -60,20 +192,16 @@ class ReporteService:
                 resultado.aciertos or '',
                 resultado.fallos or ''
             ]
-            writer.writerow(row)
+            yield writer.writerow(row)
         
         # Agregar resumen
-        writer.writerow([])
-        writer.writerow(['RESUMEN DEL REPORTE'])
-        writer.writerow(['Paciente:', paciente_nombre])
-        writer.writerow(['Fecha de generación:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        writer.writerow(['Total de ejercicios:', len(resultados)])
-        
-        exitosos = sum(1 for r in resultados if r.exito)
-        writer.writerow(['Ejercicios exitosos:', exitosos])
-        writer.writerow(['Tasa de éxito:', f'{(exitosos/len(resultados)*100):.1f}%' if resultados else '0%'])
-        
-        return output.getvalue()
+        yield writer.writerow([])
+        yield writer.writerow(['RESUMEN DEL REPORTE'])
+        yield writer.writerow(['Paciente:', paciente_nombre])
+        yield writer.writerow(['Fecha de generación:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        yield writer.writerow(['Total de ejercicios:', total])
+        yield writer.writerow(['Ejercicios exitosos:', exitosos])
+        yield writer.writerow(['Tasa de éxito:', f'{(exitosos/total*100):.1f}%' if total else '0%'])
     
     def generar_reporte_csv_sesiones(
         self,
@@ -81,8 +209,22 @@ class ReporteService:
         paciente_nombre: str
     ) -> str:
         """Genera un reporte CSV de sesiones"""
-        output = io.StringIO()
-        writer = csv.writer(output)
+        return ''.join(self.iterar_csv_sesiones(sesiones, paciente_nombre))
+    
+    def iterar_csv_sesiones(
+        self,
+        sesiones: Iterable[Sesion],
+        paciente_nombre: str
+    ) -> Iterator[str]:
+        """Genera el reporte CSV de sesiones por bloques, a medida que se recorren las sesiones"""
+        return _en_bloques(self._filas_csv_sesiones(sesiones, paciente_nombre), self.FILAS_POR_BLOQUE)
+    
+    def _filas_csv_sesiones(
+        self,
+        sesiones: Iterable[Sesion],
+        paciente_nombre: str
+    ) -> Iterator[str]:
+        writer = csv.writer(_Linea())
         
         # Encabezados
         headers = [
@@ -98,10 +240,17 @@ class ReporteService:
             'Nivel Dolor (0-10)',
             'Observaciones'
         ]
-        writer.writerow(headers)
+        yield writer.writerow(headers)
         
-        # Datos
+        # Datos (el resumen se acumula en la misma pasada)
+        total = 0
+        completadas = 0
+        tiempo_total = 0
         for sesion in sesiones:
+            total += 1
+            if sesion.estado == EstadoSesion.COMPLETADA:
+                completadas += 1
+                tiempo_total += sesion.duracion_minutos
             row = [
                 sesion.fecha_sesion.strftime('%Y-%m-%d %H:%M') if sesion.fecha_sesion else '',
                 sesion.tipo_terapia.value,
@@ -115,95 +264,68 @@ class ReporteService:
                 sesion.nivel_dolor or '',
                 sesion.observaciones or ''
             ]
-            writer.writerow(row)
+            yield writer.writerow(row)
         
         # Resumen
-        writer.writerow([])
-        writer.writerow(['RESUMEN DEL REPORTE'])
-        writer.writerow(['Paciente:', paciente_nombre])
-        writer.writerow(['Fecha de generación:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
-        
-        sesiones_completadas = [s for s in sesiones if s.estado == EstadoSesion.COMPLETADA]
-        writer.writerow(['Total sesiones:', len(sesiones)])
-        writer.writerow(['Sesiones completadas:', len(sesiones_completadas)])
+        yield writer.writerow([])
+        yield writer.writerow(['RESUMEN DEL REPORTE'])
+        yield writer.writerow(['Paciente:', paciente_nombre])
+        yield writer.writerow(['Fecha de generación:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+        yield writer.writerow(['Total sesiones:', total])
+        yield writer.writerow(['Sesiones completadas:', completadas])
         
-        if sesiones_completadas:
-            tiempo_total = sum(s.duracion_minutos for s in sesiones_completadas)
-            promedio = tiempo_total / len(sesiones_completadas)
-            writer.writerow(['Tiempo total (min):', tiempo_total])
-            writer.writerow(['Promedio duración (min):', f'{promedio:.1f}'])
-        
-        return output.getvalue()
+        if completadas:
+            promedio = tiempo_total / completadas
+            yield writer.writerow(['Tiempo total (min):', tiempo_total])
+            yield writer.writerow(['Promedio duración (min):', f'{promedio:.1f}'])
     
     def generar_analisis_progreso(
         self,
         resultados: List[ResultadoEjercicio],
-        periodo_dias: int = 30
+        periodo_dias: int = 30,
+        paciente_id: Optional[str] = None,
+        version_historial: Any = None
     ) -> Dict:
-        """Genera un análisis de progreso del paciente"""
+        """
+        Genera un análisis de progreso del paciente
+        
+        Con el paciente y la versión del historial (leída antes que los
+        resultados) se reutilizan las columnas del backend vectorizado.
+        """
         if not resultados:
             return {
                 'sin_datos': True,
                 'mensaje': 'No hay datos suficientes para análisis'
             }
         
-        def _parse_fecha(fecha_str):
-            """Parsea fecha ISO ignorando timezone para compatibilidad."""
-            if not fecha_str:
-                return None
-            try:
-                # Elimina timezone (+00:00, Z, etc.) antes de parsear
-                limpia = fecha_str.split('+')[0].rstrip('Z').strip()
-                return datetime.fromisoformat(limpia)
-            except (ValueError, AttributeError):
-                return None
-
-        # Filtrar por período
-        fecha_limite = datetime.now() - timedelta(days=periodo_dias)
-        resultados_periodo = [
-            r for r in resultados
-            if _parse_fecha(r.fecha) and _parse_fecha(r.fecha) >= fecha_limite
-        ]
-
-        if not resultados_periodo:
-            resultados_periodo = resultados  # Usar todos si no hay en el período
-
-        # Análisis por tipo de ejercicio
-        ejercicios_por_tipo = {}
-        for resultado in resultados_periodo:
-            tipo = resultado.tipo_ejercicio
-            if tipo not in ejercicios_por_tipo:
-                ejercicios_por_tipo[tipo] = []
-            ejercicios_por_tipo[tipo].append(resultado)
+        # Una sola pasada: cada fecha se parsea una vez y se acumulan
+        # período, división semanal, análisis por tipo y métricas globales
+        ahora = datetime.now()
+        columnas = self._columnas(resultados, paciente_id, version_historial)
+        if columnas is not None:
+            vista = agregacion_vectorizada.analizar_progreso(columnas, periodo_dias, ahora)
+        else:
+            vista = agregacion.AgregadorProgreso(periodo_dias, ahora).procesar(resultados)
         
+        # Análisis por tipo de ejercicio
         analisis_tipos = {}
-        for tipo, resultados_tipo in ejercicios_por_tipo.items():
-            exitosos = sum(1 for r in resultados_tipo if r.exito)
-            tasa_exito = (exitosos / len(resultados_tipo)) * 100
-            
-            precisiones = [r.precision for r in resultados_tipo if r.precision]
-            precision_promedio = sum(precisiones) / len(precisiones) if precisiones else None
-            
-            velocidades = [r.velocidad_promedio for r in resultados_tipo if r.velocidad_promedio]
-            velocidad_promedio = sum(velocidades) / len(velocidades) if velocidades else None
+        for tipo, acumulador in vista.por_tipo.items():
+            precision_promedio = acumulador.precision_promedio()
+            velocidad_promedio = acumulador.velocidad_promedio()
             
             analisis_tipos[tipo] = {
-                'total_intentos': len(resultados_tipo),
-                'exitosos': exitosos,
-                'tasa_exito': round(tasa_exito, 1),
+                'total_intentos': acumulador.total,
+                'exitosos': acumulador.exitosos,
+                'tasa_exito': round(acumulador.tasa_exito(), 1),
                 'precision_promedio': round(precision_promedio, 1) if precision_promedio else None,
                 'velocidad_promedio': round(velocidad_promedio, 2) if velocidad_promedio else None
             }
         
         # Tendencia general (últimos 7 días vs anteriores)
-        fecha_semana = datetime.now() - timedelta(days=7)
-        ultima_semana = [r for r in resultados_periodo if _parse_fecha(r.fecha) and _parse_fecha(r.fecha) >= fecha_semana]
-        semana_anterior = [r for r in resultados_periodo if _parse_fecha(r.fecha) and _parse_fecha(r.fecha) < fecha_semana]
-        
         tendencia = 'estable'
-        if ultima_semana and semana_anterior:
-            tasa_reciente = sum(1 for r in ultima_semana if r.exito) / len(ultima_semana) * 100
-            tasa_anterior = sum(1 for r in semana_anterior if r.exito) / len(semana_anterior) * 100
+        if vista.ultima_semana.total and vista.semana_anterior.total:
+            tasa_reciente = vista.ultima_semana.tasa_exito()
+            tasa_anterior = vista.semana_anterior.tasa_exito()
             
             if tasa_reciente > tasa_anterior + 5:
                 tendencia = 'mejora'
@@ -211,19 +333,15 @@ class ReporteService:
                 tendencia = 'declive'
         
         # Métricas globales
-        total_ejercicios = len(resultados_periodo)
-        exitosos_total = sum(1 for r in resultados_periodo if r.exito)
-        tasa_exito_global = (exitosos_total / total_ejercicios) * 100
-        
-        precisiones_todas = [r.precision for r in resultados_periodo if r.precision]
-        precision_global = sum(precisiones_todas) / len(precisiones_todas) if precisiones_todas else None
+        tasa_exito_global = vista.global_.tasa_exito()
+        precision_global = vista.global_.precision_promedio()
         
         return {
             'periodo_dias': periodo_dias,
-            'fecha_analisis': datetime.now().isoformat(),
+            'fecha_analisis': ahora.isoformat(),
             'metricas_globales': {
-                'total_ejercicios': total_ejercicios,
-                'ejercicios_exitosos': exitosos_total,
+                'total_ejercicios': vista.global_.total,
+                'ejercicios_exitosos': vista.global_.exitosos,
                 'tasa_exito': round(tasa_exito_global, 1),
                 'precision_promedio': round(precision_global, 1) if precision_global else None
             },
@@ -265,44 +383,31 @@ class ReporteService:
     
     def generar_comparativa_semanal(
         self,
-        resultados: List[ResultadoEjercicio]
+        resultados: List[ResultadoEjercicio],
+        paciente_id: Optional[str] = None,
+        version_historial: Any = None
     ) -> Dict:
-        """Genera una comparativa semanal de resultados"""
+        """Genera una comparativa semanal de resultados (ver generar_analisis_progreso)"""
         if not resultados:
             return {'sin_datos': True}
         
         # Agrupar por semana
-        resultados_por_semana = {}
-        for resultado in resultados:
-            if not resultado.fecha:
-                continue
-            try:
-                fecha_limpia = resultado.fecha.split('+')[0].rstrip('Z').strip()
-                fecha = datetime.fromisoformat(fecha_limpia).date()
-            except (ValueError, AttributeError):
-                continue
-            semana = fecha.isocalendar()[1]  # Número de semana del año
-            ano = fecha.year
-            clave = f"{ano}-W{semana:02d}"
-            
-            if clave not in resultados_por_semana:
-                resultados_por_semana[clave] = []
-            resultados_por_semana[clave].append(resultado)
+        columnas = self._columnas(resultados, paciente_id, version_historial)
+        if columnas is not None:
+            resultados_por_semana = agregacion_vectorizada.agrupar_por_semana(columnas)
+        else:
+            resultados_por_semana = agregacion.agrupar_por_semana(resultados)
         
         # Analizar cada semana
         datos_semanales = []
-        for semana, resultados_semana in sorted(resultados_por_semana.items()):
-            exitosos = sum(1 for r in resultados_semana if r.exito)
-            tasa_exito = (exitosos / len(resultados_semana)) * 100
-            
-            precisiones = [r.precision for r in resultados_semana if r.precision]
-            precision_promedio = sum(precisiones) / len(precisiones) if precisiones else None
+        for semana, acumulador in sorted(resultados_por_semana.items()):
+            precision_promedio = acumulador.precision_promedio()
             
             datos_semanales.append({
                 'semana': semana,
-                'total_ejercicios': len(resultados_semana),
-                'exitosos': exitosos,
-                'tasa_exito': round(tasa_exito, 1),
+                'total_ejercicios': acumulador.total,
+                'exitosos': acumulador.exitosos,
+                'tasa_exito': round(acumulador.tasa_exito(), 1),
                 'precision_promedio': round(precision_promedio, 1) if precision_promedio else None
             })
         
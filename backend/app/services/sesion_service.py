@@ -1,13 +1,17 @@
 """
 Servicio de Sesiones - Lógica de negocio para gestión de sesiones de terapia
 """
-from typing import List, Dict, Optional
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Dict, Optional, Set
 from datetime import datetime, timedelta
 from app.models.sesion import (
-    Sesion, EstadoSesion, TipoTerapia, AlertaSeguridad,
+    Sesion, EstadoSesion, TipoTerapia, AlertaSeguridad, SesionesActivas,
     EJERCICIOS_CALENTAMIENTO, EJERCICIOS_ENFRIAMIENTO
 )
 from app.models.configuracion import ConfiguracionSeguridad
+from app.utils.eventos import CentroEventos, canal_paciente, centro_eventos
+from app.utils.rueda_temporizadores import RuedaTemporizadores, Temporizador
 
 
 class SesionService:
@@ -159,7 +163,8 @@ class SesionService:
             'mensaje': 'Sesión cancelada. Descansa y vuelve cuando te sientas mejor'
         }
     
-    def obtener_resumen_sesion(self, sesion: Sesion) -> Dict:
+    @staticmethod
+    def obtener_resumen_sesion(sesion: Sesion) -> Dict:
         """Obtiene un resumen completo de la sesión"""
         return {
             'id': sesion.id,
@@ -178,6 +183,18 @@ class SesionService:
             'observaciones': sesion.observaciones
         }
     
+    @staticmethod
+    def publicar_estado(sesion: Sesion):
+        """
+        Publica el resumen de la sesión en el canal del paciente (observador de SesionesActivas)
+        
+        Una sesión completada o cancelada se publica como 'fin'.
+        """
+        tipo = 'estado' if sesion.esta_activa() else 'fin'
+        centro_eventos.publicar(
+            canal_paciente(sesion.paciente_id), tipo, SesionService.obtener_resumen_sesion(sesion)
+        )
+    
     def obtener_estadisticas_sesiones(self, sesiones: List[Sesion]) -> Dict:
         """Obtiene estadísticas de un conjunto de sesiones"""
         if not sesiones:
@@ -219,3 +236,197 @@ class SesionService:
             'sesiones_con_descansos': sesiones_con_descansos
         }
 
+
+class ProgramadorAlertas:
+    """
+    Alertas de seguridad de las sesiones en curso programadas en el servidor.
+    
+    Por cada sesión activa se programan en una rueda de temporizadores los
+    vencimientos de ConfiguracionSeguridad: el próximo descanso
+    (``intervalo_descanso``, solo en curso), el límite de tiempo
+    (``limite_tiempo_sesion``) y la inactividad (``tiempo_inactividad``, una
+    vez que el cliente empezó a reportar actividad). Cada cambio de la sesión
+    reprograma sus temporizadores en O(1), así que no hay que recalcular nada
+    en cada consulta: las alertas vencidas quedan en una cola por paciente y
+    se publican en su canal de eventos.
+    """
+    
+    DESCANSO = 'descanso'
+    LIMITE_TIEMPO = 'limite_tiempo'
+    INACTIVIDAD = 'inactividad'
+    
+    def __init__(self, sesiones: SesionesActivas, rueda: RuedaTemporizadores,
+                 max_alertas_pendientes: int = 20, centro: CentroEventos = centro_eventos,
+                 cargar_configuracion: Optional[Callable[[str], ConfiguracionSeguridad]] = None):
+        self.sesiones = sesiones
+        self.rueda = rueda
+        self.centro = centro
+        # Configuración guardada de un paciente que todavía no se configuró
+        # (por ejemplo, sesiones recuperadas tras un reinicio)
+        self.cargar_configuracion = cargar_configuracion
+        self.max_alertas_pendientes = max_alertas_pendientes
+        # paciente -> sesión para la que están programados los temporizadores
+        self._sesiones: Dict[str, Sesion] = {}
+        # paciente -> tipo de alerta -> temporizador
+        self._temporizadores: Dict[str, Dict[str, Temporizador]] = {}
+        self._configuraciones: Dict[str, ConfiguracionSeguridad] = {}
+        # pacientes cuya sesión actual reporta actividad
+        self._con_actividad: Set[str] = set()
+        self._alertas: Dict[str, Deque[AlertaSeguridad]] = {}
+        self._lock = threading.RLock()
+        
+        sesiones.suscribir(self.actualizar)
+        for sesion in sesiones.activas():
+            self.actualizar(sesion)
+    
+    def configurar(self, paciente_id, config_seguridad: ConfiguracionSeguridad):
+        """
+        Configuración de seguridad del paciente.
+        
+        Si tiene una sesión en curso sus temporizadores se reprograman con los
+        nuevos plazos; el de inactividad vuelve a contar desde ahora.
+        """
+        clave = str(paciente_id)
+        with self._lock:
+            self._configuraciones[clave] = config_seguridad
+            sesion = self._sesiones.get(clave)
+            if sesion is None:
+                return
+            self._programar_limite(clave, sesion)
+            self.actualizar(sesion)
+            temporizador = self._temporizadores.get(clave, {}).get(self.INACTIVIDAD)
+            if temporizador is not None and temporizador.activo:
+                self._programar_inactividad(clave, sesion)
+    
+    def _config(self, clave: str) -> ConfiguracionSeguridad:
+        config = self._configuraciones.get(clave)
+        if config is None:
+            if self.cargar_configuracion is not None:
+                try:
+                    config = self.cargar_configuracion(clave)
+                except Exception as e:
+                    print(f"⚠️ Error cargando configuración de seguridad de {clave}: {e}")
+            if config is None:
+                config = ConfiguracionSeguridad(paciente_id=clave)
+            self._configuraciones[clave] = config
+        return config
+    
+    def _programar(self, clave: str, tipo: str, retraso: Optional[float], accion):
+        """Reemplaza el temporizador del tipo; con retraso None solo lo cancela"""
+        temporizadores = self._temporizadores.setdefault(clave, {})
+        self.rueda.cancelar(temporizadores.pop(tipo, None))
+        if retraso is not None:
+            temporizadores[tipo] = self.rueda.programar(max(retraso, 0), accion)
+    
+    def _cancelar_todo(self, clave: str):
+        for temporizador in self._temporizadores.pop(clave, {}).values():
+            self.rueda.cancelar(temporizador)
+    
+    def actualizar(self, sesion: Sesion):
+        """Reprograma los temporizadores de la sesión después de un cambio"""
+        clave = str(sesion.paciente_id)
+        with self._lock:
+            if not sesion.esta_activa() or not sesion.fecha_inicio:
+                if self._sesiones.get(clave) is sesion:
+                    self._cancelar_todo(clave)
+                    del self._sesiones[clave]
+                    self._con_actividad.discard(clave)
+                return
+            
+            config = self._config(clave)
+            transcurrido = (datetime.now() - sesion.fecha_inicio).total_seconds()
+            
+            if self._sesiones.get(clave) is not sesion:
+                # Sesión nueva (o recuperada tras un reinicio)
+                self._cancelar_todo(clave)
+                self._sesiones[clave] = sesion
+                self._con_actividad.discard(clave)
+                self._programar_limite(clave, sesion)
+            
+            en_curso = sesion.estado == EstadoSesion.EN_CURSO
+            retraso_descanso = None
+            if en_curso and config.intervalo_descanso > 0:
+                retraso_descanso = (sesion.alertas_descanso + 1) * config.intervalo_descanso * 60 - transcurrido
+            self._programar(clave, self.DESCANSO, retraso_descanso, lambda: self._vencer_descanso(clave, sesion))
+            
+            # La inactividad solo se reinicia con la actividad reportada
+            if not en_curso:
+                self._programar(clave, self.INACTIVIDAD, None, None)
+            elif clave in self._con_actividad:
+                temporizador = self._temporizadores[clave].get(self.INACTIVIDAD)
+                if temporizador is None or not temporizador.activo:
+                    self._programar_inactividad(clave, sesion)
+    
+    def _programar_limite(self, clave: str, sesion: Sesion):
+        transcurrido = (datetime.now() - sesion.fecha_inicio).total_seconds()
+        self._programar(
+            clave, self.LIMITE_TIEMPO, self._config(clave).limite_tiempo_sesion * 60 - transcurrido,
+            lambda: self._vencer_limite(clave, sesion)
+        )
+    
+    def _programar_inactividad(self, clave: str, sesion: Sesion):
+        self._programar(
+            clave, self.INACTIVIDAD, self._config(clave).tiempo_inactividad,
+            lambda: self._vencer_inactividad(clave, sesion)
+        )
+    
+    def registrar_actividad(self, paciente_id) -> bool:
+        """
+        Registra actividad del paciente y reinicia el plazo de inactividad
+        
+        Returns:
+            bool: False si el paciente no tiene una sesión en curso
+        """
+        clave = str(paciente_id)
+        sesion = self.sesiones.obtener(clave)
+        if sesion is None:
+            return False
+        with self._lock:
+            if self._sesiones.get(clave) is sesion:
+                self._con_actividad.add(clave)
+                if sesion.estado == EstadoSesion.EN_CURSO:
+                    self._programar_inactividad(clave, sesion)
+        return True
+    
+    def _encolar(self, clave: str, alerta: AlertaSeguridad):
+        with self._lock:
+            cola = self._alertas.get(clave)
+            if cola is None:
+                cola = self._alertas[clave] = deque(maxlen=self.max_alertas_pendientes)
+            cola.append(alerta)
+        self.centro.publicar(canal_paciente(clave), 'alerta', alerta.to_dict())
+    
+    def tomar_alertas(self, paciente_id) -> List[AlertaSeguridad]:
+        """Retorna y descarta las alertas vencidas del paciente"""
+        with self._lock:
+            cola = self._alertas.pop(str(paciente_id), None)
+            return list(cola) if cola else []
+    
+    # Las acciones de los temporizadores corren en el hilo de la rueda, sin el
+    # lock del programador: aplicar una transición vuelve a llamar a actualizar()
+    
+    def _vencer_descanso(self, clave: str, sesion: Sesion):
+        def registrar(actual: Sesion) -> Optional[AlertaSeguridad]:
+            if actual is not sesion or actual.estado != EstadoSesion.EN_CURSO:
+                return None
+            actual.registrar_alerta_descanso()
+            # Si se debían varios descansos (por ejemplo, tras una pausa larga) se avisa una sola vez
+            intervalo = self._config(clave).intervalo_descanso
+            while actual.requiere_descanso(intervalo):
+                actual.registrar_alerta_descanso()
+            return AlertaSeguridad.crear_alerta_descanso()
+        
+        alerta = self.sesiones.aplicar(clave, registrar)
+        if alerta is not None:
+            self._encolar(clave, alerta)
+    
+    def _vencer_limite(self, clave: str, sesion: Sesion):
+        if self.sesiones.obtener(clave) is sesion:
+            self._encolar(clave, AlertaSeguridad.crear_alerta_limite_tiempo())
+    
+    def _vencer_inactividad(self, clave: str, sesion: Sesion):
+        if self.sesiones.obtener(clave) is not sesion:
+            return
+        self._encolar(clave, AlertaSeguridad.crear_alerta_inactividad())
+        if self._config(clave).pausa_automatica_inactividad:
+            self.sesiones.aplicar(clave, lambda actual: actual.pausar() if actual is sesion else None)
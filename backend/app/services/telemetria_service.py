@@ -0,0 +1,197 @@
+"""
+Servicio de Telemetría - Ingesta de muestras de movimiento por intento
+Responsable de validar los lotes del cliente y dejarlos para escribir sin bloquear la request
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from app.database.telemetria_journal import EscritorTelemetria, TelemetriaJournal
+from app.utils.cache import CacheLRU
+from app.utils.cinematica import NUMPY_DISPONIBLE, calcular_metricas
+from app.utils.telemetria import validar_intento_id, validar_lote
+from config.settings import get_telemetria_config
+
+_telemetria_config = get_telemetria_config()
+
+# Un solo escritor por proceso para todas las instancias del servicio
+_escritor = EscritorTelemetria(
+    TelemetriaJournal(_telemetria_config['telemetria_path']),
+    max_lotes=_telemetria_config['max_lotes_pendientes']
+)
+atexit.register(_escritor.detener)
+
+# Métricas de los intentos cuyos lotes seguían en cola al registrar el resultado:
+# se calculan fuera de la request, de a una tanda por vez
+_diferidas = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metricas-diferidas')
+
+# Secuencias ya recibidas por intento, para ignorar los reintentos del cliente.
+# Clave: (paciente, intento); valor: conjunto de números de secuencia
+_secuencias_recibidas = CacheLRU(max_costo=10000, ttl=6 * 3600, nombre='telemetria')
+_secuencias_lock = threading.Lock()
+
+
+class TelemetriaSaturada(Exception):
+    """La cola de escritura está llena; el cliente debe reintentar"""
+
+
+def _metricas_de_intento(telemetria_path: str, paciente_id: str, intento_id: str) -> Optional[Dict]:
+    """Lee la telemetría de un intento y calcula sus métricas (se ejecuta en los procesos del pool)"""
+    columnas = TelemetriaJournal(telemetria_path).leer(paciente_id, intento_id)
+    if columnas is None or not len(columnas['t']):
+        return None
+    return calcular_metricas(columnas['t'], columnas['x'], columnas['y'], columnas['e'])
+
+
+class TelemetriaService:
+    """Servicio para la telemetría de movimiento de los intentos"""
+    
+    # Segundos que el cálculo diferido espera a que se escriban los últimos lotes de un intento
+    ESPERA_LOTES = 30.0
+    
+    def __init__(self):
+        self.escritor = _escritor
+        self.journal = _escritor.journal
+        self.max_muestras_lote = _telemetria_config['max_muestras_lote']
+    
+    def registrar_lote(self, paciente_id: str, intento_id: str, datos: Optional[Dict]) -> Dict:
+        """
+        Valida un lote de muestras y lo encola para escribir
+        
+        Un lote con una secuencia ya recibida para el intento se acepta sin
+        volver a guardarse (reintento del cliente).
+        
+        Raises:
+            TelemetriaInvalida: si el intento o el lote no son válidos
+            TelemetriaSaturada: si la cola de escritura está llena
+        """
+        validar_intento_id(intento_id)
+        lote = validar_lote(datos, self.max_muestras_lote)
+        
+        clave = (str(paciente_id), intento_id)
+        with _secuencias_lock:
+            recibidas = _secuencias_recibidas.obtener(clave)
+            if recibidas is not None and lote.secuencia in recibidas:
+                return {'secuencia': lote.secuencia, 'muestras': len(lote), 'duplicado': True}
+            
+            if not self.escritor.encolar(str(paciente_id), intento_id, lote):
+                raise TelemetriaSaturada('La cola de telemetría está llena')
+            
+            if recibidas is None:
+                recibidas = set()
+                _secuencias_recibidas.guardar(clave, recibidas)
+            recibidas.add(lote.secuencia)
+        return {'secuencia': lote.secuencia, 'muestras': len(lote), 'duplicado': False}
+    
+    def cerrar_intento(self, paciente_id: str, intento_id: str) -> bool:
+        """
+        Pide compactar la telemetría del intento terminado en bloques grandes
+        
+        Returns:
+            bool: False si la cola de escritura está llena (el intento queda sin compactar)
+        """
+        validar_intento_id(intento_id)
+        return self.escritor.encolar_compactacion(str(paciente_id), intento_id)
+    
+    def obtener_intento(self, paciente_id: str, intento_id: str, desde: Optional[float] = None,
+                        hasta: Optional[float] = None) -> Optional[Dict[str, Sequence]]:
+        """Columnas t, x, y, e guardadas para el intento, opcionalmente entre ``desde`` y ``hasta`` ms (None si no hay telemetría)"""
+        validar_intento_id(intento_id)
+        return self.journal.leer(str(paciente_id), intento_id, desde, hasta)
+    
+    def lotes_pendientes(self, paciente_id: str, intento_id: str) -> bool:
+        """True si el intento tiene lotes encolados que todavía no se escribieron"""
+        validar_intento_id(intento_id)
+        return self.escritor.tiene_pendientes(str(paciente_id), intento_id)
+    
+    def metricas_intento(self, paciente_id: str, intento_id: str) -> Optional[Dict]:
+        """
+        Métricas cinemáticas del intento calculadas con su telemetría ya escrita
+        
+        No espera a los lotes que sigan en la cola (ver lotes_pendientes y
+        metricas_diferidas).
+        
+        Returns:
+            Dict con las métricas, o None si no hay telemetría o NumPy no está instalado
+        """
+        validar_intento_id(intento_id)
+        if not NUMPY_DISPONIBLE:
+            return None
+        return _metricas_de_intento(self.journal.telemetria_path, str(paciente_id), intento_id)
+    
+    def metricas_diferidas(self, paciente_id: str, intentos: Iterable[str],
+                           al_calcular: Callable[[Dict[str, Dict]], object]) -> bool:
+        """
+        Calcula en segundo plano las métricas de los intentos cuando se escriban sus lotes
+        
+        Cada intento espera hasta ESPERA_LOTES segundos a sus lotes pendientes;
+        ``al_calcular`` recibe intento_id -> métricas de los que tienen
+        telemetría y no se llama si ninguno la tiene.
+        
+        Returns:
+            bool: False si NumPy no está instalado o no hay intentos (no se programa nada)
+        """
+        paciente_id = str(paciente_id)
+        intentos = [validar_intento_id(i) for i in intentos]
+        if not NUMPY_DISPONIBLE or not intentos:
+            return False
+        
+        def calcular():
+            try:
+                calculadas = {}
+                for intento_id in intentos:
+                    self.escritor.esperar_intento(paciente_id, intento_id, self.ESPERA_LOTES)
+                    metricas = _metricas_de_intento(self.journal.telemetria_path, paciente_id, intento_id)
+                    if metricas is not None:
+                        calculadas[intento_id] = metricas
+                if calculadas:
+                    al_calcular(calculadas)
+            except Exception as e:
+                print(f"⚠️ Error al calcular métricas diferidas del paciente {paciente_id}: {e}")
+        
+        _diferidas.submit(calcular)
+        return True
+    
+    def intentos(self, paciente_id: str) -> List[str]:
+        """IDs de los intentos del paciente que tienen telemetría"""
+        directorio = os.path.join(self.journal.telemetria_path, str(paciente_id))
+        try:
+            nombres = os.listdir(directorio)
+        except FileNotFoundError:
+            return []
+        extension = self.journal.EXTENSION
+        return sorted(nombre[:-len(extension)] for nombre in nombres if nombre.endswith(extension))
+    
+    def recalcular_metricas(self, paciente_id: str, intentos: Optional[Iterable[str]] = None,
+                            procesos: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        Recalcula las métricas de varios intentos en un pool de procesos
+        
+        Args:
+            paciente_id: ID del paciente
+            intentos: IDs de los intentos (por defecto todos los que tienen telemetría)
+            procesos: tamaño del pool (por defecto la cantidad de CPUs; 1 calcula en este proceso)
+        
+        Returns:
+            Dict intento_id -> métricas (solo los intentos con telemetría)
+        """
+        if not NUMPY_DISPONIBLE:
+            return {}
+        paciente_id = str(paciente_id)
+        intentos = [validar_intento_id(i) for i in (self.intentos(paciente_id) if intentos is None else intentos)]
+        if not intentos:
+            return {}
+        
+        ruta = self.journal.telemetria_path
+        argumentos = ([ruta] * len(intentos), [paciente_id] * len(intentos), intentos)
+        procesos = min(procesos or os.cpu_count() or 1, len(intentos))
+        if procesos == 1:
+            calculadas = map(_metricas_de_intento, *argumentos)
+            return {i: m for i, m in zip(intentos, calculadas) if m is not None}
+        
+        # El cálculo es CPU puro: en procesos no compite por el GIL con las requests
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            calculadas = pool.map(_metricas_de_intento, *argumentos, chunksize=max(1, len(intentos) // (procesos * 4)))
+            return {i: m for i, m in zip(intentos, calculadas) if m is not None}
@@ -0,0 +1,162 @@
+"""
+Motor de Agregación - Acumuladores de una sola pasada para análisis de resultados
+Responsable de calcular contadores y promedios parseando cada fecha una sola vez
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def parse_fecha(fecha_str: Optional[str]) -> Optional[datetime]:
+    """Parsea fecha ISO ignorando timezone para compatibilidad."""
+    if not fecha_str:
+        return None
+    try:
+        fecha = datetime.fromisoformat(fecha_str)
+    except (ValueError, TypeError):
+        try:
+            # Elimina timezone (+00:00, Z, etc.) antes de parsear
+            limpia = fecha_str.split('+')[0].rstrip('Z').strip()
+            fecha = datetime.fromisoformat(limpia)
+        except (ValueError, AttributeError, TypeError):
+            return None
+    # Se conserva la hora local registrada, sin convertir entre zonas
+    return fecha.replace(tzinfo=None) if fecha.tzinfo else fecha
+
+
+class Acumulador:
+    """Contadores y sumas de un grupo de resultados"""
+    
+    __slots__ = ('total', 'exitosos', 'suma_precision', 'n_precision', 'suma_velocidad', 'n_velocidad')
+    
+    def __init__(self):
+        self.total = 0
+        self.exitosos = 0
+        self.suma_precision = 0.0
+        self.n_precision = 0
+        self.suma_velocidad = 0.0
+        self.n_velocidad = 0
+    
+    def agregar(self, exito: bool, precision: Optional[float], velocidad: Optional[float]):
+        """Agrega un resultado al grupo (precisión/velocidad nulas o cero se ignoran)"""
+        self.total += 1
+        if exito:
+            self.exitosos += 1
+        if precision:
+            self.suma_precision += precision
+            self.n_precision += 1
+        if velocidad:
+            self.suma_velocidad += velocidad
+            self.n_velocidad += 1
+    
+    def combinar(self, otro: 'Acumulador'):
+        """Suma los contadores de otro acumulador"""
+        self.total += otro.total
+        self.exitosos += otro.exitosos
+        self.suma_precision += otro.suma_precision
+        self.n_precision += otro.n_precision
+        self.suma_velocidad += otro.suma_velocidad
+        self.n_velocidad += otro.n_velocidad
+    
+    def tasa_exito(self) -> float:
+        """Porcentaje de resultados exitosos"""
+        return (self.exitosos / self.total) * 100 if self.total else 0
+    
+    def precision_promedio(self) -> Optional[float]:
+        """Promedio de precisión o None si no hay datos"""
+        return self.suma_precision / self.n_precision if self.n_precision else None
+    
+    def velocidad_promedio(self) -> Optional[float]:
+        """Promedio de velocidad o None si no hay datos"""
+        return self.suma_velocidad / self.n_velocidad if self.n_velocidad else None
+
+
+class VistaProgreso:
+    """Agregados de un conjunto de resultados: global, por tipo y división semanal"""
+    
+    __slots__ = ('global_', 'por_tipo', 'ultima_semana', 'semana_anterior')
+    
+    def __init__(self):
+        self.global_ = Acumulador()
+        self.por_tipo: Dict[str, Acumulador] = {}
+        self.ultima_semana = Acumulador()
+        self.semana_anterior = Acumulador()
+    
+    def combinar(self, tipo: str, acumulador: Acumulador, en_ultima_semana: Optional[bool]):
+        """Incorpora un grupo ya acumulado a los totales de la vista"""
+        self.global_.combinar(acumulador)
+        
+        acumulador_tipo = self.por_tipo.get(tipo)
+        if acumulador_tipo is None:
+            acumulador_tipo = self.por_tipo[tipo] = Acumulador()
+        acumulador_tipo.combinar(acumulador)
+        
+        if en_ultima_semana is True:
+            self.ultima_semana.combinar(acumulador)
+        elif en_ultima_semana is False:
+            self.semana_anterior.combinar(acumulador)
+
+
+class AgregadorProgreso:
+    """
+    Calcula en una sola pasada los agregados del análisis de progreso.
+    
+    Cada resultado se acumula una sola vez en el grupo (tipo, dentro del
+    período, dentro de la última semana). Al final se combinan los grupos
+    para obtener la vista del período, o la de todos los resultados cuando
+    no hay ninguno dentro del período.
+    """
+    
+    def __init__(self, periodo_dias: int = 30, ahora: Optional[datetime] = None):
+        self.ahora = ahora or datetime.now()
+        self.fecha_limite = self.ahora - timedelta(days=periodo_dias)
+        self.fecha_semana = self.ahora - timedelta(days=7)
+    
+    def procesar(self, resultados: Iterable) -> VistaProgreso:
+        """
+        Recorre los resultados una vez y retorna la vista a usar en el análisis
+        
+        Returns:
+            VistaProgreso: la vista del período, o la de todos si el período está vacío
+        """
+        fecha_limite = self.fecha_limite
+        fecha_semana = self.fecha_semana
+        grupos: Dict[Tuple[str, bool, Optional[bool]], Acumulador] = {}
+        
+        for r in resultados:
+            fecha = parse_fecha(r.fecha)
+            if fecha is None:
+                clave = (r.tipo_ejercicio, False, None)
+            else:
+                clave = (r.tipo_ejercicio, fecha >= fecha_limite, fecha >= fecha_semana)
+            
+            acumulador = grupos.get(clave)
+            if acumulador is None:
+                acumulador = grupos[clave] = Acumulador()
+            acumulador.agregar(r.exito, r.precision, r.velocidad_promedio)
+        
+        solo_periodo = any(dentro for _, dentro, _ in grupos)
+        vista = VistaProgreso()
+        for (tipo, dentro, en_ultima_semana), acumulador in grupos.items():
+            if dentro or not solo_periodo:
+                vista.combinar(tipo, acumulador, en_ultima_semana)
+        return vista
+
+
+def agrupar_por_semana(resultados: Iterable) -> Dict[str, Acumulador]:
+    """Agrupa resultados por semana del año (clave 'AAAA-Www') en una sola pasada"""
+    semanas: Dict[str, Acumulador] = {}
+    claves_por_dia: Dict[date, str] = {}
+    for r in resultados:
+        fecha = parse_fecha(r.fecha)
+        if fecha is None:
+            continue
+        dia = fecha.date()
+        clave = claves_por_dia.get(dia)
+        if clave is None:
+            clave = claves_por_dia[dia] = f"{dia.year}-W{dia.isocalendar()[1]:02d}"
+        
+        acumulador = semanas.get(clave)
+        if acumulador is None:
+            acumulador = semanas[clave] = Acumulador()
+        acumulador.agregar(r.exito, r.precision, None)
+    return semanas
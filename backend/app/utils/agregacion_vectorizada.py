@@ -0,0 +1,146 @@
+"""
+Motor de Agregación Vectorizado - Backend columnar con NumPy (opcional)
+Responsable de calcular los mismos agregados que app.utils.agregacion sobre arreglos
+"""
+import warnings
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from app.utils.agregacion import Acumulador, VistaProgreso, parse_fecha
+
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+    NUMPY_DISPONIBLE = False
+
+
+class HistorialColumnar:
+    """
+    Historial convertido una sola vez a columnas NumPy.
+    
+    - fechas: datetime64[us] (NaT si la fecha no se puede parsear)
+    - exito: bool
+    - precision / velocidad: float64 con NaN para valores nulos o cero
+    - tipos: código entero de tipo_ejercicio (``nombres_tipos[codigo]``)
+    """
+    
+    def __init__(self, resultados: Sequence):
+        if not NUMPY_DISPONIBLE:
+            raise RuntimeError('NumPy no está instalado')
+        
+        self.total = len(resultados)
+        self.fechas = self._convertir_fechas([r.fecha for r in resultados])
+        self.exito = np.array([bool(r.exito) for r in resultados], dtype=bool)
+        # None se convierte en NaN; igual que en el motor de Python, 0 tampoco cuenta para los promedios
+        self.precision = np.array([r.precision for r in resultados], dtype=np.float64)
+        self.precision[self.precision == 0] = np.nan
+        self.velocidad = np.array([r.velocidad_promedio for r in resultados], dtype=np.float64)
+        self.velocidad[self.velocidad == 0] = np.nan
+        
+        codigos: Dict[str, int] = {}
+        self.tipos = np.array(
+            [codigos.setdefault(r.tipo_ejercicio, len(codigos)) for r in resultados], dtype=np.int64
+        )
+        self.nombres_tipos: List[str] = list(codigos)
+    
+    @staticmethod
+    def _convertir_fechas(fechas: Sequence[Optional[str]]):
+        """Convierte las fechas ISO a datetime64, con conversión elemento a elemento si hace falta"""
+        try:
+            with warnings.catch_warnings():
+                # NumPy solo advierte (no falla) con fechas que traen zona horaria
+                warnings.simplefilter('error')
+                return np.array([f or 'NaT' for f in fechas], dtype='datetime64[us]')
+        except (ValueError, TypeError, Warning):
+            parseadas = (parse_fecha(f) for f in fechas)
+            return np.array(
+                [np.datetime64(f, 'us') if f else np.datetime64('NaT', 'us') for f in parseadas],
+                dtype='datetime64[us]'
+            )
+
+
+def _acumuladores(col: HistorialColumnar, indices, grupos, n_grupos: int) -> List[Acumulador]:
+    """Acumula por grupo los resultados indicados usando bincount"""
+    precision = col.precision[indices]
+    velocidad = col.velocidad[indices]
+    con_precision = ~np.isnan(precision)
+    con_velocidad = ~np.isnan(velocidad)
+    
+    totales = np.bincount(grupos, minlength=n_grupos)
+    exitosos = np.bincount(grupos, weights=col.exito[indices], minlength=n_grupos)
+    suma_precision = np.bincount(grupos, weights=np.where(con_precision, precision, 0.0), minlength=n_grupos)
+    n_precision = np.bincount(grupos, weights=con_precision, minlength=n_grupos)
+    suma_velocidad = np.bincount(grupos, weights=np.where(con_velocidad, velocidad, 0.0), minlength=n_grupos)
+    n_velocidad = np.bincount(grupos, weights=con_velocidad, minlength=n_grupos)
+    
+    acumuladores = []
+    for i in range(n_grupos):
+        acumulador = Acumulador()
+        # Tipos nativos de Python para que la respuesta sea serializable a JSON
+        acumulador.total = int(totales[i])
+        acumulador.exitosos = int(exitosos[i])
+        acumulador.suma_precision = float(suma_precision[i])
+        acumulador.n_precision = int(n_precision[i])
+        acumulador.suma_velocidad = float(suma_velocidad[i])
+        acumulador.n_velocidad = int(n_velocidad[i])
+        acumuladores.append(acumulador)
+    return acumuladores
+
+
+def _acumulador_total(col: HistorialColumnar, indices) -> Acumulador:
+    return _acumuladores(col, indices, np.zeros(len(indices), dtype=np.int64), 1)[0]
+
+
+def analizar_progreso(col: HistorialColumnar, periodo_dias: int = 30,
+                      ahora: Optional[datetime] = None) -> VistaProgreso:
+    """Equivalente vectorizado de AgregadorProgreso.procesar"""
+    ahora = ahora or datetime.now()
+    fecha_limite = np.datetime64(ahora - timedelta(days=periodo_dias), 'us')
+    fecha_semana = np.datetime64(ahora - timedelta(days=7), 'us')
+    
+    # Las comparaciones con NaT siempre son falsas
+    en_periodo = col.fechas >= fecha_limite
+    indices = np.flatnonzero(en_periodo) if en_periodo.any() else np.arange(col.total)
+    
+    vista = VistaProgreso()
+    vista.global_ = _acumulador_total(col, indices)
+    
+    # Los tipos se reportan en el orden de su primera aparición
+    tipos = col.tipos[indices]
+    codigos, primera_aparicion, grupos = np.unique(tipos, return_index=True, return_inverse=True)
+    por_codigo = _acumuladores(col, indices, grupos.ravel(), len(codigos))
+    for posicion in np.argsort(primera_aparicion, kind='stable'):
+        vista.por_tipo[col.nombres_tipos[codigos[posicion]]] = por_codigo[posicion]
+    
+    fechas = col.fechas[indices]
+    vista.ultima_semana = _acumulador_total(col, indices[fechas >= fecha_semana])
+    vista.semana_anterior = _acumulador_total(col, indices[fechas < fecha_semana])
+    return vista
+
+
+def agrupar_por_semana(col: HistorialColumnar) -> Dict[str, Acumulador]:
+    """Equivalente vectorizado de app.utils.agregacion.agrupar_por_semana"""
+    validas = np.flatnonzero(~np.isnat(col.fechas))
+    if not len(validas):
+        return {}
+    
+    dias = col.fechas[validas].astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 fue jueves: (dias + 3) % 7 da 0 para lunes
+    jueves = dias - (dias + 3) % 7 + 3
+    anio_jueves = jueves.astype('datetime64[D]').astype('datetime64[Y]')
+    semana_iso = (jueves - anio_jueves.astype('datetime64[D]').astype(np.int64)) // 7 + 1
+    # La clave usa el año calendario de la fecha, igual que el motor de Python
+    anio = dias.astype('datetime64[D]').astype('datetime64[Y]').astype(np.int64) + 1970
+    
+    claves, grupos = np.unique(anio * 100 + semana_iso, return_inverse=True)
+    acumuladores = _acumuladores(col, validas, grupos.ravel(), len(claves))
+    
+    semanas = {}
+    for clave, acumulador in zip(claves.tolist(), acumuladores):
+        # La comparativa semanal no reporta velocidad
+        acumulador.suma_velocidad = 0.0
+        acumulador.n_velocidad = 0
+        semanas[f"{clave // 100}-W{clave % 100:02d}"] = acumulador
+    return semanas
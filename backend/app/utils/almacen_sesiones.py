@@ -0,0 +1,199 @@
+"""
+Almacenes de Sesiones - Backends de sesión del lado del servidor
+Responsable de guardar los datos de sesión en memoria o en un almacén compartido con expiración
+"""
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.utils.cache import CacheLRU
+
+logger = logging.getLogger(__name__)
+
+
+class AlmacenSesiones:
+    """
+    Interfaz común de los almacenes de sesiones.
+    
+    Las sesiones se identifican por un id opaco y se guardan como
+    diccionarios con un TTL en segundos.
+    """
+    
+    def obtener(self, sid: str) -> Optional[Dict[str, Any]]:
+        """Datos de la sesión o None si no existe o expiró"""
+        raise NotImplementedError
+    
+    def guardar(self, sid: str, datos: Dict[str, Any], ttl: float):
+        """Guarda (o reemplaza) los datos de la sesión"""
+        raise NotImplementedError
+    
+    def renovar(self, sid: str, ttl: float):
+        """Extiende la expiración de una sesión sin reescribir sus datos"""
+        raise NotImplementedError
+    
+    def eliminar(self, sid: str):
+        """Elimina la sesión si existe"""
+        raise NotImplementedError
+    
+    def purgar_expirados(self) -> int:
+        """Elimina las sesiones expiradas y retorna cuántas se eliminaron"""
+        return 0
+
+
+class AlmacenMemoria(AlmacenSesiones):
+    """
+    Sesiones en la memoria del proceso (LRU con TTL).
+    
+    Para un solo nodo: leer o guardar una sesión no toca el disco. Si se
+    supera ``max_sesiones`` se descartan las usadas hace más tiempo. Los datos
+    se copian al guardar y al leer (copia superficial), así que una sesión
+    abierta no comparte el diccionario con el almacén.
+    """
+    
+    def __init__(self, max_sesiones: int = 10000, ttl: float = 3600):
+        self._cache = CacheLRU(max_costo=max_sesiones, ttl=ttl, nombre='sesiones')
+    
+    def obtener(self, sid: str) -> Optional[Dict[str, Any]]:
+        datos = self._cache.obtener(sid)
+        return dict(datos) if datos is not None else None
+    
+    def guardar(self, sid: str, datos: Dict[str, Any], ttl: float):
+        self._cache.guardar(sid, dict(datos), ttl=ttl)
+    
+    def renovar(self, sid: str, ttl: float):
+        datos = self._cache.obtener(sid)
+        if datos is not None:
+            self._cache.guardar(sid, datos, ttl=ttl)
+    
+    def eliminar(self, sid: str):
+        self._cache.invalidar(sid)
+    
+    def purgar_expirados(self) -> int:
+        return self._cache.purgar_expirados()
+    
+    def estadisticas(self) -> Dict:
+        return self._cache.estadisticas()
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+class AlmacenCompartido(AlmacenSesiones):
+    """
+    Sesiones en un almacén clave-valor compartido entre nodos (Redis o compatible).
+    
+    Solo usa ``get``, ``set(clave, valor, ex=segundos)``, ``expire`` y
+    ``delete`` del cliente. La expiración la resuelve el propio almacén, así
+    que no hace falta barrer sesiones vencidas.
+    """
+    
+    def __init__(self, cliente, prefijo: str = 'sesion:', serializador=json):
+        self.cliente = cliente
+        self.prefijo = prefijo
+        self.serializador = serializador
+    
+    def _clave(self, sid: str) -> str:
+        return f"{self.prefijo}{sid}"
+    
+    def obtener(self, sid: str) -> Optional[Dict[str, Any]]:
+        valor = self.cliente.get(self._clave(sid))
+        if valor is None:
+            return None
+        if isinstance(valor, bytes):
+            valor = valor.decode('utf-8')
+        try:
+            return self.serializador.loads(valor)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Sesión ilegible en el almacén compartido, se descarta: {e}")
+            return None
+    
+    def guardar(self, sid: str, datos: Dict[str, Any], ttl: float):
+        self.cliente.set(self._clave(sid), self.serializador.dumps(datos), ex=max(int(ttl), 1))
+    
+    def renovar(self, sid: str, ttl: float):
+        self.cliente.expire(self._clave(sid), max(int(ttl), 1))
+    
+    def eliminar(self, sid: str):
+        self.cliente.delete(self._clave(sid))
+
+
+class ClienteCompartidoLocal:
+    """
+    Sustituto en proceso del cliente de Redis con el subconjunto que usa
+    ``AlmacenCompartido``. Sirve para desarrollo y pruebas sin un servidor.
+    """
+    
+    def __init__(self):
+        # clave -> (valor, expira_en)
+        self._datos: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, clave: str) -> Optional[bytes]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            valor, expira_en = entrada
+            if expira_en is not None and expira_en <= time.monotonic():
+                del self._datos[clave]
+                return None
+            return valor
+    
+    def set(self, clave: str, valor, ex: Optional[int] = None) -> bool:
+        if isinstance(valor, str):
+            valor = valor.encode('utf-8')
+        with self._lock:
+            self._datos[clave] = (valor, time.monotonic() + ex if ex else None)
+        return True
+    
+    def expire(self, clave: str, segundos: int) -> bool:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return False
+            self._datos[clave] = (entrada[0], time.monotonic() + segundos)
+            return True
+    
+    def delete(self, *claves: str) -> int:
+        with self._lock:
+            return sum(1 for clave in claves if self._datos.pop(clave, None) is not None)
+
+
+class BarredorSesiones:
+    """Hilo en segundo plano que elimina periódicamente las sesiones expiradas"""
+    
+    def __init__(self, almacen: AlmacenSesiones, intervalo: float = 60):
+        self.almacen = almacen
+        self.intervalo = intervalo
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+    
+    def iniciar(self):
+        """Inicia el barrido (una sola vez)"""
+        if self._hilo is not None:
+            return
+        self._hilo = threading.Thread(target=self._ejecutar, name='barredor-sesiones', daemon=True)
+        self._hilo.start()
+    
+    def detener(self, timeout: Optional[float] = None):
+        """Detiene el barrido y espera a que termine el hilo"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+    
+    def barrer(self) -> int:
+        """Ejecuta un barrido inmediato"""
+        eliminadas = self.almacen.purgar_expirados()
+        if eliminadas:
+            logger.info(f"Barredor de sesiones: {eliminadas} sesiones expiradas eliminadas")
+        return eliminadas
+    
+    def _ejecutar(self):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.barrer()
+            except Exception as e:
+                logger.error(f"Error al barrer sesiones expiradas: {e}")
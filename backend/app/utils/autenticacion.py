@@ -0,0 +1,60 @@
+"""
+Autenticación - Identificación del paciente de cada request
+Responsable de resolver el paciente por token firmado (Bearer) o por la sesión
+"""
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from flask import current_app, g, jsonify, request, session
+
+from app.utils.tokens import FirmadorTokens, TokenInvalido
+
+
+def obtener_firmador() -> Optional[FirmadorTokens]:
+    """Firmador de tokens de la aplicación (None si AUTH_TOKENS está deshabilitado)"""
+    return current_app.extensions.get('firmador_tokens')
+
+
+def obtener_datos_paciente() -> Optional[Dict[str, Any]]:
+    """
+    Datos del paciente autenticado en la request actual
+
+    Con AUTH_TOKENS habilitado, una cabecera ``Authorization: Bearer`` se
+    verifica sin leer la sesión; un token inválido no vuelve a la sesión.
+    Sin cabecera se usa la sesión. El resultado se recuerda durante la request.
+    """
+    if hasattr(g, '_datos_paciente'):
+        return g._datos_paciente
+
+    firmador = obtener_firmador()
+    autorizacion = request.headers.get('Authorization', '')
+    if firmador is not None and autorizacion.startswith('Bearer '):
+        try:
+            datos = firmador.verificar(autorizacion[len('Bearer '):].strip()).get('paciente')
+        except TokenInvalido:
+            datos = None
+    else:
+        datos = session.get('paciente')
+
+    g._datos_paciente = datos
+    return datos
+
+
+def obtener_paciente_id():
+    """ID del paciente autenticado. Retorna None si no hay sesión ni token válido."""
+    paciente_data = obtener_datos_paciente()
+    if not paciente_data:
+        return None
+    return paciente_data.get('id')
+
+
+def requiere_paciente(f):
+    """Decorador para endpoints de la API: responde 401 sin paciente y deja su id en ``g.paciente_id``"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        paciente_id = obtener_paciente_id()
+        if not paciente_id:
+            return jsonify({'success': False, 'error': 'No autenticado'}), 401
+        g.paciente_id = paciente_id
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,170 @@
+"""
+Cache LRU en memoria - Utilidad compartida por repositorios y servicios
+Responsable de guardar valores ya calculados con un presupuesto de tamaño acotado
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class CacheLRU:
+    """
+    Cache LRU con presupuesto de costo, etiquetas de versión y TTL opcional.
+    
+    - Cada entrada tiene un costo (por ejemplo bytes estimados); cuando la suma
+      supera ``max_costo`` se desalojan las entradas usadas hace más tiempo.
+    - Una entrada puede llevar una etiqueta (versión, mtime, etc.). Si al leer
+      se indica otra etiqueta, la entrada se considera obsoleta y se descarta.
+    - Las entradas con TTL expiran solas; ``purgar_expirados`` las elimina.
+    """
+    
+    def __init__(self, max_costo: int, ttl: Optional[float] = None, nombre: str = 'cache'):
+        self.max_costo = max_costo
+        self.ttl = ttl
+        self.nombre = nombre
+        # clave -> (valor, costo, etiqueta, expira_en)
+        self._entradas: 'OrderedDict[Hashable, Tuple[Any, int, Any, Optional[float]]]' = OrderedDict()
+        self._costo_total = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+    
+    def obtener(self, clave: Hashable, etiqueta: Any = None) -> Optional[Any]:
+        """
+        Obtiene un valor si existe, no expiró y coincide la etiqueta (si se indica)
+        
+        Returns:
+            El valor guardado o None
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            
+            valor, _, etiqueta_guardada, expira_en = entrada
+            if (expira_en is not None and expira_en <= time.monotonic()) or \
+                    (etiqueta is not None and etiqueta_guardada != etiqueta):
+                self._eliminar(clave)
+                self.fallos += 1
+                return None
+            
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+    
+    def guardar(self, clave: Hashable, valor: Any, costo: int = 1, etiqueta: Any = None,
+                ttl: Optional[float] = None):
+        """Guarda un valor y desaloja entradas antiguas si se supera el presupuesto"""
+        ttl = ttl if ttl is not None else self.ttl
+        expira_en = time.monotonic() + ttl if ttl is not None else None
+        
+        with self._lock:
+            if clave in self._entradas:
+                self._eliminar(clave)
+            if costo > self.max_costo:
+                # Un valor más grande que todo el presupuesto no se guarda
+                return
+            
+            self._entradas[clave] = (valor, costo, etiqueta, expira_en)
+            self._costo_total += costo
+            self._desalojar()
+    
+    def actualizar(self, clave: Hashable, etiqueta_esperada: Any, etiqueta_nueva: Any,
+                   funcion: Callable[[Any], Tuple[Any, int]]) -> bool:
+        """
+        Actualiza una entrada solo si sigue en la versión esperada
+        
+        ``funcion`` recibe el valor actual y retorna (nuevo_valor, nuevo_costo).
+        Si la entrada no existe o su etiqueta no coincide, se descarta.
+        
+        Returns:
+            bool: True si la entrada se actualizó
+        """
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return False
+            
+            valor, _, etiqueta_guardada, expira_en = entrada
+            if etiqueta_guardada != etiqueta_esperada or \
+                    (expira_en is not None and expira_en <= time.monotonic()):
+                self._eliminar(clave)
+                return False
+            
+            nuevo_valor, nuevo_costo = funcion(valor)
+            self._eliminar(clave)
+            if nuevo_costo > self.max_costo:
+                return False
+            self._entradas[clave] = (nuevo_valor, nuevo_costo, etiqueta_nueva, expira_en)
+            self._costo_total += nuevo_costo
+            self._desalojar()
+            return True
+    
+    def invalidar(self, clave: Hashable):
+        """Elimina una entrada si existe"""
+        with self._lock:
+            if clave in self._entradas:
+                self._eliminar(clave)
+    
+    def invalidar_si(self, predicado: Callable[[Hashable], bool]) -> int:
+        """Elimina todas las entradas cuya clave cumpla el predicado"""
+        with self._lock:
+            claves = [clave for clave in self._entradas if predicado(clave)]
+            for clave in claves:
+                self._eliminar(clave)
+            return len(claves)
+    
+    def purgar_expirados(self) -> int:
+        """Elimina las entradas expiradas y retorna cuántas se eliminaron"""
+        ahora = time.monotonic()
+        with self._lock:
+            claves = [
+                clave for clave, (_, _, _, expira_en) in self._entradas.items()
+                if expira_en is not None and expira_en <= ahora
+            ]
+            for clave in claves:
+                self._eliminar(clave)
+            return len(claves)
+    
+    def limpiar(self):
+        """Vacía la cache y reinicia los contadores"""
+        with self._lock:
+            self._entradas.clear()
+            self._costo_total = 0
+            self.aciertos = self.fallos = self.desalojos = 0
+    
+    def estadisticas(self) -> Dict:
+        """Retorna los contadores de uso de la cache"""
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'nombre': self.nombre,
+                'entradas': len(self._entradas),
+                'costo_total': self._costo_total,
+                'max_costo': self.max_costo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'tasa_aciertos': round(self.aciertos / total * 100, 1) if total else 0
+            }
+    
+    def __len__(self) -> int:
+        return len(self._entradas)
+    
+    def __contains__(self, clave: Hashable) -> bool:
+        return clave in self._entradas
+    
+    def _eliminar(self, clave: Hashable):
+        """Elimina una entrada (se asume el lock tomado)"""
+        _, costo, _, _ = self._entradas.pop(clave)
+        self._costo_total -= costo
+    
+    def _desalojar(self):
+        """Desaloja las entradas menos usadas hasta respetar el presupuesto"""
+        while self._costo_total > self.max_costo and self._entradas:
+            clave = next(iter(self._entradas))
+            self._eliminar(clave)
+            self.desalojos += 1
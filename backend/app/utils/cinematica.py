@@ -0,0 +1,174 @@
+"""
+Métricas Cinemáticas - Cálculo vectorizado con NumPy (opcional) sobre la telemetría de un intento
+Responsable de obtener velocidad, trayectoria, rango, tiempos de reacción, suavidad y consistencia en O(n)
+"""
+import math
+from typing import Dict, Optional, Sequence
+
+from app.utils.telemetria import EVENTOS_TELEMETRIA
+
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+    NUMPY_DISPONIBLE = False
+
+# Métrica calculada -> campo de ResultadoEjercicio que reemplaza
+CAMPOS_RESULTADO = {
+    'precision': 'precision',
+    'tasa_aciertos': 'tasa_aciertos',
+    'velocidad_promedio': 'velocidad_promedio',
+    'rango_movimiento': 'rango_movimiento',
+    'tiempo_reaccion_promedio': 'tiempo_reaccion_promedio',
+    'consistencia': 'consistencia',
+    'aciertos': 'aciertos',
+    'fallos': 'fallos',
+    'longitud_trayectoria': 'longitud_trayectoria',
+    'suavidad': 'suavidad'
+}
+
+
+def calcular_metricas(t: Sequence, x: Sequence, y: Sequence, e: Sequence) -> Dict:
+    """
+    Calcula las métricas cinemáticas de un intento a partir de su telemetría
+    
+    ``t`` en milisegundos; ``x``, ``y`` en píxeles; ``e`` con los códigos de
+    EVENTOS_TELEMETRIA. Todo es O(n) salvo el reordenamiento, que solo se
+    hace si las muestras no vienen ordenadas por t.
+    
+    - velocidad en px/s: promedio (trayectoria / duración), máxima, p95 y
+      perfil por segundo del intento
+    - rango_movimiento: el mayor entre el rango en x y en y, como en el cliente
+    - tiempos de reacción en ms entre aciertos consecutivos y su distribución;
+      consistencia = 100 - coeficiente de variación (%), mínimo 0
+    - suavidad: log dimensionless jerk (más cerca de 0 es más suave) sobre
+      toda la trayectoria; jerk_rms en px/s³
+    
+    Las métricas que no se pueden calcular con las muestras disponibles
+    quedan en None.
+    
+    Raises:
+        RuntimeError: si NumPy no está instalado
+    """
+    if not NUMPY_DISPONIBLE:
+        raise RuntimeError('NumPy no está instalado')
+    
+    t = np.asarray(t, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    e = np.asarray(e)
+    if len(t) > 1 and (t[1:] < t[:-1]).any():
+        orden = np.argsort(t, kind='stable')
+        t, x, y, e = t[orden], x[orden], y[orden], e[orden]
+    
+    metricas = _metricas_eventos(t, e)
+    metricas['muestras'] = int(len(t))
+    metricas.update(_metricas_movimiento(t / 1000.0, x, y))
+    return metricas
+
+
+def _metricas_eventos(t, e) -> Dict:
+    aciertos = int(np.count_nonzero(e == EVENTOS_TELEMETRIA['acierto']))
+    fallos = int(np.count_nonzero(e == EVENTOS_TELEMETRIA['fallo']))
+    intentos = aciertos + fallos
+    precision = _redondear(aciertos / intentos * 100) if intentos else None
+    
+    reaccion = np.diff(t[e == EVENTOS_TELEMETRIA['acierto']])
+    distribucion = None
+    promedio = consistencia = None
+    if len(reaccion):
+        promedio = float(reaccion.mean())
+        p10, mediana, p90 = np.percentile(reaccion, (10, 50, 90))
+        distribucion = {
+            'cantidad': int(len(reaccion)),
+            'minimo': _redondear(reaccion.min()),
+            'p10': _redondear(p10),
+            'mediana': _redondear(mediana),
+            'p90': _redondear(p90),
+            'maximo': _redondear(reaccion.max()),
+            'desviacion': _redondear(reaccion.std())
+        }
+        if len(reaccion) > 1 and promedio > 0:
+            consistencia = _redondear(max(0.0, 100 - reaccion.std() / promedio * 100))
+    
+    return {
+        'aciertos': aciertos,
+        'fallos': fallos,
+        'precision': precision,
+        'tasa_aciertos': precision,
+        'tiempo_reaccion_promedio': _redondear(promedio),
+        'tiempos_reaccion': distribucion,
+        'consistencia': consistencia
+    }
+
+
+def _metricas_movimiento(s, x, y) -> Dict:
+    """Métricas de la trayectoria con ``s`` en segundos"""
+    metricas = {
+        'duracion': None, 'longitud_trayectoria': None, 'velocidad_promedio': None,
+        'velocidad_maxima': None, 'velocidad_p95': None, 'perfil_velocidad': [],
+        'rango_x': None, 'rango_y': None, 'rango_movimiento': None,
+        'jerk_rms': None, 'suavidad': None
+    }
+    if not len(s):
+        return metricas
+    
+    rango_x, rango_y = float(np.ptp(x)), float(np.ptp(y))
+    metricas.update(rango_x=rango_x, rango_y=rango_y, rango_movimiento=max(rango_x, rango_y))
+    
+    duracion = float(s[-1] - s[0])
+    if len(s) < 2 or duracion <= 0:
+        return metricas
+    
+    dt = np.diff(s)
+    distancias = np.hypot(np.diff(x), np.diff(y))
+    longitud = float(distancias.sum())
+    metricas.update(
+        duracion=_redondear(duracion),
+        longitud_trayectoria=_redondear(longitud),
+        velocidad_promedio=_redondear(longitud / duracion)
+    )
+    
+    con_avance = dt > 0
+    if con_avance.any():
+        velocidades = distancias[con_avance] / dt[con_avance]
+        metricas['velocidad_maxima'] = _redondear(velocidades.max())
+        metricas['velocidad_p95'] = _redondear(np.percentile(velocidades, 95))
+    
+    # Distancia recorrida en cada segundo del intento (= px/s promedio de ese segundo)
+    segundos = ((s[1:] - s[0]) // 1.0).astype(np.int64)
+    perfil = np.bincount(segundos, weights=distancias)
+    metricas['perfil_velocidad'] = [round(float(v), 1) for v in perfil]
+    
+    metricas.update(_suavidad(s, x, y, duracion))
+    return metricas
+
+
+def _suavidad(s, x, y, duracion: float) -> Dict:
+    """Jerk RMS y log dimensionless jerk (LDLJ) de la trayectoria"""
+    # np.gradient necesita instantes distintos; de muestras con el mismo t queda la primera
+    distintos = np.empty(len(s), dtype=bool)
+    distintos[0] = True
+    np.greater(s[1:], s[:-1], out=distintos[1:])
+    s, x, y = s[distintos], x[distintos], y[distintos]
+    if len(s) < 4:
+        return {}
+    
+    # x + iy: cada derivada se calcula una sola vez para los dos ejes
+    velocidad = np.gradient(x + 1j * y, s)
+    jerk = np.gradient(np.gradient(velocidad, s), s)
+    jerk2 = jerk.real ** 2 + jerk.imag ** 2
+    integral = float((0.5 * (jerk2[1:] + jerk2[:-1]) * np.diff(s)).sum())
+    velocidad_pico = float(np.abs(velocidad).max())
+    if integral <= 0 or velocidad_pico <= 0:
+        return {}
+    
+    return {
+        'jerk_rms': _redondear(math.sqrt(integral / duracion)),
+        'suavidad': _redondear(-math.log(duracion ** 3 / velocidad_pico ** 2 * integral))
+    }
+
+
+def _redondear(valor, decimales: int = 2) -> Optional[float]:
+    return None if valor is None else round(float(valor), decimales)
@@ -0,0 +1,170 @@
+"""
+Centro de Eventos - Publicación y suscripción en proceso con Server-Sent Events
+Responsable de repartir alertas, cambios de sesión y recompensas a los clientes conectados
+"""
+import itertools
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+
+def canal_paciente(paciente_id) -> str:
+    """Canal con los eventos de un paciente"""
+    return f"paciente:{paciente_id}"
+
+
+class Evento:
+    """Evento publicado, ya codificado en el formato de Server-Sent Events"""
+    
+    __slots__ = ('id', 'tipo', 'texto')
+    
+    def __init__(self, id: int, tipo: str, datos: Any):
+        self.id = id
+        self.tipo = tipo
+        # Se codifica una sola vez y se comparte entre todos los suscriptores
+        datos_json = json.dumps(datos, ensure_ascii=False, separators=(',', ':'), default=str)
+        self.texto = f"id: {id}\nevent: {tipo}\ndata: {datos_json}\n\n"
+
+
+class Suscripcion:
+    """
+    Cola acotada de eventos de un suscriptor.
+    
+    Si el cliente no lee al ritmo en que se publica, al llenarse la cola se
+    descarta el evento más antiguo (y se cuenta en ``descartados``): un
+    cliente lento nunca frena al que publica ni hace crecer la memoria.
+    """
+    
+    __slots__ = ('canal', '_cola', '_aviso', 'descartados')
+    
+    def __init__(self, canal: str, max_eventos: int):
+        self.canal = canal
+        self._cola: deque = deque(maxlen=max_eventos)
+        self._aviso = threading.Event()
+        self.descartados = 0
+    
+    def entregar(self, evento: Evento):
+        if len(self._cola) == self._cola.maxlen:
+            self.descartados += 1
+        self._cola.append(evento)
+        self._aviso.set()
+    
+    def esperar(self, timeout: Optional[float] = None) -> List[Evento]:
+        """Espera hasta ``timeout`` segundos y retorna los eventos pendientes (lista vacía si no llegó ninguno)"""
+        if not self._cola:
+            self._aviso.wait(timeout)
+        self._aviso.clear()
+        eventos = []
+        while self._cola:
+            eventos.append(self._cola.popleft())
+        return eventos
+
+
+class CentroEventos:
+    """
+    Publicación/suscripción en memoria por canal.
+    
+    Publicar no bloquea: el evento se codifica una vez y se agrega a la cola
+    de cada suscriptor del canal. Si el canal no tiene suscriptores no se
+    codifica nada. Solo reparte eventos dentro del proceso.
+    """
+    
+    def __init__(self, max_eventos: int = 100):
+        self.max_eventos = max_eventos
+        self._canales: Dict[str, Set[Suscripcion]] = {}
+        self._secuencia = itertools.count(1)
+        self._publicados = 0
+        self._descartados = 0
+        self._lock = threading.Lock()
+    
+    def suscribir(self, canal: str, max_eventos: Optional[int] = None) -> Suscripcion:
+        """Crea una suscripción al canal"""
+        suscripcion = Suscripcion(canal, max_eventos or self.max_eventos)
+        with self._lock:
+            self._canales.setdefault(canal, set()).add(suscripcion)
+        return suscripcion
+    
+    def cancelar(self, suscripcion: Suscripcion):
+        """Elimina la suscripción (no falla si ya se había eliminado)"""
+        with self._lock:
+            suscriptores = self._canales.get(suscripcion.canal)
+            if suscriptores is None or suscripcion not in suscriptores:
+                return
+            suscriptores.discard(suscripcion)
+            if not suscriptores:
+                del self._canales[suscripcion.canal]
+            self._descartados += suscripcion.descartados
+    
+    def suscriptores(self, canal: str) -> int:
+        """Cantidad de suscriptores del canal"""
+        return len(self._canales.get(canal, ()))
+    
+    def evento(self, tipo: str, datos: Any) -> Evento:
+        """Crea un evento con el siguiente id sin publicarlo (por ejemplo, el estado inicial de un flujo)"""
+        with self._lock:
+            evento_id = next(self._secuencia)
+        return Evento(evento_id, tipo, datos)
+    
+    def publicar(self, canal: str, tipo: str, datos: Any) -> int:
+        """
+        Publica un evento en el canal
+        
+        Returns:
+            int: cantidad de suscriptores que lo recibieron
+        """
+        with self._lock:
+            suscriptores = self._canales.get(canal)
+            if not suscriptores:
+                return 0
+            suscriptores = list(suscriptores)
+            self._publicados += 1
+            evento_id = next(self._secuencia)
+        
+        evento = Evento(evento_id, tipo, datos)
+        for suscripcion in suscriptores:
+            suscripcion.entregar(evento)
+        return len(suscriptores)
+    
+    def estadisticas(self) -> Dict:
+        """Canales, suscriptores y eventos publicados y descartados"""
+        with self._lock:
+            suscripciones = [s for suscriptores in self._canales.values() for s in suscriptores]
+            return {
+                'canales': len(self._canales),
+                'suscriptores': len(suscripciones),
+                'publicados': self._publicados,
+                'descartados': self._descartados + sum(s.descartados for s in suscripciones)
+            }
+
+
+def flujo_sse(centro: CentroEventos, suscripcion: Suscripcion, latido: float = 15,
+              iniciales: Iterable[Evento] = (), tipos_finales: Iterable[str] = (),
+              reintento_ms: int = 3000) -> Iterator[str]:
+    """
+    Genera el cuerpo de una respuesta text/event-stream para la suscripción
+    
+    Envía primero ``iniciales`` y luego los eventos a medida que llegan. Si
+    pasan ``latido`` segundos sin eventos envía un comentario para que los
+    proxies no corten la conexión. Termina después de enviar un evento de
+    ``tipos_finales``; la suscripción se cancela al terminar o cuando el
+    cliente se desconecta.
+    """
+    finales = set(tipos_finales)
+    try:
+        yield f"retry: {reintento_ms}\n\n"
+        pendientes = list(iniciales)
+        while True:
+            if pendientes:
+                yield ''.join(evento.texto for evento in pendientes)
+                if any(evento.tipo in finales for evento in pendientes):
+                    return
+            else:
+                yield ': latido\n\n'
+            pendientes = suscripcion.esperar(latido)
+    finally:
+        centro.cancelar(suscripcion)
+
+
+# Centro de eventos del proceso
+centro_eventos = CentroEventos()
@@ -0,0 +1,178 @@
+"""
+Índice de Logros - Evaluación de logros con umbrales ordenados
+Responsable de resolver qué logros desbloquea un valor sin recorrer todo el catálogo
+"""
+import bisect
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Cómo se combina el valor de un resultado con el progreso anterior de la métrica
+ACUMULADO = 'acumulado'  # se suma (por ejemplo, sesiones completadas)
+MAXIMO = 'maximo'        # cuenta el mayor valor alcanzado (precisión, racha)
+MINIMO = 'minimo'        # cuenta el menor valor alcanzado (duración)
+MODOS = (ACUMULADO, MAXIMO, MINIMO)
+
+
+class ProgresoLogros:
+    """Progreso de un paciente en cada métrica y logros que ya se le otorgaron"""
+    
+    __slots__ = ('valores', 'completados')
+    
+    def __init__(self):
+        # metrica -> valor acumulado / mejor valor alcanzado
+        self.valores: Dict[str, float] = {}
+        # códigos de los logros otorgados
+        self.completados: Set[str] = set()
+
+
+class IndiceLogros:
+    """
+    Catálogo de logros agrupado por métrica con umbrales ordenados.
+    
+    Dentro de una métrica los logros quedan ordenados por ``requisito_valor``,
+    así que los que alcanza un valor son siempre un prefijo de la lista y se
+    obtienen con una búsqueda binaria. En las métricas MINIMO el umbral se
+    guarda negado para que la misma búsqueda sirva.
+    
+    Los logros solo necesitan ``codigo``, ``requisito_valor`` y ``metrica``
+    (None para los que no se evalúan automáticamente).
+    """
+    
+    def __init__(self, logros: Iterable, modos: Dict[str, str]):
+        for metrica, modo in modos.items():
+            if modo not in MODOS:
+                raise ValueError(f"Modo inválido para la métrica '{metrica}': {modo}")
+        self.modos = dict(modos)
+        
+        por_metrica: Dict[str, List] = {}
+        for logro in logros:
+            metrica = logro.metrica
+            if metrica is None:
+                continue
+            if metrica not in self.modos:
+                raise ValueError(f"Métrica desconocida en el logro '{logro.codigo}': {metrica}")
+            por_metrica.setdefault(metrica, []).append(logro)
+        
+        self._logros: Dict[str, List] = {}
+        self._claves: Dict[str, List[float]] = {}
+        self._metrica_por_codigo: Dict[str, str] = {}
+        for metrica, lista in por_metrica.items():
+            # Orden estable: a igual umbral se respeta el orden del catálogo
+            lista.sort(key=lambda logro: self._clave(metrica, logro.requisito_valor))
+            self._logros[metrica] = lista
+            self._claves[metrica] = [self._clave(metrica, logro.requisito_valor) for logro in lista]
+            for logro in lista:
+                self._metrica_por_codigo[logro.codigo] = metrica
+    
+    def __len__(self) -> int:
+        return len(self._metrica_por_codigo)
+    
+    def _clave(self, metrica: str, valor: float) -> float:
+        return -valor if self.modos[metrica] == MINIMO else valor
+    
+    def metricas(self) -> List[str]:
+        """Métricas que tienen al menos un logro"""
+        return list(self._logros)
+    
+    def logros(self, metrica: str) -> Sequence:
+        """Logros de la métrica ordenados de más fácil a más difícil"""
+        return self._logros.get(metrica, [])
+    
+    def metrica_de(self, codigo: str) -> Optional[str]:
+        """Métrica con la que se evalúa el logro indicado"""
+        return self._metrica_por_codigo.get(codigo)
+    
+    def alcanzados(self, metrica: str, valor: Optional[float]) -> int:
+        """Cantidad de logros de la métrica cuyo requisito cumple ``valor`` (largo del prefijo)"""
+        claves = self._claves.get(metrica)
+        if valor is None or not claves:
+            return 0
+        return bisect.bisect_right(claves, self._clave(metrica, valor))
+    
+    def desbloqueados(self, metrica: str, valor: Optional[float]) -> Sequence:
+        """Logros de la métrica cuyo requisito cumple ``valor``"""
+        return self.logros(metrica)[:self.alcanzados(metrica, valor)]
+    
+    def siguiente(self, metrica: str, valor: Optional[float]):
+        """Primer logro de la métrica que ``valor`` todavía no alcanza (None si no queda ninguno)"""
+        lista = self.logros(metrica)
+        posicion = self.alcanzados(metrica, valor)
+        return lista[posicion] if posicion < len(lista) else None
+    
+    def combinar(self, metrica: str, anterior: Optional[float], valor: Optional[float]) -> Optional[float]:
+        """Progreso de la métrica después de registrar ``valor``"""
+        if valor is None:
+            return anterior
+        if anterior is None:
+            return valor
+        modo = self.modos[metrica]
+        if modo == ACUMULADO:
+            return anterior + valor
+        if modo == MAXIMO:
+            return max(anterior, valor)
+        return min(anterior, valor)
+    
+    def cruzados(self, metrica: str, anterior: Optional[float], actual: Optional[float]) -> Sequence:
+        """
+        Logros de la métrica que alcanza ``actual`` pero no ``anterior``
+        
+        El progreso de cada métrica solo avanza (se suma, o se queda con el
+        máximo o el mínimo), así que cada umbral se cruza una sola vez: estos
+        son los logros que desbloquea el cambio de ``anterior`` a ``actual``.
+        """
+        return self.logros(metrica)[self.alcanzados(metrica, anterior):self.alcanzados(metrica, actual)]
+    
+    def evaluar(self, progreso: ProgresoLogros, valores: Dict[str, Optional[float]]) -> List:
+        """
+        Incorpora los valores de un resultado al progreso de un paciente
+        
+        Por métrica son dos búsquedas binarias (valor anterior y nuevo); el
+        costo no depende del tamaño del catálogo.
+        
+        Returns:
+            Logros desbloqueados
+        """
+        nuevos = []
+        for metrica, valor in valores.items():
+            if valor is None or metrica not in self._logros:
+                continue
+            anterior = progreso.valores.get(metrica)
+            actual = self.combinar(metrica, anterior, valor)
+            progreso.valores[metrica] = actual
+            for logro in self.cruzados(metrica, anterior, actual):
+                progreso.completados.add(logro.codigo)
+                nuevos.append(logro)
+        return nuevos
+    
+    def restaurar(self, filas: Iterable[Tuple[str, Optional[float], bool]]) -> ProgresoLogros:
+        """
+        Reconstruye el progreso de un paciente desde sus filas guardadas
+        
+        Args:
+            filas: (codigo, progreso_actual, completado) por cada logro con progreso
+        """
+        progreso = ProgresoLogros()
+        for codigo, valor, completado in filas:
+            metrica = self._metrica_por_codigo.get(codigo)
+            if metrica is None:
+                # Logro que ya no está en el catálogo
+                continue
+            if completado:
+                progreso.completados.add(codigo)
+            if valor is not None:
+                anterior = progreso.valores.get(metrica)
+                if anterior is None:
+                    progreso.valores[metrica] = valor
+                elif self.modos[metrica] == MINIMO:
+                    progreso.valores[metrica] = min(anterior, valor)
+                else:
+                    # Los valores acumulados solo crecen: la fila más reciente es la mayor
+                    progreso.valores[metrica] = max(anterior, valor)
+        return progreso
+    
+    def estado(self, progreso: ProgresoLogros) -> List[Tuple[object, Optional[float], bool]]:
+        """Todos los logros del índice como (logro, progreso_actual, completado)"""
+        return [
+            (logro, progreso.valores.get(metrica), logro.codigo in progreso.completados)
+            for metrica, lista in self._logros.items()
+            for logro in lista
+        ]
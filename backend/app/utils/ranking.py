@@ -0,0 +1,253 @@
+"""
+Índice de Ranking - Tabla de posiciones incremental (skip list indexable)
+Responsable de mantener ordenados los puntos de los pacientes con operaciones O(log n)
+"""
+import random
+import threading
+from datetime import date, timedelta
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Clave mayor que cualquier (-puntos, id): marca el final de cada nivel
+_FIN = (float('inf'), '')
+
+
+class _Nodo:
+    __slots__ = ('clave', 'paciente_id', 'puntos', 'siguientes', 'anchos')
+    
+    def __init__(self, clave: Tuple, paciente_id: Hashable, puntos: int, niveles: int):
+        self.clave = clave
+        self.paciente_id = paciente_id
+        self.puntos = puntos
+        self.siguientes: List[Optional['_Nodo']] = [None] * niveles
+        # anchos[i]: cuántas posiciones avanza el enlace siguientes[i]
+        self.anchos: List[int] = [1] * niveles
+
+
+class IndiceRanking:
+    """
+    Ranking de pacientes ordenado por puntos (mayor primero).
+    
+    Implementado como skip list indexable: cada enlace guarda cuántas
+    posiciones salta, lo que permite obtener la posición de un paciente o el
+    paciente en una posición en O(log n). Los empates se ordenan por id.
+    """
+    
+    # Alcanza para ~1 millón de pacientes con probabilidad 1/2 por nivel
+    NIVELES = 20
+    
+    def __init__(self, semilla: Optional[int] = None):
+        self._fin = _Nodo(_FIN, None, 0, 0)
+        self._cabeza = _Nodo(None, None, 0, self.NIVELES)
+        self._cabeza.siguientes = [self._fin] * self.NIVELES
+        self._por_paciente: Dict[str, _Nodo] = {}
+        self._random = random.Random(semilla)
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._por_paciente)
+    
+    def __contains__(self, paciente_id: Hashable) -> bool:
+        return str(paciente_id) in self._por_paciente
+    
+    @staticmethod
+    def _clave(paciente_id: Hashable, puntos: int) -> Tuple:
+        return (-puntos, str(paciente_id))
+    
+    def puntos(self, paciente_id: Hashable) -> Optional[int]:
+        """Puntos del paciente o None si no está en el ranking"""
+        nodo = self._por_paciente.get(str(paciente_id))
+        return nodo.puntos if nodo else None
+    
+    def actualizar(self, paciente_id: Hashable, puntos: int):
+        """Fija los puntos de un paciente (lo agrega si no estaba)"""
+        with self._lock:
+            nodo = self._por_paciente.get(str(paciente_id))
+            if nodo is not None:
+                if nodo.puntos == puntos:
+                    return
+                self._quitar(nodo.clave)
+            self._insertar(paciente_id, puntos)
+    
+    def sumar(self, paciente_id: Hashable, puntos: int) -> int:
+        """Suma (o resta) puntos a un paciente y retorna su nuevo total"""
+        with self._lock:
+            total = (self.puntos(paciente_id) or 0) + puntos
+            self.actualizar(paciente_id, total)
+            return total
+    
+    def eliminar(self, paciente_id: Hashable) -> bool:
+        """Quita a un paciente del ranking"""
+        with self._lock:
+            nodo = self._por_paciente.get(str(paciente_id))
+            if nodo is None:
+                return False
+            self._quitar(nodo.clave)
+            return True
+    
+    def posicion(self, paciente_id: Hashable) -> Optional[int]:
+        """Posición del paciente (1 = primero) o None si no está en el ranking"""
+        with self._lock:
+            nodo = self._por_paciente.get(str(paciente_id))
+            if nodo is None:
+                return None
+            
+            clave = nodo.clave
+            actual = self._cabeza
+            posicion = 0
+            for nivel in reversed(range(self.NIVELES)):
+                while actual.siguientes[nivel].clave <= clave:
+                    posicion += actual.anchos[nivel]
+                    actual = actual.siguientes[nivel]
+            return posicion
+    
+    def top(self, limite: int) -> List[Tuple[int, Hashable, int]]:
+        """Los primeros ``limite`` pacientes como (posición, paciente_id, puntos)"""
+        return self.rango(1, limite)
+    
+    def rango(self, desde: int, cantidad: int) -> List[Tuple[int, Hashable, int]]:
+        """``cantidad`` pacientes a partir de la posición ``desde`` (1 = primero)"""
+        with self._lock:
+            desde = max(desde, 1)
+            if cantidad <= 0 or desde > len(self):
+                return []
+            
+            # Se baja por los niveles hasta el nodo en la posición ``desde``
+            actual = self._cabeza
+            restante = desde
+            for nivel in reversed(range(self.NIVELES)):
+                while actual.anchos[nivel] <= restante and actual.siguientes[nivel] is not self._fin:
+                    restante -= actual.anchos[nivel]
+                    actual = actual.siguientes[nivel]
+            
+            resultado = []
+            posicion = desde
+            while actual is not self._fin and len(resultado) < cantidad:
+                resultado.append((posicion, actual.paciente_id, actual.puntos))
+                actual = actual.siguientes[0]
+                posicion += 1
+            return resultado
+    
+    def vecinos(self, paciente_id: Hashable, cantidad: int = 2) -> List[Tuple[int, Hashable, int]]:
+        """El paciente junto con los ``cantidad`` anteriores y posteriores en el ranking"""
+        with self._lock:
+            posicion = self.posicion(paciente_id)
+            if posicion is None:
+                return []
+            desde = max(posicion - cantidad, 1)
+            return self.rango(desde, posicion + cantidad - desde + 1)
+    
+    def limpiar(self):
+        """Vacía el ranking"""
+        with self._lock:
+            self._cabeza.siguientes = [self._fin] * self.NIVELES
+            self._cabeza.anchos = [1] * self.NIVELES
+            self._por_paciente.clear()
+    
+    def _niveles_aleatorios(self) -> int:
+        niveles = 1
+        while niveles < self.NIVELES and self._random.random() < 0.5:
+            niveles += 1
+        return niveles
+    
+    def _insertar(self, paciente_id: Hashable, puntos: int):
+        """Inserta un nodo nuevo (se asume el lock tomado y el paciente ausente)"""
+        clave = self._clave(paciente_id, puntos)
+        anteriores: List[_Nodo] = [self._cabeza] * self.NIVELES
+        pasos = [0] * self.NIVELES
+        
+        actual = self._cabeza
+        for nivel in reversed(range(self.NIVELES)):
+            while actual.siguientes[nivel].clave < clave:
+                pasos[nivel] += actual.anchos[nivel]
+                actual = actual.siguientes[nivel]
+            anteriores[nivel] = actual
+        
+        niveles = self._niveles_aleatorios()
+        nodo = _Nodo(clave, paciente_id, puntos, niveles)
+        avance = 0
+        for nivel in range(niveles):
+            anterior = anteriores[nivel]
+            nodo.siguientes[nivel] = anterior.siguientes[nivel]
+            anterior.siguientes[nivel] = nodo
+            nodo.anchos[nivel] = anterior.anchos[nivel] - avance
+            anterior.anchos[nivel] = avance + 1
+            avance += pasos[nivel]
+        for nivel in range(niveles, self.NIVELES):
+            anteriores[nivel].anchos[nivel] += 1
+        
+        self._por_paciente[str(paciente_id)] = nodo
+    
+    def _quitar(self, clave: Tuple):
+        """Quita el nodo con la clave indicada (se asume el lock tomado y el nodo presente)"""
+        anteriores: List[_Nodo] = [self._cabeza] * self.NIVELES
+        actual = self._cabeza
+        for nivel in reversed(range(self.NIVELES)):
+            while actual.siguientes[nivel].clave < clave:
+                actual = actual.siguientes[nivel]
+            anteriores[nivel] = actual
+        
+        nodo = anteriores[0].siguientes[0]
+        for nivel in range(len(nodo.siguientes)):
+            anterior = anteriores[nivel]
+            anterior.anchos[nivel] += nodo.anchos[nivel] - 1
+            anterior.siguientes[nivel] = nodo.siguientes[nivel]
+        for nivel in range(len(nodo.siguientes), self.NIVELES):
+            anteriores[nivel].anchos[nivel] -= 1
+        
+        del self._por_paciente[clave[1]]
+
+
+class RankingVentana:
+    """
+    Ranking de los puntos ganados en los últimos ``dias`` días.
+    
+    Los puntos se guardan por día; cuando un día sale de la ventana sus
+    puntos se restan del índice, así que cada consulta solo paga por los
+    días que vencieron desde la anterior.
+    """
+    
+    def __init__(self, dias: int = 7):
+        self.dias = dias
+        self.indice = IndiceRanking()
+        self._por_dia: Dict[date, Dict[str, Tuple[Hashable, int]]] = {}
+        self._lock = threading.RLock()
+    
+    def sumar(self, paciente_id: Hashable, puntos: int, dia: Optional[date] = None):
+        """Registra puntos ganados por un paciente en un día (hoy por defecto)"""
+        hoy = date.today()
+        dia = dia or hoy
+        with self._lock:
+            self._expirar(hoy)
+            if dia <= hoy - timedelta(days=self.dias) or not puntos:
+                return
+            
+            del_dia = self._por_dia.setdefault(dia, {})
+            _, acumulado = del_dia.get(str(paciente_id), (paciente_id, 0))
+            del_dia[str(paciente_id)] = (paciente_id, acumulado + puntos)
+            self._sumar_indice(paciente_id, puntos)
+    
+    def top(self, limite: int) -> List[Tuple[int, Hashable, int]]:
+        with self._lock:
+            self._expirar(date.today())
+            return self.indice.top(limite)
+    
+    def posicion(self, paciente_id: Hashable) -> Optional[int]:
+        with self._lock:
+            self._expirar(date.today())
+            return self.indice.posicion(paciente_id)
+    
+    def vecinos(self, paciente_id: Hashable, cantidad: int = 2) -> List[Tuple[int, Hashable, int]]:
+        with self._lock:
+            self._expirar(date.today())
+            return self.indice.vecinos(paciente_id, cantidad)
+    
+    def _expirar(self, hoy: date):
+        """Resta del índice los puntos de los días que quedaron fuera de la ventana"""
+        limite = hoy - timedelta(days=self.dias)
+        for dia in [d for d in self._por_dia if d <= limite]:
+            for paciente_id, puntos in self._por_dia.pop(dia).values():
+                self._sumar_indice(paciente_id, -puntos)
+    
+    def _sumar_indice(self, paciente_id: Hashable, puntos: int):
+        if self.indice.sumar(paciente_id, puntos) <= 0:
+            self.indice.eliminar(paciente_id)
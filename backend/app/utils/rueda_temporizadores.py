@@ -0,0 +1,175 @@
+"""
+Rueda de Temporizadores - Planificador jerárquico de vencimientos
+Responsable de programar y cancelar miles de temporizadores en O(1) y disparar los vencidos
+"""
+import logging
+import math
+import threading
+import time
+from typing import Callable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Temporizador:
+    """Acción programada para un instante (en ticks de la rueda)"""
+    
+    __slots__ = ('vencimiento', 'accion', '_ranura')
+    
+    def __init__(self, vencimiento: int, accion: Callable[[], None]):
+        self.vencimiento = vencimiento
+        self.accion = accion
+        # Ranura donde está guardado; None si ya venció o se canceló
+        self._ranura: Optional[Set['Temporizador']] = None
+    
+    @property
+    def activo(self) -> bool:
+        return self._ranura is not None
+
+
+class RuedaTemporizadores:
+    """
+    Rueda de temporizadores jerárquica (Varghese y Lauck).
+    
+    El tiempo se cuenta en ticks de ``resolucion`` segundos. Cada nivel tiene
+    ``ranuras`` ranuras y cubre ``ranuras`` veces el rango del nivel anterior:
+    con los valores por defecto (1 s, 64 ranuras, 4 niveles) se programan
+    vencimientos de hasta ~194 días. Programar y cancelar son O(1); al avanzar
+    solo se recorren las ranuras de los ticks transcurridos, y los
+    temporizadores de los niveles superiores bajan de nivel cuando su ranura
+    se alcanza. Los vencimientos fuera de rango se reprograman al bajar.
+    
+    El reloj es inyectable para poder avanzar la rueda con un reloj falso.
+    """
+    
+    def __init__(self, resolucion: float = 1.0, ranuras: int = 64, niveles: int = 4,
+                 reloj: Callable[[], float] = time.monotonic):
+        if ranuras < 2 or ranuras & (ranuras - 1):
+            raise ValueError('La cantidad de ranuras debe ser una potencia de 2')
+        self.resolucion = resolucion
+        self.reloj = reloj
+        self._bits = ranuras.bit_length() - 1
+        self._mascara = ranuras - 1
+        self._niveles: List[List[Set[Temporizador]]] = [
+            [set() for _ in range(ranuras)] for _ in range(niveles)
+        ]
+        self._rango = 1 << (self._bits * niveles)
+        self._tick = self._ticks(reloj())
+        self._cantidad = 0
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+    
+    def __len__(self) -> int:
+        return self._cantidad
+    
+    def _ticks(self, instante: float) -> int:
+        return int(instante / self.resolucion)
+    
+    def _insertar(self, temporizador: Temporizador, minimo: int):
+        # Un vencimiento anterior a ``minimo`` se dispara en ese tick
+        vencimiento = max(temporizador.vencimiento, minimo)
+        delta = vencimiento - self._tick
+        if delta >= self._rango:
+            # Fuera de rango: se guarda en el último nivel y se reubica al bajar
+            vencimiento = self._tick + self._rango - 1
+            delta = self._rango - 1
+        
+        nivel = 0
+        while delta >= 1 << (self._bits * (nivel + 1)):
+            nivel += 1
+        ranura = self._niveles[nivel][(vencimiento >> (self._bits * nivel)) & self._mascara]
+        ranura.add(temporizador)
+        temporizador._ranura = ranura
+    
+    def programar(self, retraso: float, accion: Callable[[], None]) -> Temporizador:
+        """Programa ``accion`` para dentro de ``retraso`` segundos"""
+        with self._lock:
+            # Se redondea hacia arriba: un temporizador nunca se dispara antes de tiempo
+            vencimiento = math.ceil((self.reloj() + retraso) / self.resolucion)
+            temporizador = Temporizador(vencimiento, accion)
+            # Lo que vence ahora o antes sale en el próximo tick
+            self._insertar(temporizador, self._tick + 1)
+            self._cantidad += 1
+            return temporizador
+    
+    def cancelar(self, temporizador: Optional[Temporizador]) -> bool:
+        """Cancela el temporizador; retorna False si ya había vencido o se había cancelado"""
+        if temporizador is None:
+            return False
+        with self._lock:
+            if temporizador._ranura is None:
+                return False
+            temporizador._ranura.discard(temporizador)
+            temporizador._ranura = None
+            self._cantidad -= 1
+            return True
+    
+    def avanzar(self, ahora: Optional[float] = None) -> int:
+        """
+        Avanza la rueda hasta ``ahora`` (por defecto el reloj) y ejecuta las
+        acciones vencidas, fuera del lock y en orden de vencimiento
+        
+        Returns:
+            int: cantidad de acciones ejecutadas
+        """
+        objetivo = self._ticks(self.reloj() if ahora is None else ahora)
+        vencidos: List[Temporizador] = []
+        with self._lock:
+            while self._tick < objetivo:
+                if not self._cantidad:
+                    # Rueda vacía: no hace falta recorrer los ticks intermedios
+                    self._tick = objetivo
+                    break
+                self._tick += 1
+                self._bajar_niveles()
+                
+                ranura = self._niveles[0][self._tick & self._mascara]
+                if ranura:
+                    for temporizador in ranura:
+                        temporizador._ranura = None
+                    vencidos.extend(ranura)
+                    self._cantidad -= len(ranura)
+                    ranura.clear()
+        
+        for temporizador in vencidos:
+            try:
+                temporizador.accion()
+            except Exception as e:
+                logger.error(f"Error en la acción de un temporizador: {e}")
+        return len(vencidos)
+    
+    def _bajar_niveles(self):
+        """Al cruzar el límite de una vuelta, redistribuye la ranura correspondiente de cada nivel superior"""
+        # Primero los niveles más altos, así lo que baja queda en su nivel definitivo
+        for nivel in range(len(self._niveles) - 1, 0, -1):
+            if self._tick & ((1 << (self._bits * nivel)) - 1):
+                continue
+            indice = (self._tick >> (self._bits * nivel)) & self._mascara
+            ranura = self._niveles[nivel][indice]
+            if not ranura:
+                continue
+            pendientes = list(ranura)
+            ranura.clear()
+            for temporizador in pendientes:
+                # El tick actual todavía no se procesó
+                self._insertar(temporizador, self._tick)
+    
+    def iniciar(self):
+        """Inicia el hilo que avanza la rueda cada ``resolucion`` segundos (una sola vez)"""
+        if self._hilo is not None:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ejecutar, name='rueda-temporizadores', daemon=True)
+        self._hilo.start()
+    
+    def detener(self, timeout: Optional[float] = None):
+        """Detiene el hilo de la rueda"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+            self._hilo = None
+    
+    def _ejecutar(self):
+        while not self._detener.wait(self.resolucion):
+            self.avanzar()
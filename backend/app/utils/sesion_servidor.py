@@ -0,0 +1,134 @@
+"""
+Sesión del Servidor - SessionInterface de Flask sobre los almacenes de sesiones
+Responsable de leer y guardar la sesión de cada request en el almacén configurado
+"""
+import logging
+import secrets
+from datetime import timedelta
+from typing import Any, Mapping, Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from app.utils.almacen_sesiones import (
+    AlmacenCompartido, AlmacenMemoria, AlmacenSesiones, ClienteCompartidoLocal
+)
+
+try:
+    import redis
+    REDIS_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    redis = None
+    REDIS_DISPONIBLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class SesionServidor(CallbackDict, SessionMixin):
+    """Sesión cuyos datos viven en el servidor; la cookie solo lleva el id"""
+    
+    def __init__(self, datos: Optional[Mapping[str, Any]] = None, sid: Optional[str] = None,
+                 nueva: bool = False):
+        def al_modificar(sesion):
+            sesion.modified = True
+        
+        super().__init__(datos, al_modificar)
+        self.sid = sid
+        self.new = nueva
+        self.modified = False
+
+
+class InterfazSesionServidor(SessionInterface):
+    """
+    Guarda la sesión en un AlmacenSesiones y envía en la cookie solo un id aleatorio.
+    
+    Igual que Flask-Session, una request que no modifica la sesión no escribe
+    en el almacén; solo se renueva la expiración de las sesiones permanentes
+    cuando SESSION_REFRESH_EACH_REQUEST está activo.
+    """
+    
+    def __init__(self, almacen: AlmacenSesiones):
+        self.almacen = almacen
+    
+    @staticmethod
+    def _nuevo_sid() -> str:
+        return secrets.token_urlsafe(32)
+    
+    def open_session(self, app, request) -> SesionServidor:
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            datos = self.almacen.obtener(sid)
+            if datos is not None:
+                return SesionServidor(datos, sid=sid)
+        return SesionServidor(sid=self._nuevo_sid(), nueva=True)
+    
+    def save_session(self, app, session: SesionServidor, response):
+        nombre = self.get_cookie_name(app)
+        dominio = self.get_cookie_domain(app)
+        ruta = self.get_cookie_path(app)
+        response.vary.add('Cookie')
+        
+        if not session:
+            # Sesión vaciada (logout): se elimina del almacén y se borra la cookie
+            if session.modified and not session.new:
+                self.almacen.eliminar(session.sid)
+                response.delete_cookie(
+                    nombre, domain=dominio, path=ruta,
+                    secure=self.get_cookie_secure(app),
+                    samesite=self.get_cookie_samesite(app),
+                    httponly=self.get_cookie_httponly(app)
+                )
+            return
+        
+        if not self.should_set_cookie(app, session):
+            return
+        
+        ttl = app.permanent_session_lifetime.total_seconds()
+        if session.modified:
+            self.almacen.guardar(session.sid, dict(session), ttl)
+        else:
+            self.almacen.renovar(session.sid, ttl)
+        
+        response.set_cookie(
+            nombre, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=dominio,
+            path=ruta,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def crear_almacen(config: Mapping[str, Any]) -> AlmacenSesiones:
+    """
+    Crea el almacén de sesiones según SESSION_BACKEND
+    
+    - memoria: LRU con TTL en el proceso (un solo nodo)
+    - compartido: Redis en SESSION_REDIS_URL; sin URL se usa un sustituto local
+    """
+    backend = config.get('SESSION_BACKEND', 'memoria')
+    ttl = config.get('PERMANENT_SESSION_LIFETIME', 3600)
+    if isinstance(ttl, timedelta):
+        ttl = ttl.total_seconds()
+    
+    if backend == 'memoria':
+        return AlmacenMemoria(max_sesiones=config.get('SESSION_MAX_ENTRADAS', 10000), ttl=ttl)
+    
+    if backend == 'compartido':
+        url = config.get('SESSION_REDIS_URL')
+        if url:
+            if not REDIS_DISPONIBLE:
+                raise RuntimeError('SESSION_BACKEND=compartido con SESSION_REDIS_URL requiere el paquete redis')
+            cliente = redis.Redis.from_url(url)
+        else:
+            logger.warning('SESSION_REDIS_URL no configurada: las sesiones usan un almacén local no compartido')
+            cliente = ClienteCompartidoLocal()
+        return AlmacenCompartido(
+            cliente,
+            prefijo=config.get('SESSION_KEY_PREFIX', 'sesion:'),
+            serializador=TaggedJSONSerializer()
+        )
+    
+    raise ValueError(f"SESSION_BACKEND inválido: {backend}")
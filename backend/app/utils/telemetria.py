@@ -0,0 +1,153 @@
+"""
+Telemetría de Movimiento - Validación de lotes de muestras (t, x, y, evento)
+Responsable de convertir y validar los lotes columnares que envía el cliente durante un intento
+"""
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+    NUMPY_DISPONIBLE = False
+
+# Códigos de evento de una muestra
+EVENTOS_TELEMETRIA = {
+    'movimiento': 0,
+    'acierto': 1,
+    'fallo': 2,
+    'objetivo': 3
+}
+
+# t en milisegundos desde el inicio del intento; x, y en píxeles del área de juego
+T_MAXIMO_MS = 24 * 60 * 60 * 1000
+COORDENADA_MAXIMA = 32767
+
+# Ids generados por el cliente (por ejemplo crypto.randomUUID())
+PATRON_INTENTO_ID = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class TelemetriaInvalida(ValueError):
+    """El lote de telemetría no tiene el formato esperado"""
+
+
+class LoteTelemetria:
+    """
+    Lote validado de muestras en columnas.
+    
+    Con NumPy las columnas son arreglos (t: float64, x/y: float32,
+    e: uint8); sin NumPy son listas de Python con los mismos valores.
+    """
+    
+    __slots__ = ('secuencia', 't', 'x', 'y', 'e')
+    
+    def __init__(self, secuencia: int, t, x, y, e):
+        self.secuencia = secuencia
+        self.t = t
+        self.x = x
+        self.y = y
+        self.e = e
+    
+    def __len__(self) -> int:
+        return len(self.t)
+
+
+def validar_intento_id(intento_id: str) -> str:
+    """Valida el id de intento generado por el cliente (se usa como nombre de archivo)"""
+    if not isinstance(intento_id, str) or not PATRON_INTENTO_ID.match(intento_id):
+        raise TelemetriaInvalida('intento_id inválido')
+    return intento_id
+
+
+def validar_lote(datos: Optional[Dict[str, Any]], max_muestras: int = 4096) -> LoteTelemetria:
+    """
+    Valida un lote ``{"secuencia": n, "t": [...], "x": [...], "y": [...], "e": [...]}``
+    
+    ``e`` es opcional (todas las muestras son de movimiento). Todas las
+    columnas deben tener el mismo largo, los valores deben ser finitos, ``t``
+    no puede decrecer dentro del lote y las coordenadas deben estar dentro
+    de ±COORDENADA_MAXIMA.
+    
+    Raises:
+        TelemetriaInvalida: si el lote no es válido
+    """
+    if not isinstance(datos, dict):
+        raise TelemetriaInvalida('Se esperaba un objeto JSON')
+    
+    secuencia = datos.get('secuencia')
+    if isinstance(secuencia, bool) or not isinstance(secuencia, int) or secuencia < 0:
+        raise TelemetriaInvalida('secuencia debe ser un entero no negativo')
+    
+    columnas = {}
+    for nombre in ('t', 'x', 'y', 'e'):
+        valor = datos.get(nombre)
+        if valor is None and nombre == 'e':
+            continue
+        if not isinstance(valor, list):
+            raise TelemetriaInvalida(f"'{nombre}' debe ser una lista")
+        columnas[nombre] = valor
+    
+    cantidad = len(columnas['t'])
+    if cantidad == 0:
+        raise TelemetriaInvalida('El lote no tiene muestras')
+    if cantidad > max_muestras:
+        raise TelemetriaInvalida(f'El lote supera el máximo de {max_muestras} muestras')
+    if any(len(columna) != cantidad for columna in columnas.values()):
+        raise TelemetriaInvalida('Todas las columnas deben tener el mismo largo')
+    
+    if NUMPY_DISPONIBLE:
+        return _validar_numpy(secuencia, columnas, cantidad)
+    return _validar_python(secuencia, columnas, cantidad)
+
+
+def _validar_numpy(secuencia: int, columnas: Dict[str, List], cantidad: int) -> LoteTelemetria:
+    # Como en _validar_python, los códigos de evento son números: NumPy
+    # convertiría true/false y los textos numéricos sin avisar
+    if 'e' in columnas and not set(map(type, columnas['e'])) <= {int, float}:
+        raise TelemetriaInvalida('Código de evento desconocido')
+    try:
+        t = np.asarray(columnas['t'], dtype=np.float64)
+        x = np.asarray(columnas['x'], dtype=np.float64)
+        y = np.asarray(columnas['y'], dtype=np.float64)
+        e = np.asarray(columnas['e'], dtype=np.float64) if 'e' in columnas else np.zeros(cantidad)
+    except (TypeError, ValueError):
+        raise TelemetriaInvalida('Las columnas deben contener solo números')
+    if t.ndim != 1 or x.ndim != 1 or y.ndim != 1 or e.ndim != 1:
+        raise TelemetriaInvalida('Las columnas deben contener solo números')
+    
+    if not (np.isfinite(t).all() and np.isfinite(x).all() and np.isfinite(y).all()):
+        raise TelemetriaInvalida('Las muestras deben ser números finitos')
+    if t[0] < 0 or t[-1] > T_MAXIMO_MS or (np.diff(t) < 0).any():
+        raise TelemetriaInvalida('t debe ser creciente y estar dentro del intento')
+    if (np.abs(x) > COORDENADA_MAXIMA).any() or (np.abs(y) > COORDENADA_MAXIMA).any():
+        raise TelemetriaInvalida('Coordenadas fuera de rango')
+    if not (np.isin(e, list(EVENTOS_TELEMETRIA.values()))).all():
+        raise TelemetriaInvalida('Código de evento desconocido')
+    
+    return LoteTelemetria(
+        secuencia, t, x.astype(np.float32), y.astype(np.float32), e.astype(np.uint8)
+    )
+
+
+def _validar_python(secuencia: int, columnas: Dict[str, List], cantidad: int) -> LoteTelemetria:
+    try:
+        t = [float(v) for v in columnas['t']]
+        x = [float(v) for v in columnas['x']]
+        y = [float(v) for v in columnas['y']]
+        e = [v for v in columnas['e']] if 'e' in columnas else [0] * cantidad
+    except (TypeError, ValueError):
+        raise TelemetriaInvalida('Las columnas deben contener solo números')
+    
+    if not all(math.isfinite(v) for columna in (t, x, y) for v in columna):
+        raise TelemetriaInvalida('Las muestras deben ser números finitos')
+    if t[0] < 0 or t[-1] > T_MAXIMO_MS or any(b < a for a, b in zip(t, t[1:])):
+        raise TelemetriaInvalida('t debe ser creciente y estar dentro del intento')
+    if any(abs(v) > COORDENADA_MAXIMA for columna in (x, y) for v in columna):
+        raise TelemetriaInvalida('Coordenadas fuera de rango')
+    codigos = set(EVENTOS_TELEMETRIA.values())
+    if not all(v in codigos and not isinstance(v, bool) for v in e):
+        raise TelemetriaInvalida('Código de evento desconocido')
+    
+    return LoteTelemetria(secuencia, t, x, y, [int(v) for v in e])
@@ -0,0 +1,84 @@
+"""
+Tokens Firmados - Autenticación sin estado en el servidor
+Responsable de emitir y verificar tokens HMAC con expiración que llevan el id del paciente
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, Optional
+
+from app.utils.cache import CacheLRU
+
+
+class TokenInvalido(Exception):
+    """El token está mal formado, tiene una firma inválida o expiró"""
+
+
+def _codificar(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b'=').decode('ascii')
+
+
+def _decodificar(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+
+class FirmadorTokens:
+    """
+    Emite y verifica tokens ``<datos>.<firma>`` (JSON en base64url + HMAC-SHA256).
+    
+    El token lleva el id del paciente (``sub``), la expiración (``exp``) y
+    los claims que se indiquen, así que cualquier proceso o nodo con el
+    mismo secreto puede verificarlo sin consultar ningún almacenamiento.
+    Las verificaciones exitosas se guardan en una cache LRU hasta que el
+    token expira, para no repetir la decodificación y el HMAC en cada request.
+    """
+    
+    def __init__(self, secreto: str, ttl: int = 3600, cache_entradas: int = 4096):
+        # Clave propia para los tokens, derivada del secreto de la aplicación
+        self._clave = hashlib.sha256(b'rehavr-tokens:' + secreto.encode('utf-8')).digest()
+        self.ttl = ttl
+        self._verificados = CacheLRU(max_costo=cache_entradas, nombre='tokens')
+    
+    def _firmar(self, datos: str) -> str:
+        return _codificar(hmac.new(self._clave, datos.encode('utf-8'), hashlib.sha256).digest())
+    
+    def emitir(self, paciente_id, claims: Optional[Dict[str, Any]] = None,
+               ttl: Optional[int] = None) -> str:
+        """Emite un token para el paciente con los claims indicados"""
+        ahora = int(time.time())
+        contenido = dict(claims or {})
+        contenido.update({'sub': paciente_id, 'iat': ahora, 'exp': ahora + (ttl or self.ttl)})
+        datos = _codificar(json.dumps(contenido, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        return f"{datos}.{self._firmar(datos)}"
+    
+    def verificar(self, token: str) -> Dict[str, Any]:
+        """
+        Verifica un token y retorna su contenido
+        
+        Raises:
+            TokenInvalido: si el token no es válido o expiró
+        """
+        contenido = self._verificados.obtener(token)
+        if contenido is not None:
+            return contenido
+        
+        datos, separador, firma = token.partition('.')
+        if not separador or not hmac.compare_digest(firma.encode('utf-8'), self._firmar(datos).encode('ascii')):
+            raise TokenInvalido('Firma inválida')
+        try:
+            contenido = json.loads(_decodificar(datos))
+        except (ValueError, TypeError):
+            raise TokenInvalido('Token mal formado')
+        
+        restante = contenido.get('exp', 0) - time.time()
+        if restante <= 0:
+            raise TokenInvalido('Token expirado')
+        
+        self._verificados.guardar(token, contenido, ttl=restante)
+        return contenido
+    
+    def estadisticas(self) -> Dict:
+        """Contadores de la cache de verificación"""
+        return self._verificados.estadisticas()
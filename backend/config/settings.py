@@ -17,6 +17,36 @@ class Config:
     # Configuración de la base de datos
     DATA_PATH = os.environ.get('DATA_PATH') or 'data/pacientes'
     HISTORIAL_PATH = os.environ.get('HISTORIAL_PATH') or 'data/pacientes/historial'
+    HISTORIAL_FSYNC = os.environ.get('HISTORIAL_FSYNC') or 'never'  # always | interval | never
+    HISTORIAL_FSYNC_INTERVAL = float(os.environ.get('HISTORIAL_FSYNC_INTERVAL') or 1.0)  # segundos
+    HISTORIAL_CACHE_MB = int(os.environ.get('HISTORIAL_CACHE_MB') or 64)
+    HISTORIAL_PAGINA_DEFECTO = int(os.environ.get('HISTORIAL_PAGINA_DEFECTO') or 50)
+    HISTORIAL_PAGINA_MAX = int(os.environ.get('HISTORIAL_PAGINA_MAX') or 200)
+    HISTORIAL_RESUMEN_ULTIMOS = int(os.environ.get('HISTORIAL_RESUMEN_ULTIMOS') or 8)
+    HABILIDAD_PATH = os.environ.get('HABILIDAD_PATH') or 'data/pacientes/habilidad'
+    CONFIGURACION_PATH = os.environ.get('CONFIGURACION_PATH') or 'data/pacientes/configuracion'
+    RESULTADOS_MAX_LOTE = int(os.environ.get('RESULTADOS_MAX_LOTE') or 100)  # resultados por /api/ejercicios/resultados/lote
+    CATALOGO_MAX_AGE = int(os.environ.get('CATALOGO_MAX_AGE') or 3600)  # segundos que el cliente reutiliza el catálogo
+    
+    # Telemetría de movimiento por intento (/api/ejercicios/telemetria/<intento_id>)
+    TELEMETRIA_PATH = os.environ.get('TELEMETRIA_PATH') or 'data/pacientes/telemetria'
+    TELEMETRIA_MAX_MUESTRAS_LOTE = int(os.environ.get('TELEMETRIA_MAX_MUESTRAS_LOTE') or 4096)
+    TELEMETRIA_MAX_LOTES_PENDIENTES = int(os.environ.get('TELEMETRIA_MAX_LOTES_PENDIENTES') or 1000)
+    
+    # Cache de reportes calculados
+    REPORTES_CACHE_ENTRADAS = int(os.environ.get('REPORTES_CACHE_ENTRADAS') or 1000)
+    REPORTES_CACHE_TTL = int(os.environ.get('REPORTES_CACHE_TTL') or 300)  # segundos
+    # Reportes con NumPy desde este tamaño de historial (0 los desactiva)
+    REPORTES_UMBRAL_VECTORIZADO = int(os.environ.get('REPORTES_UMBRAL_VECTORIZADO', 500))
+    REPORTES_COLUMNAS_MAX_RESULTADOS = int(os.environ.get('REPORTES_COLUMNAS_MAX_RESULTADOS') or 500000)
+    
+    # Sesiones de terapia en curso: cada cuánto se escriben en BD las transiciones
+    SESIONES_VACIADO_INTERVALO = float(os.environ.get('SESIONES_VACIADO_INTERVALO') or 5)  # segundos
+    ALERTAS_RESOLUCION = float(os.environ.get('ALERTAS_RESOLUCION') or 1.0)  # segundos por tick de las alertas de seguridad
+    
+    # Eventos por Server-Sent Events (/api/sesion/eventos)
+    EVENTOS_LATIDO = float(os.environ.get('EVENTOS_LATIDO') or 15)  # segundos sin eventos antes de un latido
+    EVENTOS_MAX_COLA = int(os.environ.get('EVENTOS_MAX_COLA') or 100)  # eventos por cliente; se descartan los más antiguos
     
     # Configuración de MySQL
     MYSQL_HOST = os.environ.get('MYSQL_HOST') or '127.0.0.1'
@@ -30,10 +60,19 @@ class Config:
     CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000']
     
     # Configuración de sesiones
-    SESSION_TYPE = 'filesystem'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND') or 'memoria'  # memoria | compartido | filesystem
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL')  # sin URL, 'compartido' usa un sustituto local
+    SESSION_MAX_ENTRADAS = int(os.environ.get('SESSION_MAX_ENTRADAS') or 10000)
+    SESSION_BARRIDO_INTERVALO = int(os.environ.get('SESSION_BARRIDO_INTERVALO') or 60)  # segundos
+    SESSION_TYPE = 'filesystem'  # solo con SESSION_BACKEND=filesystem (Flask-Session)
     SESSION_FILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'sessions')
     PERMANENT_SESSION_LIFETIME = 3600  # 1 hora
     
+    # Tokens firmados (Authorization: Bearer) como alternativa a la sesión
+    AUTH_TOKENS = (os.environ.get('AUTH_TOKENS') or 'false').lower() == 'true'
+    AUTH_TOKEN_TTL = int(os.environ.get('AUTH_TOKEN_TTL') or 3600)  # segundos
+    AUTH_TOKEN_CACHE_ENTRADAS = int(os.environ.get('AUTH_TOKEN_CACHE_ENTRADAS') or 4096)
+    
     # Configuración de logging
     LOG_LEVEL = 'INFO'
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -88,7 +127,7 @@ def get_config(config_name: str = None) -> Config:
     
     Args:
         config_name: Nombre de la configuración
-        
+    
     Returns:
         Config: Objeto de configuración
     """
@@ -108,6 +147,12 @@ def get_database_config() -> Dict[str, Any]:
     return {
         'data_path': os.environ.get('DATA_PATH', 'data/pacientes'),
         'historial_path': os.environ.get('HISTORIAL_PATH', 'data/pacientes/historial'),
+        'historial_fsync': os.environ.get('HISTORIAL_FSYNC', 'never'),
+        'historial_fsync_interval': float(os.environ.get('HISTORIAL_FSYNC_INTERVAL', 1.0)),
+        'historial_cache_mb': int(os.environ.get('HISTORIAL_CACHE_MB', 64)),
+        'historial_resumen_ultimos': int(os.environ.get('HISTORIAL_RESUMEN_ULTIMOS', 8)),
+        'habilidad_path': os.environ.get('HABILIDAD_PATH', 'data/pacientes/habilidad'),
+        'configuracion_path': os.environ.get('CONFIGURACION_PATH', 'data/pacientes/configuracion'),
         'backup_enabled': os.environ.get('BACKUP_ENABLED', 'false').lower() == 'true',
         'backup_interval': int(os.environ.get('BACKUP_INTERVAL', 24)),  # horas
         'mysql_host': os.environ.get('MYSQL_HOST', '127.0.0.1'),
@@ -134,7 +179,7 @@ def get_mysql_config() -> Dict[str, Any]:
         'database': os.environ.get('MYSQL_DATABASE', 'rehabilitacion_virtual'),
         'charset': os.environ.get('MYSQL_CHARSET', 'utf8mb4'),
         'autocommit': True,
-        'pool_size': int(os.environ.get('MYSQL_POOL_SIZE', 5)),
+        'pool_size': int(os.environ.get('MYSQL_POOL_SIZE', 10)),
         'pool_recycle': int(os.environ.get('MYSQL_POOL_RECYCLE', 3600))
     }
 
@@ -155,6 +200,35 @@ def get_security_config() -> Dict[str, Any]:
     }
 
 
+def get_reportes_config() -> Dict[str, Any]:
+    """
+    Obtiene la configuración de la cache de reportes
+    
+    Returns:
+        Dict: Configuración de reportes
+    """
+    return {
+        'cache_entradas': int(os.environ.get('REPORTES_CACHE_ENTRADAS', 1000)),
+        'cache_ttl': int(os.environ.get('REPORTES_CACHE_TTL', 300)),  # segundos
+        'umbral_vectorizado': int(os.environ.get('REPORTES_UMBRAL_VECTORIZADO', 500)),  # resultados; 0 lo desactiva
+        'columnas_max_resultados': int(os.environ.get('REPORTES_COLUMNAS_MAX_RESULTADOS', 500000))
+    }
+
+
+def get_telemetria_config() -> Dict[str, Any]:
+    """
+    Obtiene la configuración de la telemetría de movimiento
+    
+    Returns:
+        Dict: Configuración de telemetría
+    """
+    return {
+        'telemetria_path': os.environ.get('TELEMETRIA_PATH', 'data/pacientes/telemetria'),
+        'max_muestras_lote': int(os.environ.get('TELEMETRIA_MAX_MUESTRAS_LOTE', 4096)),
+        'max_lotes_pendientes': int(os.environ.get('TELEMETRIA_MAX_LOTES_PENDIENTES', 1000))
+    }
+
+
 def get_cors_config() -> Dict[str, Any]:
     """
     Obtiene la configuración de CORS
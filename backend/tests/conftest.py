@@ -0,0 +1,8 @@
+"""
+Configuración de pytest - las pruebas importan ``app`` desde backend/
+"""
+import os
+import sys
+
+# Agregar el directorio del backend al path, como al ejecutar run.py desde backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
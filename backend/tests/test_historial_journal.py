@@ -0,0 +1,79 @@
+"""
+Pruebas de la paginación del journal de historial con fechas en distintos formatos
+"""
+import json
+import os
+
+import pytest
+
+from app.database.historial_journal import HistorialJournal, clave_fecha
+
+# Registros antiguos con espacio y nuevos en ISO con 'T', intercalados en el mismo día
+REGISTROS = [
+    {'fecha': '2024-03-01 08:00:00', 'nombre': 'a'},
+    {'fecha': '2024-03-01T09:30:00', 'nombre': 'b'},
+    {'fecha': '2024-03-01 10:15:00', 'nombre': 'c'},
+    {'fecha': '2024-03-01T11:00:00.250000', 'nombre': 'd'},
+    {'fecha': '2024-03-01 12:00:00', 'nombre': 'e'},
+    {'fecha': '2024-03-02T07:00:00+00:00', 'nombre': 'f'},
+]
+
+
+def recorrer(journal: HistorialJournal, paciente_id: str, limite: int, desde=None):
+    """Nombres de todas las páginas, siguiendo el cursor"""
+    nombres = []
+    cursor = None
+    while True:
+        pagina = journal.pagina(paciente_id, limite, cursor, desde)
+        nombres.extend(registro['nombre'] for _, registro in pagina['registros'])
+        cursor = pagina['siguiente']
+        if cursor is None:
+            return nombres
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return HistorialJournal(str(tmp_path))
+
+
+class TestClaveFecha:
+
+    def test_formatos_del_mismo_instante_coinciden(self):
+        assert clave_fecha('2024-03-01 08:00:00') == clave_fecha('2024-03-01T08:00:00')
+    
+    def test_zona_horaria_se_descarta(self):
+        assert clave_fecha('2024-03-02T07:00:00+00:00') == '2024-03-02T07:00:00'
+        assert clave_fecha('2024-03-02T07:00:00Z') == '2024-03-02T07:00:00'
+    
+    def test_fecha_vacia_o_invalida(self):
+        assert clave_fecha(None) == ''
+        assert clave_fecha('ayer') == 'ayer'
+
+
+class TestPaginaFechasMezcladas:
+
+    @pytest.mark.parametrize('limite', [1, 2, 4, 10])
+    def test_orden_descendente_con_formatos_mezclados(self, journal, limite):
+        journal.append_many('1', REGISTROS)
+        assert recorrer(journal, '1', limite) == ['f', 'e', 'd', 'c', 'b', 'a']
+    
+    def test_desde_no_excluye_registros_con_espacio(self, journal):
+        journal.append_many('1', REGISTROS)
+        assert recorrer(journal, '1', 2, desde='2024-03-01T10:00:00') == ['f', 'e', 'd', 'c']
+    
+    def test_desde_con_espacio(self, journal):
+        journal.append_many('1', REGISTROS)
+        assert recorrer(journal, '1', 10, desde='2024-03-01 11:00:00') == ['f', 'e', 'd']
+    
+    def test_registros_agregados_fuera_de_orden(self, journal):
+        journal.append_many('1', REGISTROS[3:])
+        journal.append_many('1', REGISTROS[:3])
+        assert recorrer(journal, '1', 3) == ['f', 'e', 'd', 'c', 'b', 'a']
+    
+    def test_historial_con_json_antiguo(self, journal, tmp_path):
+        with open(os.path.join(str(tmp_path), '1.json'), 'w', encoding='utf-8') as f:
+            json.dump(REGISTROS[:3], f)
+        journal.append_many('1', REGISTROS[3:])
+        
+        assert recorrer(journal, '1', 2) == ['f', 'e', 'd', 'c', 'b', 'a']
+        assert recorrer(journal, '1', 2, desde='2024-03-01T09:00:00') == ['f', 'e', 'd', 'c', 'b']
@@ -0,0 +1,195 @@
+"""
+Pruebas de LogroManager.registrar_metricas con lotes concurrentes, sobre una
+base falsa que bloquea filas como InnoDB
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+from app.database.mysql_manager import LogroManager, MySQLConnectionManager
+
+UMBRALES = (10, 50, 100)
+
+
+class BaseDatosFalsa:
+    """
+    metricas_logros_pacientes y logros_pacientes en memoria.
+    
+    Las sentencias que escriben o leen con FOR UPDATE bloquean la fila: en
+    autocommit el bloqueo se libera al terminar la sentencia y dentro de una
+    transacción al hacer commit o rollback.
+    """
+    
+    def __init__(self, pausa: float = 0.0005):
+        self.pausa = pausa
+        # (paciente, métrica) -> [valor_anterior, valor]
+        self.metricas: Dict[Tuple[int, str], List[Optional[float]]] = {}
+        self.progreso: List[Tuple] = []
+        self._duenos: Dict[Tuple, 'ConexionFalsa'] = {}
+        self._condicion = threading.Condition()
+    
+    def get_connection(self) -> 'ConexionFalsa':
+        return ConexionFalsa(self)
+    
+    def bloquear(self, conexion: 'ConexionFalsa', clave: Tuple):
+        with self._condicion:
+            while self._duenos.get(clave, conexion) is not conexion:
+                self._condicion.wait()
+            self._duenos[clave] = conexion
+    
+    def liberar(self, conexion: 'ConexionFalsa'):
+        with self._condicion:
+            for clave in [clave for clave, dueno in self._duenos.items() if dueno is conexion]:
+                del self._duenos[clave]
+            self._condicion.notify_all()
+
+
+class ConexionFalsa:
+
+    def __init__(self, base: BaseDatosFalsa):
+        self.base = base
+        self.en_transaccion = False
+        self._deshacer: List[Tuple] = []
+    
+    def start_transaction(self):
+        assert not self.en_transaccion
+        self.en_transaccion = True
+    
+    def commit(self):
+        self.en_transaccion = False
+        self._deshacer.clear()
+        self.base.liberar(self)
+    
+    def rollback(self):
+        for tabla, clave, anterior in reversed(self._deshacer):
+            if tabla == 'metricas':
+                if anterior is None:
+                    self.base.metricas.pop(clave, None)
+                else:
+                    self.base.metricas[clave] = anterior
+            else:
+                del self.base.progreso[clave:]
+        self.commit()
+    
+    def cursor(self, dictionary: bool = False) -> 'CursorFalso':
+        return CursorFalso(self)
+    
+    def close(self):
+        if self.en_transaccion:
+            self.rollback()
+    
+    def fin_sentencia(self):
+        if not self.en_transaccion:
+            self._deshacer.clear()
+            self.base.liberar(self)
+        # Ida y vuelta al servidor: los demás hilos corren entre sentencias
+        time.sleep(self.base.pausa)
+
+
+class CursorFalso:
+
+    def __init__(self, conexion: ConexionFalsa):
+        self.conexion = conexion
+        self.base = conexion.base
+        self._fila = None
+    
+    def execute(self, sql: str, parametros: Tuple):
+        if 'INSERT INTO metricas_logros_pacientes' in sql:
+            paciente_id, metrica, valor = parametros
+            clave = (paciente_id, metrica)
+            self.base.bloquear(self.conexion, clave)
+            fila = self.base.metricas.get(clave)
+            self.conexion._deshacer.append(('metricas', clave, list(fila) if fila else None))
+            if fila is None:
+                self.base.metricas[clave] = [None, valor]
+            else:
+                assert 'valor + VALUES(valor)' in sql
+                self.base.metricas[clave] = [fila[1], fila[1] + valor]
+        elif 'SELECT valor_anterior, valor' in sql:
+            if 'FOR UPDATE' in sql:
+                self.base.bloquear(self.conexion, tuple(parametros))
+            self._fila = tuple(self.base.metricas[tuple(parametros)])
+        else:
+            raise AssertionError(f'Sentencia inesperada: {sql}')
+        self.conexion.fin_sentencia()
+    
+    def executemany(self, sql: str, filas: List[Tuple]):
+        assert 'INSERT INTO logros_pacientes' in sql
+        self.conexion._deshacer.append(('progreso', len(self.base.progreso), None))
+        self.base.progreso.extend(filas)
+        self.conexion.fin_sentencia()
+    
+    def fetchone(self):
+        return self._fila
+    
+    def close(self):
+        pass
+
+
+def crear_manager(base: BaseDatosFalsa) -> LogroManager:
+    """LogroManager sobre la base falsa, sin conectarse a MySQL"""
+    connection_manager = MySQLConnectionManager.__new__(MySQLConnectionManager)
+    connection_manager.connection_pool = base
+    manager = LogroManager.__new__(LogroManager)
+    manager.connection_manager = connection_manager
+    return manager
+
+
+def filas_cruzadas(cambios: List[Tuple[Optional[float], float]], paciente_id: int = 1) -> List[Tuple]:
+    """Una fila completada por cada umbral que cruzó cada cambio"""
+    filas = []
+    for anterior, actual in cambios:
+        for umbral in UMBRALES:
+            if (anterior or 0) < umbral <= actual:
+                filas.append((paciente_id, umbral, actual, True, None))
+    return filas
+
+
+class TestRegistrarMetricas:
+
+    def test_lotes_intercalados_cruzan_cada_umbral_una_vez(self):
+        base = BaseDatosFalsa()
+        manager = crear_manager(base)
+        errores = []
+        
+        def trabajador():
+            try:
+                for _ in range(15):
+                    manager.registrar_metricas([(1, 'sesiones', 'acumulado', 1)], filas_cruzadas)
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errores.append(e)
+        
+        hilos = [threading.Thread(target=trabajador) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        
+        assert errores == []
+        assert base.metricas[(1, 'sesiones')][1] == 120
+        assert sorted(fila[1] for fila in base.progreso) == list(UMBRALES)
+    
+    def test_cambios_de_un_lote_con_varios_valores_de_la_misma_metrica(self):
+        base = BaseDatosFalsa(pausa=0)
+        manager = crear_manager(base)
+        
+        cambios = manager.registrar_metricas(
+            [(1, 'sesiones', 'acumulado', 6), (1, 'sesiones', 'acumulado', 6)], filas_cruzadas
+        )
+        assert cambios == [(None, 6), (6, 12)]
+        assert [fila[1] for fila in base.progreso] == [10]
+    
+    def test_error_al_armar_el_progreso_deshace_las_metricas(self):
+        base = BaseDatosFalsa(pausa=0)
+        manager = crear_manager(base)
+        manager.registrar_metricas([(1, 'sesiones', 'acumulado', 4)], filas_cruzadas)
+        
+        def fallar(cambios):
+            raise RuntimeError('falla al armar el progreso')
+        
+        with pytest.raises(RuntimeError):
+            manager.registrar_metricas([(1, 'sesiones', 'acumulado', 20)], fallar)
+        assert base.metricas[(1, 'sesiones')] == [None, 4]
+        assert base._duenos == {}
@@ -0,0 +1,215 @@
+"""
+Pruebas de las alertas de seguridad programadas en la rueda, con un reloj falso
+"""
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+from app.models.configuracion import ConfiguracionSeguridad
+from app.models.sesion import EstadoSesion, Sesion, TipoTerapia
+from app.services.sesion_service import ProgramadorAlertas
+from app.utils.eventos import CentroEventos, canal_paciente
+from app.utils.rueda_temporizadores import RuedaTemporizadores
+
+PACIENTE = 7
+
+
+class SesionesEnMemoria:
+    """Las operaciones de SesionesActivas que usa el programador, sin base de datos"""
+    
+    def __init__(self):
+        self._activas: Dict[str, Sesion] = {}
+        self._observadores: List[Callable[[Sesion], None]] = []
+    
+    def suscribir(self, observador: Callable[[Sesion], None]):
+        self._observadores.append(observador)
+    
+    def activas(self) -> List[Sesion]:
+        return list(self._activas.values())
+    
+    def obtener(self, paciente_id) -> Optional[Sesion]:
+        return self._activas.get(str(paciente_id))
+    
+    def _notificar(self, sesion: Sesion):
+        for observador in self._observadores:
+            observador(sesion)
+    
+    def registrar(self, sesion: Sesion):
+        self._activas[str(sesion.paciente_id)] = sesion
+        self._notificar(sesion)
+    
+    def aplicar(self, paciente_id, transicion: Callable[[Sesion], object]):
+        clave = str(paciente_id)
+        sesion = self._activas.get(clave)
+        if sesion is None:
+            return None
+        resultado = transicion(sesion)
+        self._notificar(sesion)
+        if not sesion.esta_activa():
+            del self._activas[clave]
+        return resultado
+
+
+class Escenario:
+    """
+    Programador con una rueda de reloj falso.
+    
+    El programador mide lo transcurrido con la fecha de inicio de la sesión y
+    ``datetime.now()``: avanzar el reloj falso corre también hacia atrás la
+    fecha de inicio, para que los dos relojes coincidan.
+    """
+    
+    def __init__(self, config: ConfiguracionSeguridad):
+        self.ahora = 0.0
+        self.rueda = RuedaTemporizadores(reloj=lambda: self.ahora)
+        self.sesiones = SesionesEnMemoria()
+        self.centro = CentroEventos()
+        self.suscripcion = self.centro.suscribir(canal_paciente(PACIENTE))
+        self.programador = ProgramadorAlertas(
+            self.sesiones, self.rueda, centro=self.centro,
+            cargar_configuracion=lambda paciente_id: config
+        )
+        self.sesion: Optional[Sesion] = None
+    
+    def iniciar_sesion(self) -> Sesion:
+        self.sesion = Sesion(paciente_id=PACIENTE, tipo_terapia=TipoTerapia.REHABILITACION)
+        self.sesion.iniciar()
+        self.sesiones.registrar(self.sesion)
+        return self.sesion
+    
+    def aplicar(self, transicion: Callable[[Sesion], object]):
+        self.sesiones.aplicar(PACIENTE, transicion)
+    
+    def avanzar(self, segundos: float) -> List[str]:
+        """Avanza el reloj y retorna los tipos de las alertas vencidas"""
+        self.ahora += segundos
+        if self.sesion is not None and self.sesion.fecha_inicio:
+            self.sesion.fecha_inicio -= timedelta(seconds=segundos)
+        self.rueda.avanzar()
+        return [alerta.tipo for alerta in self.programador.tomar_alertas(PACIENTE)]
+    
+    def temporizadores(self) -> Dict[str, int]:
+        """Tipo de alerta -> tick de vencimiento de los temporizadores activos"""
+        return {
+            tipo: temporizador.vencimiento
+            for tipo, temporizador in self.programador._temporizadores.get(str(PACIENTE), {}).items()
+            if temporizador.activo
+        }
+
+
+@pytest.fixture
+def config():
+    return ConfiguracionSeguridad(
+        paciente_id=PACIENTE,
+        limite_tiempo_sesion=30,
+        intervalo_descanso=10,
+        tiempo_inactividad=30,
+        pausa_automatica_inactividad=True
+    )
+
+
+class TestProgramadorAlertas:
+
+    def test_calentamiento_solo_programa_el_limite(self, config):
+        escenario = Escenario(config)
+        escenario.iniciar_sesion()
+        assert escenario.temporizadores() == {ProgramadorAlertas.LIMITE_TIEMPO: 1800}
+        
+        escenario.aplicar(lambda sesion: sesion.completar_calentamiento())
+        assert escenario.temporizadores() == {
+            ProgramadorAlertas.LIMITE_TIEMPO: 1800,
+            ProgramadorAlertas.DESCANSO: 600
+        }
+    
+    def test_descanso_inactividad_y_limite(self, config):
+        escenario = Escenario(config)
+        sesion = escenario.iniciar_sesion()
+        escenario.aplicar(lambda actual: actual.completar_calentamiento())
+        
+        # Descanso a los 10 minutos, ni un tick antes
+        assert escenario.avanzar(599) == []
+        assert escenario.avanzar(1) == [ProgramadorAlertas.DESCANSO]
+        assert sesion.alertas_descanso == 1
+        
+        # La inactividad solo cuenta desde la primera actividad reportada
+        assert escenario.avanzar(100) == []
+        assert escenario.programador.registrar_actividad(PACIENTE) is True
+        assert escenario.avanzar(29) == []
+        # La actividad reinicia el plazo
+        escenario.programador.registrar_actividad(PACIENTE)
+        assert escenario.avanzar(29) == []
+        assert escenario.avanzar(1) == [ProgramadorAlertas.INACTIVIDAD]
+        assert sesion.estado == EstadoSesion.PAUSA
+        assert sesion.pausas_tomadas == 1
+        
+        # En pausa no se avisan descansos ni inactividad
+        assert ProgramadorAlertas.DESCANSO not in escenario.temporizadores()
+        assert ProgramadorAlertas.INACTIVIDAD not in escenario.temporizadores()
+        assert escenario.avanzar(600) == []
+        
+        # Al reanudar se avisa una sola vez el descanso atrasado
+        escenario.aplicar(lambda actual: actual.reanudar())
+        assert escenario.avanzar(1) == [ProgramadorAlertas.DESCANSO]
+        assert sesion.alertas_descanso == 2
+        escenario.programador.registrar_actividad(PACIENTE)
+        
+        # El límite vence a los 30 minutos de iniciada, también en pausa
+        escenario.aplicar(lambda actual: actual.pausar())
+        assert escenario.avanzar(1800 - escenario.ahora - 1) == []
+        assert escenario.avanzar(1) == [ProgramadorAlertas.LIMITE_TIEMPO]
+        
+        # Al terminar la sesión no queda nada programado
+        escenario.aplicar(lambda actual: actual.finalizar())
+        assert escenario.temporizadores() == {}
+        assert len(escenario.rueda) == 0
+    
+    def test_alertas_se_publican_en_el_canal_del_paciente(self, config):
+        escenario = Escenario(config)
+        escenario.iniciar_sesion()
+        escenario.aplicar(lambda sesion: sesion.completar_calentamiento())
+        escenario.avanzar(600)
+        
+        eventos = escenario.suscripcion.esperar(timeout=0)
+        assert [evento.tipo for evento in eventos] == ['alerta']
+        assert f'"tipo":"{ProgramadorAlertas.DESCANSO}"' in eventos[0].texto
+    
+    def test_sin_pausa_automatica_la_inactividad_avisa_una_vez(self, config):
+        config.pausa_automatica_inactividad = False
+        escenario = Escenario(config)
+        sesion = escenario.iniciar_sesion()
+        escenario.aplicar(lambda actual: actual.completar_calentamiento())
+        escenario.programador.registrar_actividad(PACIENTE)
+        
+        assert escenario.avanzar(30) == [ProgramadorAlertas.INACTIVIDAD]
+        assert sesion.estado == EstadoSesion.EN_CURSO
+        assert escenario.avanzar(60) == []
+    
+    def test_sesion_cancelada_no_dispara(self, config):
+        escenario = Escenario(config)
+        escenario.iniciar_sesion()
+        escenario.aplicar(lambda sesion: sesion.completar_calentamiento())
+        escenario.programador.registrar_actividad(PACIENTE)
+        
+        escenario.aplicar(lambda sesion: sesion.cancelar())
+        assert len(escenario.rueda) == 0
+        assert escenario.avanzar(3600) == []
+    
+    def test_reconfigurar_reprograma_la_sesion_en_curso(self, config):
+        escenario = Escenario(config)
+        escenario.iniciar_sesion()
+        escenario.aplicar(lambda sesion: sesion.completar_calentamiento())
+        escenario.avanzar(120)
+        
+        nueva = ConfiguracionSeguridad(
+            paciente_id=PACIENTE, limite_tiempo_sesion=5, intervalo_descanso=3
+        )
+        escenario.programador.configurar(PACIENTE, nueva)
+        # Los plazos se cuentan desde el inicio de la sesión
+        assert escenario.temporizadores() == {
+            ProgramadorAlertas.LIMITE_TIEMPO: 300,
+            ProgramadorAlertas.DESCANSO: 180
+        }
+        assert escenario.avanzar(59) == []
+        assert escenario.avanzar(1) == [ProgramadorAlertas.DESCANSO]
+        assert escenario.avanzar(120) == [ProgramadorAlertas.LIMITE_TIEMPO]
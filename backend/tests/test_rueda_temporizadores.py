@@ -0,0 +1,200 @@
+"""
+Pruebas de la rueda de temporizadores con un reloj falso
+"""
+import math
+import random
+
+import pytest
+
+from app.utils.rueda_temporizadores import RuedaTemporizadores
+
+
+class RelojFalso:
+    """Reloj que solo avanza cuando la prueba lo pide"""
+    
+    def __init__(self, ahora: float = 0.0):
+        self.ahora = ahora
+    
+    def __call__(self) -> float:
+        return self.ahora
+
+
+@pytest.fixture
+def reloj():
+    return RelojFalso()
+
+
+def avanzar_hasta(rueda: RuedaTemporizadores, reloj: RelojFalso, instante: float) -> int:
+    reloj.ahora = instante
+    return rueda.avanzar()
+
+
+class TestRuedaTemporizadores:
+
+    def test_ranuras_deben_ser_potencia_de_2(self, reloj):
+        with pytest.raises(ValueError):
+            RuedaTemporizadores(ranuras=6, reloj=reloj)
+    
+    def test_no_dispara_antes_de_tiempo(self, reloj):
+        rueda = RuedaTemporizadores(reloj=reloj)
+        reloj.ahora = 0.3
+        disparos = []
+        rueda.programar(10.5, lambda: disparos.append(reloj.ahora))
+        
+        # Vence en 10.8: se redondea hacia arriba al tick 11
+        assert avanzar_hasta(rueda, reloj, 10.8) == 0
+        assert avanzar_hasta(rueda, reloj, 10.99) == 0
+        assert avanzar_hasta(rueda, reloj, 11.0) == 1
+        assert disparos == [11.0]
+        assert len(rueda) == 0
+    
+    def test_no_dispara_antes_de_tiempo_con_resolucion_fraccionaria(self, reloj):
+        rueda = RuedaTemporizadores(resolucion=0.25, reloj=reloj)
+        disparos = []
+        rueda.programar(1.1, lambda: disparos.append(reloj.ahora))
+        
+        assert avanzar_hasta(rueda, reloj, 1.1) == 0
+        assert avanzar_hasta(rueda, reloj, 1.25) == 1
+        assert disparos == [1.25]
+    
+    def test_retraso_cero_o_negativo_sale_en_el_proximo_tick(self, reloj):
+        rueda = RuedaTemporizadores(reloj=reloj)
+        disparos = []
+        rueda.programar(0, lambda: disparos.append('cero'))
+        rueda.programar(-5, lambda: disparos.append('negativo'))
+        
+        assert rueda.avanzar() == 0
+        assert avanzar_hasta(rueda, reloj, 1) == 2
+        assert sorted(disparos) == ['cero', 'negativo']
+    
+    def test_cancelar(self, reloj):
+        rueda = RuedaTemporizadores(reloj=reloj)
+        disparos = []
+        cancelado = rueda.programar(5, lambda: disparos.append('cancelado'))
+        vigente = rueda.programar(5, lambda: disparos.append('vigente'))
+        assert len(rueda) == 2
+        
+        assert rueda.cancelar(cancelado) is True
+        assert not cancelado.activo
+        assert rueda.cancelar(cancelado) is False
+        assert rueda.cancelar(None) is False
+        assert len(rueda) == 1
+        
+        avanzar_hasta(rueda, reloj, 10)
+        assert disparos == ['vigente']
+        assert not vigente.activo
+        # Un temporizador vencido ya no se puede cancelar
+        assert rueda.cancelar(vigente) is False
+        assert len(rueda) == 0
+    
+    def test_cancelar_en_un_nivel_superior(self, reloj):
+        rueda = RuedaTemporizadores(ranuras=4, niveles=3, reloj=reloj)
+        disparos = []
+        temporizador = rueda.programar(40, lambda: disparos.append(reloj.ahora))
+        
+        # Baja de nivel dos veces antes de vencer; se cancela a mitad de camino
+        avanzar_hasta(rueda, reloj, 33)
+        assert temporizador.activo
+        assert rueda.cancelar(temporizador) is True
+        avanzar_hasta(rueda, reloj, 100)
+        assert disparos == []
+    
+    def test_cascada_entre_niveles(self, reloj):
+        # 4 ranuras y 3 niveles: el nivel 0 cubre 4 ticks, el 1 16 y el 2 64
+        rueda = RuedaTemporizadores(ranuras=4, niveles=3, reloj=reloj)
+        retrasos = [1, 3, 4, 5, 15, 16, 17, 47, 63]
+        disparos = {}
+        for retraso in retrasos:
+            rueda.programar(retraso, lambda retraso=retraso: disparos.setdefault(retraso, reloj.ahora))
+        
+        for tick in range(1, 70):
+            avanzar_hasta(rueda, reloj, tick)
+        
+        assert disparos == {retraso: retraso for retraso in retrasos}
+        assert len(rueda) == 0
+    
+    def test_vencimiento_fuera_de_rango(self, reloj):
+        rueda = RuedaTemporizadores(ranuras=4, niveles=2, reloj=reloj)
+        disparos = []
+        # El rango es de 16 ticks: se reprograma cada vez que baja
+        rueda.programar(50, lambda: disparos.append(reloj.ahora))
+        
+        for tick in range(1, 60):
+            avanzar_hasta(rueda, reloj, tick)
+        assert disparos == [50]
+    
+    def test_avance_largo_ejecuta_en_orden_de_vencimiento(self, reloj):
+        rueda = RuedaTemporizadores(ranuras=4, niveles=3, reloj=reloj)
+        disparos = []
+        for retraso in [30, 2, 17, 5, 60]:
+            rueda.programar(retraso, lambda retraso=retraso: disparos.append(retraso))
+        
+        assert avanzar_hasta(rueda, reloj, 100) == 5
+        assert disparos == [2, 5, 17, 30, 60]
+    
+    def test_programar_despues_de_un_salto_con_la_rueda_vacia(self, reloj):
+        rueda = RuedaTemporizadores(ranuras=4, niveles=2, reloj=reloj)
+        avanzar_hasta(rueda, reloj, 1000)
+        disparos = []
+        rueda.programar(3, lambda: disparos.append(reloj.ahora))
+        
+        assert avanzar_hasta(rueda, reloj, 1002) == 0
+        assert avanzar_hasta(rueda, reloj, 1003) == 1
+        assert disparos == [1003]
+    
+    def test_accion_que_programa_otro_temporizador(self, reloj):
+        rueda = RuedaTemporizadores(reloj=reloj)
+        disparos = []
+        
+        def primero():
+            disparos.append(('primero', reloj.ahora))
+            rueda.programar(5, lambda: disparos.append(('segundo', reloj.ahora)))
+        
+        rueda.programar(5, primero)
+        avanzar_hasta(rueda, reloj, 5)
+        avanzar_hasta(rueda, reloj, 9)
+        avanzar_hasta(rueda, reloj, 10)
+        assert disparos == [('primero', 5), ('segundo', 10)]
+    
+    def test_error_en_una_accion_no_detiene_las_demas(self, reloj):
+        rueda = RuedaTemporizadores(reloj=reloj)
+        disparos = []
+        rueda.programar(1, lambda: 1 / 0)
+        rueda.programar(1, lambda: disparos.append('ok'))
+        
+        assert avanzar_hasta(rueda, reloj, 1) == 2
+        assert disparos == ['ok']
+    
+    def test_aleatorio_contra_referencia(self, reloj):
+        """Ningún temporizador vence antes de su tick ni después del primer avance que lo alcanza"""
+        generador = random.Random(20240611)
+        rueda = RuedaTemporizadores(resolucion=0.5, ranuras=4, niveles=3, reloj=reloj)
+        vencimientos = {}
+        disparos = {}
+        cancelados = set()
+        temporizadores = {}
+        
+        for indice in range(2000):
+            reloj.ahora += generador.choice([0, 0.2, 0.5, 1.3, 7])
+            retraso = generador.uniform(0, 60)
+            vencimientos[indice] = math.ceil((reloj.ahora + retraso) / 0.5) * 0.5
+            temporizadores[indice] = rueda.programar(
+                retraso, lambda indice=indice: disparos.setdefault(indice, reloj.ahora)
+            )
+            if generador.random() < 0.2:
+                victima = generador.randrange(indice + 1)
+                if rueda.cancelar(temporizadores[victima]):
+                    cancelados.add(victima)
+            rueda.avanzar()
+            for vencido, instante in disparos.items():
+                assert instante >= vencimientos[vencido]
+            pendientes = {
+                otro for otro, vencimiento in vencimientos.items()
+                if vencimiento <= reloj.ahora and otro not in cancelados
+            }
+            assert pendientes <= set(disparos)
+        
+        avanzar_hasta(rueda, reloj, reloj.ahora + 100)
+        assert set(disparos) | cancelados == set(vencimientos)
+        assert not set(disparos) & cancelados
+        assert len(rueda) == 0
@@ -1,6 +1,54 @@
 import React, { useRef, useEffect, useState } from 'react'
 import axios from 'axios'
 
+// 100 - coeficiente de variación (%) de los tiempos de reacción, en una sola pasada
+const consistenciaReaccion = (tiempos) => {
+  if (tiempos.length < 2) return 100
+  let suma = 0
+  let sumaCuadrados = 0
+  for (const rt of tiempos) {
+    suma += rt
+    sumaCuadrados += rt * rt
+  }
+  const promedio = suma / tiempos.length
+  if (promedio <= 0) return 100
+  const varianza = Math.max(0, sumaCuadrados / tiempos.length - promedio * promedio)
+  return Math.max(0, 100 - Math.sqrt(varianza) / promedio * 100)
+}
+
+// Resultados que no se pudieron enviar (sin conexión); se reenvían en lote
+const RESULTADOS_PENDIENTES = 'rehavr-resultados-pendientes'
+const MAX_LOTE_RESULTADOS = 100
+
+const leerPendientes = () => {
+  try {
+    return JSON.parse(localStorage.getItem(RESULTADOS_PENDIENTES) || '[]')
+  } catch {
+    return []
+  }
+}
+
+const guardarPendiente = (resultado) => {
+  localStorage.setItem(RESULTADOS_PENDIENTES, JSON.stringify([...leerPendientes(), resultado]))
+}
+
+const enviarPendientes = async () => {
+  const lote = leerPendientes().slice(0, MAX_LOTE_RESULTADOS)
+  if (lote.length === 0) return
+  try {
+    await axios.post('/api/ejercicios/resultados/lote', { resultados: lote }, { withCredentials: true })
+  } catch (error) {
+    // Sin respuesta o error del servidor: se reintenta más tarde
+    if (!error.response || error.response.status >= 500 || error.response.status === 401) return
+  }
+  // Registrados, duplicados e inválidos ya no se reenvían; la clave evita duplicar si se repite
+  const enviadas = new Set(lote.map(r => r.clave_idempotencia))
+  localStorage.setItem(
+    RESULTADOS_PENDIENTES,
+    JSON.stringify(leerPendientes().filter(r => !enviadas.has(r.clave_idempotencia)))
+  )
+}
+
 const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
   const canvasRef = useRef(null)
   const [gameState, setGameState] = useState('ready') // ready, playing, completed
@@ -34,6 +82,57 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
     maxY: -Infinity
   })
 
+  // Telemetría de movimiento: muestras en columnas que se envían en lotes
+  const telemetryRef = useRef({
+    intentoId: null,
+    secuencia: 0,
+    inicio: 0,
+    ultimaMuestra: 0,
+    t: [],
+    x: [],
+    y: [],
+    e: []
+  })
+
+  const registrarMuestra = (x, y, evento) => {
+    const telemetry = telemetryRef.current
+    if (!telemetry.intentoId) return
+    const t = Math.round(performance.now() - telemetry.inicio)
+    // Los movimientos se muestrean a ~60 Hz; aciertos y fallos siempre se guardan
+    if (evento === 0 && t - telemetry.ultimaMuestra < 16) return
+    telemetry.ultimaMuestra = t
+    telemetry.t.push(t)
+    telemetry.x.push(Math.round(x))
+    telemetry.y.push(Math.round(y))
+    telemetry.e.push(evento)
+  }
+
+  const enviarTelemetria = () => {
+    const telemetry = telemetryRef.current
+    if (!telemetry.intentoId || telemetry.t.length === 0) return Promise.resolve()
+    const lote = {
+      secuencia: telemetry.secuencia++,
+      t: telemetry.t,
+      x: telemetry.x,
+      y: telemetry.y,
+      e: telemetry.e
+    }
+    telemetry.t = []
+    telemetry.x = []
+    telemetry.y = []
+    telemetry.e = []
+    return axios
+      .post(`/api/ejercicios/telemetria/${telemetry.intentoId}`, lote, { withCredentials: true })
+      .catch(error => console.error('Error al enviar telemetría:', error))
+  }
+
+  // Reenviar los resultados que quedaron sin enviar (al montar y al recuperar la conexión)
+  useEffect(() => {
+    enviarPendientes()
+    window.addEventListener('online', enviarPendientes)
+    return () => window.removeEventListener('online', enviarPendientes)
+  }, [])
+
   // Configurar velocidad según nivel
   useEffect(() => {
     if (nivel === 1) {
@@ -61,6 +160,7 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
           }
           return prev - 1
         })
+        enviarTelemetria()
       }, 1000)
     } else {
       if (timerIntervalRef.current) {
@@ -197,6 +297,9 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
 
   const handleGameComplete = async () => {
     setGameState('completed')
+    const intentoId = telemetryRef.current.intentoId
+    await enviarTelemetria()
+    telemetryRef.current.intentoId = null
     const metrics = metricsRef.current
     const tiempoEjecucion = startTime ? (Date.now() - startTime) / 1000 : 60
     
@@ -213,12 +316,7 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
     const avgReactionTime = metrics.reactionTimes.length > 0
       ? metrics.reactionTimes.reduce((a, b) => a + b, 0) / metrics.reactionTimes.length
       : 0
-    const consistency = metrics.reactionTimes.length > 1
-      ? 100 - (Math.sqrt(metrics.reactionTimes.reduce((sum, rt) => {
-          const avg = metrics.reactionTimes.reduce((a, b) => a + b, 0) / metrics.reactionTimes.length
-          return sum + Math.pow(rt - avg, 2)
-        }, 0) / metrics.reactionTimes.length) / avgReactionTime * 100)
-      : 100
+    const consistency = consistenciaReaccion(metrics.reactionTimes)
 
     const observaciones = JSON.stringify({
       precision: precisionValue.toFixed(2),
@@ -230,30 +328,34 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
       maxCombo: maxCombo
     })
 
+    const resultado = {
+      ejercicio_id: ejercicioId,
+      nivel: nivel,
+      exito: success,
+      tiempo_ejecucion: tiempoEjecucion,
+      puntuacion: score,
+      observaciones: observaciones,
+      precision: precisionValue,
+      velocidad_promedio: avgSpeed,
+      rango_movimiento: movementRange,
+      tiempo_reaccion_promedio: avgReactionTime,
+      tasa_aciertos: hits / totalAttempts * 100,
+      consistencia: consistency,
+      combo_maximo: maxCombo,
+      aciertos: hits,
+      fallos: misses,
+      intento_id: intentoId,
+      clave_idempotencia: intentoId
+    }
+
     try {
-      await axios.post(
-        '/api/ejercicios/resultado',
-        {
-          ejercicio_id: ejercicioId,
-          nivel: nivel,
-          exito: success,
-          tiempo_ejecucion: tiempoEjecucion,
-          puntuacion: score,
-          observaciones: observaciones,
-          precision: precisionValue,
-          velocidad_promedio: avgSpeed,
-          rango_movimiento: movementRange,
-          tiempo_reaccion_promedio: avgReactionTime,
-          tasa_aciertos: hits / totalAttempts * 100,
-          consistencia: consistency,
-          combo_maximo: maxCombo,
-          aciertos: hits,
-          fallos: misses
-        },
-        { withCredentials: true }
-      )
+      await axios.post('/api/ejercicios/resultado', resultado, { withCredentials: true })
+      enviarPendientes()
     } catch (error) {
       console.error('Error al registrar resultado:', error)
+      if (!error.response) {
+        guardarPendiente(resultado)
+      }
     }
 
     if (onComplete) {
@@ -266,6 +368,18 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
     setGameState('playing')
     setStartTime(Date.now())
     metricsRef.current.startTime = Date.now()
+    telemetryRef.current = {
+      intentoId: window.crypto?.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`,
+      secuencia: 0,
+      inicio: performance.now(),
+      ultimaMuestra: -Infinity,
+      t: [],
+      x: [],
+      y: [],
+      e: []
+    }
   }
 
   // Manejo de clics
@@ -287,6 +401,8 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
 
       const wasHit = checkHit(mouseX, mouseY, combo)
       
+      registrarMuestra(mouseX, mouseY, wasHit ? 1 : 2)
+      
       if (wasHit) {
         setHits(prev => prev + 1)
       } else {
@@ -294,9 +410,17 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
       }
     }
 
+    const handleMouseMove = (e) => {
+      if (gameState !== 'playing') return
+      const rect = canvas.getBoundingClientRect()
+      registrarMuestra(e.clientX - rect.left, e.clientY - rect.top, 0)
+    }
+
     canvas.addEventListener('click', handleClick)
+    canvas.addEventListener('mousemove', handleMouseMove)
     return () => {
       canvas.removeEventListener('click', handleClick)
+      canvas.removeEventListener('mousemove', handleMouseMove)
     }
   }, [gameState, nivel, combo])
 
@@ -521,10 +645,7 @@ const EjercicioCanvas = ({ ejercicioId, nivel, onComplete }) => {
     : 0
   const hitRate = totalAttempts > 0 ? ((hits / totalAttempts) * 100).toFixed(1) : 0
   const consistency = metricsRef.current.reactionTimes.length > 1
-    ? (100 - (Math.sqrt(metricsRef.current.reactionTimes.reduce((sum, rt) => {
-        const avg = metricsRef.current.reactionTimes.reduce((a, b) => a + b, 0) / metricsRef.current.reactionTimes.length
-        return sum + Math.pow(rt - avg, 2)
-      }, 0) / metricsRef.current.reactionTimes.length) / (metricsRef.current.reactionTimes.reduce((a, b) => a + b, 0) / metricsRef.current.reactionTimes.length) * 100)).toFixed(1)
+    ? consistenciaReaccion(metricsRef.current.reactionTimes).toFixed(1)
     : 100
 
   return (
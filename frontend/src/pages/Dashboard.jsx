@@ -137,6 +137,7 @@ export default function Dashboard() {
   const { theme, toggle } = useTheme()
   const [paciente, setPaciente]   = useState(null)
   const [historial, setHistorial] = useState([])
+  const [resumenHistorial, setResumenHistorial] = useState({ total: 0, exitosos: 0 })
   const [ejercicios, setEjercicios] = useState([])
   const [loading, setLoading]     = useState(true)
   const [currentTime, setCurrentTime] = useState(new Date())
@@ -151,20 +152,21 @@ export default function Dashboard() {
 
   const loadData = async () => {
     try {
-      const [pacienteRes, historialRes, ejerciciosRes] = await Promise.all([
-        axios.get('/api/auth/paciente',      { withCredentials: true }),
-        axios.get('/api/ejercicios/historial', { withCredentials: true }),
-        axios.get('/api/ejercicios/',          { withCredentials: true }),
-      ])
-
-      if (pacienteRes.data.success) {
-        setPaciente(pacienteRes.data.paciente?.paciente || pacienteRes.data.paciente)
-      } else {
+      // Paciente, totales, últimas sesiones y ejercicios en una sola petición
+      const { data } = await axios.get('/api/dashboard/resumen', { withCredentials: true })
+      if (!data.success) {
         navigate('/login')
+        return
       }
 
-      if (historialRes.data.success)  setHistorial(historialRes.data.historial  || [])
-      if (ejerciciosRes.data.success) setEjercicios(ejerciciosRes.data.ejercicios || [])
+      const resumen = data.resumen || {}
+      setPaciente(data.paciente)
+      setHistorial(resumen.ultimos_resultados || [])
+      setResumenHistorial({
+        total: resumen.total_ejercicios || 0,
+        exitosos: resumen.ejercicios_exitosos || 0,
+      })
+      setEjercicios(data.ejercicios || [])
     } catch (err) {
       if (err.response?.status === 401) navigate('/login')
     } finally {
@@ -201,8 +203,8 @@ export default function Dashboard() {
   }
 
   /* ── Métricas calculadas ── */
-  const totalSesiones     = historial.length
-  const exitosos          = historial.filter(h => h.exito).length
+  const totalSesiones     = resumenHistorial.total
+  const exitosos          = resumenHistorial.exitosos
   const porcentajeProgreso = totalSesiones > 0
     ? Math.round((exitosos / totalSesiones) * 100)
     : 0
@@ -434,7 +436,7 @@ export default function Dashboard() {
                 </p>
               </div>
               <div className="rehavr-section-badge">
-                {historial.length} registros
+                {totalSesiones} registros
               </div>
             </div>
 
@@ -449,11 +451,11 @@ export default function Dashboard() {
                   </tr>
                 </thead>
                 <tbody>
-                  {historial.slice(-8).reverse().map((act, i) => {
+                  {historial.map((act, i) => {
                     const fecha = new Date(act.fecha_ejercicio || act.fecha)
                     const nombre = act.tipo_ejercicio || act.nivel || act.ejercicio || 'N/A'
                     return (
-                      <tr key={i} className="rehavr-table-row">
+                      <tr key={act.id ?? i} className="rehavr-table-row">
                         <td>
                           {isNaN(fecha)
                             ? '—'